@@ -0,0 +1,164 @@
+"""Lectura del archivo columnar (Parquet) de meses cerrados. v1.7
+
+scripts/archivo_parquet.py exporta ventas, gastos y caja_diaria por mes a
+
+    <directorio>/<tabla>/mes=AAAA-MM/datos.parquet
+
+Un mes exportado se lee siempre del archivo (aunque sus filas sigan en la
+BD): combinar() parte el rango pedido en tramos de meses archivados y vivos,
+así no hay filas repetidas. Solo se leen los archivos de los meses del rango,
+solo las columnas pedidas (column pruning) y el filtro por fecha baja a los
+row groups (predicate pushdown sobre las estadísticas min/max).
+
+pyarrow es opcional: sin él los meses archivados se ignoran con un aviso y
+todo se lee de la BD.
+"""
+import logging
+import os
+import threading
+from datetime import date
+
+from app.database import DB_PATH, _is_sqlite
+
+# Directorio del archivo para la BD principal (PostgreSQL o data/orvann.db)
+ARCHIVO_DIR = os.environ.get('ORVANN_ARCHIVO_DIR',
+                             os.path.join(os.path.dirname(DB_PATH), 'archivo'))
+ARCHIVO_NOMBRE = 'datos.parquet'
+TABLAS = ('ventas', 'gastos', 'caja_diaria')
+
+logger = logging.getLogger(__name__)
+
+_LOCK = threading.Lock()
+# directorio de la tabla → (mtime_ns, frozenset de meses)
+_meses = {}
+
+
+def disponible():
+    """True si pyarrow está instalado."""
+    try:
+        import pyarrow.dataset  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def directorio(db_path=None):
+    """Raíz del archivo: ARCHIVO_DIR, o <base>_parquet junto a un db_path explícito
+    (el escritor SQLite pasa DB_PATH: es la BD principal)."""
+    if db_path is None or db_path == DB_PATH:
+        return ARCHIVO_DIR
+    return os.path.splitext(db_path)[0] + '_parquet'
+
+
+def ruta_mes(tabla, mes, db_path=None):
+    return os.path.join(directorio(db_path), tabla, f'mes={mes}', ARCHIVO_NOMBRE)
+
+
+def meses_archivados(tabla, db_path=None):
+    """frozenset de 'AAAA-MM' exportados para tabla (cacheado por mtime del directorio)."""
+    base = os.path.join(directorio(db_path), tabla)
+    try:
+        mtime = os.stat(base).st_mtime_ns
+    except OSError:
+        return frozenset()
+    previo = _meses.get(base)
+    if previo is not None and previo[0] == mtime:
+        return previo[1]
+    meses = frozenset(n[4:] for n in os.listdir(base)
+                      if n.startswith('mes=') and os.path.exists(os.path.join(base, n, ARCHIVO_NOMBRE)))
+    with _LOCK:
+        _meses[base] = (mtime, meses)
+    return meses
+
+
+def tramos(desde, hasta, archivados):
+    """[(desde, hasta, archivado)] consecutivos que cubren [desde, hasta]
+    (fechas ISO inclusive), cortando en los bordes de meses archivados."""
+    d, h = date.fromisoformat(str(desde)[:10]), date.fromisoformat(str(hasta)[:10])
+    res = []
+    while d <= h:
+        mes = d.replace(day=1)
+        siguiente = date(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
+        fin = min(h, date.fromordinal(siguiente.toordinal() - 1))
+        archivado = mes.isoformat()[:7] in archivados
+        if res and res[-1][2] == archivado:
+            res[-1] = (res[-1][0], fin.isoformat(), archivado)
+        else:
+            res.append((d.isoformat(), fin.isoformat(), archivado))
+        d = date.fromordinal(fin.toordinal() + 1)
+    return res
+
+
+def _dataset(tabla, desde, hasta, db_path):
+    """Dataset pyarrow con los archivos de los meses de [desde, hasta], o None."""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    meses = sorted(m for m in meses_archivados(tabla, db_path) if desde[:7] <= m <= hasta[:7])
+    if not meses:
+        return None
+    archivos = [ruta_mes(tabla, m, db_path) for m in meses]
+    # Meses exportados antes de agregar una columna: la columna sale nula
+    esquema = pa.unify_schemas([pq.read_schema(a) for a in archivos])
+    return ds.dataset(archivos, format='parquet', schema=esquema)
+
+
+def _filtro(desde, hasta):
+    import pyarrow.dataset as ds
+    return ((ds.field('fecha') >= date.fromisoformat(desde[:10]))
+            & (ds.field('fecha') <= date.fromisoformat(hasta[:10])))
+
+
+def leer(tabla, desde, hasta, columnas=None, db_path=None):
+    """Filas archivadas de tabla con fecha en [desde, hasta] como dicts, con
+    fecha en el tipo del backend (str en SQLite, date en PostgreSQL)."""
+    dataset = _dataset(tabla, desde, hasta, db_path)
+    if dataset is None:
+        return []
+    if columnas is not None:
+        columnas = [c for c in columnas if c in dataset.schema.names]
+    filas = dataset.to_table(columns=columnas, filter=_filtro(desde, hasta)).to_pylist()
+    if _is_sqlite(db_path):
+        for f in filas:
+            if f.get('fecha') is not None:
+                f['fecha'] = f['fecha'].isoformat()
+    return filas
+
+
+def resumen(tabla, desde, hasta, medida, por='mes', db_path=None):
+    """[{'periodo', medida, 'filas'}] de los meses archivados: suma de medida
+    agrupada por 'mes' (AAAA-MM) o 'fecha' (AAAA-MM-DD). Lee solo fecha y medida."""
+    import pyarrow.compute as pc
+    dataset = _dataset(tabla, desde, hasta, db_path)
+    if dataset is None:
+        return []
+    t = dataset.to_table(columns=['fecha', medida], filter=_filtro(desde, hasta))
+    if por == 'mes':
+        # year()/month() sobre date32 (strftime por fila es ~10x más lento)
+        t = t.append_column('anio', pc.year(t['fecha'])).append_column('mes', pc.month(t['fecha']))
+        claves = ['anio', 'mes']
+    else:
+        claves = ['fecha']
+    t = t.group_by(claves).aggregate([(medida, 'sum'), (medida, 'count')])
+    res = []
+    for r in t.to_pylist():
+        periodo = f"{r['anio']:04d}-{r['mes']:02d}" if por == 'mes' else r['fecha'].isoformat()
+        res.append({'periodo': periodo, medida: r[f'{medida}_sum'] or 0, 'filas': r[f'{medida}_count']})
+    return res
+
+
+def combinar(tabla, desde, hasta, leer_bd, leer_archivo, db_path=None):
+    """Concatena leer_archivo(a, b) para los tramos de meses archivados y
+    leer_bd(a, b) para el resto, del tramo más reciente al más antiguo (como
+    ORDER BY fecha DESC). Sin pyarrow todo va a leer_bd."""
+    archivados = meses_archivados(tabla, db_path)
+    if archivados and not disponible():
+        logger.warning("Hay meses de %s en Parquet pero pyarrow no está instalado: "
+                       "se leen solo de la BD", tabla)
+        archivados = frozenset()
+    if not archivados:
+        return leer_bd(desde, hasta)
+    filas = []
+    for a, b, archivado in reversed(tramos(desde, hasta, archivados)):
+        filas.extend(leer_archivo(a, b) if archivado else leer_bd(a, b))
+    return filas
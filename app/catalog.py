@@ -0,0 +1,153 @@
+"""Catálogo de SKUs en memoria para ORVANN Retail OS. v1.7
+
+Cache de proceso (compartido por todas las sesiones de Streamlit) con un
+registro compacto por SKU. Resuelve escaneos de código de barras o SKU en
+O(1) sin ir a la BD.
+
+Las escrituras de productos o stock en app/models.py llaman
+actualizar(skus, db_path): relee solo esos SKUs por PK y los reemplaza en el
+catálogo cargado, sin recarga completa. Los cambios masivos llaman
+invalidar(db_path), que sube la versión; la siguiente lectura recarga el
+catálogo con una sola consulta. La recarga corre fuera de _LOCK y se
+instala de una vez: las sesiones que ya tienen un catálogo vigente no la
+esperan. Un TTL acota lo desactualizado que puede quedar si otro proceso
+(scripts) escribe.
+"""
+import threading
+import time
+from collections import namedtuple
+
+from app.database import query
+
+ItemCatalogo = namedtuple(
+    'ItemCatalogo', ['sku', 'nombre', 'precio_venta', 'stock', 'stock_minimo', 'codigo_barras']
+)
+
+TTL_SEGUNDOS = 300
+
+_LOCK = threading.Lock()      # estado de abajo; nunca se tiene durante una consulta
+_CARGA = threading.Lock()     # una recarga completa a la vez
+_PARCHES = threading.Lock()   # releer + aplicar parches en orden de commit
+_versiones = {}   # db_path -> versión actual
+_catalogos = {}   # db_path -> {'version', 'cargado', 'por_sku', 'por_codigo'}
+_en_carga = {}    # db_path -> {sku: item o None} parcheados durante una recarga
+
+
+def invalidar(db_path=None):
+    """Marca el catálogo como desactualizado. Llamar tras escribir productos o stock."""
+    with _LOCK:
+        _versiones[db_path] = _versiones.get(db_path, 0) + 1
+
+
+def get_version(db_path=None):
+    with _LOCK:
+        return _versiones.get(db_path, 0)
+
+
+_SELECT = "SELECT sku, nombre, precio_venta, stock, stock_minimo, codigo_barras FROM productos"
+
+
+def _item(r):
+    return ItemCatalogo(r['sku'], r['nombre'], r['precio_venta'], r['stock'],
+                        r['stock_minimo'], r.get('codigo_barras'))
+
+
+def _cargar(db_path):
+    por_sku = {}
+    por_codigo = {}
+    for r in query(_SELECT, db_path=db_path):
+        item = _item(r)
+        por_sku[item.sku.upper()] = item
+        if item.codigo_barras:
+            por_codigo[item.codigo_barras] = item
+    return por_sku, por_codigo
+
+
+def _vigente(cat, version):
+    return cat and cat['version'] == version and time.monotonic() - cat['cargado'] < TTL_SEGUNDOS
+
+
+def _aplicar(por_sku, por_codigo, sku, item):
+    """Reemplaza (o quita, si item es None) el registro de sku en los índices."""
+    anterior = por_sku.pop(sku.upper(), None)
+    if anterior and anterior.codigo_barras and por_codigo.get(anterior.codigo_barras) is anterior:
+        del por_codigo[anterior.codigo_barras]
+    if item is not None:
+        por_sku[sku.upper()] = item
+        if item.codigo_barras:
+            por_codigo[item.codigo_barras] = item
+
+
+def get_catalogo(db_path=None):
+    """Catálogo vigente {'por_sku', 'por_codigo', 'version'}; recarga si está viejo."""
+    with _LOCK:
+        version = _versiones.get(db_path, 0)
+        cat = _catalogos.get(db_path)
+        if _vigente(cat, version):
+            return cat
+    with _CARGA:
+        with _LOCK:
+            # Otra sesión pudo recargar mientras esperábamos
+            version = _versiones.get(db_path, 0)
+            cat = _catalogos.get(db_path)
+            if _vigente(cat, version):
+                return cat
+            _en_carga[db_path] = {}
+        try:
+            por_sku, por_codigo = _cargar(db_path)
+        finally:
+            with _LOCK:
+                parches = _en_carga.pop(db_path)
+        with _LOCK:
+            # Lo escrito durante la consulta puede no estar en ella
+            for sku, item in parches.items():
+                _aplicar(por_sku, por_codigo, sku, item)
+            cat = {
+                'version': version,
+                'cargado': time.monotonic(),
+                'por_sku': por_sku,
+                'por_codigo': por_codigo,
+            }
+            _catalogos[db_path] = cat
+            return cat
+
+
+def actualizar(skus, db_path=None):
+    """Tras escribir productos o stock de skus: relee esas filas por PK y las
+    reemplaza en el catálogo cargado (un SKU borrado sale). Sin catálogo
+    cargado no hace nada: el primer uso lo carga completo."""
+    skus = sorted({s for s in skus if s})
+    if not skus:
+        return
+    with _PARCHES:
+        with _LOCK:
+            if db_path not in _catalogos and db_path not in _en_carga:
+                return
+        marcas = ', '.join('?' for _ in skus)
+        filas = {r['sku']: _item(r) for r in query(f"{_SELECT} WHERE sku IN ({marcas})", tuple(skus),
+                                                   db_path=db_path)}
+        with _LOCK:
+            cat = _catalogos.get(db_path)
+            parches = _en_carga.get(db_path)
+            for sku in skus:
+                item = filas.get(sku)
+                if cat:
+                    _aplicar(cat['por_sku'], cat['por_codigo'], sku, item)
+                if parches is not None:
+                    parches[sku] = item
+
+
+def buscar_por_codigo(codigo, db_path=None):
+    """Resuelve un escaneo: primero código de barras exacto, luego SKU (sin
+    distinguir mayúsculas). Retorna ItemCatalogo o None."""
+    codigo = (codigo or '').strip()
+    if not codigo:
+        return None
+    cat = get_catalogo(db_path)
+    return cat['por_codigo'].get(codigo) or cat['por_sku'].get(codigo.upper())
+
+
+def limpiar():
+    """Descarta todos los catálogos cargados (tests)."""
+    with _LOCK:
+        _catalogos.clear()
@@ -1,8 +1,12 @@
 """Utilidades de formateo y helpers para ORVANN Retail OS. v1.6
 Incluye render_table() — HTML puro para tablas (bypass Glide DataGrid canvas).
 """
+import hashlib
 import html as _html
+import json
+import uuid
 import streamlit as st
+import numpy as np
 import pandas as pd
 
 
@@ -75,6 +79,101 @@ def color_stock(stock, minimo=3):
     return "🟢"
 
 
+# ── Formateo vectorizado (columnas completas) ─────────────
+# Mismo resultado que fmt_cop / fmt_pct / color_stock pero sobre Series o
+# arrays completos, sin .apply fila por fila.
+
+def _como_salida(valores, resultado):
+    """Devuelve Series (con el mismo índice) si la entrada era Series; si no, ndarray."""
+    if isinstance(valores, pd.Series):
+        return pd.Series(resultado, index=valores.index, dtype=object)
+    return resultado
+
+
+def _a_float(valores):
+    """Convierte a float64; None/NaN/no numéricos → NaN."""
+    arr = np.asarray(valores)
+    if arr.dtype.kind in 'iufb':
+        return arr.astype(float, copy=False)
+    return pd.to_numeric(pd.Series(arr, dtype=object), errors='coerce').to_numpy(dtype=float)
+
+
+_POT10 = 10 ** np.arange(17, -1, -1, dtype=np.int64)
+_ESPACIO, _CERO = ord(' '), ord('0')
+
+
+def _codigos_digitos(enteros):
+    """Matriz (n, 18) de códigos Unicode con los dígitos de cada entero,
+    alineados a la derecha y con espacios en lugar de ceros a la izquierda."""
+    col = enteros[:, None]
+    codigos = (col // _POT10 % 10 + _CERO).astype(np.uint32)
+    relleno = col < _POT10
+    relleno[:, -1] = False  # el último dígito siempre se muestra (ej. $0)
+    codigos[relleno] = _ESPACIO
+    return codigos
+
+
+def fmt_cop_col(valores):
+    """Versión vectorizada de fmt_cop: $1.234.567 / -$1.234. None o NaN → $0.
+
+    Los dígitos salen de una matriz de códigos calculada aritméticamente y se
+    intercala '.' cada 3 dígitos. Soporta montos por debajo de 10^18.
+    """
+    x = _a_float(valores)
+    x = np.where(np.isnan(x), 0.0, x)
+    negativo = x < 0
+    # rint redondea mitad a par, igual que format(..., '.0f')
+    enteros = np.rint(np.abs(x)).astype(np.int64)
+    n = len(enteros)
+    if n == 0:
+        return _como_salida(valores, np.empty(0, dtype=object))
+
+    grupos = _codigos_digitos(enteros).reshape(n, 6, 3)
+    celdas = np.empty((n, 6, 4), dtype=np.uint32)
+    celdas[:, :, 1:] = grupos
+    celdas[:, 0, 0] = _ESPACIO
+    celdas[:, 1:, 0] = np.where(grupos[:, :-1, 2] == _ESPACIO, _ESPACIO, ord('.'))
+    texto = np.char.lstrip(celdas.reshape(n, 24).view('U24').ravel())
+
+    resultado = np.char.add(np.where(negativo, '-$', '$'), texto).astype(object)
+    return _como_salida(valores, resultado)
+
+
+def fmt_pct_col(valores):
+    """Versión vectorizada de fmt_pct: 50.7%. None o NaN → 0%.
+
+    Los valores a un pelo de la mitad de una décima (donde x*10 pierde
+    precisión) se formatean con el camino escalar para dar el mismo texto.
+    """
+    x = _a_float(valores)
+    nulos = np.isnan(x)
+    x = np.where(nulos, 0.0, x)
+    n = len(x)
+    if n == 0:
+        return _como_salida(valores, np.empty(0, dtype=object))
+
+    decimas = np.abs(x) * 10
+    t = np.rint(decimas).astype(np.int64)
+    enteros = np.char.lstrip(_codigos_digitos(t // 10).view('U18').ravel())
+    decimal = (t % 10 + _CERO).astype(np.uint32).view('U1')
+    texto = np.char.add(np.char.add(enteros, '.'), np.char.add(decimal, '%'))
+    resultado = np.char.add(np.where(np.signbit(x), '-', ''), texto).astype(object)
+
+    dudosos = np.flatnonzero(np.abs(decimas - np.floor(decimas) - 0.5) < 1e-6)
+    for i in dudosos:
+        resultado[i] = f"{x[i]:.1f}%"
+    resultado[nulos] = '0%'
+    return _como_salida(valores, resultado)
+
+
+def color_stock_col(stock, minimo=3):
+    """Versión vectorizada de color_stock. `minimo` puede ser escalar o columna."""
+    s = np.asarray(stock, dtype=float)
+    m = np.asarray(minimo, dtype=float)
+    resultado = np.select([s <= 0, s <= m], ["🔴", "🟡"], default="🟢").astype(object)
+    return _como_salida(stock, resultado)
+
+
 def color_pe(progreso_pct):
     """Color para barra de punto de equilibrio."""
     if progreso_pct >= 100:
@@ -84,6 +183,40 @@ def color_pe(progreso_pct):
     return "red"
 
 
+def clave_envio(form, enviado, datos=None):
+    """Clave de idempotencia del formulario `form` en este render.
+
+    Se llama después del botón de envío. En un envío retorna la clave vigente
+    si los datos son los mismos con que se usó (doble tap, rerun interrumpido:
+    el modelo retorna el resultado original) y una nueva si cambiaron. Un
+    render sin envío posterior a un envío confirmado (confirmar_envio) la
+    descarta, salvo el rerun que sigue al propio envío: el segundo tap de un
+    doble tap puede llegar después. Sin envío retorna None.
+    """
+    slot = f"_clave_envio_{form}"
+    actual = st.session_state.get(slot)
+    if not enviado:
+        if actual and actual['confirmada']:
+            if actual['rerun']:
+                actual['rerun'] = False
+            else:
+                del st.session_state[slot]
+        return None
+    huella = hashlib.sha256(json.dumps(datos, sort_keys=True, default=str).encode()).hexdigest()
+    if actual is None or actual['huella'] != huella:
+        actual = {'clave': uuid.uuid4().hex, 'huella': huella, 'confirmada': False, 'rerun': False}
+        st.session_state[slot] = actual
+    return actual['clave']
+
+
+def confirmar_envio(form):
+    """Tras un envío confirmado: la clave sigue valiendo para repeticiones
+    del mismo envío hasta el próximo render sin envío (clave_envio)."""
+    actual = st.session_state.get(f"_clave_envio_{form}")
+    if actual:
+        actual.update(confirmada=True, rerun=True)
+
+
 CATEGORIAS_GASTO = [
     'Arriendo',
     'Servicios (Agua, Luz, Gas)',
@@ -5,8 +5,23 @@ Conexión dual SQLite / PostgreSQL para ORVANN Retail OS. v1.6
 - Si no → SQLite local (data/orvann.db)
 - Tests siempre usan SQLite (pasan db_path explícito)
 """
+import functools
+import logging
 import os
+import queue
+import random
+import re
 import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future
+from contextlib import contextmanager
+from decimal import Decimal
+from functools import lru_cache
+from pathlib import Path
+
+from app.sentencias import Sentencia, compilar, ejecutar_pg, posicional_a_pg
 
 DB_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'orvann.db')
 DATABASE_URL = os.environ.get('DATABASE_URL', '')
@@ -14,41 +29,481 @@ DATABASE_URL = os.environ.get('DATABASE_URL', '')
 # Detectar si estamos usando PostgreSQL
 USE_POSTGRES = DATABASE_URL.startswith('postgres')
 
+logger = logging.getLogger(__name__)
+
+# Réplica de lectura (v1.7): query(..., analitica=True) va a DATABASE_REPLICA_URL
+# si está al día con la última escritura de este proceso; si no, a la primaria.
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL', '')
+REPLICA_LAG_MAX = 30    # s de atraso tolerado antes de volver a la primaria
+REPLICA_LAG_CACHE = 5   # s entre mediciones del atraso
+REPLICA_PAUSA = 30      # s sin intentar la réplica tras una falla de conexión
+
+# Clases de carga (v1.7). cupos: sentencias/transacciones simultáneas de la
+# clase en el proceso (su "pool"); timeout: segundos por sentencia
+# (statement_timeout en PostgreSQL, progress handler en SQLite); espera:
+# segundos máximos esperando cupo antes de CargaSaturada.
+ClaseCarga = namedtuple('ClaseCarga', ['cupos', 'timeout', 'espera'])
+CLASES_CARGA = {
+    'pos': ClaseCarga(cupos=8, timeout=5, espera=10),
+    'dashboard': ClaseCarga(cupos=4, timeout=15, espera=10),
+    # Al menos un cupo por socio (JP, KATHE, ANDRES): tres reportes a la vez
+    # en un servidor ocioso no deben saturar
+    'analytics': ClaseCarga(cupos=3, timeout=60, espera=10),
+}
+CLASES_ACTIVAS = os.environ.get('ORVANN_CLASES_CARGA', '1') == '1'
+
+_REPLICA_LOCK = threading.Lock()
+_replica = {'lag': 0.0, 'lsn': None, 'medido': float('-inf'), 'caida_hasta': 0.0}
+_ultima_lsn = None  # pg_current_wal_lsn() de la primaria tras el último commit del proceso
+
+# Reintentos ante errores transitorios (v1.7): backoff exponencial con jitter
+# hasta agotar el plazo. Ver clasificar_error() / reintentar().
+REINTENTO_BASE = 0.05   # segundos
+REINTENTO_MAX = 1.0     # segundos
+REINTENTO_PLAZO = float(os.environ.get('ORVANN_REINTENTO_PLAZO', '8'))  # segundos
+
+# Perfil SQLite (v1.7). 'rendimiento': WAL (lectores no bloquean al que
+# escribe ni al revés), pragmas de abajo, query() por una conexión de solo
+# lectura reutilizada por hilo y transacciones con BEGIN IMMEDIATE.
+# 'basico': comportamiento v1.6.
+SQLITE_PERFIL = os.environ.get('ORVANN_SQLITE_PERFIL', 'rendimiento')
+SQLITE_PRAGMAS = (
+    ('busy_timeout', 5000),             # ms esperando un lock antes de "database is locked"
+    ('synchronous', 'NORMAL'),          # seguro con WAL: fsync solo en checkpoint
+    ('cache_size', -16000),             # ~16 MB de páginas por conexión
+    ('temp_store', 'MEMORY'),
+    ('mmap_size', 128 * 1024 * 1024),
+)
+# Cada cuánto (segundos) una escritura corre PRAGMA optimize + checkpoint del WAL
+SQLITE_MANTENIMIENTO = 600
+# Conexiones de lectura que cada hilo mantiene abiertas (una por BD)
+LECTORES_POR_HILO = 4
+# Escritor único (v1.7): con ORVANN_SQLITE_ESCRITOR=1 las unidades de trabajo
+# de todas las sesiones pasan por un hilo que las agrupa en transacciones.
+SQLITE_ESCRITOR = os.environ.get('ORVANN_SQLITE_ESCRITOR', '') == '1'
+LOTE_ESCRITOR = 64
+
+_SQLITE_LOCK = threading.Lock()
+# db_path → conexión ancla (ver _asegurar_wal)
+_wal_listo = {}
+_ultimo_mantenimiento = {}
+_lectores = threading.local()
+# Años archivados (v1.7, scripts/particiones.py): db_path → ((año, ruta), ...)
+# y generación por db_path (cambia al archivar: los lectores se reabren)
+_archivos = {}
+_archivos_gen = {}
+TABLAS_ARCHIVO = ('ventas', 'gastos')
+
+# Contadores de sentencias (proceso completo). Útiles para medir cuántos
+# round trips hace cada página: get_query_stats() / reset_query_stats().
+_STATS_LOCK = threading.Lock()
+_STATS = {'query': 0, 'execute': 0, 'memo_hits': 0, 'lotes_escritor': 0, 'trabajos_escritor': 0,
+          'reintentos': 0, 'reintentos_agotados': 0, 'replica': 0, 'replica_descartada': 0}
+
+# Dinero en pesos enteros (v1.7): un Decimal que llegue a SQLite se guarda
+# como entero; en PostgreSQL SUM(bigint) vuelve como NUMERIC y se convierte
+# a int (ver _numeric_a_python), así ambos backends retornan el mismo tipo.
+sqlite3.register_adapter(Decimal, lambda d: int(d) if d == d.to_integral_value() else float(d))
+
+# Memo por rerun: cada sesión de Streamlit corre en su propio hilo, así que
+# el scope vive en un threading.local.
+_memo_local = threading.local()
+
+
+def _contar(clave, n=1):
+    with _STATS_LOCK:
+        _STATS[clave] = _STATS.get(clave, 0) + n
+
+
+def get_query_stats():
+    """Copia de los contadores: query, execute, memo_hits, lotes/trabajos_escritor,
+    reintentos, reintentos_agotados (y reintentos_<tipo> por clasificación),
+    replica / replica_descartada (lecturas analíticas servidas o no por la réplica)."""
+    with _STATS_LOCK:
+        return dict(_STATS)
+
+
+def reset_query_stats():
+    """Pone en cero los contadores."""
+    with _STATS_LOCK:
+        for k in _STATS:
+            _STATS[k] = 0
+
+
+@contextmanager
+def memo_scope():
+    """Memoiza query() idénticos dentro del bloque (un rerun de Streamlit).
+
+    Cualquier escritura (execute, execute_many, execute_raw o
+    invalidate_memo) vacía el memo, así una lectura posterior ve el cambio.
+    Los scopes anidados reutilizan el memo del scope externo.
+    """
+    if getattr(_memo_local, 'memo', None) is not None:
+        yield
+        return
+    _memo_local.memo = {}
+    try:
+        yield
+    finally:
+        _memo_local.memo = None
+
+
+def invalidate_memo():
+    """Vacía el memo del scope activo (si hay). Llamar tras escribir con conexión propia."""
+    memo = getattr(_memo_local, 'memo', None)
+    if memo:
+        memo.clear()
+
 
-def _get_pg_connection():
-    """Conexión a PostgreSQL usando psycopg2."""
+def _get_pg_connection(url=None):
+    """Conexión a PostgreSQL usando psycopg2 (la primaria si url es None).
+    Con una clase de carga activa, la sesión nace con su statement_timeout."""
     import psycopg2
     import psycopg2.extras
-    url = DATABASE_URL
+    url = url or DATABASE_URL
     # Railway usa postgres:// pero psycopg2 necesita postgresql://
     if url.startswith('postgres://'):
         url = url.replace('postgres://', 'postgresql://', 1)
-    conn = psycopg2.connect(url)
+    clase = _clase_actual()
+    opciones = {'options': f'-c statement_timeout={int(clase.timeout * 1000)}'} if clase else {}
+    conn = psycopg2.connect(url, **opciones)
+    psycopg2.extensions.register_type(_tipo_numeric(), conn)
     return conn
 
 
-def _get_sqlite_connection(db_path=None):
-    """Conexión a SQLite."""
+def _numeric_a_python(valor, cur):
+    """NUMERIC → int si es entero (sumas de pesos), float si no (promedios)."""
+    if valor is None:
+        return None
+    d = Decimal(valor)
+    return int(d) if d == d.to_integral_value() else float(d)
+
+
+def _tipo_numeric():
+    import psycopg2.extensions
+    return psycopg2.extensions.new_type((1700,), 'ORVANN_NUMERIC', _numeric_a_python)
+
+
+# ── Clases de carga ──────────────────────────────────────
+
+class CargaSaturada(RuntimeError):
+    """No hubo cupo para la clase de carga dentro de su espera."""
+
+
+_carga_local = threading.local()
+_CUPOS_LOCK = threading.Lock()
+_cupos = {}
+
+
+@contextmanager
+def clase_carga(nombre):
+    """Todo lo que corre en el bloque (en este hilo) usa la clase nombre:
+    'pos', 'dashboard' o 'analytics'. Si ya hay una clase activa, manda la
+    externa: la clase la define la entrada del flujo, no la función interna."""
+    if nombre not in CLASES_CARGA:
+        raise ValueError(f"Clase de carga desconocida: {nombre}")
+    if getattr(_carga_local, 'clase', None) is not None:
+        yield
+        return
+    _carga_local.clase = nombre
+    try:
+        yield
+    finally:
+        _carga_local.clase = None
+
+
+def carga(nombre):
+    """Decorador: la función corre en la clase de carga nombre."""
+    def decorador(fn):
+        @functools.wraps(fn)
+        def envuelta(*args, **kwargs):
+            with clase_carga(nombre):
+                return fn(*args, **kwargs)
+        return envuelta
+    return decorador
+
+
+def con_clase(fn):
+    """fn lista para otro hilo (ThreadPoolExecutor): corre con la clase de
+    carga activa en este hilo. Cada hilo ocupa su propio cupo."""
+    nombre = getattr(_carga_local, 'clase', None)
+    if nombre is None:
+        return fn
+
+    @functools.wraps(fn)
+    def envuelta(*args, **kwargs):
+        with clase_carga(nombre):
+            return fn(*args, **kwargs)
+    return envuelta
+
+
+def _clase_actual():
+    """ClaseCarga activa en este hilo, o None (sin clase: sin límites)."""
+    if not CLASES_ACTIVAS:
+        return None
+    nombre = getattr(_carga_local, 'clase', None)
+    return CLASES_CARGA.get(nombre) if nombre else None
+
+
+def _semaforo(nombre):
+    cupos = CLASES_CARGA[nombre].cupos
+    with _CUPOS_LOCK:
+        actual = _cupos.get(nombre)
+        if actual is None or actual[0] != cupos:
+            actual = _cupos[nombre] = (cupos, threading.BoundedSemaphore(cupos))
+        return actual[1]
+
+
+@contextmanager
+def _admision():
+    """Ocupa un cupo de la clase activa mientras dura la sentencia o
+    transacción. Reentrante por hilo: un query() dentro de transaction() no
+    pide otro cupo (evita bloquearse contra sí mismo)."""
+    nombre = getattr(_carga_local, 'clase', None)
+    if not CLASES_ACTIVAS or nombre is None or getattr(_carga_local, 'en_cupo', False):
+        yield
+        return
+    semaforo = _semaforo(nombre)
+    if not semaforo.acquire(timeout=CLASES_CARGA[nombre].espera):
+        _contar(f'saturada_{nombre}')
+        raise CargaSaturada(f"Hay demasiadas consultas '{nombre}' en curso; intenta en unos segundos")
+    _carga_local.en_cupo = True
+    try:
+        yield
+    finally:
+        _carga_local.en_cupo = False
+        semaforo.release()
+
+
+class _Plazo:
+    """Vencimiento por sentencia para el progress handler de SQLite."""
+
+    def __init__(self, segundos):
+        self.segundos = segundos
+        self.reiniciar()
+
+    def reiniciar(self):
+        self.limite = time.monotonic() + self.segundos
+
+    def vencido(self):
+        # Distinto de 0 → SQLite interrumpe la sentencia ("interrupted")
+        return 1 if time.monotonic() > self.limite else 0
+
+
+@contextmanager
+def _sin_plazo():
+    yield None
+
+
+@contextmanager
+def _plazo_sqlite(conn):
+    """Con clase activa, corta en SQLite las sentencias que pasen su timeout."""
+    clase = _clase_actual()
+    if clase is None:
+        yield None
+        return
+    plazo = _Plazo(clase.timeout)
+    conn.set_progress_handler(plazo.vencido, 10000)
+    try:
+        yield plazo
+    finally:
+        conn.set_progress_handler(None, 0)
+
+
+def _perfil_rendimiento():
+    return SQLITE_PERFIL == 'rendimiento'
+
+
+def _asegurar_wal(db_path):
+    """journal_mode=WAL queda guardado en el archivo: basta una vez por proceso.
+
+    La conexión que lo fija queda abierta (ancla, sin uso): al cerrarse la
+    última conexión SQLite hace checkpoint y borra -wal/-shm, y cada
+    conexión nueva los volvería a crear (~2x más caro abrir una sesión).
+    """
+    if db_path in _wal_listo:
+        return
+    with _SQLITE_LOCK:
+        if db_path in _wal_listo:
+            return
+        conn = sqlite3.connect(db_path, timeout=5, check_same_thread=False)
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+            # Una lectura abre el índice del WAL: recién ahí la conexión cuenta
+            conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        except Exception:
+            conn.close()
+            raise
+        _wal_listo[db_path] = conn
+        _ultimo_mantenimiento.setdefault(db_path, time.monotonic())
+
+
+def cerrar_sqlite(db_path=None):
+    """Suelta la conexión ancla y los lectores del hilo para db_path
+    (antes de borrar o reemplazar el archivo)."""
+    path = db_path or DB_PATH
+    with _SQLITE_LOCK:
+        ancla = _wal_listo.pop(path, None)
+        _ultimo_mantenimiento.pop(path, None)
+    if ancla is not None:
+        ancla.close()
+    cache = getattr(_lectores, 'conexiones', None) or {}
+    for clave in [c for c in cache if c[0] == path]:
+        cache.pop(clave).close()
+
+
+def ruta_archivo(anio, db_path=None):
+    """Archivo SQLite del año archivado: data/orvann.db → data/orvann_archivo_2024.db"""
+    base, _ = os.path.splitext(db_path or DB_PATH)
+    return f"{base}_archivo_{int(anio)}.db"
+
+
+def archivos_sqlite(db_path=None):
+    """((año, ruta), ...) de los años archivados junto a db_path (cacheado)."""
+    path = db_path or DB_PATH
+    res = _archivos.get(path)
+    if res is not None:
+        return res
+    base = os.path.basename(os.path.splitext(path)[0])
+    patron = re.compile(re.escape(base) + r'_archivo_(\d{4})\.db$')
+    directorio = os.path.dirname(os.path.abspath(path))
+    try:
+        nombres = os.listdir(directorio)
+    except OSError:
+        nombres = []
+    encontrados = []
+    for nombre in nombres:
+        m = patron.match(nombre)
+        if m:
+            encontrados.append((int(m.group(1)), os.path.join(directorio, nombre)))
+    res = _archivos[path] = tuple(sorted(encontrados))
+    return res
+
+
+def refrescar_archivos(db_path=None):
+    """Olvida los años archivados de db_path (después de archivar uno)."""
+    path = db_path or DB_PATH
+    with _SQLITE_LOCK:
+        _archivos.pop(path, None)
+        _archivos_gen[path] = _archivos_gen.get(path, 0) + 1
+
+
+def _adjuntar_archivos(conn, db_path, solo_lectura):
+    """ATTACH de cada año archivado como archivo_<año> y vistas TEMP
+    ventas_historico / gastos_historico (tabla viva UNION ALL archivos), que
+    tapan las vistas de la BD principal. Columnas agregadas después de
+    archivar salen NULL en el archivo. SQLite adjunta hasta 10 bases."""
+    archivos = archivos_sqlite(db_path)
+    if not archivos:
+        return
+    for anio, ruta in archivos:
+        destino = Path(ruta).resolve().as_uri() + '?mode=ro' if solo_lectura else ruta
+        conn.execute(f"ATTACH DATABASE ? AS archivo_{anio}", (destino,))
+    for tabla in TABLAS_ARCHIVO:
+        cols = [r[1] for r in conn.execute(f"PRAGMA main.table_info({tabla})")]
+        partes = [f"SELECT {', '.join(cols)} FROM main.{tabla}"]
+        for anio, _ in archivos:
+            hay = {r[1] for r in conn.execute(f"PRAGMA archivo_{anio}.table_info({tabla})")}
+            if hay:
+                select = ', '.join(c if c in hay else f"NULL AS {c}" for c in cols)
+                partes.append(f"SELECT {select} FROM archivo_{anio}.{tabla}")
+        conn.execute(f"CREATE TEMP VIEW {tabla}_historico AS " + " UNION ALL ".join(partes))
+
+
+def _get_sqlite_connection(db_path=None, solo_lectura=False):
+    """Conexión a SQLite con el perfil configurado (SQLITE_PERFIL)."""
     if db_path is None:
         db_path = DB_PATH
-    conn = sqlite3.connect(db_path)
+    if not _perfil_rendimiento():
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys = ON")
+        _adjuntar_archivos(conn, db_path, False)
+        return conn
+    _asegurar_wal(db_path)
+    if solo_lectura:
+        conn = sqlite3.connect(Path(db_path).resolve().as_uri() + '?mode=ro', uri=True, timeout=5)
+    else:
+        conn = sqlite3.connect(db_path, timeout=5)
     conn.row_factory = sqlite3.Row
+    for nombre, valor in SQLITE_PRAGMAS:
+        conn.execute(f"PRAGMA {nombre} = {valor}")
     conn.execute("PRAGMA foreign_keys = ON")
+    _adjuntar_archivos(conn, db_path, solo_lectura)
+    return conn
+
+
+def _conexion_lectura(db_path):
+    """Conexión de solo lectura reutilizada por el hilo (perfil rendimiento).
+
+    Abrir una conexión WAL con los pragmas cuesta más que la consulta típica,
+    y cache_size/mmap_size solo rinden si la conexión sobrevive. Sin
+    transacción abierta entre SELECTs, cada consulta ve lo último confirmado.
+    La clave incluye el inodo: si el archivo se reemplaza (restore) se reabre;
+    y la generación de archivos: al archivar un año se reabre con el ATTACH.
+    None si el archivo no existe.
+    """
+    path = db_path or DB_PATH
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    clave = (path, st.st_dev, st.st_ino, _archivos_gen.get(path, 0))
+    cache = getattr(_lectores, 'conexiones', None)
+    if cache is None:
+        cache = _lectores.conexiones = OrderedDict()
+    conn = cache.get(clave)
+    if conn is not None:
+        cache.move_to_end(clave)
+        return conn
+    conn = _get_sqlite_connection(path, solo_lectura=True)
+    cache[clave] = conn
+    while len(cache) > LECTORES_POR_HILO:
+        cache.popitem(last=False)[1].close()
     return conn
 
 
-def get_connection(db_path=None):
+def get_connection(db_path=None, solo_lectura=False):
     """Retorna conexión al backend activo.
 
     Si db_path es explícito → SQLite (tests).
     Si DATABASE_URL → PostgreSQL.
     Si no → SQLite local.
+    solo_lectura: en SQLite (perfil rendimiento) abre con mode=ro.
     """
     if db_path is not None:
-        return _get_sqlite_connection(db_path)
+        return _get_sqlite_connection(db_path, solo_lectura)
     if USE_POSTGRES:
         return _get_pg_connection()
-    return _get_sqlite_connection()
+    return _get_sqlite_connection(None, solo_lectura)
+
+
+def mantenimiento_sqlite(db_path=None, conn=None, truncar=False):
+    """PRAGMA optimize + checkpoint del WAL. Retorna (busy, páginas_wal, páginas_copiadas).
+
+    Las escrituras lo corren solas cada SQLITE_MANTENIMIENTO segundos
+    (checkpoint PASSIVE, no bloquea); truncar=True deja el -wal en cero.
+    """
+    propia = conn is None
+    if propia:
+        conn = _get_sqlite_connection(db_path)
+    try:
+        conn.execute("PRAGMA optimize")
+        modo = 'TRUNCATE' if truncar else 'PASSIVE'
+        resultado = tuple(conn.execute(f"PRAGMA wal_checkpoint({modo})").fetchone())
+    finally:
+        if propia:
+            conn.close()
+    _ultimo_mantenimiento[db_path or DB_PATH] = time.monotonic()
+    return resultado
+
+
+def _mantenimiento_si_toca(conn, db_path):
+    if not _perfil_rendimiento():
+        return
+    path = db_path or DB_PATH
+    if time.monotonic() - _ultimo_mantenimiento.get(path, 0) >= SQLITE_MANTENIMIENTO:
+        mantenimiento_sqlite(path, conn=conn)
 
 
 def _is_sqlite(db_path=None):
@@ -67,92 +522,574 @@ def _rows_to_dicts(cursor, is_sqlite_conn=True):
         return [dict(zip(columns, row)) for row in cursor.fetchall()]
 
 
+@lru_cache(maxsize=1024)
+def _sql_pg(sql):
+    return posicional_a_pg(sql)
+
+
 def adapt_sql(sql, db_path=None):
     """Adapta SQL de SQLite a PostgreSQL si es necesario.
 
-    SQLite usa ? como placeholder, PostgreSQL usa %s.
+    SQLite usa ? como placeholder, PostgreSQL usa %s. La traducción respeta
+    literales (un '?' dentro de un string no se toca), escapa '%' y queda
+    cacheada por texto.
+    Las sentencias calientes no pasan por aquí: ver app/sentencias.py.
     """
     if _is_sqlite(db_path):
         return sql
-    return sql.replace('?', '%s')
+    return _sql_pg(sql)
 
 
-def query(sql, params=(), db_path=None):
-    """Ejecuta un SELECT y retorna lista de dicts."""
-    conn = get_connection(db_path)
+def _run_sqlite(conn, sql, params):
+    if isinstance(sql, Sentencia):
+        return conn.execute(compilar(sql, 'sqlite').sql, params)
+    return conn.execute(sql, params)
+
+
+def _run_pg(cursor, sql, params):
+    if isinstance(sql, Sentencia):
+        ejecutar_pg(cursor, sql, params)
+    elif params:
+        cursor.execute(_sql_pg(sql), params)
+    else:
+        # Sin parámetros psycopg2 no interpola: el SQL va tal cual
+        cursor.execute(sql)
+
+
+def _clave_memo(sql, params, db_path):
+    if isinstance(sql, Sentencia):
+        return (sql.nombre, tuple(sorted(params.items())), db_path)
+    return (sql, tuple(params), db_path)
+
+
+# ── Reintentos ───────────────────────────────────────────
+
+# SQLSTATE de PostgreSQL con rollback garantizado: serialización, deadlock,
+# lock no disponible (NOWAIT / lock_timeout)
+_PG_BLOQUEO = ('40001', '40P01', '55P03')
+
+
+def clasificar_error(exc):
+    """Tipo de error transitorio, o None si no vale la pena reintentar.
+
+    'bloqueo':  lock/serialización; la sentencia no se aplicó (rollback),
+                siempre se puede reintentar.
+    'conexion': se cayó la conexión; pudo aplicarse o no, solo se reintenta
+                lo idempotente.
+    """
+    if isinstance(exc, sqlite3.OperationalError):
+        texto = str(exc).lower()
+        return 'bloqueo' if 'locked' in texto or 'busy' in texto else None
+    try:
+        import psycopg2
+        import psycopg2.extensions
+    except ImportError:
+        return None
+    if isinstance(exc, psycopg2.extensions.TransactionRollbackError) or \
+            getattr(exc, 'pgcode', None) in _PG_BLOQUEO:
+        return 'bloqueo'
+    if isinstance(exc, psycopg2.extensions.QueryCanceledError):
+        return None  # statement_timeout: reintentar repetiría la misma consulta lenta
+    if isinstance(exc, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+        return 'conexion'
+    return None
+
+
+def _espera(intento):
+    """Backoff exponencial con jitter, acotado a REINTENTO_MAX."""
+    return min(REINTENTO_BASE * (2 ** intento), REINTENTO_MAX) * random.uniform(0.5, 1.0)
+
+
+def reintentar(fn, idempotente=False, plazo=None):
+    """Llama fn() y la repite ante errores transitorios hasta el plazo (segundos).
+
+    'bloqueo' siempre se reintenta; 'conexion' solo si idempotente (lecturas,
+    unidades de trabajo con clave de idempotencia). Lo demás se propaga.
+    """
+    limite = time.monotonic() + (REINTENTO_PLAZO if plazo is None else plazo)
+    intento = 0
+    while True:
+        try:
+            return fn()
+        except Exception as exc:
+            tipo = clasificar_error(exc)
+            if tipo is None or (tipo == 'conexion' and not idempotente):
+                raise
+            espera = _espera(intento)
+            if time.monotonic() + espera > limite:
+                _contar('reintentos_agotados')
+                raise
+            intento += 1
+            _contar('reintentos')
+            _contar(f'reintentos_{tipo}')
+            logger.warning("Reintento %d tras error transitorio (%s): %s", intento, tipo, exc)
+            time.sleep(espera)
+
+
+# ── Réplica de lectura ───────────────────────────────────
+
+# Estado de la réplica: atraso en segundos (0 si ya aplicó todo lo recibido;
+# una primaria sin tráfico no cuenta como atraso) y LSN aplicada, en bytes.
+# En una BD que no es réplica las LSN y replay_timestamp son NULL: (0, NULL).
+_SQL_ESTADO_REPLICA = """
+    SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+           END,
+           pg_last_wal_replay_lsn() - '0/0'::pg_lsn
+"""
+_SQL_LSN_PRIMARIA = "SELECT pg_current_wal_lsn() - '0/0'::pg_lsn"
+
+
+def _marcar_escritura(conn, db_path=None):
+    """Tras un commit en la primaria guarda su posición del WAL (guardia de
+    lectura-después-de-escritura). Solo si hay réplica: es un viaje más.
+    Nunca falla: el commit ya ocurrió. Sin la LSN, las lecturas van a la
+    primaria durante REPLICA_PAUSA."""
+    global _ultima_lsn
+    if _is_sqlite(db_path) or not DATABASE_REPLICA_URL:
+        return
+    try:
+        cursor = conn.cursor()
+        cursor.execute(_SQL_LSN_PRIMARIA)
+        lsn = int(cursor.fetchone()[0])
+        conn.rollback()
+    except Exception as exc:
+        logger.warning("Sin LSN tras la escritura, se lee de la primaria por %ds: %s", REPLICA_PAUSA, exc)
+        with _REPLICA_LOCK:
+            _replica['caida_hasta'] = time.monotonic() + REPLICA_PAUSA
+        return
+    with _REPLICA_LOCK:
+        if _ultima_lsn is None or lsn > _ultima_lsn:
+            _ultima_lsn = lsn
+
+
+def _replica_al_dia(lag, lsn_replica, ultima_lsn):
+    """True si la réplica está dentro de REPLICA_LAG_MAX y ya aplicó la última
+    escritura del proceso (LSN aplicada >= LSN de la primaria tras el commit).
+    lsn_replica None: la BD no es réplica (no aplica WAL de otra), sirve tal cual."""
+    if lag > REPLICA_LAG_MAX:
+        return False
+    return ultima_lsn is None or lsn_replica is None or lsn_replica >= ultima_lsn
+
+
+def _leer_replica(sql, params):
+    """Filas desde la réplica, o None si no sirve (caída, atrasada o sin la
+    última escritura): el llamador lee de la primaria."""
+    if time.monotonic() < _replica['caida_hasta']:
+        _contar('replica_descartada')
+        return None
+    try:
+        conn = _get_pg_connection(DATABASE_REPLICA_URL)
+    except Exception as exc:
+        if clasificar_error(exc) is None:
+            raise
+        _replica_caida(exc)
+        return None
+    try:
+        cursor = conn.cursor()
+        with _REPLICA_LOCK:
+            lag, lsn, medido = _replica['lag'], _replica['lsn'], _replica['medido']
+            ultima = _ultima_lsn
+        # La LSN aplicada solo avanza: una medición que ya cubre la última
+        # escritura sigue valiendo hasta que vence el cache del atraso
+        if time.monotonic() - medido >= REPLICA_LAG_CACHE or not _replica_al_dia(lag, lsn, ultima):
+            medido = time.monotonic()
+            cursor.execute(_SQL_ESTADO_REPLICA)
+            lag, lsn = cursor.fetchone()
+            lag, lsn = float(lag), None if lsn is None else int(lsn)
+            with _REPLICA_LOCK:
+                _replica['lag'], _replica['lsn'], _replica['medido'] = lag, lsn, medido
+        if not _replica_al_dia(lag, lsn, ultima):
+            _contar('replica_descartada')
+            return None
+        _contar('query')
+        _run_pg(cursor, sql, params)
+        _contar('replica')
+        return _rows_to_dicts(cursor, False)
+    except Exception as exc:
+        if clasificar_error(exc) is None:
+            raise
+        _replica_caida(exc)
+        return None
+    finally:
+        conn.close()
+
+
+def _replica_caida(exc):
+    _contar('replica_descartada')
+    logger.warning("Réplica no disponible, se lee de la primaria por %ds: %s", REPLICA_PAUSA, exc)
+    with _REPLICA_LOCK:
+        _replica['caida_hasta'] = time.monotonic() + REPLICA_PAUSA
+
+
+def query(sql, params=(), db_path=None, analitica=False):
+    """Ejecuta un SELECT y retorna lista de dicts. sql puede ser SQL con '?' y
+    params en tupla, o una Sentencia registrada con params en dict.
+    Dentro de memo_scope() las llamadas idénticas no vuelven a la BD.
+    analitica=True (rangos largos, auditoría): se sirve desde la réplica si
+    hay DATABASE_REPLICA_URL y está al día; si no, desde la primaria."""
+    memo = getattr(_memo_local, 'memo', None)
+    key = None
+    if memo is not None:
+        key = _clave_memo(sql, params, db_path)
+        if key in memo:
+            _contar('memo_hits')
+            return [dict(r) for r in memo[key]]
+
+    with _admision():
+        rows = None
+        if analitica and DATABASE_REPLICA_URL and not _is_sqlite(db_path):
+            rows = _leer_replica(sql, params)
+        if rows is None:
+            rows = reintentar(lambda: _leer(sql, params, db_path), idempotente=True)
+
+    if key is not None:
+        memo[key] = rows
+        return [dict(r) for r in rows]
+    return rows
+
+
+def _leer(sql, params, db_path):
+    _contar('query')
     is_sqlite = _is_sqlite(db_path)
+    lector = _conexion_lectura(db_path) if is_sqlite and _perfil_rendimiento() else None
+    conn = lector or get_connection(db_path)
     try:
-        adapted = adapt_sql(sql, db_path)
         if is_sqlite:
-            cursor = conn.execute(adapted, params)
-            return _rows_to_dicts(cursor, True)
-        else:
-            cursor = conn.cursor()
-            cursor.execute(adapted, params)
-            return _rows_to_dicts(cursor, False)
+            with _plazo_sqlite(conn):
+                return _rows_to_dicts(_run_sqlite(conn, sql, params), True)
+        cursor = conn.cursor()
+        _run_pg(cursor, sql, params)
+        return _rows_to_dicts(cursor, False)
     finally:
-        conn.close()
+        if lector is None:
+            conn.close()
 
 
 def execute(sql, params=(), db_path=None):
-    """Ejecuta INSERT/UPDATE/DELETE y retorna lastrowid.
-    PostgreSQL: agrega RETURNING id solo si la tabla tiene columna id."""
+    """Ejecuta INSERT/UPDATE/DELETE.
+    SQL ad-hoc: retorna lastrowid (PostgreSQL: RETURNING id si la tabla tiene id).
+    Sentencia: retorna la columna declarada en retorna, o rowcount.
+    Se reintenta ante locks; una conexión caída se propaga (pudo aplicarse)."""
+    invalidate_memo()
+    with _admision():
+        return reintentar(lambda: _escribir(sql, params, db_path))
+
+
+def _escribir(sql, params, db_path):
+    _contar('execute')
     conn = get_connection(db_path)
     is_sqlite = _is_sqlite(db_path)
     try:
-        adapted = adapt_sql(sql, db_path)
         if is_sqlite:
-            cursor = conn.execute(adapted, params)
+            with _plazo_sqlite(conn):
+                result = _sqlite_execute(conn, sql, params)
             conn.commit()
-            return cursor.lastrowid
+            _mantenimiento_si_toca(conn, db_path)
         else:
-            cursor = conn.cursor()
-            # Para INSERT en PostgreSQL, agregar RETURNING id solo si es seguro
-            if adapted.strip().upper().startswith('INSERT') and 'RETURNING' not in adapted.upper():
-                # Tablas sin columna 'id' (ej: caja_diaria, productos)
-                # No agregar RETURNING id para estas
-                _NO_ID_TABLES = ('caja_diaria', 'productos')
-                has_id = not any(t in adapted.lower() for t in _NO_ID_TABLES)
-                if has_id:
-                    adapted = adapted.rstrip().rstrip(';') + ' RETURNING id'
-                    cursor.execute(adapted, params)
-                    result = cursor.fetchone()
-                    conn.commit()
-                    return result[0] if result else None
-                else:
-                    cursor.execute(adapted, params)
-                    conn.commit()
-                    return cursor.rowcount
-            else:
-                cursor.execute(adapted, params)
-                conn.commit()
-                if cursor.description:
-                    result = cursor.fetchone()
-                    return result[0] if result else None
-                return cursor.rowcount
+            result = _pg_execute(conn.cursor(), sql, params)
+            conn.commit()
+            _marcar_escritura(conn, db_path)
+        return result
     finally:
         conn.close()
 
 
+def _sqlite_execute(conn, sql, params):
+    cursor = _run_sqlite(conn, sql, params)
+    if isinstance(sql, Sentencia) and not sql.retorna:
+        return cursor.rowcount
+    return cursor.lastrowid
+
+
+# Solo SQL ad-hoc (scripts, consultas sueltas): las escrituras de app/models
+# son Sentencias con retorna explícito. Tablas sin columna 'id': no se les
+# agrega RETURNING id en PostgreSQL.
+_NO_ID_TABLES = ('caja_diaria', 'productos', 'idempotencia', 'snapshots_stock', 'cierres_mes')
+_INSERT_INTO = re.compile(r'^\s*INSERT\s+INTO\s+(\w+)', re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def _con_returning_id(sql):
+    """SQL ad-hoc con RETURNING id si es un INSERT a una tabla con id, o None."""
+    m = _INSERT_INTO.match(sql)
+    if not m or m.group(1).lower() in _NO_ID_TABLES or 'RETURNING' in sql.upper():
+        return None
+    return sql.rstrip().rstrip(';') + ' RETURNING id'
+
+
+def _pg_execute(cursor, sql, params):
+    """Ejecuta en PostgreSQL y retorna el id insertado (o rowcount / primer valor)."""
+    if isinstance(sql, Sentencia):
+        ejecutar_pg(cursor, sql, params)
+        if sql.retorna:
+            result = cursor.fetchone()
+            return result[0] if result else None
+        return cursor.rowcount
+    con_id = _con_returning_id(sql)
+    if con_id is not None:
+        _run_pg(cursor, con_id, params)
+        result = cursor.fetchone()
+        return result[0] if result else None
+    _run_pg(cursor, sql, params)
+    if cursor.description:
+        result = cursor.fetchone()
+        return result[0] if result else None
+    return cursor.rowcount
+
+
+class Transaccion:
+    """Conexión abierta dentro de transaction(): query/execute sin commit propio."""
+
+    def __init__(self, conn, db_path=None, plazo=None):
+        self.conn = conn
+        self.db_path = db_path
+        self.is_sqlite = _is_sqlite(db_path)
+        self._cursor = None if self.is_sqlite else conn.cursor()
+        self._plazo = plazo  # SQLite: el timeout de la clase corre por sentencia
+
+    def query(self, sql, params=()):
+        _contar('query')
+        if self._plazo is not None:
+            self._plazo.reiniciar()
+        if self.is_sqlite:
+            return _rows_to_dicts(_run_sqlite(self.conn, sql, params), True)
+        _run_pg(self._cursor, sql, params)
+        return _rows_to_dicts(self._cursor, False)
+
+    def execute(self, sql, params=()):
+        """Igual que execute(): lastrowid / RETURNING para SQL ad-hoc, retorna o
+        rowcount para una Sentencia."""
+        _contar('execute')
+        if self._plazo is not None:
+            self._plazo.reiniciar()
+        if self.is_sqlite:
+            return _sqlite_execute(self.conn, sql, params)
+        return _pg_execute(self._cursor, sql, params)
+
+
+@contextmanager
+def transaction(db_path=None):
+    """Agrupa varias escrituras en una sola transacción.
+
+        with transaction(db_path) as tx:
+            tx.execute(...)
+            tx.query(...)
+
+    Commit al salir del bloque; rollback si hay excepción.
+    Con clase de carga activa ocupa un cupo durante todo el bloque.
+    """
+    invalidate_memo()
+    with _admision():
+        conn = get_connection(db_path)
+        is_sqlite = _is_sqlite(db_path)
+        plazo = _plazo_sqlite(conn) if is_sqlite else _sin_plazo()
+        try:
+            with plazo as p:
+                if is_sqlite and _perfil_rendimiento():
+                    # Toma el lock de escritura al inicio: leer-y-luego-escribir en WAL
+                    # con BEGIN diferido falla con SQLITE_BUSY si otro escribió entre medio
+                    conn.execute("BEGIN IMMEDIATE")
+                yield Transaccion(conn, db_path, p)
+            conn.commit()
+            if is_sqlite:
+                _mantenimiento_si_toca(conn, db_path)
+            else:
+                _marcar_escritura(conn, db_path)
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+            invalidate_memo()
+
+
+# ── Escritor único SQLite ────────────────────────────────
+
+class EscritorSQLite:
+    """Hilo dueño de las escrituras SQLite: toma de la cola todo lo que haya
+    (hasta LOTE_ESCRITOR trabajos) y lo confirma en una sola transacción.
+
+    Cada trabajo corre en su SAVEPOINT: si falla (ej. stock insuficiente)
+    solo se deshace el suyo y su future recibe la excepción. Los futures se
+    resuelven después del COMMIT, así nadie ve como hecho algo no confirmado.
+    Un solo escritor: no hay "database is locked" entre sesiones y se paga
+    un commit por lote en vez de uno por venta.
+    """
+
+    def __init__(self):
+        self._cola = queue.Queue()
+        self._conexiones = {}
+        self._hilo = threading.Thread(target=self._loop, name='orvann-escritor', daemon=True)
+        self._hilo.start()
+
+    def enviar(self, fn, db_path=None):
+        """Encola fn(tx) para db_path y retorna un Future con su resultado."""
+        if threading.current_thread() is self._hilo:
+            raise RuntimeError("Unidad de trabajo anidada dentro del escritor")
+        futuro = Future()
+        self._cola.put((fn, db_path or DB_PATH, futuro))
+        return futuro
+
+    def detener(self):
+        self._cola.put(None)
+        self._hilo.join()
+
+    def vivo(self):
+        return self._hilo.is_alive()
+
+    def _loop(self):
+        while True:
+            trabajo = self._cola.get()
+            if trabajo is None:
+                break
+            lote = [trabajo]
+            while len(lote) < LOTE_ESCRITOR:
+                try:
+                    trabajo = self._cola.get_nowait()
+                except queue.Empty:
+                    break
+                if trabajo is None:
+                    self._cola.put(None)
+                    break
+                lote.append(trabajo)
+            por_bd = {}
+            for fn, path, futuro in lote:
+                por_bd.setdefault(path, []).append((fn, futuro))
+            for path, trabajos in por_bd.items():
+                self._confirmar(path, trabajos)
+        for conn in self._conexiones.values():
+            conn.close()
+
+    def _conexion(self, path):
+        conn = self._conexiones.get(path)
+        if conn is None:
+            conn = _get_sqlite_connection(path)
+            conn.isolation_level = None  # BEGIN/SAVEPOINT/COMMIT explícitos
+            self._conexiones[path] = conn
+        return conn
+
+    def _confirmar(self, path, trabajos):
+        resultados = []
+        try:
+            conn = self._conexion(path)
+            conn.execute("BEGIN IMMEDIATE")
+        except Exception as exc:
+            self._conexiones.pop(path, None)
+            for _, futuro in trabajos:
+                futuro.set_exception(exc)
+            return
+        tx = Transaccion(conn, path)
+        try:
+            for fn, futuro in trabajos:
+                conn.execute("SAVEPOINT trabajo")
+                try:
+                    resultados.append((futuro, True, fn(tx)))
+                    conn.execute("RELEASE trabajo")
+                except Exception as exc:
+                    conn.execute("ROLLBACK TO trabajo")
+                    conn.execute("RELEASE trabajo")
+                    resultados.append((futuro, False, exc))
+            conn.execute("COMMIT")
+        except Exception as exc:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            hechos = {id(f) for f, _, _ in resultados}
+            for futuro, ok, valor in resultados:
+                futuro.set_exception(exc if ok else valor)
+            for _, futuro in trabajos:
+                if id(futuro) not in hechos:
+                    futuro.set_exception(exc)
+            return
+        _contar('lotes_escritor')
+        _contar('trabajos_escritor', len(trabajos))
+        for futuro, ok, valor in resultados:
+            if ok:
+                futuro.set_result(valor)
+            else:
+                futuro.set_exception(valor)
+        try:
+            _mantenimiento_si_toca(conn, path)
+        except Exception:
+            pass
+
+
+_escritor = None
+_escritor_lock = threading.Lock()
+
+
+def escritor():
+    """El EscritorSQLite del proceso (se arranca la primera vez)."""
+    global _escritor
+    with _escritor_lock:
+        if _escritor is None or not _escritor.vivo():
+            _escritor = EscritorSQLite()
+        return _escritor
+
+
+def detener_escritor():
+    """Vacía la cola y termina el hilo escritor (tests, apagado)."""
+    global _escritor
+    with _escritor_lock:
+        actual, _escritor = _escritor, None
+    if actual is not None:
+        actual.detener()
+
+
+def unidad_de_trabajo(fn, db_path=None, idempotente=False):
+    """Ejecuta fn(tx) de forma atómica y retorna su resultado.
+
+    Con SQLITE_ESCRITOR (y backend SQLite) pasa por el escritor único y
+    espera su future; si no, es un transaction() normal en este hilo.
+    Ante un error transitorio se repite la unidad completa (fn puede correr
+    más de una vez); idempotente=True permite reintentar tras una conexión caída.
+    """
+    if not (SQLITE_ESCRITOR and _is_sqlite(db_path)):
+        def intento():
+            with transaction(db_path) as tx:
+                return fn(tx)
+        return reintentar(intento, idempotente)
+    invalidate_memo()
+    try:
+        return reintentar(lambda: escritor().enviar(fn, db_path).result(), idempotente)
+    finally:
+        invalidate_memo()
+
+
+def es_error_integridad(exc):
+    """True si exc es una violación de constraint (UNIQUE, CHECK, FK) en cualquier backend."""
+    if isinstance(exc, sqlite3.IntegrityError):
+        return True
+    try:
+        import psycopg2
+    except ImportError:
+        return False
+    return isinstance(exc, psycopg2.IntegrityError)
+
+
 def execute_many(sql, params_list, db_path=None):
     """Ejecuta múltiples INSERT/UPDATE/DELETE."""
+    _contar('execute')
+    invalidate_memo()
     conn = get_connection(db_path)
     is_sqlite = _is_sqlite(db_path)
     try:
-        adapted = adapt_sql(sql, db_path)
         if is_sqlite:
-            conn.executemany(adapted, params_list)
+            conn.executemany(sql, params_list)
         else:
             cursor = conn.cursor()
             for params in params_list:
-                cursor.execute(adapted, params)
+                _run_pg(cursor, sql, params)
         conn.commit()
+        _marcar_escritura(conn, db_path)
     finally:
         conn.close()
 
 
 def execute_raw(sql, params=(), db_path=None):
     """Ejecuta SQL sin adaptar placeholders (para DDL específico del backend)."""
+    _contar('execute')
+    invalidate_memo()
     conn = get_connection(db_path)
     is_sqlite = _is_sqlite(db_path)
     try:
@@ -162,6 +1099,7 @@ def execute_raw(sql, params=(), db_path=None):
             cursor = conn.cursor()
             cursor.execute(sql, params)
         conn.commit()
+        _marcar_escritura(conn, db_path)
     finally:
         conn.close()
 
@@ -7,6 +7,8 @@ import sys
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 from app.components.styles import apply_theme
+from app.database import memo_scope
+from app import outbox
 
 # Logo ORVANN como page icon (favicon)
 _LOGO_PATH = os.path.join(os.path.dirname(__file__), '..', 'ORVANN.png')
@@ -21,6 +23,9 @@ st.set_page_config(
 
 apply_theme()
 
+# Outbox del POS (solo si ORVANN_OUTBOX está definida): worker de sincronización
+outbox.asegurar_worker()
+
 # ── Navegación con session_state (TAREA 1 — fix nav bug) ──
 PAGES = {
     "vender": {"label": "🛒 Vender", "module": "app.pages.vender"},
@@ -78,20 +83,22 @@ for i, (key, info) in enumerate(PAGES.items()):
         )
 
 # ── Cargar la página seleccionada ──
+# memo_scope: lecturas idénticas dentro de este rerun van una sola vez a la BD
 page_key = st.session_state.current_page
 
-if page_key == "vender":
-    from app.pages.vender import render
-    render()
-elif page_key == "dashboard":
-    from app.pages.dashboard import render
-    render()
-elif page_key == "inventario":
-    from app.pages.inventario import render
-    render()
-elif page_key == "historial":
-    from app.pages.historial import render
-    render()
-elif page_key == "admin":
-    from app.pages.admin import render
-    render()
+with memo_scope():
+    if page_key == "vender":
+        from app.pages.vender import render
+        render()
+    elif page_key == "dashboard":
+        from app.pages.dashboard import render
+        render()
+    elif page_key == "inventario":
+        from app.pages.inventario import render
+        render()
+    elif page_key == "historial":
+        from app.pages.historial import render
+        render()
+    elif page_key == "admin":
+        from app.pages.admin import render
+        render()
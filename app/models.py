@@ -1,106 +1,283 @@
 """Logica de negocio de ORVANN Retail OS. v1.6"""
+import hashlib
+import json
+import re
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime, timedelta
-from app.database import query, execute, get_connection, adapt_sql, _is_sqlite
+from decimal import Decimal, ROUND_HALF_UP
+from app.database import (query, execute, _is_sqlite, transaction, unidad_de_trabajo,
+                          es_error_integridad, carga, con_clase, _clase_actual)
+from app.sentencias import sentencia
+from app import archivo, catalog
 
 SOCIOS = ['JP', 'KATHE', 'ANDRES']
 
 
+# ── Sentencias calientes ─────────────────────────────────
+# Camino del POS (venta, stock, kardex, consultas del día). Se compilan una
+# vez por backend: ver app/sentencias.py.
+
+_S_IDEMPOTENCIA_LEER = sentencia('idempotencia_leer', """
+    SELECT operacion, resultado, huella FROM idempotencia WHERE clave = :clave
+""")
+_S_IDEMPOTENCIA_GUARDAR = sentencia('idempotencia_guardar', """
+    INSERT INTO idempotencia (clave, operacion, resultado, huella)
+    VALUES (:clave, :operacion, :resultado, :huella)
+""")
+_S_PRODUCTO_PARA_VENTA = sentencia('producto_para_venta', """
+    SELECT stock, nombre, costo FROM productos WHERE sku = :sku
+""")
+_S_VENTA_INSERTAR = sentencia('venta_insertar', """
+    INSERT INTO ventas (fecha, hora, sku, cantidad, precio_unitario, descuento_pct, total, metodo_pago,
+                        cliente, vendedor, notas, costo_unitario, producto_nombre)
+    VALUES (:fecha, :hora, :sku, :cantidad, :precio, :descuento, :total, :metodo_pago,
+            :cliente, :vendedor, :notas, :costo, :nombre)
+""", retorna='id')
+_S_CREDITO_INSERTAR = sentencia('credito_insertar', """
+    INSERT INTO creditos_clientes (venta_id, cliente, monto, fecha_credito, pagado, notas, cliente_id)
+    VALUES (:venta_id, :cliente, :monto, :fecha, 0, :notas, :cliente_id)
+""", retorna='id')
+_S_CLIENTE_CREAR = sentencia('cliente_crear', """
+    INSERT INTO clientes (nombre, nombre_normalizado) VALUES (:nombre, :clave)
+    ON CONFLICT (nombre_normalizado) DO NOTHING
+""")
+_S_CLIENTE_POR_NOMBRE = sentencia('cliente_por_nombre', """
+    SELECT id FROM clientes WHERE nombre_normalizado = :clave
+""")
+_S_CLIENTE_SALDO = sentencia('cliente_saldo', """
+    UPDATE clientes SET saldo = saldo + :monto, creditos_abiertos = creditos_abiertos + :creditos
+    WHERE id = :id
+""")
+_S_ABONO_INSERTAR = sentencia('abono_insertar', """
+    INSERT INTO abonos (credito_id, cliente_id, fecha, monto, notas)
+    VALUES (:credito_id, :cliente_id, :fecha, :monto, :notas)
+""", retorna='id')
+_S_STOCK_SUMAR = sentencia('stock_sumar', """
+    UPDATE productos SET stock = stock + :cantidad WHERE sku = :sku
+""")
+_S_MOVIMIENTO_INSERTAR = sentencia('movimiento_insertar', """
+    INSERT INTO movimientos_inventario (fecha, sku, tipo, cantidad, referencia)
+    VALUES (:fecha, :sku, :tipo, :cantidad, :referencia)
+""", retorna='id')
+_S_VENTAS_DIA = sentencia('ventas_dia', """
+    SELECT * FROM ventas WHERE fecha = :fecha ORDER BY hora DESC
+""")
+_S_CAJA_DIA = sentencia('caja_dia', """
+    SELECT * FROM caja_diaria WHERE fecha = :fecha
+""")
+
+# Acumulados de caja_diaria: columna por método de pago + gastos en efectivo.
+# Cada escritura de ventas/gastos suma (o resta) su monto en la misma
+# transacción; la fila del día se crea si no existe (abierta=0).
+COLUMNAS_CAJA = {
+    'Efectivo': 'ventas_efectivo',
+    'Transferencia': 'ventas_transferencia',
+    'Datáfono': 'ventas_datafono',
+    'Crédito': 'ventas_credito',
+}
+_S_CAJA_SUMAR = {
+    col: sentencia(f'caja_sumar_{col}', f"""
+        INSERT INTO caja_diaria (fecha, {col}) VALUES (:fecha, :monto)
+        ON CONFLICT (fecha) DO UPDATE SET {col} = caja_diaria.{col} + excluded.{col}
+    """)
+    for col in (*COLUMNAS_CAJA.values(), 'gastos_efectivo')
+}
+_S_CAJA_ABRIR = sentencia('caja_abrir', """
+    INSERT INTO caja_diaria (fecha, efectivo_inicio, cerrada, abierta)
+    VALUES (:fecha, :efectivo_inicio, 0, 1)
+    ON CONFLICT (fecha) DO UPDATE SET efectivo_inicio = excluded.efectivo_inicio, abierta = 1
+""")
+_S_CAJA_CERRAR = sentencia('caja_cerrar', """
+    INSERT INTO caja_diaria (fecha, efectivo_cierre_real, cerrada, notas, abierta)
+    VALUES (:fecha, :efectivo_real, 1, :notas, 1)
+    ON CONFLICT (fecha) DO UPDATE SET efectivo_cierre_real = excluded.efectivo_cierre_real,
+        cerrada = 1, notas = excluded.notas, abierta = 1
+""")
+
+# Demás INSERT de models: también declaran qué retornan (retorna='id' o
+# rowcount), así execute() no deduce RETURNING id del nombre de la tabla.
+_S_GASTO_INSERTAR = sentencia('gasto_insertar', """
+    INSERT INTO gastos (fecha, categoria, monto, descripcion, metodo_pago, pagado_por, es_inversion, notas)
+    VALUES (:fecha, :categoria, :monto, :descripcion, :metodo_pago, :pagado_por, :es_inversion, :notas)
+""", retorna='id')
+_S_SNAPSHOT_INSERTAR = sentencia('snapshot_insertar', """
+    INSERT INTO snapshots_stock (fecha, sku, stock, ultimo_movimiento_id)
+    VALUES (:fecha, :sku, :stock, :tope)
+""")
+_S_PAGO_SOCIO_INSERTAR = sentencia('pago_socio_insertar', """
+    INSERT INTO pagos_socios (fecha, de_socio, a_socio, monto, notas)
+    VALUES (:fecha, :de_socio, :a_socio, :monto, :notas)
+""", retorna='id')
+_S_PRODUCTO_INSERTAR = sentencia('producto_insertar', """
+    INSERT INTO productos (sku, nombre, categoria, talla, color, costo, precio_venta, stock, stock_minimo,
+                           proveedor, notas, codigo_barras)
+    VALUES (:sku, :nombre, :categoria, :talla, :color, :costo, :precio_venta, :stock, :stock_minimo,
+            :proveedor, :notas, :codigo_barras)
+""")
+_S_COSTO_FIJO_INSERTAR = sentencia('costo_fijo_insertar', """
+    INSERT INTO costos_fijos (concepto, monto_mensual, activo, notas)
+    VALUES (:concepto, :monto_mensual, :activo, :notas)
+""", retorna='id')
+_S_PEDIDO_INSERTAR = sentencia('pedido_insertar', """
+    INSERT INTO pedidos_proveedores (fecha_pedido, proveedor, descripcion, unidades, costo_unitario, total,
+                                     estado, pagado_por, fecha_entrega_est, notas)
+    VALUES (:fecha_pedido, :proveedor, :descripcion, :unidades, :costo_unitario, :total,
+            'Pendiente', :pagado_por, :fecha_entrega_est, :notas)
+""", retorna='id')
+
+
+# ── Dinero ───────────────────────────────────────────────
+
+def _pesos(valor):
+    """Redondea un monto a pesos enteros (mitades hacia arriba). None se conserva.
+    Toda escritura de dinero pasa por aquí: las columnas son INTEGER/BIGINT."""
+    if valor is None:
+        return None
+    return int(Decimal(str(valor)).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+# ── Idempotencia ─────────────────────────────────────────
+
+_SIN_RESULTADO = object()
+
+
+def _huella(operacion, datos):
+    """sha256 de los argumentos de la escritura: una clave vale para un solo payload."""
+    return hashlib.sha256(json.dumps([operacion, datos], sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _resultado_previo(clave, operacion, huella=None, db_path=None):
+    """Resultado guardado bajo la clave (búsqueda por PK) o _SIN_RESULTADO.
+    ValueError si la clave se usó para otra operación u otros datos (las filas
+    anteriores a la huella no se comparan)."""
+    rows = query(_S_IDEMPOTENCIA_LEER, {'clave': clave}, db_path=db_path)
+    if not rows:
+        return _SIN_RESULTADO
+    if rows[0]['operacion'] != operacion:
+        raise ValueError(f"La clave {clave} ya se usó para {rows[0]['operacion']}")
+    if rows[0]['huella'] is not None and huella is not None and rows[0]['huella'] != huella:
+        raise ValueError(f"La clave {clave} ya se usó con otros datos de {operacion}")
+    return json.loads(rows[0]['resultado']) if rows[0]['resultado'] is not None else None
+
+
+def _idempotente(clave, operacion, escribir, db_path=None, datos=None):
+    """Ejecuta escribir(tx) en una transacción y guarda su resultado bajo clave.
+    Pasa por unidad_de_trabajo(): con el escritor único activo se agrupa.
+
+    Sin clave se comporta como una transacción normal. Con clave, un
+    reintento retorna el resultado original sin volver a escribir; si dos
+    sesiones compiten, la PK de idempotencia deja pasar solo una. datos son
+    los argumentos de la escritura: la misma clave con otros datos es un
+    error, no el resultado de otra venta.
+    """
+    huella = _huella(operacion, datos) if clave else None
+    if clave:
+        previo = _resultado_previo(clave, operacion, huella, db_path)
+        if previo is not _SIN_RESULTADO:
+            return previo
+    def unidad(tx):
+        resultado = escribir(tx)
+        if clave:
+            tx.execute(_S_IDEMPOTENCIA_GUARDAR, {'clave': clave, 'operacion': operacion, 'huella': huella,
+                                                 'resultado': json.dumps(resultado, default=str)})
+        return resultado
+
+    try:
+        # Con clave es seguro repetir tras una conexión caída: si ya se
+        # confirmó, la PK de idempotencia lo detecta abajo
+        resultado = unidad_de_trabajo(unidad, db_path, idempotente=bool(clave))
+    except Exception as exc:
+        if clave and es_error_integridad(exc):
+            previo = _resultado_previo(clave, operacion, huella, db_path)
+            if previo is not _SIN_RESULTADO:
+                return previo
+        raise
+    return resultado
+
+
 # ── Ventas ──────────────────────────────────────────────
 
+@carga('pos')
 def registrar_venta(sku, cantidad, precio, metodo_pago, cliente=None,
-                    vendedor=None, descuento=0, notas=None, db_path=None):
+                    vendedor=None, descuento=0, notas=None, fecha=None, hora=None,
+                    clave_idempotencia=None, db_path=None):
     """Registra venta, descuenta stock. Si es crédito, crea registro en creditos_clientes.
-    Compatible SQLite y PostgreSQL via adapt_sql()."""
-    conn = get_connection(db_path)
-    is_sqlite = _is_sqlite(db_path)
-    _sql = lambda s: adapt_sql(s, db_path)
-    try:
-        if is_sqlite:
-            prod = conn.execute(_sql("SELECT stock, nombre FROM productos WHERE sku = ?"), (sku,)).fetchone()
-            prod = dict(prod) if prod else None
-        else:
-            cur = conn.cursor()
-            cur.execute(_sql("SELECT stock, nombre FROM productos WHERE sku = ?"), (sku,))
-            cols = [d[0] for d in cur.description] if cur.description else []
-            row = cur.fetchone()
-            prod = dict(zip(cols, row)) if row else None
-
-        if prod is None:
+    Congela costo_unitario y producto_nombre: el COGS histórico no cambia con el catálogo.
+    fecha/hora por defecto son el momento actual (el outbox los fija al encolar).
+    clave_idempotencia: generada por el cliente; un reintento con la misma
+    clave retorna el venta_id original sin duplicar la venta.
+    Compatible SQLite y PostgreSQL (una sola transacción)."""
+    def escribir(tx):
+        prod = tx.query(_S_PRODUCTO_PARA_VENTA, {'sku': sku})
+        if not prod:
             raise ValueError(f"Producto {sku} no existe")
+        prod = prod[0]
         if prod['stock'] < cantidad:
             raise ValueError(f"Stock insuficiente para {sku}: {prod['stock']} disponibles, {cantidad} solicitados")
+        if metodo_pago == 'Crédito' and not cliente:
+            raise ValueError("Venta a crédito requiere nombre de cliente")
 
-        total = precio * cantidad * (1 - descuento / 100)
-        hoy = date.today().isoformat()
-        ahora = datetime.now().strftime('%H:%M:%S')
-
-        insert_sql = _sql("""
-            INSERT INTO ventas (fecha, hora, sku, cantidad, precio_unitario, descuento_pct, total, metodo_pago, cliente, vendedor, notas)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """)
-        params = (hoy, ahora, sku, cantidad, precio, descuento, total, metodo_pago, cliente, vendedor, notas)
+        total = _pesos(precio * cantidad * (1 - descuento / 100))
+        hoy = fecha or date.today().isoformat()
+        ahora = hora or datetime.now().strftime('%H:%M:%S')
+        _verificar_mes_abierto(hoy, tx)
 
-        if is_sqlite:
-            cursor = conn.execute(insert_sql, params)
-            venta_id = cursor.lastrowid
-        else:
-            cur = conn.cursor()
-            cur.execute(insert_sql.rstrip().rstrip(';') + ' RETURNING id', params)
-            venta_id = cur.fetchone()[0]
+        venta_id = tx.execute(_S_VENTA_INSERTAR, {
+            'fecha': hoy, 'hora': ahora, 'sku': sku, 'cantidad': cantidad, 'precio': _pesos(precio),
+            'descuento': descuento, 'total': total, 'metodo_pago': metodo_pago, 'cliente': cliente,
+            'vendedor': vendedor, 'notas': notas, 'costo': prod['costo'], 'nombre': prod['nombre'],
+        })
 
-        update_sql = _sql("UPDATE productos SET stock = stock - ? WHERE sku = ?")
-        if is_sqlite:
-            conn.execute(update_sql, (cantidad, sku))
-        else:
-            cur.execute(update_sql, (cantidad, sku))
+        _mover_stock(tx, sku, -cantidad, 'venta', f'venta:{venta_id}', hoy)
+        _sumar_caja(tx, hoy, COLUMNAS_CAJA[metodo_pago], total)
 
         if metodo_pago == 'Crédito':
-            if not cliente:
-                raise ValueError("Venta a crédito requiere nombre de cliente")
-            credit_sql = _sql("""
-                INSERT INTO creditos_clientes (venta_id, cliente, monto, fecha_credito, pagado, notas)
-                VALUES (?, ?, ?, ?, 0, ?)
-            """)
-            if is_sqlite:
-                conn.execute(credit_sql, (venta_id, cliente, total, hoy, notas))
-            else:
-                cur.execute(credit_sql, (venta_id, cliente, total, hoy, notas))
-
-        conn.commit()
+            cliente_id = _cliente_id(tx, cliente)
+            tx.execute(_S_CREDITO_INSERTAR, {'venta_id': venta_id, 'cliente': cliente, 'monto': total,
+                                             'fecha': hoy, 'notas': notas, 'cliente_id': cliente_id})
+            tx.execute(_S_CLIENTE_SALDO, {'id': cliente_id, 'monto': total, 'creditos': 1})
         return venta_id
-    finally:
-        conn.close()
+
+    venta_id = _idempotente(clave_idempotencia, 'registrar_venta', escribir, db_path, datos={
+        'sku': sku, 'cantidad': cantidad, 'precio': precio, 'metodo_pago': metodo_pago, 'cliente': cliente,
+        'vendedor': vendedor, 'descuento': descuento, 'notas': notas, 'fecha': fecha, 'hora': hora})
+    catalog.actualizar([sku], db_path)
+    return venta_id
 
 
+@carga('pos')
 def anular_venta(venta_id, db_path=None):
-    """Revierte una venta: devuelve stock, elimina crédito si existe, borra venta.
-    Compatible SQLite y PostgreSQL."""
-    # Fetch venta using backend-agnostic query()
-    ventas = query("SELECT * FROM ventas WHERE id = ?", (venta_id,), db_path=db_path)
-    if not ventas:
-        raise ValueError(f"Venta #{venta_id} no existe")
-    venta = ventas[0]
-
-    # Execute all updates using backend-agnostic execute()
-    execute("UPDATE productos SET stock = stock + ? WHERE sku = ?",
-            (venta['cantidad'], venta['sku']), db_path=db_path)
-    execute("DELETE FROM creditos_clientes WHERE venta_id = ?", (venta_id,), db_path=db_path)
-    execute("DELETE FROM ventas WHERE id = ?", (venta_id,), db_path=db_path)
+    """Revierte una venta: devuelve stock (movimiento 'anulacion'), elimina crédito
+    y sus abonos si existen (descontando lo pendiente del saldo del cliente),
+    borra venta. Una sola transacción, compatible SQLite y PostgreSQL."""
+    with transaction(db_path) as tx:
+        ventas = tx.query("SELECT * FROM ventas WHERE id = ?", (venta_id,))
+        if not ventas:
+            raise ValueError(f"Venta #{venta_id} no existe")
+        venta = ventas[0]
+        _verificar_mes_abierto(venta['fecha'], tx)
+
+        _mover_stock(tx, venta['sku'], venta['cantidad'], 'anulacion', f'venta:{venta_id}')
+        _sumar_caja(tx, venta['fecha'], COLUMNAS_CAJA[venta['metodo_pago']], -venta['total'])
+        for credito in tx.query("SELECT * FROM creditos_clientes WHERE venta_id = ?", (venta_id,)):
+            if credito['cliente_id'] and not credito['pagado']:
+                tx.execute(_S_CLIENTE_SALDO, {'id': credito['cliente_id'], 'creditos': -1,
+                                              'monto': -(credito['monto'] - (credito['monto_pagado'] or 0))})
+            tx.execute("DELETE FROM abonos WHERE credito_id = ?", (credito['id'],))
+        tx.execute("DELETE FROM creditos_clientes WHERE venta_id = ?", (venta_id,))
+        tx.execute("DELETE FROM ventas WHERE id = ?", (venta_id,))
+    catalog.actualizar([venta['sku']], db_path)
 
     return dict(venta)
 
 
+@carga('pos')
 def get_ventas_dia(fecha=None, db_path=None):
     """Ventas del día con totales por método de pago."""
     if fecha is None:
         fecha = date.today().isoformat()
-    ventas = query("""
-        SELECT v.*, p.nombre as producto_nombre
-        FROM ventas v
-        LEFT JOIN productos p ON v.sku = p.sku
-        WHERE v.fecha = ?
-        ORDER BY v.hora DESC
-    """, (fecha,), db_path=db_path)
+    ventas = query(_S_VENTAS_DIA, {'fecha': fecha}, db_path=db_path)
 
     totales = {}
     total_general = 0
@@ -117,6 +294,7 @@ def get_ventas_dia(fecha=None, db_path=None):
     }
 
 
+@carga('dashboard')
 def get_ventas_mes(year, month, db_path=None):
     """Ventas del mes con métricas."""
     fecha_inicio = f"{year}-{month:02d}-01"
@@ -126,11 +304,10 @@ def get_ventas_mes(year, month, db_path=None):
         fecha_fin = f"{year}-{month + 1:02d}-01"
 
     ventas = query("""
-        SELECT v.*, p.nombre as producto_nombre, p.costo
-        FROM ventas v
-        LEFT JOIN productos p ON v.sku = p.sku
-        WHERE v.fecha >= ? AND v.fecha < ?
-        ORDER BY v.fecha DESC, v.hora DESC
+        SELECT *, costo_unitario AS costo
+        FROM ventas
+        WHERE fecha >= ? AND fecha < ?
+        ORDER BY fecha DESC, hora DESC
     """, (fecha_inicio, fecha_fin), db_path=db_path)
 
     total_ventas = sum(v['total'] for v in ventas)
@@ -156,17 +333,48 @@ def get_ventas_mes(year, month, db_path=None):
     }
 
 
-def get_ventas_rango(fecha_inicio, fecha_fin, db_path=None):
-    """Ventas en un rango de fechas."""
-    return query("""
-        SELECT v.*, p.nombre as producto_nombre, p.costo
-        FROM ventas v
-        LEFT JOIN productos p ON v.sku = p.sku
-        WHERE v.fecha >= ? AND v.fecha <= ?
-        ORDER BY v.fecha DESC, v.hora DESC
-    """, (fecha_inicio, fecha_fin), db_path=db_path)
-
-
+@carga('analytics')
+def get_ventas_rango(fecha_inicio, fecha_fin, analitica=False, db_path=None):
+    """Ventas en un rango de fechas, incluidos años/meses archivados
+    (ventas_historico y Parquet). analitica=True: puede leerse de la réplica."""
+    def bd(desde, hasta):
+        return query("""
+            SELECT *, costo_unitario AS costo
+            FROM ventas_historico
+            WHERE fecha >= ? AND fecha <= ?
+            ORDER BY fecha DESC, hora DESC
+        """, (desde, hasta), db_path=db_path, analitica=analitica)
+
+    def parquet(desde, hasta):
+        ventas = archivo.leer('ventas', desde, hasta, db_path=db_path)
+        for v in ventas:
+            v['costo'] = v.get('costo_unitario')
+        ventas.sort(key=lambda v: (str(v['fecha']), v.get('hora') or ''), reverse=True)
+        return ventas
+
+    return archivo.combinar('ventas', fecha_inicio, fecha_fin, bd, parquet, db_path)
+
+
+@carga('analytics')
+def get_ventas_por_mes(fecha_inicio, fecha_fin, analitica=False, db_path=None):
+    """[{'periodo': 'AAAA-MM', 'total', 'filas'}] del rango, ordenado por mes.
+    Los meses en Parquet se agregan leyendo solo fecha y total."""
+    def bd(desde, hasta):
+        return query("""
+            SELECT substr(CAST(fecha AS TEXT), 1, 7) AS periodo, SUM(total) AS total, COUNT(*) AS filas
+            FROM ventas_historico
+            WHERE fecha >= ? AND fecha <= ?
+            GROUP BY substr(CAST(fecha AS TEXT), 1, 7)
+        """, (desde, hasta), db_path=db_path, analitica=analitica)
+
+    def parquet(desde, hasta):
+        return archivo.resumen('ventas', desde, hasta, 'total', db_path=db_path)
+
+    meses = archivo.combinar('ventas', fecha_inicio, fecha_fin, bd, parquet, db_path)
+    return sorted(meses, key=lambda m: m['periodo'])
+
+
+@carga('dashboard')
 def get_ventas_semana(db_path=None):
     """Ventas de la semana actual (lunes a hoy)."""
     hoy = date.today()
@@ -188,6 +396,7 @@ def get_ventas_semana(db_path=None):
     }
 
 
+@carga('dashboard')
 def get_ventas_semana_anterior(db_path=None):
     """Ventas de la semana anterior."""
     hoy = date.today()
@@ -202,6 +411,7 @@ def get_ventas_semana_anterior(db_path=None):
     return {'total': total, 'unidades': unidades}
 
 
+@carga('dashboard')
 def get_ventas_diarias_mes(year, month, db_path=None):
     """Ventas agrupadas por día para gráfico."""
     fecha_inicio = f"{year}-{month:02d}-01"
@@ -221,8 +431,18 @@ def get_ventas_diarias_mes(year, month, db_path=None):
 
 # ── Punto de Equilibrio ──────────────────────────────────
 
+@carga('dashboard')
 def calcular_punto_equilibrio(db_path=None):
     """Calcula punto de equilibrio mensual."""
+    hoy = date.today()
+    ventas_mes = get_ventas_mes(hoy.year, hoy.month, db_path=db_path)
+
+    return _resultado_pe(*_agregados_pe(db_path),
+                         ventas_mes['total_ventas'], ventas_mes['total_unidades'])
+
+
+def _agregados_pe(db_path=None):
+    """(costos fijos, margen ponderado, stock, precio ponderado) del catálogo actual."""
     costos = query("SELECT SUM(monto_mensual) as total FROM costos_fijos WHERE activo = 1", db_path=db_path)
     cf = costos[0]['total'] or 0
 
@@ -245,6 +465,19 @@ def calcular_punto_equilibrio(db_path=None):
         total_stock += stock
         total_precio_pond += p['precio_venta'] * stock
 
+    return cf, total_margen_pond, total_stock, total_precio_pond
+
+
+def _resultado_pe(cf, total_margen_pond, total_stock, total_precio_pond,
+                  ventas_acumuladas, unidades_vendidas):
+    """Arma el dict de punto de equilibrio a partir de los agregados ponderados por stock."""
+    cf = float(cf or 0)
+    total_margen_pond = float(total_margen_pond or 0)
+    total_precio_pond = float(total_precio_pond or 0)
+    total_stock = total_stock or 0
+    ventas_acumuladas = float(ventas_acumuladas or 0)
+    unidades_vendidas = unidades_vendidas or 0
+
     margen_prom = total_margen_pond / total_stock if total_stock > 0 else 0.5
     ticket_prom = total_precio_pond / total_stock if total_stock > 0 else 100000
 
@@ -253,10 +486,6 @@ def calcular_punto_equilibrio(db_path=None):
     pe_diario = pe_unidades / 30
 
     hoy = date.today()
-    ventas_mes = get_ventas_mes(hoy.year, hoy.month, db_path=db_path)
-    ventas_acumuladas = ventas_mes['total_ventas']
-    unidades_vendidas = ventas_mes['total_unidades']
-
     progreso_pct = (ventas_acumuladas / pe_pesos * 100) if pe_pesos > 0 else 0
     dias_restantes = max(1, 30 - hoy.day)
     unidades_faltantes = max(0, pe_unidades - unidades_vendidas)
@@ -276,34 +505,420 @@ def calcular_punto_equilibrio(db_path=None):
     }
 
 
-# ── Liquidación Socios ────────────────────────────────────
+# ── Dashboard snapshot ────────────────────────────────────
+
+# Todos los KPIs del Dashboard en un solo round trip. CTEs válidos en SQLite y
+# PostgreSQL; las fechas llegan como parámetros. Cada fila trae los KPIs más una
+# alerta de stock (LEFT JOIN), así la lista de alertas viaja en la misma sentencia.
+_SNAPSHOT_SQL = """
+    WITH cf AS (
+        SELECT COALESCE(SUM(monto_mensual), 0) AS cf
+        FROM costos_fijos WHERE activo = 1
+    ),
+    pe_stock AS (
+        SELECT SUM((precio_venta - costo) * 1.0 / precio_venta
+                   * CASE WHEN stock < 1 THEN 1 ELSE stock END) AS pe_margen_pond,
+               SUM(CASE WHEN stock < 1 THEN 1 ELSE stock END) AS pe_stock,
+               SUM(precio_venta * CASE WHEN stock < 1 THEN 1 ELSE stock END) AS pe_precio_pond
+        FROM productos WHERE stock > 0 AND precio_venta > 0
+    ),
+    pe_todos AS (
+        SELECT SUM((precio_venta - costo) * 1.0 / precio_venta
+                   * CASE WHEN stock < 1 THEN 1 ELSE stock END) AS pe_todos_margen_pond,
+               SUM(CASE WHEN stock < 1 THEN 1 ELSE stock END) AS pe_todos_stock,
+               SUM(precio_venta * CASE WHEN stock < 1 THEN 1 ELSE stock END) AS pe_todos_precio_pond
+        FROM productos WHERE precio_venta > 0
+    ),
+    ventas_periodo AS (
+        SELECT
+            SUM(CASE WHEN v.fecha >= ? AND v.fecha <= ? THEN v.total ELSE 0 END) AS semana_total,
+            SUM(CASE WHEN v.fecha >= ? AND v.fecha <= ? THEN v.cantidad ELSE 0 END) AS semana_unidades,
+            SUM(CASE WHEN v.fecha >= ? AND v.fecha <= ? THEN COALESCE(v.costo_unitario, 0) * v.cantidad ELSE 0 END) AS semana_costo,
+            SUM(CASE WHEN v.fecha >= ? AND v.fecha <= ? THEN v.total ELSE 0 END) AS semana_ant_total,
+            SUM(CASE WHEN v.fecha >= ? AND v.fecha <= ? THEN v.cantidad ELSE 0 END) AS semana_ant_unidades,
+            SUM(CASE WHEN v.fecha >= ? AND v.fecha < ? THEN v.total ELSE 0 END) AS mes_total,
+            SUM(CASE WHEN v.fecha >= ? AND v.fecha < ? THEN v.cantidad ELSE 0 END) AS mes_unidades,
+            SUM(CASE WHEN v.fecha >= ? AND v.fecha < ? THEN COALESCE(v.costo_unitario, 0) * v.cantidad ELSE 0 END) AS mes_costo
+        FROM ventas v
+        WHERE v.fecha >= ?
+    ),
+    gastos_mes AS (
+        SELECT COALESCE(SUM(monto), 0) AS gastos_mes
+        FROM gastos WHERE fecha >= ? AND fecha < ?
+    ),
+    inventario AS (
+        SELECT COUNT(*) AS total_skus, SUM(stock) AS total_unidades,
+               SUM(costo * stock) AS valor_costo, SUM(precio_venta * stock) AS valor_venta
+        FROM productos
+    ),
+    deuda AS (
+        SELECT COALESCE(SUM(total), 0) AS deuda_proveedores
+        FROM pedidos_proveedores WHERE estado = 'Pendiente'
+    ),
+    creditos AS (
+        SELECT COUNT(*) AS creditos_cantidad, COALESCE(SUM(monto), 0) AS creditos_total,
+               COALESCE(SUM(monto_pagado), 0) AS creditos_abonado
+        FROM creditos_clientes WHERE pagado = 0
+    ),
+    alertas AS (
+        SELECT sku AS alerta_sku, nombre AS alerta_nombre, stock AS alerta_stock
+        FROM productos WHERE stock <= stock_minimo
+    ),
+    kpis AS (
+        SELECT * FROM cf, pe_stock, pe_todos, ventas_periodo, gastos_mes,
+                      inventario, deuda, creditos
+    )
+    SELECT k.*, a.alerta_sku, a.alerta_nombre, a.alerta_stock
+    FROM kpis k
+    LEFT JOIN alertas a ON 1 = 1
+    ORDER BY a.alerta_stock, a.alerta_nombre
+"""
 
-def calcular_liquidacion_socios(db_path=None):
-    """
-    Calcula cuánto puso cada socio y cuánto le corresponde.
-    Cada fila de gastos es un pago real de un socio específico.
-    """
-    gastos = query("SELECT * FROM gastos ORDER BY fecha", db_path=db_path)
 
-    aportes = {s: 0.0 for s in SOCIOS}
-    total_real = 0.0
-    por_categoria = {}
-    por_socio_categoria = {s: {} for s in SOCIOS}
+@carga('dashboard')
+def get_dashboard_snapshot(db_path=None):
+    """KPIs del Dashboard en una sola sentencia (PE, semana, mes, inventario,
+    deuda, créditos y alertas). Mismos valores que las funciones individuales."""
+    hoy = date.today()
+    lunes = hoy - timedelta(days=hoy.weekday())
+    domingo_pasado = lunes - timedelta(days=1)
+    lunes_pasado = domingo_pasado - timedelta(days=domingo_pasado.weekday())
+    mes_inicio = hoy.replace(day=1)
+    mes_fin = date(hoy.year + 1, 1, 1) if hoy.month == 12 else date(hoy.year, hoy.month + 1, 1)
+
+    semana = (lunes.isoformat(), hoy.isoformat())
+    anterior = (lunes_pasado.isoformat(), domingo_pasado.isoformat())
+    mes = (mes_inicio.isoformat(), mes_fin.isoformat())
+    params = (semana * 3 + anterior * 2 + mes * 3
+              + (min(lunes_pasado, mes_inicio).isoformat(),) + mes)
+
+    rows = query(_SNAPSHOT_SQL, params, db_path=db_path)
+    k = rows[0]
+
+    if k['pe_stock']:
+        pe_aggs = (k['pe_margen_pond'], k['pe_stock'], k['pe_precio_pond'])
+    else:
+        pe_aggs = (k['pe_todos_margen_pond'], k['pe_todos_stock'], k['pe_todos_precio_pond'])
+
+    mes_total = k['mes_total'] or 0
+    mes_costo = k['mes_costo'] or 0
+    semana_total = k['semana_total'] or 0
+    semana_costo = k['semana_costo'] or 0
 
+    return {
+        'pe': _resultado_pe(k['cf'], *pe_aggs, mes_total, k['mes_unidades'] or 0),
+        'semana': {
+            'total': semana_total,
+            'unidades': k['semana_unidades'] or 0,
+            'costo': semana_costo,
+            'utilidad': semana_total - semana_costo,
+            'fecha_inicio': lunes.isoformat(),
+            'fecha_fin': hoy.isoformat(),
+        },
+        'semana_anterior': {
+            'total': k['semana_ant_total'] or 0,
+            'unidades': k['semana_ant_unidades'] or 0,
+        },
+        'mes': {
+            'total_ventas': mes_total,
+            'total_costo': mes_costo,
+            'utilidad_bruta': mes_total - mes_costo,
+            'total_unidades': k['mes_unidades'] or 0,
+        },
+        'gastos_mes': k['gastos_mes'] or 0,
+        'inventario': {
+            'total_skus': k['total_skus'],
+            'total_unidades': k['total_unidades'],
+            'valor_costo': k['valor_costo'],
+            'valor_venta': k['valor_venta'],
+        },
+        'deuda_proveedores': k['deuda_proveedores'] or 0,
+        'creditos': {
+            'cantidad': k['creditos_cantidad'],
+            'total': k['creditos_total'] or 0,
+            'abonado': k['creditos_abonado'] or 0,
+        },
+        'alertas': [
+            {'sku': r['alerta_sku'], 'nombre': r['alerta_nombre'], 'stock': r['alerta_stock']}
+            for r in rows if r['alerta_sku'] is not None
+        ],
+    }
+
+
+# ── Cierre de mes ─────────────────────────────────────────
+# Un mes terminado se cierra una vez: su P&L queda en cierres_mes y ventas y
+# gastos con fecha en ese mes no se pueden crear, editar ni borrar hasta
+# reabrirlo. Los meses pasados y el comparativo leen una fila por mes.
+
+def _verificar_mes_abierto(fecha, tx):
+    """ValueError si fecha cae en un mes cerrado o exportado a Parquet (Historial
+    lo lee del archivo: un cambio en la BD no se vería y --purgar lo borraría).
+    El mes en curso nunca está cerrado (cerrar_mes solo acepta meses
+    terminados): ahí no consulta."""
+    mes = str(fecha)[:7]
+    if mes >= date.today().isoformat()[:7]:
+        return
+    if tx.query("SELECT mes FROM cierres_mes WHERE mes = ?", (mes,)):
+        raise ValueError(f"El mes {mes} está cerrado. Reabrirlo para modificar ventas o gastos.")
+    if _mes_archivado(mes, tx.db_path):
+        raise ValueError(f"El mes {mes} está archivado en Parquet y no se puede modificar.")
+
+
+def _mes_archivado(mes, db_path=None):
+    return any(mes in archivo.meses_archivados(t, db_path) for t in archivo.TABLAS)
+
+
+def _limites_mes(year, month):
+    """(primer día, último día) del mes como ISO."""
+    inicio = date(year, month, 1)
+    siguiente = date(year + month // 12, month % 12 + 1, 1)
+    return inicio.isoformat(), (siguiente - timedelta(days=1)).isoformat()
+
+
+def _resultado_mes(year, month, db_path=None):
+    """P&L del mes calculado desde las filas (BD y archivo Parquet)."""
+    desde, hasta = _limites_mes(year, month)
+    ventas = get_ventas_rango(desde, hasta, db_path=db_path)
+    gastos = get_gastos_rango(desde, hasta, db_path=db_path)
+
+    ingresos = sum(v['total'] for v in ventas)
+    costo = sum((v.get('costo_unitario') or 0) * v['cantidad'] for v in ventas)
+    unidades = sum(v['cantidad'] for v in ventas)
+    por_categoria = {}
+    por_socio = {}
+    por_socio_categoria = {}
     for g in gastos:
-        monto = g['monto']
-        pagado_por = g['pagado_por']
+        por_categoria[g['categoria']] = por_categoria.get(g['categoria'], 0) + g['monto']
+        por_socio[g['pagado_por']] = por_socio.get(g['pagado_por'], 0) + g['monto']
+        cats = por_socio_categoria.setdefault(g['pagado_por'], {})
+        cats[g['categoria']] = cats.get(g['categoria'], 0) + g['monto']
+    total_gastos = sum(por_categoria.values())
 
-        if pagado_por in SOCIOS:
-            aportes[pagado_por] += monto
+    pe = _resultado_pe(*_agregados_pe(db_path), ingresos, unidades)
+    inventario = get_valor_inventario_en_fecha(hasta, db_path=db_path)
 
-        total_real += monto
+    return {
+        'mes': desde[:7],
+        'ingresos': ingresos,
+        'costo_mercancia': costo,
+        'utilidad_bruta': ingresos - costo,
+        'gastos': total_gastos,
+        'utilidad_operativa': ingresos - costo - total_gastos,
+        'unidades': unidades,
+        'num_ventas': len(ventas),
+        'gastos_por_categoria': por_categoria,
+        'gastos_por_socio': por_socio,
+        'gastos_por_socio_categoria': por_socio_categoria,
+        'costos_fijos': _pesos(pe['cf']),
+        'margen_prom': pe['margen_prom'],
+        'pe_pesos': _pesos(pe['pe_pesos']),
+        'pe_unidades': pe['pe_unidades'],
+        'progreso_pe_pct': pe['progreso_pct'],
+        'inventario_unidades': inventario['unidades'],
+        'inventario_valor_costo': inventario['valor_costo'],
+        'cerrado': False,
+    }
+
+
+def _cierre_a_dict(row):
+    res = {k: v for k, v in row.items() if k != 'created_at'}
+    res['gastos_por_categoria'] = json.loads(row['gastos_por_categoria'])
+    res['gastos_por_socio'] = json.loads(row['gastos_por_socio'])
+    res['gastos_por_socio_categoria'] = json.loads(row['gastos_por_socio_categoria'] or '{}')
+    res['cerrado'] = True
+    res['cerrado_en'] = row['created_at']
+    return res
+
+
+_COLUMNAS_CIERRE = ('mes', 'ingresos', 'costo_mercancia', 'utilidad_bruta', 'gastos',
+                    'utilidad_operativa', 'unidades', 'num_ventas', 'gastos_por_categoria',
+                    'gastos_por_socio', 'gastos_por_socio_categoria', 'costos_fijos', 'margen_prom',
+                    'pe_pesos', 'pe_unidades', 'progreso_pe_pct', 'inventario_unidades',
+                    'inventario_valor_costo')
+_S_CIERRE_INSERTAR = sentencia('cierre_mes_insertar', f"""
+    INSERT INTO cierres_mes ({', '.join(_COLUMNAS_CIERRE)})
+    VALUES ({', '.join(':' + c for c in _COLUMNAS_CIERRE)})
+""")
+
+
+@carga('dashboard')
+def cerrar_mes(year, month, db_path=None):
+    """Congela el P&L de un mes terminado en cierres_mes. Desde ahí sus
+    ventas y gastos quedan bloqueados hasta reabrir_mes()."""
+    hoy = date.today()
+    if (year, month) >= (hoy.year, hoy.month):
+        raise ValueError("Solo se pueden cerrar meses terminados")
+    res = _resultado_mes(year, month, db_path=db_path)
+    fila = dict(res, gastos_por_categoria=json.dumps(res['gastos_por_categoria'], sort_keys=True),
+                gastos_por_socio=json.dumps(res['gastos_por_socio'], sort_keys=True),
+                gastos_por_socio_categoria=json.dumps(res['gastos_por_socio_categoria'], sort_keys=True))
+    with transaction(db_path) as tx:
+        if tx.query("SELECT mes FROM cierres_mes WHERE mes = ?", (res['mes'],)):
+            raise ValueError(f"El mes {res['mes']} ya está cerrado")
+        tx.execute(_S_CIERRE_INSERTAR, {c: fila[c] for c in _COLUMNAS_CIERRE})
+    return dict(res, cerrado=True)
+
+
+def reabrir_mes(year, month, db_path=None):
+    """Borra el cierre del mes: vuelve a calcularse desde las filas y se
+    pueden editar sus ventas y gastos. Retorna False si no estaba cerrado.
+    Un mes exportado a Parquet no se reabre: el archivo es su copia vigente."""
+    mes = f"{year}-{month:02d}"
+    if _mes_archivado(mes, db_path):
+        raise ValueError(f"El mes {mes} está archivado en Parquet y no se puede reabrir.")
+    with transaction(db_path) as tx:
+        if not tx.query("SELECT mes FROM cierres_mes WHERE mes = ?", (mes,)):
+            return False
+        tx.execute("DELETE FROM cierres_mes WHERE mes = ?", (mes,))
+    return True
+
+
+@carga('dashboard')
+def get_resultado_mes(year, month, db_path=None):
+    """P&L del mes: el snapshot si está cerrado, si no calculado desde las filas."""
+    row = query("SELECT * FROM cierres_mes WHERE mes = ?", (f"{year}-{month:02d}",), db_path=db_path)
+    if row:
+        return _cierre_a_dict(row[0])
+    return _resultado_mes(year, month, db_path=db_path)
+
+
+@carga('dashboard')
+def comparar_meses(desde, hasta, db_path=None):
+    """P&L de cada mes de desde a hasta ('AAAA-MM', inclusive), ordenado.
+    Los cerrados salen de una sola consulta a cierres_mes; solo los abiertos
+    (normalmente el mes en curso) se calculan desde las filas."""
+    cerrados = {r['mes']: _cierre_a_dict(r) for r in query(
+        "SELECT * FROM cierres_mes WHERE mes >= ? AND mes <= ? ORDER BY mes",
+        (desde, hasta), db_path=db_path)}
+    res = []
+    year, month = int(desde[:4]), int(desde[5:7])
+    while f"{year}-{month:02d}" <= hasta:
+        mes = f"{year}-{month:02d}"
+        res.append(cerrados.get(mes) or _resultado_mes(year, month, db_path=db_path))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return res
 
-        cat = g['categoria']
-        por_categoria[cat] = por_categoria.get(cat, 0) + monto
 
-        if pagado_por in SOCIOS:
-            por_socio_categoria[pagado_por][cat] = por_socio_categoria[pagado_por].get(cat, 0) + monto
+# ── Liquidación Socios ────────────────────────────────────
+# Cada fila de gastos es un pago real de un socio y a cada uno le corresponde
+# un tercio del total. La liquidación se arma con agregados por mes ×
+# socio × categoría: los meses cerrados salen del caché de cierres_mes, los
+# exportados a Parquet del archivo y el resto de un GROUP BY sobre tramos de
+# fecha. El costo crece con meses × categorías, no con el número de gastos.
+
+def _fuera_de_meses(meses):
+    """(condición, params) sobre fecha que deja fuera los meses dados
+    ('AAAA-MM'), como OR de rangos para que cada tramo use idx_gastos_fecha.
+    Sin meses retorna ('', ())."""
+    bloques = []  # [inicio, fin) de cada bloque de meses contiguos
+    for mes in sorted(meses):
+        y, m = int(mes[:4]), int(mes[5:7])
+        inicio, fin = date(y, m, 1).isoformat(), date(y + m // 12, m % 12 + 1, 1).isoformat()
+        if bloques and bloques[-1][1] == inicio:
+            bloques[-1][1] = fin
+        else:
+            bloques.append([inicio, fin])
+    if not bloques:
+        return '', ()
+    condiciones, params = ["fecha < ?"], [bloques[0][0]]
+    for (_, fin), (inicio, _) in zip(bloques, bloques[1:]):
+        condiciones.append("(fecha >= ? AND fecha < ?)")
+        params += [fin, inicio]
+    condiciones.append("fecha >= ?")
+    params.append(bloques[-1][1])
+    return ' OR '.join(condiciones), tuple(params)
+
+
+def _sumar(detalle, mes, socio, categoria, monto):
+    cats = detalle.setdefault(mes, {}).setdefault(socio, {})
+    cats[categoria] = cats.get(categoria, 0) + monto
+
+
+def _gastos_por_mes_socio(db_path=None):
+    """{mes: {socio: {categoría: pesos}}} de todos los gastos."""
+    detalle = {r['mes']: json.loads(r['gastos_por_socio_categoria']) for r in query(
+        "SELECT mes, gastos_por_socio_categoria FROM cierres_mes "
+        "WHERE gastos_por_socio_categoria IS NOT NULL", db_path=db_path)}
+    archivados = archivo.meses_archivados('gastos', db_path) - detalle.keys()
+    if archivados and not archivo.disponible():
+        archivados = frozenset()
+
+    donde, params = _fuera_de_meses(detalle.keys() | archivados)
+    for r in query(f"""
+        SELECT substr(CAST(fecha AS TEXT), 1, 7) AS mes, pagado_por, categoria, SUM(monto) AS total
+        FROM gastos_historico {'WHERE ' + donde if donde else ''}
+        GROUP BY 1, 2, 3
+    """, params, db_path=db_path):
+        _sumar(detalle, r['mes'], r['pagado_por'], r['categoria'], int(r['total']))
+
+    for mes in archivados:
+        desde, hasta = _limites_mes(int(mes[:4]), int(mes[5:7]))
+        for g in archivo.leer('gastos', desde, hasta, columnas=['pagado_por', 'categoria', 'monto'],
+                              db_path=db_path):
+            _sumar(detalle, mes, g['pagado_por'], g['categoria'], g['monto'])
+    return detalle
+
+
+def _transferencias(saldos):
+    """Pagos [{'de', 'a', 'monto'}] que dejan a todos los socios en cero:
+    el que más debe le paga al que más le deben, hasta agotar."""
+    deben = sorted(([s, -_pesos(v)] for s, v in saldos.items() if _pesos(v) < 0), key=lambda x: -x[1])
+    les_deben = sorted(([s, _pesos(v)] for s, v in saldos.items() if _pesos(v) > 0), key=lambda x: -x[1])
+    res = []
+    while deben and les_deben:
+        monto = min(deben[0][1], les_deben[0][1])
+        res.append({'de': deben[0][0], 'a': les_deben[0][0], 'monto': monto})
+        deben[0][1] -= monto
+        les_deben[0][1] -= monto
+        if not deben[0][1]:
+            deben.pop(0)
+        if not les_deben[0][1]:
+            les_deben.pop(0)
+    return res
+
+
+@carga('dashboard')
+def calcular_liquidacion_socios(db_path=None):
+    """
+    Calcula cuánto puso cada socio y cuánto le corresponde, con el saldo
+    acumulado mes a mes. Los pagos entre socios (pagos_socios) saldan: el que
+    paga sube su saldo y el que recibe lo baja. Saldo > 0 = le deben.
+    """
+    detalle = _gastos_por_mes_socio(db_path)
+    pagos = query("SELECT * FROM pagos_socios ORDER BY fecha, id", db_path=db_path)
+    pagos_mes = {}
+    for p in pagos:
+        neto = pagos_mes.setdefault(str(p['fecha'])[:7], dict.fromkeys(SOCIOS, 0))
+        neto[p['de_socio']] += p['monto']
+        neto[p['a_socio']] -= p['monto']
+
+    aportes = dict.fromkeys(SOCIOS, 0)
+    pagado = dict.fromkeys(SOCIOS, 0)
+    por_categoria = {}
+    por_socio_categoria = {s: {} for s in SOCIOS}
+    total_real = 0
+    meses = []
+    for mes in sorted(detalle.keys() | pagos_mes.keys()):
+        socios = detalle.get(mes, {})
+        aportes_mes = {s: sum(socios.get(s, {}).values()) for s in SOCIOS}
+        total_mes = sum(aportes_mes.values())
+        for s, cats in socios.items():
+            for cat, monto in cats.items():
+                por_categoria[cat] = por_categoria.get(cat, 0) + monto
+                por_socio_categoria[s][cat] = por_socio_categoria[s].get(cat, 0) + monto
+        neto = pagos_mes.get(mes, dict.fromkeys(SOCIOS, 0))
+        total_real += total_mes
+        for s in SOCIOS:
+            aportes[s] += aportes_mes[s]
+            pagado[s] += neto[s]
+        # Acumulados en pesos enteros: el único float es el tercio del total
+        meses.append({
+            'mes': mes,
+            'total': total_mes,
+            'aportes': aportes_mes,
+            'pagos': neto,
+            'saldos': {s: aportes[s] - total_real / 3 + pagado[s] for s in SOCIOS},
+        })
 
     parte_cada_uno = total_real / 3 if total_real > 0 else 0
 
@@ -312,7 +927,8 @@ def calcular_liquidacion_socios(db_path=None):
         saldos[s] = {
             'aportado': aportes[s],
             'le_corresponde': parte_cada_uno,
-            'saldo': aportes[s] - parte_cada_uno,
+            'pagos': pagado[s],
+            'saldo': aportes[s] - parte_cada_uno + pagado[s],
         }
 
     return {
@@ -322,88 +938,99 @@ def calcular_liquidacion_socios(db_path=None):
         'saldos': saldos,
         'por_categoria': por_categoria,
         'por_socio_categoria': por_socio_categoria,
-        'gastos': gastos,
+        'meses': meses,
+        'pagos': pagos,
+        'transferencias': _transferencias({s: saldos[s]['saldo'] for s in SOCIOS}),
     }
 
 
-# ── Caja ─────────────────────────────────────────────────
-
-def abrir_caja(fecha=None, efectivo_inicio=0, db_path=None):
-    """Abre la caja del día con un monto inicial de efectivo.
-    Compatible SQLite y PostgreSQL."""
-    if fecha is None:
-        fecha = date.today().isoformat()
+@carga('pos')
+def registrar_pago_socio(fecha, de_socio, a_socio, monto, notas=None, clave_idempotencia=None,
+                         db_path=None):
+    """Registra que de_socio le pagó monto a a_socio para saldar la liquidación."""
+    if de_socio not in SOCIOS or a_socio not in SOCIOS:
+        raise ValueError(f"Socio inválido: {de_socio} → {a_socio}")
+    if de_socio == a_socio:
+        raise ValueError("El pago debe ser entre dos socios distintos")
+    monto = _pesos(monto)
+    if not monto or monto <= 0:
+        raise ValueError("El monto debe ser mayor a 0")
+    return _idempotente(
+        clave_idempotencia, 'registrar_pago_socio',
+        lambda tx: tx.execute(_S_PAGO_SOCIO_INSERTAR, {'fecha': fecha, 'de_socio': de_socio,
+                                                       'a_socio': a_socio, 'monto': monto, 'notas': notas}),
+        db_path,
+        datos={'fecha': fecha, 'de_socio': de_socio, 'a_socio': a_socio, 'monto': monto, 'notas': notas},
+    )
 
-    existing = query("SELECT * FROM caja_diaria WHERE fecha = ?", (fecha,), db_path=db_path)
-    if existing:
-        execute("UPDATE caja_diaria SET efectivo_inicio = ? WHERE fecha = ?",
-                (efectivo_inicio, fecha), db_path=db_path)
-    else:
-        execute("""
-            INSERT INTO caja_diaria (fecha, efectivo_inicio, cerrada)
-            VALUES (?, ?, 0)
-        """, (fecha, efectivo_inicio), db_path=db_path)
 
-    return {'fecha': fecha, 'efectivo_inicio': efectivo_inicio}
+def eliminar_pago_socio(pago_id, db_path=None):
+    execute("DELETE FROM pagos_socios WHERE id = ?", (pago_id,), db_path=db_path)
 
 
-def get_estado_caja(fecha=None, db_path=None):
-    """Estado de caja del día."""
-    if fecha is None:
-        fecha = date.today().isoformat()
+# ── Caja ─────────────────────────────────────────────────
 
-    caja = query("SELECT * FROM caja_diaria WHERE fecha = ?", (fecha,), db_path=db_path)
-    efectivo_inicio = caja[0]['efectivo_inicio'] if caja else 0
-    caja_abierta = len(caja) > 0
+def _sumar_caja(tx, fecha, columna, monto):
+    """Suma monto (negativo para revertir) al acumulado del día en caja_diaria."""
+    if monto:
+        tx.execute(_S_CAJA_SUMAR[columna], {'fecha': str(fecha)[:10], 'monto': monto})
 
-    ventas = query("""
-        SELECT metodo_pago, SUM(total) as total
-        FROM ventas WHERE fecha = ?
-        GROUP BY metodo_pago
-    """, (fecha,), db_path=db_path)
 
-    totales_ventas = {v['metodo_pago']: v['total'] for v in ventas}
+def _estado_caja(fecha, caja):
+    """Estado del día desde su fila de caja_diaria (o None)."""
+    caja = caja or {}
+    efectivo_inicio = caja.get('efectivo_inicio') or 0
+    totales_ventas = {m: caja[c] for m, c in COLUMNAS_CAJA.items() if caja.get(c)}
     ventas_efectivo = totales_ventas.get('Efectivo', 0)
-
-    gastos = query("""
-        SELECT SUM(monto) as total
-        FROM gastos WHERE fecha = ? AND metodo_pago = 'Efectivo'
-    """, (fecha,), db_path=db_path)
-    gastos_efectivo = gastos[0]['total'] if gastos and gastos[0]['total'] else 0
-
-    efectivo_esperado = efectivo_inicio + ventas_efectivo - gastos_efectivo
-
+    gastos_efectivo = caja.get('gastos_efectivo') or 0
     return {
         'fecha': fecha,
-        'caja_abierta': caja_abierta,
+        'caja_abierta': bool(caja.get('abierta')),
         'efectivo_inicio': efectivo_inicio,
         'totales_ventas': totales_ventas,
         'ventas_efectivo': ventas_efectivo,
         'gastos_efectivo': gastos_efectivo,
-        'efectivo_esperado': efectivo_esperado,
-        'cerrada': caja[0]['cerrada'] if caja else 0,
-        'efectivo_cierre_real': caja[0]['efectivo_cierre_real'] if caja else None,
+        'efectivo_esperado': efectivo_inicio + ventas_efectivo - gastos_efectivo,
+        'cerrada': caja.get('cerrada') or 0,
+        'efectivo_cierre_real': caja.get('efectivo_cierre_real'),
     }
 
 
+@carga('pos')
+def abrir_caja(fecha=None, efectivo_inicio=0, db_path=None):
+    """Abre la caja del día con un monto inicial de efectivo.
+    Compatible SQLite y PostgreSQL."""
+    if fecha is None:
+        fecha = date.today().isoformat()
+    efectivo_inicio = _pesos(efectivo_inicio)
+
+    execute(_S_CAJA_ABRIR, {'fecha': fecha, 'efectivo_inicio': efectivo_inicio}, db_path=db_path)
+
+    return {'fecha': fecha, 'efectivo_inicio': efectivo_inicio}
+
+
+@carga('pos')
+def get_estado_caja(fecha=None, db_path=None):
+    """Estado de caja del día: una lectura por PK de caja_diaria."""
+    if fecha is None:
+        fecha = date.today().isoformat()
+    caja = query(_S_CAJA_DIA, {'fecha': fecha}, db_path=db_path)
+    return _estado_caja(fecha, caja[0] if caja else None)
+
+
+@carga('pos')
 def cerrar_caja(fecha, efectivo_real, notas=None, db_path=None):
-    """Registra cierre de caja y calcula diferencia.
+    """Registra cierre de caja, calcula diferencia y toma el snapshot de stock del día.
     Compatible SQLite y PostgreSQL."""
-    estado = get_estado_caja(fecha, db_path=db_path)
+    efectivo_real = _pesos(efectivo_real)
+    with transaction(db_path) as tx:
+        caja = tx.query(_S_CAJA_DIA, {'fecha': fecha})
+        estado = _estado_caja(fecha, caja[0] if caja else None)
+        tx.execute(_S_CAJA_CERRAR, {'fecha': fecha, 'efectivo_real': efectivo_real, 'notas': notas})
     diferencia = efectivo_real - estado['efectivo_esperado']
 
-    # Check if caja exists for today
-    existing = query("SELECT * FROM caja_diaria WHERE fecha = ?", (fecha,), db_path=db_path)
-    if existing:
-        execute("""
-            UPDATE caja_diaria SET efectivo_cierre_real = ?, cerrada = 1, notas = ?
-            WHERE fecha = ?
-        """, (efectivo_real, notas, fecha), db_path=db_path)
-    else:
-        execute("""
-            INSERT INTO caja_diaria (fecha, efectivo_inicio, efectivo_cierre_real, cerrada, notas)
-            VALUES (?, ?, ?, 1, ?)
-        """, (fecha, estado['efectivo_inicio'], efectivo_real, notas), db_path=db_path)
+    # Snapshot diario del kardex: acota las consultas de stock a una fecha
+    tomar_snapshot_stock(fecha, db_path=db_path)
 
     return {
         'efectivo_esperado': estado['efectivo_esperado'],
@@ -412,6 +1039,7 @@ def cerrar_caja(fecha, efectivo_real, notas=None, db_path=None):
     }
 
 
+@carga('pos')
 def reabrir_caja(fecha=None, db_path=None):
     """Reabre una caja cerrada (borra cierre, mantiene apertura).
     Compatible SQLite y PostgreSQL."""
@@ -424,6 +1052,151 @@ def reabrir_caja(fecha=None, db_path=None):
     """, (fecha,), db_path=db_path)
 
 
+def verificar_caja(fecha_inicio=None, fecha_fin=None, reparar=False, db_path=None):
+    """Recalcula los acumulados de caja_diaria desde ventas y gastos y los
+    compara con los guardados. Sin fechas revisa todo; los meses exportados a
+    Parquet se omiten (sus filas ya no están en la BD).
+
+    Retorna {'dias', 'diferencias': [{fecha, columna, guardado, calculado}], 'ok'}.
+    Con reparar=True deja los acumulados como los calculados.
+    """
+    params = (fecha_inicio or '0001-01-01', fecha_fin or '9999-12-31')
+
+    calculado = {}
+    for r in query("""
+        SELECT fecha, metodo_pago, SUM(total) AS total FROM ventas_historico
+        WHERE fecha >= ? AND fecha <= ? GROUP BY fecha, metodo_pago
+    """, params, db_path=db_path):
+        calculado.setdefault(str(r['fecha']), {})[COLUMNAS_CAJA[r['metodo_pago']]] = int(r['total'])
+    for r in query("""
+        SELECT fecha, SUM(monto) AS total FROM gastos_historico
+        WHERE metodo_pago = 'Efectivo' AND fecha >= ? AND fecha <= ? GROUP BY fecha
+    """, params, db_path=db_path):
+        calculado.setdefault(str(r['fecha']), {})['gastos_efectivo'] = int(r['total'])
+    guardado = {str(r['fecha']): r for r in query(
+        "SELECT * FROM caja_diaria WHERE fecha >= ? AND fecha <= ?", params, db_path=db_path)}
+
+    archivados = archivo.meses_archivados('ventas', db_path) | archivo.meses_archivados('gastos', db_path)
+    columnas = (*COLUMNAS_CAJA.values(), 'gastos_efectivo')
+    diferencias = []
+    for fecha in sorted(calculado.keys() | guardado.keys()):
+        if fecha[:7] in archivados:
+            continue
+        fila = guardado.get(fecha, {})
+        for col in columnas:
+            real = calculado.get(fecha, {}).get(col, 0)
+            if (fila.get(col) or 0) != real:
+                diferencias.append({'fecha': fecha, 'columna': col,
+                                    'guardado': fila.get(col), 'calculado': real})
+
+    if reparar and diferencias:
+        with transaction(db_path) as tx:
+            for d in diferencias:
+                _sumar_caja(tx, d['fecha'], d['columna'], d['calculado'] - (d['guardado'] or 0))
+    return {'dias': len(guardado), 'diferencias': diferencias, 'ok': not diferencias}
+
+
+# Conciliación por rango: una sola consulta sobre caja_diaria (acumulados
+# del día) con un calendario recursivo, así los días sin caja también salen.
+UMBRAL_DESCUADRE = 20000   # pesos: diferencia que siempre se marca atípica
+Z_ATIPICO = 3              # desviaciones estándar sobre la media del rango
+
+_DIAS_RANGO = {
+    'sqlite': "SELECT date(?) UNION ALL SELECT date(fecha, '+1 day') FROM dias WHERE fecha < date(?)",
+    'postgres': ("SELECT CAST(? AS DATE) UNION ALL "
+                 "SELECT CAST(fecha + 1 AS DATE) FROM dias WHERE fecha < CAST(? AS DATE)"),
+}
+
+_CONCILIACION = """
+    WITH RECURSIVE dias(fecha) AS ({dias}),
+    caja AS (
+        SELECT c.fecha, c.abierta, c.cerrada, c.efectivo_cierre_real, c.ventas_efectivo, c.gastos_efectivo,
+               COALESCE(c.efectivo_inicio, 0) AS efectivo_inicio,
+               COALESCE(c.efectivo_inicio, 0) + c.ventas_efectivo - c.gastos_efectivo AS esperado,
+               CASE WHEN c.cerrada = 1 THEN c.efectivo_cierre_real
+                    - (COALESCE(c.efectivo_inicio, 0) + c.ventas_efectivo - c.gastos_efectivo) END AS diferencia,
+               MAX(CASE WHEN c.cerrada = 1 THEN c.fecha END) OVER (
+                   ORDER BY c.fecha ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) AS fecha_cierre_previo
+        FROM caja_diaria c
+        WHERE c.fecha <= ?
+          AND c.fecha >= COALESCE((SELECT MAX(fecha) FROM caja_diaria WHERE fecha < ? AND cerrada = 1), ?)
+    )
+    SELECT d.fecha, c.fecha IS NOT NULL AS con_caja, c.abierta, c.cerrada, c.efectivo_inicio, c.ventas_efectivo, c.gastos_efectivo,
+           c.esperado, c.efectivo_cierre_real AS real, c.diferencia,
+           p.efectivo_cierre_real AS cierre_previo,
+           CASE WHEN c.abierta = 1 THEN c.efectivo_inicio - p.efectivo_cierre_real END AS descuadre_apertura,
+           SUM(COALESCE(c.diferencia, 0)) OVER (ORDER BY d.fecha) AS deriva,
+           AVG(c.diferencia) OVER () AS media,
+           AVG(c.diferencia * c.diferencia) OVER () AS media_cuadrados
+    FROM dias d
+    LEFT JOIN caja c ON c.fecha = d.fecha
+    LEFT JOIN caja_diaria p ON p.fecha = c.fecha_cierre_previo
+    ORDER BY d.fecha
+"""
+
+
+@carga('analytics')
+def conciliar_caja(fecha_inicio, fecha_fin, umbral=UMBRAL_DESCUADRE, z=Z_ATIPICO,
+                   analitica=False, db_path=None):
+    """Efectivo esperado vs real de cada día de [fecha_inicio, fecha_fin].
+
+    Por día: esperado, real y diferencia (solo cajas cerradas), deriva
+    (diferencias acumuladas desde fecha_inicio), cierre_previo (efectivo
+    real del último cierre anterior) y descuadre_apertura (inicio del día
+    menos ese cierre; solo cajas abiertas). atipico marca diferencias de
+    |dif| >= umbral o a más de z desviaciones de la media del rango.
+    Los meses purgados a Parquet salen como días sin caja.
+
+    Retorna {'dias': [...], 'resumen': {...}}.
+    """
+    sql = _CONCILIACION.format(dias=_DIAS_RANGO['sqlite' if _is_sqlite(db_path) else 'postgres'])
+    filas = query(sql, (fecha_inicio, fecha_fin, fecha_fin, fecha_inicio, fecha_inicio),
+                  analitica=analitica, db_path=db_path)
+
+    media = float(filas[0]['media']) if filas and filas[0]['media'] is not None else 0.0
+    cuadrados = float(filas[0]['media_cuadrados']) if filas and filas[0]['media_cuadrados'] is not None else 0.0
+    sigma = max(0.0, cuadrados - media * media) ** 0.5
+    dias = []
+    for f in filas:
+        dif = f['diferencia']
+        dias.append({
+            'fecha': str(f['fecha'])[:10],
+            'con_caja': bool(f['con_caja']),
+            'abierta': bool(f['abierta']),
+            'cerrada': bool(f['cerrada']),
+            'efectivo_inicio': f['efectivo_inicio'],
+            'ventas_efectivo': f['ventas_efectivo'],
+            'gastos_efectivo': f['gastos_efectivo'],
+            'esperado': f['esperado'],
+            'real': f['real'],
+            'diferencia': dif,
+            'deriva': int(f['deriva']),
+            'cierre_previo': f['cierre_previo'],
+            'descuadre_apertura': f['descuadre_apertura'],
+            'atipico': dif is not None and (abs(dif) >= umbral
+                                            or (sigma > 0 and abs(dif - media) > z * sigma)),
+        })
+
+    cerradas = [d for d in dias if d['cerrada']]
+    # Cerrada sin efectivo_cierre_real (filas de scripts o v1.6): sin diferencia
+    diferencias = [d['diferencia'] for d in cerradas if d['diferencia'] is not None]
+    return {
+        'dias': dias,
+        'resumen': {
+            'dias': len(dias),
+            'con_caja': sum(d['con_caja'] for d in dias),
+            'cerradas': len(cerradas),
+            'sin_cerrar': sum(d['con_caja'] and not d['cerrada'] for d in dias),
+            'diferencia_total': dias[-1]['deriva'] if dias else 0,
+            'faltantes': sum(dif for dif in diferencias if dif < 0),
+            'sobrantes': sum(dif for dif in diferencias if dif > 0),
+            'atipicos': sum(d['atipico'] for d in dias),
+            'descuadres_apertura': sum(bool(d['descuadre_apertura']) for d in dias),
+        },
+    }
+
+
+@carga('pos')
 def editar_venta(venta_id, precio=None, metodo_pago=None, vendedor=None,
                  notas=None, db_path=None):
     """Edita campos de una venta sin afectar stock.
@@ -431,6 +1204,7 @@ def editar_venta(venta_id, precio=None, metodo_pago=None, vendedor=None,
     updates = []
     params = []
     if precio is not None:
+        precio = _pesos(precio)
         updates.append("precio_unitario = ?")
         params.append(precio)
     if metodo_pago is not None:
@@ -446,88 +1220,252 @@ def editar_venta(venta_id, precio=None, metodo_pago=None, vendedor=None,
     if not updates:
         return
 
-    # Si cambia precio, recalcular total
-    if precio is not None:
-        venta = query("SELECT * FROM ventas WHERE id = ?", (venta_id,), db_path=db_path)
+    with transaction(db_path) as tx:
+        venta = tx.query("SELECT * FROM ventas WHERE id = ?", (venta_id,))
+        if venta:
+            _verificar_mes_abierto(venta[0]['fecha'], tx)
+
+        # Si cambia precio, recalcular total
+        if precio is not None:
+            if venta:
+                v = venta[0]
+                new_total = _pesos(precio * v['cantidad'] * (1 - (v.get('descuento_pct') or 0) / 100))
+                updates.append("total = ?")
+                params.append(new_total)
+
+        params.append(venta_id)
+        sql = f"UPDATE ventas SET {', '.join(updates)} WHERE id = ?"
+        tx.execute(sql, tuple(params))
+
+        # Mover el monto entre acumulados de caja si cambió total o método
         if venta:
             v = venta[0]
-            new_total = precio * v['cantidad'] * (1 - (v.get('descuento_pct') or 0) / 100)
-            updates.append("total = ?")
-            params.append(new_total)
+            nuevo = tx.query("SELECT total, metodo_pago FROM ventas WHERE id = ?", (venta_id,))[0]
+            _sumar_caja(tx, v['fecha'], COLUMNAS_CAJA[v['metodo_pago']], -v['total'])
+            _sumar_caja(tx, v['fecha'], COLUMNAS_CAJA[nuevo['metodo_pago']], nuevo['total'])
+
+
+# ── Clientes y créditos ───────────────────────────────────
+# Cada crédito apunta a un cliente (clientes). clientes.saldo es lo pendiente
+# de sus créditos y se mueve en la misma transacción que la venta a crédito,
+# el abono o la anulación: "¿cuánto debe?" es una lectura indexada. Cada abono
+# queda en el historial (abonos) con el monto aplicado.
+
+def normalizar_nombre(nombre):
+    """Clave de búsqueda y unicidad del cliente: minúsculas, sin tildes,
+    espacios simples ('  María  José ' → 'maria jose')."""
+    texto = unicodedata.normalize('NFKD', nombre or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(texto.lower().split())
+
+
+def _normalizar_telefono(telefono):
+    return re.sub(r'\D', '', telefono or '') or None
+
+
+def _prefijo(columna, prefijo, db_path=None):
+    """(condición, params) para 'columna empieza por prefijo' usando índice.
+    SQLite compara por bytes: el rango [prefijo, siguiente) sirve en el índice
+    normal. En PostgreSQL el orden depende de la collation de la BD (es_CO,
+    en_US...), donde ese rango deja fuera o mete filas; ahí va LIKE, que usa
+    los índices text_pattern_ops (schema.py)."""
+    if _is_sqlite(db_path):
+        return (f"{columna} >= ? AND {columna} < ?",
+                (prefijo, prefijo[:-1] + chr(ord(prefijo[-1]) + 1)))
+    escapado = prefijo.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"{columna} LIKE ?", (escapado + '%',)
+
+
+def _cliente_id(tx, nombre):
+    """id del cliente con ese nombre (normalizado); lo crea si no existe."""
+    clave = normalizar_nombre(nombre)
+    if not clave:
+        raise ValueError("Venta a crédito requiere nombre de cliente")
+    tx.execute(_S_CLIENTE_CREAR, {'nombre': ' '.join(nombre.split()), 'clave': clave})
+    return tx.query(_S_CLIENTE_POR_NOMBRE, {'clave': clave})[0]['id']
+
+
+def _vincular_credito(tx, credito):
+    """Asigna cliente a un crédito que no lo tiene (filas insertadas por
+    scripts) y suma lo pendiente al saldo. Retorna el cliente_id."""
+    cliente_id = _cliente_id(tx, credito['cliente'])
+    tx.execute("UPDATE creditos_clientes SET cliente_id = ? WHERE id = ?", (cliente_id, credito['id']))
+    if not credito['pagado']:
+        tx.execute(_S_CLIENTE_SALDO, {'id': cliente_id, 'creditos': 1,
+                                      'monto': credito['monto'] - (credito['monto_pagado'] or 0)})
+    return cliente_id
+
+
+def _aplicar_abono(tx, credito, monto, fecha, notas=None):
+    """Aplica hasta monto a lo pendiente del crédito: fila en abonos,
+    monto_pagado (y pagado/fecha_pago si se completa) y saldo del cliente.
+    Retorna (aplicado, pendiente_restante)."""
+    cliente_id = credito['cliente_id'] or _vincular_credito(tx, credito)
+    pendiente = credito['monto'] - (credito['monto_pagado'] or 0)
+    aplicado = min(monto, pendiente)
+    completo = aplicado >= pendiente
+    if aplicado > 0:
+        tx.execute(_S_ABONO_INSERTAR, {'credito_id': credito['id'], 'cliente_id': cliente_id,
+                                       'fecha': fecha, 'monto': aplicado, 'notas': notas})
+    tx.execute("""
+        UPDATE creditos_clientes SET monto_pagado = ?, pagado = ?, fecha_pago = ? WHERE id = ?
+    """, ((credito['monto_pagado'] or 0) + aplicado, int(completo), fecha if completo else None,
+          credito['id']))
+    tx.execute(_S_CLIENTE_SALDO, {'id': cliente_id, 'monto': -aplicado, 'creditos': -int(completo)})
+    return aplicado, pendiente - aplicado
+
+
+@carga('pos')
+def buscar_clientes(texto='', limite=10, db_path=None):
+    """Clientes por prefijo de nombre (sin tildes ni mayúsculas) o de teléfono
+    (si el texto es numérico), con su saldo. Texto vacío → los que más deben."""
+    telefono = _normalizar_telefono(texto) if texto and not re.search(r'[^\d\s+()-]', texto) else None
+    clave = normalizar_nombre(texto)
+    if telefono:
+        columna, prefijo = 'telefono', telefono
+    elif clave:
+        columna, prefijo = 'nombre_normalizado', clave
+    else:
+        return query("SELECT * FROM clientes WHERE saldo > 0 ORDER BY saldo DESC LIMIT ?",
+                     (limite,), db_path=db_path)
+    condicion, params = _prefijo(columna, prefijo, db_path)
+    return query(f"SELECT * FROM clientes WHERE {condicion} ORDER BY {columna} LIMIT ?",
+                 params + (limite,), db_path=db_path)
 
-    params.append(venta_id)
-    sql = f"UPDATE ventas SET {', '.join(updates)} WHERE id = ?"
-    execute(sql, tuple(params), db_path=db_path)
 
+@carga('pos')
+def get_cliente(cliente_id, db_path=None):
+    rows = query("SELECT * FROM clientes WHERE id = ?", (cliente_id,), db_path=db_path)
+    return rows[0] if rows else None
 
-# ── Créditos ──────────────────────────────────────────────
 
-def get_creditos_pendientes(db_path=None):
-    return query("""
-        SELECT c.*, v.fecha as fecha_venta, v.sku, p.nombre as producto_nombre
+def editar_cliente(cliente_id, nombre=None, telefono=None, notas=None, db_path=None):
+    """Actualiza nombre, teléfono o notas. ValueError si el nombre ya es de otro cliente."""
+    updates = []
+    params = []
+    if nombre is not None:
+        if not normalizar_nombre(nombre):
+            raise ValueError("El nombre no puede estar vacío")
+        updates += ["nombre = ?", "nombre_normalizado = ?"]
+        params += [' '.join(nombre.split()), normalizar_nombre(nombre)]
+    if telefono is not None:
+        updates.append("telefono = ?")
+        params.append(_normalizar_telefono(telefono))
+    if notas is not None:
+        updates.append("notas = ?")
+        params.append(notas)
+    if not updates:
+        return
+    params.append(cliente_id)
+    try:
+        execute(f"UPDATE clientes SET {', '.join(updates)} WHERE id = ?", tuple(params), db_path=db_path)
+    except Exception as exc:
+        if es_error_integridad(exc):
+            raise ValueError(f"Ya existe un cliente llamado {nombre}") from exc
+        raise
+
+
+@carga('pos')
+def get_creditos_pendientes(cliente_id=None, db_path=None):
+    """Créditos sin pagar (de un cliente, por idx_creditos_cliente). La venta se
+    busca solo por id: fecha_credito la puede editar el usuario o un script y
+    no siempre coincide con la fecha de la venta."""
+    filtro = "AND c.cliente_id = ?" if cliente_id is not None else ""
+    return query(f"""
+        SELECT c.*, v.fecha as fecha_venta, v.sku, v.producto_nombre, cl.telefono
         FROM creditos_clientes c
-        LEFT JOIN ventas v ON c.venta_id = v.id
-        LEFT JOIN productos p ON v.sku = p.sku
-        WHERE c.pagado = 0
+        LEFT JOIN ventas v ON v.id = c.venta_id
+        LEFT JOIN clientes cl ON cl.id = c.cliente_id
+        WHERE c.pagado = 0 {filtro}
         ORDER BY c.fecha_credito
-    """, db_path=db_path)
+    """, (cliente_id,) if cliente_id is not None else (), db_path=db_path)
 
 
+@carga('pos')
+def get_abonos(cliente_id=None, credito_id=None, limite=100, db_path=None):
+    """Historial de abonos, del más reciente al más antiguo."""
+    condiciones, params = [], []
+    if cliente_id is not None:
+        condiciones.append("cliente_id = ?")
+        params.append(cliente_id)
+    if credito_id is not None:
+        condiciones.append("credito_id = ?")
+        params.append(credito_id)
+    donde = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    return query(f"SELECT * FROM abonos {donde} ORDER BY fecha DESC, id DESC LIMIT ?",
+                 (*params, limite), db_path=db_path)
+
+
+@carga('pos')
 def registrar_pago_credito(credito_id, fecha_pago=None, db_path=None):
-    """Marca un credito como completamente pagado."""
+    """Marca un credito como completamente pagado (abona lo pendiente)."""
     if fecha_pago is None:
         fecha_pago = date.today().isoformat()
-    # Set monto_pagado to full monto when marking as paid
-    credito = query("SELECT monto FROM creditos_clientes WHERE id = ?", (credito_id,), db_path=db_path)
-    if credito:
-        execute("UPDATE creditos_clientes SET pagado = 1, fecha_pago = ?, monto_pagado = ? WHERE id = ?",
-                (fecha_pago, credito[0]['monto'], credito_id), db_path=db_path)
-    else:
-        execute("UPDATE creditos_clientes SET pagado = 1, fecha_pago = ? WHERE id = ?",
-                (fecha_pago, credito_id), db_path=db_path)
+    with transaction(db_path) as tx:
+        credito = tx.query("SELECT * FROM creditos_clientes WHERE id = ?", (credito_id,))
+        if credito and not credito[0]['pagado']:
+            _aplicar_abono(tx, credito[0], credito[0]['monto'], fecha_pago)
 
 
-def registrar_abono(credito_id, monto_abono, db_path=None):
-    """Registra un abono parcial a un credito. Si cubre el total, marca como pagado."""
-    credito = query("SELECT * FROM creditos_clientes WHERE id = ?", (credito_id,), db_path=db_path)
-    if not credito:
-        raise ValueError(f"Credito #{credito_id} no existe")
-    credito = credito[0]
-
-    if credito['pagado']:
-        raise ValueError(f"Credito #{credito_id} ya esta pagado")
-
+@carga('pos')
+def registrar_abono(credito_id, monto_abono, clave_idempotencia=None, db_path=None):
+    """Registra un abono parcial a un credito. Si cubre el total, marca como pagado.
+    Con clave_idempotencia un reintento no suma el abono dos veces."""
+    monto_abono = _pesos(monto_abono)
     if monto_abono <= 0:
         raise ValueError("El monto del abono debe ser mayor a 0")
 
-    monto_pagado_actual = credito.get('monto_pagado') or 0
-    nuevo_pagado = monto_pagado_actual + monto_abono
-    saldo_restante = credito['monto'] - nuevo_pagado
-
-    if saldo_restante <= 0:
-        # Abono completa el pago
-        execute("""
-            UPDATE creditos_clientes
-            SET monto_pagado = ?, pagado = 1, fecha_pago = ?
-            WHERE id = ?
-        """, (credito['monto'], date.today().isoformat(), credito_id), db_path=db_path)
-    else:
-        # Abono parcial
-        execute("""
-            UPDATE creditos_clientes SET monto_pagado = ? WHERE id = ?
-        """, (nuevo_pagado, credito_id), db_path=db_path)
+    def escribir(tx):
+        credito = tx.query("SELECT * FROM creditos_clientes WHERE id = ?", (credito_id,))
+        if not credito:
+            raise ValueError(f"Credito #{credito_id} no existe")
+        credito = credito[0]
+
+        if credito['pagado']:
+            raise ValueError(f"Credito #{credito_id} ya esta pagado")
+
+        _, saldo_restante = _aplicar_abono(tx, credito, monto_abono, date.today().isoformat())
+        return {
+            'credito_id': credito_id,
+            'abono': monto_abono,
+            'total_pagado': credito['monto'] - saldo_restante,
+            'saldo_restante': saldo_restante,
+            'completado': saldo_restante <= 0,
+        }
 
-    return {
-        'credito_id': credito_id,
-        'abono': monto_abono,
-        'total_pagado': min(nuevo_pagado, credito['monto']),
-        'saldo_restante': max(0, saldo_restante),
-        'completado': saldo_restante <= 0,
-    }
+    return _idempotente(clave_idempotencia, 'registrar_abono', escribir, db_path,
+                        datos={'credito_id': credito_id, 'monto': monto_abono})
+
+
+def verificar_clientes(reparar=False, db_path=None):
+    """Recalcula saldo y creditos_abiertos de cada cliente desde sus créditos
+    pendientes y los compara con los guardados.
+
+    Retorna {'clientes', 'diferencias': [{id, nombre, saldo, calculado,
+    creditos_abiertos, abiertos_calculado}], 'ok'}. Con reparar=True deja
+    los guardados como los calculados.
+    """
+    filas = query("""
+        SELECT cl.id, cl.nombre, cl.saldo, cl.creditos_abiertos,
+               COALESCE(SUM(c.monto - COALESCE(c.monto_pagado, 0)), 0) AS calculado,
+               COUNT(c.id) AS abiertos_calculado
+        FROM clientes cl
+        LEFT JOIN creditos_clientes c ON c.cliente_id = cl.id AND c.pagado = 0
+        GROUP BY cl.id, cl.nombre, cl.saldo, cl.creditos_abiertos
+    """, db_path=db_path)
+    diferencias = [f for f in filas
+                   if f['saldo'] != f['calculado'] or f['creditos_abiertos'] != f['abiertos_calculado']]
+    if reparar and diferencias:
+        with transaction(db_path) as tx:
+            for d in diferencias:
+                tx.execute("UPDATE clientes SET saldo = ?, creditos_abiertos = ? WHERE id = ?",
+                           (int(d['calculado']), d['abiertos_calculado'], d['id']))
+    return {'clientes': len(filas), 'diferencias': diferencias, 'ok': not diferencias}
 
 
 # ── Inventario ────────────────────────────────────────────
 
+@carga('dashboard')
 def get_alertas_stock(db_path=None):
     return query("""
         SELECT * FROM productos WHERE stock <= stock_minimo
@@ -535,6 +1473,7 @@ def get_alertas_stock(db_path=None):
     """, db_path=db_path)
 
 
+@carga('dashboard')
 def get_resumen_inventario(db_path=None):
     total = query("""
         SELECT COUNT(*) as total_skus, SUM(stock) as total_unidades,
@@ -551,25 +1490,229 @@ def get_resumen_inventario(db_path=None):
     return {'total': total[0] if total else {}, 'por_categoria': por_categoria}
 
 
-def agregar_stock(sku, cantidad, db_path=None):
-    execute("UPDATE productos SET stock = stock + ? WHERE sku = ?", (cantidad, sku), db_path=db_path)
+@carga('pos')
+def agregar_stock(sku, cantidad, referencia=None, db_path=None):
+    """Entrada de mercancía: suma stock y registra el movimiento en el kardex."""
+    with transaction(db_path) as tx:
+        _mover_stock(tx, sku, cantidad, 'entrada', referencia)
+    catalog.actualizar([sku], db_path)
+
+
+# ── Kardex (movimientos de inventario) ──────────────────
+
+TIPOS_MOVIMIENTO = ('inicial', 'venta', 'anulacion', 'entrada', 'ajuste')
+
+
+def _registrar_movimiento(tx, sku, cantidad, tipo, referencia=None, fecha=None):
+    """Agrega una fila al kardex. Debe ir en la misma transacción que el cambio de stock."""
+    if not cantidad:
+        return
+    tx.execute(_S_MOVIMIENTO_INSERTAR, {'fecha': fecha or date.today().isoformat(), 'sku': sku,
+                                        'tipo': tipo, 'cantidad': cantidad, 'referencia': referencia})
+
+
+def _mover_stock(tx, sku, cantidad, tipo, referencia=None, fecha=None):
+    """Suma `cantidad` (con signo) a productos.stock y la registra en el kardex."""
+    if not tx.execute(_S_STOCK_SUMAR, {'cantidad': cantidad, 'sku': sku}):
+        raise ValueError(f"Producto {sku} no existe")
+    _registrar_movimiento(tx, sku, cantidad, tipo, referencia, fecha)
+
+
+@carga('analytics')
+def get_movimientos(sku, fecha_inicio=None, fecha_fin=None, db_path=None):
+    """Kardex de un SKU en orden cronológico, con saldo acumulado."""
+    filtros = ""
+    params = [sku]
+    if fecha_inicio:
+        filtros += " AND fecha >= ?"
+        params.append(fecha_inicio)
+    if fecha_fin:
+        filtros += " AND fecha <= ?"
+        params.append(fecha_fin)
+    movs = query(f"""
+        SELECT id, fecha, tipo, cantidad, referencia
+        FROM movimientos_inventario
+        WHERE sku = ?{filtros}
+        ORDER BY fecha, id
+    """, tuple(params), db_path=db_path)
+    saldo = get_stock_en_fecha(_dia_anterior(fecha_inicio), sku=sku, db_path=db_path) if fecha_inicio else []
+    saldo = saldo[0]['stock'] if saldo else 0
+    for m in movs:
+        saldo += m['cantidad']
+        m['saldo'] = saldo
+    return movs
+
+
+def _dia_anterior(fecha):
+    return (date.fromisoformat(str(fecha)[:10]) - timedelta(days=1)).isoformat()
+
+
+def _sql_stock_en_fecha(hasta_id=False):
+    """Stock por SKU al cierre de una fecha: último snapshot <= fecha + delta.
+
+    El delta solo lee movimientos posteriores al snapshot (por fecha, vía
+    idx_movimientos_fecha) o insertados después de tomarlo con fecha
+    anterior (por id, vía la PK). Sin snapshots recorre todo el kardex.
+    """
+    tope = " AND m.id <= ?" if hasta_id else ""
+    return f"""
+        WITH corte AS (
+            SELECT fecha, MAX(ultimo_movimiento_id) AS mov_id
+            FROM snapshots_stock
+            WHERE fecha = (SELECT MAX(fecha) FROM snapshots_stock WHERE fecha <= ?)
+            GROUP BY fecha
+        ),
+        delta_mov AS (
+            SELECT m.sku, m.cantidad
+            FROM movimientos_inventario m JOIN corte c ON m.fecha > c.fecha
+            WHERE m.fecha <= ?{tope}
+            UNION ALL
+            SELECT m.sku, m.cantidad
+            FROM movimientos_inventario m JOIN corte c ON m.id > c.mov_id
+            WHERE m.fecha <= c.fecha{tope}
+            UNION ALL
+            SELECT m.sku, m.cantidad
+            FROM movimientos_inventario m
+            WHERE NOT EXISTS (SELECT 1 FROM corte) AND m.fecha <= ?{tope}
+        ),
+        delta AS (
+            SELECT sku, SUM(cantidad) AS cantidad FROM delta_mov GROUP BY sku
+        ),
+        base AS (
+            SELECT s.sku, s.stock FROM snapshots_stock s JOIN corte c ON s.fecha = c.fecha
+        ),
+        stock_fecha AS (
+            SELECT k.sku, COALESCE(b.stock, 0) + COALESCE(d.cantidad, 0) AS stock
+            FROM (SELECT sku FROM base UNION SELECT sku FROM delta) k
+            LEFT JOIN base b ON b.sku = k.sku
+            LEFT JOIN delta d ON d.sku = k.sku
+        )
+    """
+
+
+def _params_stock_en_fecha(fecha, hasta_id=None):
+    if hasta_id is None:
+        return (fecha, fecha, fecha)
+    return (fecha, fecha, hasta_id, hasta_id, fecha, hasta_id)
+
+
+@carga('analytics')
+def get_stock_en_fecha(fecha, sku=None, db_path=None):
+    """Stock por SKU al cierre de `fecha` (YYYY-MM-DD), valorizado al costo actual.
+    Solo SKUs con stock distinto de 0."""
+    filtro = "AND sf.sku = ?" if sku else ""
+    params = _params_stock_en_fecha(fecha) + ((sku,) if sku else ())
+    return query(_sql_stock_en_fecha() + f"""
+        SELECT sf.sku, p.nombre, sf.stock, p.costo, sf.stock * COALESCE(p.costo, 0) AS valor_costo
+        FROM stock_fecha sf
+        LEFT JOIN productos p ON p.sku = sf.sku
+        WHERE sf.stock <> 0 {filtro}
+        ORDER BY sf.sku
+    """, params, db_path=db_path)
+
+
+@carga('analytics')
+def get_valor_inventario_en_fecha(fecha, db_path=None):
+    """Unidades y valor a costo del inventario al cierre de `fecha`."""
+    row = query(_sql_stock_en_fecha() + """
+        SELECT COALESCE(SUM(sf.stock), 0) AS unidades,
+               COALESCE(SUM(sf.stock * COALESCE(p.costo, 0)), 0) AS valor_costo
+        FROM stock_fecha sf
+        LEFT JOIN productos p ON p.sku = sf.sku
+    """, _params_stock_en_fecha(fecha), db_path=db_path)[0]
+    return {'fecha': fecha, 'unidades': row['unidades'], 'valor_costo': row['valor_costo']}
+
+
+@carga('analytics')
+def tomar_snapshot_stock(fecha=None, db_path=None):
+    """Guarda el stock por SKU al cierre de `fecha` (reemplaza uno previo del mismo día).
+    Se toma al cerrar caja; acota el delta de get_stock_en_fecha. Retorna filas guardadas."""
+    if fecha is None:
+        fecha = date.today().isoformat()
+    with transaction(db_path) as tx:
+        tope = tx.query("SELECT COALESCE(MAX(id), 0) AS id FROM movimientos_inventario")[0]['id']
+        tx.execute("DELETE FROM snapshots_stock WHERE fecha = ?", (fecha,))
+        filas = tx.query(_sql_stock_en_fecha(hasta_id=True) + """
+            SELECT sku, stock FROM stock_fecha
+        """, _params_stock_en_fecha(fecha, tope))
+        for f in filas:
+            tx.execute(_S_SNAPSHOT_INSERTAR, {'fecha': fecha, 'sku': f['sku'], 'stock': f['stock'],
+                                              'tope': tope})
+    return len(filas)
+
+
+@carga('analytics')
+def verificar_kardex(workers=4, tamano_bloque=200, db_path=None):
+    """Recalcula el stock de cada SKU desde el kardex y lo compara con productos.stock.
+
+    Los SKUs se revisan por bloques en paralelo (un hilo y una conexión por
+    bloque). Los hilos heredan la clase analytics y no pasan de sus cupos.
+    Retorna {'skus', 'diferencias': [{sku, stock, kardex}], 'ok'}.
+    """
+    skus = [r['sku'] for r in query("SELECT sku FROM productos ORDER BY sku", db_path=db_path)]
+    bloques = [skus[i:i + tamano_bloque] for i in range(0, len(skus), tamano_bloque)]
+
+    def revisar(bloque):
+        marcas = ', '.join('?' * len(bloque))
+        return query(f"""
+            SELECT p.sku, p.stock, COALESCE(SUM(m.cantidad), 0) AS kardex
+            FROM productos p
+            LEFT JOIN movimientos_inventario m ON m.sku = p.sku
+            WHERE p.sku IN ({marcas})
+            GROUP BY p.sku, p.stock
+            HAVING p.stock <> COALESCE(SUM(m.cantidad), 0)
+        """, tuple(bloque), db_path=db_path)
+
+    clase = _clase_actual()
+    if clase is not None:
+        workers = min(workers, clase.cupos)
+    diferencias = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        for filas in ex.map(con_clase(revisar), bloques):
+            diferencias.extend(filas)
+    return {'skus': len(skus), 'diferencias': diferencias, 'ok': not diferencias}
 
 
 # ── Gastos ────────────────────────────────────────────────
 
+@carga('pos')
 def registrar_gasto(fecha, categoria, monto, descripcion, pagado_por,
-                    metodo_pago=None, es_inversion=0, notas=None, db_path=None):
-    """Registra un nuevo gasto."""
-    return execute("""
-        INSERT INTO gastos (fecha, categoria, monto, descripcion, metodo_pago, pagado_por, es_inversion, notas)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """, (fecha, categoria, monto, descripcion, metodo_pago, pagado_por, es_inversion, notas),
-        db_path=db_path)
+                    metodo_pago=None, es_inversion=0, notas=None, clave_idempotencia=None,
+                    db_path=None):
+    """Registra un nuevo gasto. Con clave_idempotencia un reintento retorna el id original."""
+    return _idempotente(
+        clave_idempotencia, 'registrar_gasto',
+        lambda tx: _insertar_gasto(tx, fecha, categoria, monto, descripcion, pagado_por,
+                                   metodo_pago, es_inversion, notas),
+        db_path,
+        datos={'fecha': fecha, 'categoria': categoria, 'monto': monto, 'descripcion': descripcion,
+               'pagado_por': pagado_por, 'metodo_pago': metodo_pago, 'es_inversion': es_inversion,
+               'notas': notas},
+    )
+
 
+def _insertar_gasto(tx, fecha, categoria, monto, descripcion, pagado_por,
+                    metodo_pago=None, es_inversion=0, notas=None):
+    _verificar_mes_abierto(fecha, tx)
+    gasto_id = tx.execute(_S_GASTO_INSERTAR, {
+        'fecha': fecha, 'categoria': categoria, 'monto': _pesos(monto), 'descripcion': descripcion,
+        'metodo_pago': metodo_pago, 'pagado_por': pagado_por, 'es_inversion': es_inversion, 'notas': notas})
+    if metodo_pago == 'Efectivo':
+        _sumar_caja(tx, fecha, 'gastos_efectivo', _pesos(monto))
+    return gasto_id
 
+
+def _gasto_en_caja(tx, gasto, signo):
+    """Suma (signo=1) o resta (signo=-1) un gasto en efectivo del acumulado de caja."""
+    if gasto['metodo_pago'] == 'Efectivo':
+        _sumar_caja(tx, gasto['fecha'], 'gastos_efectivo', signo * gasto['monto'])
+
+
+@carga('pos')
 def registrar_gasto_parejo(fecha, categoria, monto_total, descripcion,
                            metodo_pago=None, es_inversion=0, notas=None, db_path=None):
     """Registra un gasto dividido parejo entre los 3 socios. Crea 3 registros."""
+    monto_total = _pesos(monto_total)
     parte = round(monto_total / 3)
     resto = monto_total - (parte * 3)
     ids = []
@@ -581,6 +1724,7 @@ def registrar_gasto_parejo(fecha, categoria, monto_total, descripcion,
     return ids
 
 
+@carga('pos')
 def registrar_gasto_personalizado(fecha, categoria, montos_por_socio, descripcion,
                                   metodo_pago=None, es_inversion=0, notas=None, db_path=None):
     """Registra un gasto con montos diferentes por socio. Solo crea registros para montos > 0."""
@@ -606,7 +1750,7 @@ def editar_gasto(gasto_id, fecha=None, categoria=None, monto=None,
         params.append(categoria)
     if monto is not None:
         updates.append("monto = ?")
-        params.append(monto)
+        params.append(_pesos(monto))
     if descripcion is not None:
         updates.append("descripcion = ?")
         params.append(descripcion)
@@ -619,16 +1763,32 @@ def editar_gasto(gasto_id, fecha=None, categoria=None, monto=None,
 
     if not updates:
         return
-    params.append(gasto_id)
-    sql = f"UPDATE gastos SET {', '.join(updates)} WHERE id = ?"
-    execute(sql, tuple(params), db_path=db_path)
+    with transaction(db_path) as tx:
+        previo = tx.query("SELECT fecha, monto, metodo_pago FROM gastos WHERE id = ?", (gasto_id,))
+        if previo:
+            _verificar_mes_abierto(previo[0]['fecha'], tx)
+        if fecha is not None:
+            _verificar_mes_abierto(fecha, tx)
+        params.append(gasto_id)
+        sql = f"UPDATE gastos SET {', '.join(updates)} WHERE id = ?"
+        tx.execute(sql, tuple(params))
+        if previo:
+            _gasto_en_caja(tx, previo[0], -1)
+            _gasto_en_caja(tx, tx.query("SELECT fecha, monto, metodo_pago FROM gastos WHERE id = ?",
+                                        (gasto_id,))[0], 1)
 
 
 def eliminar_gasto(gasto_id, db_path=None):
     """Elimina un gasto por ID."""
-    execute("DELETE FROM gastos WHERE id = ?", (gasto_id,), db_path=db_path)
+    with transaction(db_path) as tx:
+        previo = tx.query("SELECT fecha, monto, metodo_pago FROM gastos WHERE id = ?", (gasto_id,))
+        if previo:
+            _verificar_mes_abierto(previo[0]['fecha'], tx)
+            _gasto_en_caja(tx, previo[0], -1)
+        tx.execute("DELETE FROM gastos WHERE id = ?", (gasto_id,))
 
 
+@carga('dashboard')
 def get_gastos_mes(year, month, db_path=None):
     fecha_inicio = f"{year}-{month:02d}-01"
     fecha_fin = f"{year + 1}-01-01" if month == 12 else f"{year}-{month + 1:02d}-01"
@@ -646,11 +1806,21 @@ def get_gastos_mes(year, month, db_path=None):
     return {'gastos': gastos, 'por_categoria': por_categoria, 'total': total}
 
 
-def get_gastos_rango(fecha_inicio, fecha_fin, db_path=None):
-    """Gastos en un rango de fechas."""
-    return query("""
-        SELECT * FROM gastos WHERE fecha >= ? AND fecha <= ? ORDER BY fecha DESC
-    """, (fecha_inicio, fecha_fin), db_path=db_path)
+@carga('analytics')
+def get_gastos_rango(fecha_inicio, fecha_fin, analitica=False, db_path=None):
+    """Gastos en un rango de fechas, incluidos los archivados (gastos_historico
+    y Parquet). analitica=True: puede leerse de la réplica."""
+    def bd(desde, hasta):
+        return query("""
+            SELECT * FROM gastos_historico WHERE fecha >= ? AND fecha <= ? ORDER BY fecha DESC
+        """, (desde, hasta), db_path=db_path, analitica=analitica)
+
+    def parquet(desde, hasta):
+        gastos = archivo.leer('gastos', desde, hasta, db_path=db_path)
+        gastos.sort(key=lambda g: (str(g['fecha']), g['id']), reverse=True)
+        return gastos
+
+    return archivo.combinar('gastos', fecha_inicio, fecha_fin, bd, parquet, db_path)
 
 
 # ── Productos ─────────────────────────────────────────────
@@ -659,47 +1829,130 @@ def get_productos(db_path=None):
     return query("SELECT * FROM productos ORDER BY categoria, nombre", db_path=db_path)
 
 
+@carga('pos')
 def get_producto(sku, db_path=None):
     result = query("SELECT * FROM productos WHERE sku = ?", (sku,), db_path=db_path)
     return result[0] if result else None
 
 
+# Deben coincidir con los índices de expresión de scripts/migrations/0006_busqueda.py
+_PG_BUSQUEDA_DOC = ("to_tsvector('simple', coalesce(sku, '') || ' ' || coalesce(nombre, '') || ' ' || "
+                    "coalesce(categoria, '') || ' ' || coalesce(talla, '') || ' ' || coalesce(color, ''))")
+_PG_BUSQUEDA_TRGM = "(coalesce(sku, '') || ' ' || coalesce(nombre, ''))"
+# 0006 sigue sin pg_trgm si el usuario no puede crear extensiones: nombre → instalada
+_PG_EXTENSIONES = {}
+
+
+def _pg_extension(nombre):
+    """True si la extensión está instalada en PostgreSQL (una consulta por proceso)."""
+    if nombre not in _PG_EXTENSIONES:
+        _PG_EXTENSIONES[nombre] = bool(query("SELECT 1 FROM pg_extension WHERE extname = ?", (nombre,)))
+    return _PG_EXTENSIONES[nombre]
+
+
+def _tokens_busqueda(texto):
+    """Parte el texto en tokens alfanuméricos (SKU 'CAM-NEG-S' → cam, neg, s)."""
+    return [t for t in re.split(r'[^\w]+', (texto or '').lower()) if t]
+
+
+@carga('pos')
+def buscar_productos(texto, limite=20, solo_con_stock=False, db_path=None):
+    """Búsqueda indexada por prefijo sobre sku, nombre, categoría, talla y color.
+
+    SQLite: FTS5 (productos_fts) ordenado por bm25, con más peso a sku y nombre.
+    PostgreSQL: tsvector con prefijos + similitud de trigramas como desempate
+    (sin pg_trgm, solo ts_rank).
+    Texto vacío → primeros `limite` productos por categoría y nombre.
+    """
+    tokens = _tokens_busqueda(texto)
+    filtro_stock = " AND p.stock > 0" if solo_con_stock else ""
+
+    if not tokens:
+        return query(f"""
+            SELECT p.* FROM productos p WHERE 1 = 1{filtro_stock}
+            ORDER BY p.categoria, p.nombre LIMIT ?
+        """, (limite,), db_path=db_path)
+
+    if _is_sqlite(db_path):
+        # Cada token como prefijo entre comillas; espacio = AND implícito
+        match = ' '.join('"' + t.replace('"', '""') + '"*' for t in tokens)
+        return query(f"""
+            SELECT p.*
+            FROM productos_fts f
+            JOIN productos p ON p.sku = f.sku
+            WHERE productos_fts MATCH ?{filtro_stock}
+            ORDER BY bm25(productos_fts, 10.0, 5.0, 1.0, 1.0, 1.0), p.nombre
+            LIMIT ?
+        """, (match, limite), db_path=db_path)
+
+    tsquery = ' & '.join(t + ':*' for t in tokens)
+    params = (tsquery,)
+    desempate = ''
+    if _pg_extension('pg_trgm'):
+        desempate = f"similarity({_PG_BUSQUEDA_TRGM}, ?) DESC, "
+        params += (' '.join(tokens),)
+    return query(f"""
+        SELECT p.*
+        FROM productos p, to_tsquery('simple', ?) q
+        WHERE {_PG_BUSQUEDA_DOC} @@ q{filtro_stock}
+        ORDER BY ts_rank({_PG_BUSQUEDA_DOC}, q) DESC, {desempate}p.nombre
+        LIMIT ?
+    """, params + (limite,), db_path=db_path)
+
+
 def crear_producto(sku, nombre, categoria, talla, color, costo, precio_venta,
-                   stock=0, stock_minimo=3, proveedor=None, notas=None, db_path=None):
-    """Crea un nuevo producto."""
-    execute("""
-        INSERT INTO productos (sku, nombre, categoria, talla, color, costo, precio_venta, stock, stock_minimo, proveedor, notas)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (sku, nombre, categoria, talla, color, costo, precio_venta, stock, stock_minimo, proveedor, notas),
-        db_path=db_path)
+                   stock=0, stock_minimo=3, proveedor=None, notas=None, codigo_barras=None,
+                   db_path=None):
+    """Crea un nuevo producto. El stock inicial queda como movimiento 'inicial'."""
+    with transaction(db_path) as tx:
+        tx.execute(_S_PRODUCTO_INSERTAR, {
+            'sku': sku, 'nombre': nombre, 'categoria': categoria, 'talla': talla, 'color': color,
+            'costo': _pesos(costo), 'precio_venta': _pesos(precio_venta), 'stock': stock,
+            'stock_minimo': stock_minimo, 'proveedor': proveedor, 'notas': notas,
+            'codigo_barras': codigo_barras or None})
+        _registrar_movimiento(tx, sku, stock, 'inicial')
+    catalog.actualizar([sku], db_path)
 
 
 def editar_producto(sku, nombre=None, categoria=None, talla=None, color=None,
                     costo=None, precio_venta=None, stock=None, stock_minimo=None,
-                    proveedor=None, notas=None, db_path=None):
-    """Edita un producto existente."""
+                    proveedor=None, notas=None, codigo_barras=None, db_path=None):
+    """Edita un producto existente. codigo_barras='' lo borra.
+    Un cambio de stock queda en el kardex como movimiento 'ajuste'."""
     updates = []
     params = []
     for field, value in [('nombre', nombre), ('categoria', categoria), ('talla', talla),
-                         ('color', color), ('costo', costo), ('precio_venta', precio_venta),
+                         ('color', color), ('costo', _pesos(costo)), ('precio_venta', _pesos(precio_venta)),
                          ('stock', stock), ('stock_minimo', stock_minimo),
-                         ('proveedor', proveedor), ('notas', notas)]:
+                         ('proveedor', proveedor), ('notas', notas),
+                         ('codigo_barras', codigo_barras)]:
         if value is not None:
             updates.append(f"{field} = ?")
-            params.append(value)
+            params.append(None if field == 'codigo_barras' and value == '' else value)
     if not updates:
         return
     params.append(sku)
     sql = f"UPDATE productos SET {', '.join(updates)} WHERE sku = ?"
-    execute(sql, tuple(params), db_path=db_path)
+    with transaction(db_path) as tx:
+        anterior = tx.query("SELECT stock FROM productos WHERE sku = ?", (sku,)) if stock is not None else []
+        tx.execute(sql, tuple(params))
+        if anterior:
+            _registrar_movimiento(tx, sku, stock - anterior[0]['stock'], 'ajuste', 'editar_producto')
+    catalog.actualizar([sku], db_path)
 
 
 def eliminar_producto(sku, db_path=None):
     """Elimina un producto. Falla si tiene ventas asociadas."""
-    ventas = query("SELECT COUNT(*) as c FROM ventas WHERE sku = ?", (sku,), db_path=db_path)
+    ventas = query("SELECT COUNT(*) as c FROM ventas_historico WHERE sku = ?", (sku,), db_path=db_path)
     if ventas[0]['c'] > 0:
         raise ValueError(f"No se puede eliminar {sku}: tiene {ventas[0]['c']} ventas asociadas")
-    execute("DELETE FROM productos WHERE sku = ?", (sku,), db_path=db_path)
+    with transaction(db_path) as tx:
+        prod = tx.query("SELECT stock FROM productos WHERE sku = ?", (sku,))
+        if prod:
+            # El kardex es append-only: el SKU queda en 0 antes de desaparecer
+            _registrar_movimiento(tx, sku, -prod[0]['stock'], 'ajuste', 'eliminar_producto')
+        tx.execute("DELETE FROM productos WHERE sku = ?", (sku,))
+    catalog.actualizar([sku], db_path)
 
 
 # ── Costos Fijos ─────────────────────────────────────────
@@ -709,10 +1962,8 @@ def get_costos_fijos(db_path=None):
 
 
 def crear_costo_fijo(concepto, monto_mensual, activo=1, notas=None, db_path=None):
-    return execute("""
-        INSERT INTO costos_fijos (concepto, monto_mensual, activo, notas)
-        VALUES (?, ?, ?, ?)
-    """, (concepto, monto_mensual, activo, notas), db_path=db_path)
+    return execute(_S_COSTO_FIJO_INSERTAR, {'concepto': concepto, 'monto_mensual': _pesos(monto_mensual),
+                                            'activo': activo, 'notas': notas}, db_path=db_path)
 
 
 def editar_costo_fijo(costo_id, concepto=None, monto_mensual=None, activo=None, notas=None, db_path=None):
@@ -723,7 +1974,7 @@ def editar_costo_fijo(costo_id, concepto=None, monto_mensual=None, activo=None,
         params.append(concepto)
     if monto_mensual is not None:
         updates.append("monto_mensual = ?")
-        params.append(monto_mensual)
+        params.append(_pesos(monto_mensual))
     if activo is not None:
         updates.append("activo = ?")
         params.append(activo)
@@ -762,47 +2013,44 @@ def get_total_deuda_proveedores(db_path=None):
 def registrar_pedido(fecha_pedido, proveedor, descripcion, unidades, costo_unitario,
                      pagado_por=None, fecha_entrega_est=None, notas=None, db_path=None):
     """Registra un nuevo pedido a proveedor. Estado inicial: Pendiente."""
+    costo_unitario = _pesos(costo_unitario)
     total = unidades * costo_unitario
-    return execute("""
-        INSERT INTO pedidos_proveedores (fecha_pedido, proveedor, descripcion, unidades, costo_unitario, total, estado, pagado_por, fecha_entrega_est, notas)
-        VALUES (?, ?, ?, ?, ?, ?, 'Pendiente', ?, ?, ?)
-    """, (fecha_pedido, proveedor, descripcion, unidades, costo_unitario, total,
-          pagado_por, fecha_entrega_est, notas), db_path=db_path)
+    return execute(_S_PEDIDO_INSERTAR, {
+        'fecha_pedido': fecha_pedido, 'proveedor': proveedor, 'descripcion': descripcion,
+        'unidades': unidades, 'costo_unitario': costo_unitario, 'total': total,
+        'pagado_por': pagado_por, 'fecha_entrega_est': fecha_entrega_est, 'notas': notas}, db_path=db_path)
 
 
-def pagar_pedido(pedido_id, pagado_por, fecha_pago=None, metodo_pago='Transferencia', db_path=None):
+def pagar_pedido(pedido_id, pagado_por, fecha_pago=None, metodo_pago='Transferencia',
+                 clave_idempotencia=None, db_path=None):
     """
-    Marca un pedido como Pagado y registra el gasto correspondiente.
-    Crea gastos según quién paga (un socio o parejo).
+    Marca un pedido como Pagado y registra el gasto correspondiente
+    (misma transacción). Con clave_idempotencia un reintento no duplica el gasto.
     """
-    pedido = query("SELECT * FROM pedidos_proveedores WHERE id = ?", (pedido_id,), db_path=db_path)
-    if not pedido:
-        raise ValueError(f"Pedido #{pedido_id} no existe")
-    pedido = pedido[0]
-
-    if pedido['estado'] not in ('Pendiente',):
-        raise ValueError(f"Pedido #{pedido_id} ya está en estado '{pedido['estado']}'")
-
     if fecha_pago is None:
         fecha_pago = date.today().isoformat()
 
-    # Registrar gasto
-    desc = f"Pedido #{pedido_id} — {pedido['proveedor']}: {pedido['descripcion']}"
-    registrar_gasto(
-        fecha=fecha_pago,
-        categoria='Mercancía',
-        monto=pedido['total'],
-        descripcion=desc,
-        pagado_por=pagado_por,
-        metodo_pago=metodo_pago,
-        db_path=db_path,
-    )
+    def escribir(tx):
+        pedido = tx.query("SELECT * FROM pedidos_proveedores WHERE id = ?", (pedido_id,))
+        if not pedido:
+            raise ValueError(f"Pedido #{pedido_id} no existe")
+        pedido = pedido[0]
 
-    # Actualizar estado
-    execute("UPDATE pedidos_proveedores SET estado = 'Pagado', pagado_por = ? WHERE id = ?",
-            (pagado_por, pedido_id), db_path=db_path)
+        if pedido['estado'] not in ('Pendiente',):
+            raise ValueError(f"Pedido #{pedido_id} ya está en estado '{pedido['estado']}'")
 
-    return pedido
+        # Registrar gasto
+        desc = f"Pedido #{pedido_id} — {pedido['proveedor']}: {pedido['descripcion']}"
+        _insertar_gasto(tx, fecha=fecha_pago, categoria='Mercancía', monto=pedido['total'],
+                        descripcion=desc, pagado_por=pagado_por, metodo_pago=metodo_pago)
+
+        # Actualizar estado
+        tx.execute("UPDATE pedidos_proveedores SET estado = 'Pagado', pagado_por = ? WHERE id = ?",
+                   (pagado_por, pedido_id))
+        return pedido
+
+    return _idempotente(clave_idempotencia, 'pagar_pedido', escribir, db_path,
+                        datos={'pedido_id': pedido_id, 'pagado_por': pagado_por, 'metodo_pago': metodo_pago})
 
 
 def recibir_mercancia(pedido_id, skus_cantidades, db_path=None):
@@ -818,11 +2066,11 @@ def recibir_mercancia(pedido_id, skus_cantidades, db_path=None):
     if pedido['estado'] == 'Pendiente':
         raise ValueError(f"Pedido #{pedido_id} aún no está pagado")
 
-    for sku, cantidad in skus_cantidades:
-        agregar_stock(sku, cantidad, db_path=db_path)
-
-    execute("UPDATE pedidos_proveedores SET estado = 'Completo' WHERE id = ?",
-            (pedido_id,), db_path=db_path)
+    with transaction(db_path) as tx:
+        for sku, cantidad in skus_cantidades:
+            _mover_stock(tx, sku, cantidad, 'entrada', f'pedido:{pedido_id}')
+        tx.execute("UPDATE pedidos_proveedores SET estado = 'Completo' WHERE id = ?", (pedido_id,))
+    catalog.actualizar([sku for sku, _ in skus_cantidades], db_path)
 
     return pedido
 
@@ -830,6 +2078,7 @@ def recibir_mercancia(pedido_id, skus_cantidades, db_path=None):
 def editar_pedido(pedido_id, proveedor=None, descripcion=None, unidades=None,
                   costo_unitario=None, estado=None, notas=None, db_path=None):
     """Edita un pedido existente."""
+    costo_unitario = _pesos(costo_unitario)
     updates = []
     params = []
     for field, value in [('proveedor', proveedor), ('descripcion', descripcion),
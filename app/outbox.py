@@ -0,0 +1,268 @@
+"""Outbox local para el POS de ORVANN Retail OS. v1.7
+
+Cuando ORVANN_OUTBOX apunta a un archivo, las escrituras del POS (ventas,
+gastos y eventos de caja) se confirman primero en un journal SQLite local
+con una clave de idempotencia, y un worker en segundo plano las reenvía a
+la BD principal (PostgreSQL en Railway) en lotes, con reintentos y backoff
+exponencial. Así el cajero no queda bloqueado si el enlace a Railway se cae.
+
+Estados de una entrada:
+- pendiente:     en cola (o esperando el siguiente reintento)
+- sincronizado:  aplicada en la BD principal
+- conflicto:     rechazada por regla de negocio (ej. stock insuficiente);
+                 no se reintenta, queda visible en el POS para revisión
+
+Sin ORVANN_OUTBOX, enviar() llama directo a app.models (comportamiento v1.6).
+"""
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import date, datetime
+
+OUTBOX_PATH = os.environ.get('ORVANN_OUTBOX', '')
+
+BACKOFF_BASE = 2      # segundos
+BACKOFF_MAX = 300     # segundos
+INTERVALO_WORKER = 5  # segundos entre pasadas del worker
+TAMANO_LOTE = 50
+
+logger = logging.getLogger(__name__)
+
+_worker = None
+_worker_lock = threading.Lock()
+_sync_lock = threading.Lock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    clave TEXT NOT NULL UNIQUE,
+    operacion TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'pendiente'
+        CHECK(estado IN ('pendiente', 'sincronizado', 'conflicto')),
+    intentos INTEGER NOT NULL DEFAULT 0,
+    proximo_intento REAL NOT NULL DEFAULT 0,
+    ultimo_error TEXT,
+    resultado TEXT,
+    created_at TEXT NOT NULL,
+    synced_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_pendientes ON outbox(estado, proximo_intento, id);
+"""
+
+
+def _operaciones():
+    """Operaciones que pueden pasar por el outbox → función de app.models."""
+    from app import models
+    return {
+        'registrar_venta': models.registrar_venta,
+        'registrar_gasto': models.registrar_gasto,
+        'abrir_caja': models.abrir_caja,
+        'cerrar_caja': models.cerrar_caja,
+        'reabrir_caja': models.reabrir_caja,
+    }
+
+
+# Operaciones que aceptan clave_idempotencia: la clave del outbox viaja con
+# ellas, así un reenvío tras una caída no duplica en la BD principal.
+_CON_CLAVE = ('registrar_venta', 'registrar_gasto')
+
+
+def activo(outbox_path=None):
+    """True si las escrituras del POS pasan por el outbox."""
+    return bool(outbox_path or OUTBOX_PATH)
+
+
+def _conectar(outbox_path=None):
+    path = outbox_path or OUTBOX_PATH
+    conn = sqlite3.connect(path, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = FULL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _fijar_momento(operacion, payload):
+    """Congela fecha/hora al encolar: la réplica puede llegar otro día."""
+    payload = dict(payload)
+    if operacion == 'registrar_venta':
+        payload.setdefault('fecha', date.today().isoformat())
+        payload.setdefault('hora', datetime.now().strftime('%H:%M:%S'))
+    elif operacion in ('abrir_caja', 'reabrir_caja'):
+        if payload.get('fecha') is None:
+            payload['fecha'] = date.today().isoformat()
+    return payload
+
+
+def encolar(operacion, payload, clave=None, outbox_path=None):
+    """Confirma la operación en el journal local y retorna su clave.
+
+    Si la clave ya existe (doble submit) no se duplica.
+    """
+    if operacion not in _operaciones():
+        raise ValueError(f"Operación no soportada por el outbox: {operacion}")
+    clave = clave or uuid.uuid4().hex
+    payload = _fijar_momento(operacion, payload)
+    conn = _conectar(outbox_path)
+    try:
+        conn.execute("""
+            INSERT OR IGNORE INTO outbox (clave, operacion, payload, created_at)
+            VALUES (?, ?, ?, ?)
+        """, (clave, operacion, json.dumps(payload), datetime.now().isoformat(timespec='seconds')))
+        conn.commit()
+    finally:
+        conn.close()
+    return clave
+
+
+def enviar(operacion, clave=None, outbox_path=None, **kwargs):
+    """Punto de entrada del POS.
+
+    Con outbox activo encola y retorna {'pendiente': True, 'clave': ...};
+    si no, ejecuta directo y retorna {'pendiente': False, 'resultado': ...}.
+    """
+    if activo(outbox_path):
+        clave = encolar(operacion, kwargs, clave=clave, outbox_path=outbox_path)
+        if outbox_path is None:
+            # Worker solo para el outbox configurado del proceso
+            asegurar_worker()
+        return {'pendiente': True, 'clave': clave, 'resultado': None}
+    if clave and operacion in _CON_CLAVE:
+        kwargs['clave_idempotencia'] = clave
+    resultado = _operaciones()[operacion](**kwargs)
+    return {'pendiente': False, 'clave': clave, 'resultado': resultado}
+
+
+def _backoff(intentos):
+    """Backoff exponencial con jitter, acotado a BACKOFF_MAX."""
+    espera = min(BACKOFF_BASE * (2 ** (intentos - 1)), BACKOFF_MAX)
+    return espera * random.uniform(0.5, 1.0)
+
+
+def _a_json(resultado):
+    try:
+        return json.dumps(resultado, default=str)
+    except (TypeError, ValueError):
+        return json.dumps(str(resultado))
+
+
+def sincronizar(db_path=None, outbox_path=None, lote=TAMANO_LOTE):
+    """Reenvía un lote de entradas pendientes a la BD principal, en orden.
+
+    - ValueError (regla de negocio, ej. stock) → 'conflicto', sin reintento.
+    - Cualquier otro error (conexión, timeout) → reintento con backoff; el
+      lote se corta ahí para no reordenar operaciones dependientes.
+
+    Retorna {'sincronizadas', 'conflictos', 'fallidas'}.
+    """
+    ops = _operaciones()
+    res = {'sincronizadas': 0, 'conflictos': 0, 'fallidas': 0}
+    with _sync_lock:
+        conn = _conectar(outbox_path)
+        try:
+            pendientes = conn.execute("""
+                SELECT id, clave, operacion, payload, intentos, proximo_intento
+                FROM outbox WHERE estado = 'pendiente'
+                ORDER BY id LIMIT ?
+            """, (lote,)).fetchall()
+            ahora = time.time()
+            for e in pendientes:
+                if e['proximo_intento'] > ahora:
+                    break
+                payload = json.loads(e['payload'])
+                if e['operacion'] in _CON_CLAVE:
+                    payload['clave_idempotencia'] = e['clave']
+                try:
+                    resultado = ops[e['operacion']](**payload, db_path=db_path)
+                except ValueError as exc:
+                    conn.execute("""
+                        UPDATE outbox SET estado = 'conflicto', intentos = intentos + 1,
+                               ultimo_error = ? WHERE id = ?
+                    """, (str(exc), e['id']))
+                    conn.commit()
+                    res['conflictos'] += 1
+                    logger.warning("Outbox %s en conflicto: %s", e['clave'], exc)
+                    continue
+                except Exception as exc:
+                    intentos = e['intentos'] + 1
+                    conn.execute("""
+                        UPDATE outbox SET intentos = ?, proximo_intento = ?, ultimo_error = ?
+                        WHERE id = ?
+                    """, (intentos, time.time() + _backoff(intentos), str(exc), e['id']))
+                    conn.commit()
+                    res['fallidas'] += 1
+                    logger.warning("Outbox %s falló (intento %d): %s", e['clave'], intentos, exc)
+                    break
+                conn.execute("""
+                    UPDATE outbox SET estado = 'sincronizado', intentos = intentos + 1,
+                           ultimo_error = NULL, resultado = ?, synced_at = ?
+                    WHERE id = ?
+                """, (_a_json(resultado), datetime.now().isoformat(timespec='seconds'), e['id']))
+                conn.commit()
+                res['sincronizadas'] += 1
+        finally:
+            conn.close()
+    return res
+
+
+def estado_sync(outbox_path=None):
+    """Resumen para el POS: pendientes, conflictos y último error."""
+    if not activo(outbox_path):
+        return {'activo': False, 'pendientes': 0, 'conflictos': [], 'ultimo_error': None}
+    conn = _conectar(outbox_path)
+    try:
+        pendientes = conn.execute(
+            "SELECT COUNT(*) AS n, MAX(ultimo_error) AS err FROM outbox WHERE estado = 'pendiente'"
+        ).fetchone()
+        conflictos = [dict(r) for r in conn.execute("""
+            SELECT clave, operacion, payload, ultimo_error, created_at
+            FROM outbox WHERE estado = 'conflicto' ORDER BY id
+        """)]
+    finally:
+        conn.close()
+    return {
+        'activo': True,
+        'pendientes': pendientes['n'],
+        'conflictos': conflictos,
+        'ultimo_error': pendientes['err'],
+    }
+
+
+def descartar_conflicto(clave, outbox_path=None):
+    """Saca un conflicto ya revisado de la vista del POS."""
+    conn = _conectar(outbox_path)
+    try:
+        conn.execute("DELETE FROM outbox WHERE clave = ? AND estado = 'conflicto'", (clave,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _loop(db_path, outbox_path):
+    while True:
+        try:
+            sincronizar(db_path=db_path, outbox_path=outbox_path)
+        except Exception:
+            logger.exception("Worker del outbox")
+        time.sleep(INTERVALO_WORKER)
+
+
+def asegurar_worker(db_path=None, outbox_path=None):
+    """Arranca (una vez por proceso) el hilo que vacía el outbox."""
+    global _worker
+    if not activo(outbox_path):
+        return None
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(
+                target=_loop, args=(db_path, outbox_path),
+                name='orvann-outbox', daemon=True,
+            )
+            _worker.start()
+    return _worker
@@ -1,22 +1,27 @@
 """Vista Admin — 6 tabs: Gastos, Socios, Pedidos, Caja, Config, Auditoría. v1.6"""
 import streamlit as st
 import pandas as pd
-from datetime import date
+from datetime import date, timedelta
 
 from app.models import (
     registrar_gasto, registrar_gasto_parejo, registrar_gasto_personalizado,
     editar_gasto, eliminar_gasto, get_gastos_mes,
-    calcular_liquidacion_socios,
+    calcular_liquidacion_socios, registrar_pago_socio, eliminar_pago_socio,
     get_estado_caja, abrir_caja, cerrar_caja,
+    cerrar_mes, reabrir_mes, get_resultado_mes,
     get_creditos_pendientes, registrar_pago_credito, registrar_abono,
+    buscar_clientes, editar_cliente, get_abonos, verificar_clientes,
     get_pedidos, get_pedidos_pendientes, get_total_deuda_proveedores,
     registrar_pedido, pagar_pedido, recibir_mercancia, eliminar_pedido,
     get_costos_fijos, crear_costo_fijo, editar_costo_fijo, eliminar_costo_fijo,
     get_productos, crear_producto, editar_producto, eliminar_producto,
     agregar_stock,
+    get_movimientos, get_stock_en_fecha, get_valor_inventario_en_fecha, verificar_kardex,
+    verificar_caja, conciliar_caja,
 )
+from app.database import clase_carga, CargaSaturada
 from app.components.helpers import (
-    fmt_cop, render_table, CATEGORIAS_GASTO, METODOS_PAGO, VENDEDORES,
+    fmt_cop, fmt_cop_col, render_table, clave_envio, confirmar_envio, CATEGORIAS_GASTO, METODOS_PAGO, VENDEDORES,
 )
 
 SOCIOS = ['JP', 'KATHE', 'ANDRES']
@@ -48,7 +53,11 @@ def render():
     with tab5:
         render_config()
     with tab6:
-        render_auditoria()
+        with clase_carga('analytics'):
+            try:
+                render_auditoria()
+            except CargaSaturada as e:
+                st.warning(str(e))
 
 
 # ══════════════════════════════════════════════════════════
@@ -113,14 +122,20 @@ def render_gastos():
                 col_save, col_del = st.columns(2)
                 with col_save:
                     if st.form_submit_button("Guardar cambios", use_container_width=True):
-                        editar_gasto(g['id'], monto=new_monto, pagado_por=new_pagado, descripcion=new_desc)
-                        st.success("Gasto actualizado")
-                        st.rerun()
+                        try:
+                            editar_gasto(g['id'], monto=new_monto, pagado_por=new_pagado, descripcion=new_desc)
+                            st.success("Gasto actualizado")
+                            st.rerun()
+                        except ValueError as e:
+                            st.error(str(e))
                 with col_del:
                     if st.form_submit_button("Eliminar gasto", use_container_width=True):
-                        eliminar_gasto(g['id'])
-                        st.success(f"Gasto #{g['id']} eliminado")
-                        st.rerun()
+                        try:
+                            eliminar_gasto(g['id'])
+                            st.success(f"Gasto #{g['id']} eliminado")
+                            st.rerun()
+                        except ValueError as e:
+                            st.error(str(e))
     else:
         st.info("No hay gastos este mes")
 
@@ -236,10 +251,51 @@ def render_liquidacion():
             'Socio': socio,
             'Aportado': fmt_cop(s['aportado']),
             'Corresponde': fmt_cop(s['le_corresponde']),
+            'Pagos': fmt_cop(s['pagos']),
             'Saldo': estado,
         })
     render_table(pd.DataFrame(rows))
 
+    for t in liq['transferencias']:
+        st.caption(f"Para quedar a paz y salvo: {t['de']} le paga {fmt_cop(t['monto'])} a {t['a']}")
+
+    with st.expander("Saldo acumulado por mes"):
+        if liq['meses']:
+            render_table(pd.DataFrame([
+                {'Mes': m['mes'], 'Gastos': fmt_cop(m['total']),
+                 **{s: fmt_cop(m['saldos'][s]) for s in SOCIOS}}
+                for m in reversed(liq['meses'])
+            ]))
+        else:
+            st.caption("Sin gastos registrados")
+
+    with st.expander("Pagos entre socios"):
+        with st.form("form_pago_socio", clear_on_submit=True):
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                de_socio = st.selectbox("Paga", SOCIOS, key="ps_de")
+            with col2:
+                a_socio = st.selectbox("Recibe", SOCIOS, index=1, key="ps_a")
+            with col3:
+                monto_pago = st.number_input("Monto", min_value=0, value=0, step=10000, key="ps_monto")
+            fecha_pago = st.date_input("Fecha", value=date.today(), key="ps_fecha")
+            if st.form_submit_button("Registrar pago", use_container_width=True):
+                try:
+                    registrar_pago_socio(fecha_pago.isoformat(), de_socio, a_socio, monto_pago)
+                    st.success(f"{de_socio} le pagó {fmt_cop(monto_pago)} a {a_socio}")
+                    st.rerun()
+                except ValueError as e:
+                    st.error(str(e))
+
+        for p in reversed(liq['pagos']):
+            col_p, col_x = st.columns([5, 1])
+            with col_p:
+                st.markdown(f"{p['fecha']} — {p['de_socio']} → {p['a_socio']}: {fmt_cop(p['monto'])}")
+            with col_x:
+                if st.button("Eliminar", key=f"del_ps_{p['id']}"):
+                    eliminar_pago_socio(p['id'])
+                    st.rerun()
+
     with st.expander("Detalle por socio y categoria"):
         for socio in SOCIOS:
             st.markdown(f"**{socio}** — Total: {fmt_cop(liq['aportes'][socio])}")
@@ -305,9 +361,12 @@ def render_pedidos():
                         pagador = st.selectbox("Pagado por", SOCIOS, key=f"pp_pag_{p['id']}")
                     with cp2:
                         metodo = st.selectbox("Metodo", ['Transferencia', 'Efectivo', 'Datafono'], key=f"pp_met_{p['id']}")
-                    if st.form_submit_button("Marcar como Pagado", use_container_width=True):
+                    pagar = st.form_submit_button("Marcar como Pagado", use_container_width=True)
+                    clave = clave_envio(f"pagar_pedido_{p['id']}", pagar, [pagador, metodo])
+                    if pagar:
                         try:
-                            pagar_pedido(p['id'], pagador, metodo_pago=metodo)
+                            pagar_pedido(p['id'], pagador, metodo_pago=metodo, clave_idempotencia=clave)
+                            confirmar_envio(f"pagar_pedido_{p['id']}")
                             st.success(f"Pedido #{p['id']} pagado por {pagador}")
                             st.rerun()
                         except ValueError as e:
@@ -392,11 +451,16 @@ def render_caja():
                         st.error(f"Faltante: {fmt_cop(abs(dif))}")
                     st.rerun()
 
+    # ── Cierre de mes (dentro de tab Caja) ──
+    st.markdown("---")
+    render_cierre_mes()
+
     # ── Creditos pendientes (dentro de tab Caja) ──
     st.markdown("---")
     st.markdown("### Creditos Pendientes")
 
-    creditos = get_creditos_pendientes()
+    cliente = _buscar_cliente()
+    creditos = get_creditos_pendientes(cliente['id'] if cliente else None)
     if not creditos:
         st.success("No hay creditos pendientes")
     else:
@@ -426,10 +490,13 @@ def render_caja():
             with col_b:
                 with st.form(f"form_abono_{c['id']}"):
                     monto_ab = st.number_input("Abono", min_value=0, value=0, step=1000, key=f"ab_m_{c['id']}")
-                    if st.form_submit_button("Abonar"):
+                    abonar = st.form_submit_button("Abonar")
+                    clave = clave_envio(f"abono_{c['id']}", abonar, monto_ab)
+                    if abonar:
                         if monto_ab > 0:
                             try:
-                                result = registrar_abono(c['id'], monto_ab)
+                                result = registrar_abono(c['id'], monto_ab, clave_idempotencia=clave)
+                                confirmar_envio(f"abono_{c['id']}")
                                 if result['completado']:
                                     st.success(f"Credito completado con abono de {fmt_cop(monto_ab)}")
                                 else:
@@ -439,6 +506,81 @@ def render_caja():
                                 st.error(str(e))
 
 
+def _buscar_cliente():
+    """Buscador de clientes por nombre o teléfono. Retorna el cliente elegido o None."""
+    texto = st.text_input("Buscar cliente (nombre o teléfono)", key="buscar_cliente")
+    clientes = buscar_clientes(texto)
+    if not texto:
+        if clientes:
+            st.caption("Mayores saldos: " + " · ".join(f"{c['nombre']} {fmt_cop(c['saldo'])}" for c in clientes[:5]))
+        return None
+    if not clientes:
+        st.info("Sin clientes que coincidan")
+        return None
+
+    cliente = st.selectbox("Cliente", clientes, key="cliente_sel",
+                           format_func=lambda c: f"{c['nombre']} — {c['telefono'] or 'sin teléfono'} — "
+                                                 f"debe {fmt_cop(c['saldo'])}")
+    c1, c2 = st.columns(2)
+    with c1:
+        st.metric("Saldo", fmt_cop(cliente['saldo']))
+    with c2:
+        st.metric("Créditos abiertos", cliente['creditos_abiertos'])
+
+    with st.form(f"form_cliente_{cliente['id']}"):
+        telefono = st.text_input("Teléfono", value=cliente['telefono'] or '')
+        if st.form_submit_button("Guardar teléfono"):
+            try:
+                editar_cliente(cliente['id'], telefono=telefono)
+                st.rerun()
+            except ValueError as e:
+                st.error(str(e))
+
+    abonos = get_abonos(cliente_id=cliente['id'])
+    with st.expander(f"Historial de abonos ({len(abonos)})"):
+        if abonos:
+            df = pd.DataFrame(abonos)[['fecha', 'credito_id', 'monto', 'notas']]
+            df['monto'] = fmt_cop_col(df['monto'])
+            render_table(df)
+        else:
+            st.caption("Sin abonos")
+    return cliente
+
+
+def render_cierre_mes():
+    st.markdown("### Cierre de Mes")
+    hoy = date.today()
+    opciones = []
+    y, m = hoy.year, hoy.month
+    for _ in range(12):
+        y, m = (y - 1, 12) if m == 1 else (y, m - 1)
+        opciones.append((y, m))
+    y, m = st.selectbox("Mes", opciones, format_func=lambda ym: f"{ym[0]}-{ym[1]:02d}", key="cierre_mes")
+
+    res = get_resultado_mes(y, m)
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        st.metric("Ingresos", fmt_cop(res['ingresos']))
+    with c2:
+        st.metric("Gastos", fmt_cop(res['gastos']))
+    with c3:
+        st.metric("Utilidad operativa", fmt_cop(res['utilidad_operativa']))
+
+    if res['cerrado']:
+        st.success(f"Mes cerrado ({res['cerrado_en']}). Ventas y gastos del mes bloqueados.")
+        if st.button("Reabrir mes", key="btn_reabrir_mes"):
+            reabrir_mes(y, m)
+            st.rerun()
+    else:
+        st.caption("Al cerrar se congela el resultado y no se pueden editar ventas ni gastos del mes.")
+        if st.button("Cerrar mes", key="btn_cerrar_mes", use_container_width=True):
+            try:
+                cerrar_mes(y, m)
+                st.rerun()
+            except ValueError as e:
+                st.error(str(e))
+
+
 # ══════════════════════════════════════════════════════════
 # TAB 5: CONFIG (Costos Fijos + Productos)
 # ══════════════════════════════════════════════════════════
@@ -549,6 +691,7 @@ def _render_productos():
             # Mostrar SKU auto-generado
             sku_auto = _generar_sku(categoria, color or 'XXX', talla)
             sku_override = st.text_input("SKU (auto-generado, editable)", value=sku_auto, key="np_sku")
+            codigo_barras = st.text_input("Código de barras (opcional)", key="np_codigo_barras")
 
             if st.form_submit_button("Crear Producto", use_container_width=True):
                 final_sku = sku_override.strip().upper() if sku_override.strip() else sku_auto
@@ -558,6 +701,7 @@ def _render_productos():
                             sku=final_sku, nombre=nombre, categoria=categoria,
                             talla=talla, color=color, costo=costo, precio_venta=precio_venta,
                             stock=stock_ini, proveedor=proveedor or None,
+                            codigo_barras=codigo_barras.strip() or None,
                         )
                         st.success(f"Producto {final_sku} creado")
                         st.rerun()
@@ -596,12 +740,14 @@ def _render_productos():
                     new_stock = st.number_input("Stock", value=int(p['stock']), step=1, key="ep_stock")
                 with ep4:
                     new_min = st.number_input("Stock minimo", value=int(p.get('stock_minimo', 3)), step=1, key="ep_min")
+                new_codigo = st.text_input("Código de barras", value=p.get('codigo_barras') or '', key="ep_codigo_barras")
 
                 col_s, col_d = st.columns(2)
                 with col_s:
                     if st.form_submit_button("Guardar", use_container_width=True):
                         editar_producto(p['sku'], costo=new_costo, precio_venta=new_precio,
-                                        stock=new_stock, stock_minimo=new_min)
+                                        stock=new_stock, stock_minimo=new_min,
+                                        codigo_barras=new_codigo.strip())
                         st.success(f"{p['sku']} actualizado")
                         st.rerun()
                 with col_d:
@@ -625,6 +771,7 @@ def render_auditoria():
 
     seccion = st.selectbox("Tabla a inspeccionar", [
         "Gastos", "Ventas", "Productos", "Créditos", "Pedidos", "Costos Fijos", "Caja Diaria",
+        "Kardex",
     ], key="audit_tabla")
 
     if seccion == "Gastos":
@@ -641,11 +788,13 @@ def render_auditoria():
         _audit_costos_fijos()
     elif seccion == "Caja Diaria":
         _audit_caja()
+    elif seccion == "Kardex":
+        _audit_kardex()
 
 
 def _audit_gastos():
     from app.database import query as db_query
-    gastos = db_query("SELECT * FROM gastos ORDER BY fecha DESC, id DESC")
+    gastos = db_query("SELECT * FROM gastos_historico ORDER BY fecha DESC, id DESC", analitica=True)
     st.metric("Total registros", len(gastos))
 
     if not gastos:
@@ -674,17 +823,16 @@ def _audit_gastos():
     # Tabla completa
     st.markdown("#### Todos los gastos")
     display = df[['id', 'fecha', 'categoria', 'monto', 'descripcion', 'metodo_pago', 'pagado_por', 'es_inversion']].copy()
-    display['monto'] = df['monto'].apply(fmt_cop)
+    display['monto'] = fmt_cop_col(df['monto'])
     render_table(display, max_height=500)
 
 
 def _audit_ventas():
     from app.database import query as db_query
     ventas = db_query("""
-        SELECT v.*, p.nombre as producto_nombre
-        FROM ventas v LEFT JOIN productos p ON v.sku = p.sku
-        ORDER BY v.fecha DESC, v.id DESC
-    """)
+        SELECT * FROM ventas_historico
+        ORDER BY fecha DESC, id DESC
+    """, analitica=True)
     st.metric("Total registros", len(ventas))
 
     if not ventas:
@@ -711,8 +859,8 @@ def _audit_ventas():
 
     st.markdown("#### Todas las ventas")
     display = df[['id', 'fecha', 'hora', 'sku', 'producto_nombre', 'cantidad', 'precio_unitario', 'total', 'metodo_pago', 'vendedor', 'cliente']].copy()
-    display['total'] = df['total'].apply(fmt_cop)
-    display['precio_unitario'] = df['precio_unitario'].apply(fmt_cop)
+    display['total'] = fmt_cop_col(df['total'])
+    display['precio_unitario'] = fmt_cop_col(df['precio_unitario'])
     render_table(display, max_height=500)
 
 
@@ -741,20 +889,19 @@ def _audit_productos():
 
     st.markdown("#### Todos los productos")
     display = df[['sku', 'nombre', 'categoria', 'talla', 'color', 'costo', 'precio_venta', 'stock', 'stock_minimo']].copy()
-    display['costo'] = df['costo'].apply(fmt_cop)
-    display['precio_venta'] = df['precio_venta'].apply(fmt_cop)
+    display['costo'] = fmt_cop_col(df['costo'])
+    display['precio_venta'] = fmt_cop_col(df['precio_venta'])
     render_table(display, max_height=500)
 
 
 def _audit_creditos():
     from app.database import query as db_query
     creditos = db_query("""
-        SELECT c.*, v.sku, v.fecha as fecha_venta, p.nombre as producto_nombre
+        SELECT c.*, v.sku, v.fecha as fecha_venta, v.producto_nombre
         FROM creditos_clientes c
         LEFT JOIN ventas v ON c.venta_id = v.id
-        LEFT JOIN productos p ON v.sku = p.sku
         ORDER BY c.id DESC
-    """)
+    """, analitica=True)
     st.metric("Total créditos", len(creditos))
 
     if not creditos:
@@ -777,11 +924,22 @@ def _audit_creditos():
     cols = ['id', 'cliente', 'monto', 'monto_pagado', 'fecha_credito', 'pagado', 'producto_nombre']
     cols_exist = [c for c in cols if c in df.columns]
     display = df[cols_exist].copy()
-    display['monto'] = df['monto'].apply(fmt_cop)
+    display['monto'] = fmt_cop_col(df['monto'])
     if 'monto_pagado' in display.columns:
-        display['monto_pagado'] = df['monto_pagado'].fillna(0).apply(fmt_cop)
+        display['monto_pagado'] = fmt_cop_col(df['monto_pagado'])
     render_table(display, max_height=400)
 
+    if st.button("Verificar saldos de clientes", key="audit_clientes"):
+        res = verificar_clientes()
+        if res['ok']:
+            st.success(f"✅ {res['clientes']} clientes cuadran con sus créditos pendientes")
+        else:
+            st.error(f"{len(res['diferencias'])} clientes no cuadran")
+            render_table(pd.DataFrame(res['diferencias']))
+    if st.button("Reparar saldos", key="audit_clientes_reparar"):
+        res = verificar_clientes(reparar=True)
+        st.success(f"{len(res['diferencias'])} saldos corregidos")
+
 
 def _audit_pedidos():
     pedidos = get_pedidos()
@@ -806,8 +964,8 @@ def _audit_pedidos():
 
     st.markdown("#### Todos los pedidos")
     display = df[['id', 'fecha_pedido', 'proveedor', 'descripcion', 'unidades', 'costo_unitario', 'total', 'estado', 'pagado_por']].copy()
-    display['total'] = df['total'].apply(lambda x: fmt_cop(x or 0))
-    display['costo_unitario'] = df['costo_unitario'].apply(lambda x: fmt_cop(x or 0))
+    display['total'] = fmt_cop_col(df['total'])
+    display['costo_unitario'] = fmt_cop_col(df['costo_unitario'])
     render_table(display, max_height=500)
 
 
@@ -830,13 +988,15 @@ def _audit_costos_fijos():
 
     st.markdown("#### Todos los costos fijos")
     display = df[['id', 'concepto', 'monto_mensual', 'activo', 'notas']].copy()
-    display['monto_mensual'] = df['monto_mensual'].apply(fmt_cop)
+    display['monto_mensual'] = fmt_cop_col(df['monto_mensual'])
     render_table(display, max_height=400)
 
 
 def _audit_caja():
     from app.database import query as db_query
-    cajas = db_query("SELECT * FROM caja_diaria ORDER BY fecha DESC")
+    _conciliacion_caja()
+
+    cajas = db_query("SELECT * FROM caja_diaria ORDER BY fecha DESC", analitica=True)
     st.metric("Total registros caja", len(cajas))
 
     if not cajas:
@@ -846,7 +1006,106 @@ def _audit_caja():
     df = pd.DataFrame(cajas)
     st.markdown("#### Todos los registros de caja")
     display = df.copy()
-    for col in ['efectivo_inicio', 'efectivo_cierre_real']:
+    for col in ['efectivo_inicio', 'efectivo_cierre_real', 'ventas_efectivo', 'ventas_transferencia',
+                'ventas_datafono', 'ventas_credito', 'gastos_efectivo']:
         if col in display.columns:
-            display[col] = df[col].apply(lambda x: fmt_cop(x) if x is not None else '-')
+            display[col] = fmt_cop_col(df[col]).where(df[col].notna(), '-')
     render_table(display, max_height=400)
+
+    st.markdown("#### Verificación")
+    if st.button("Recalcular acumulados desde ventas y gastos", key="audit_caja_verificar"):
+        res = verificar_caja()
+        if res['ok']:
+            st.success(f"✅ {res['dias']} días de caja cuadran con ventas y gastos")
+        else:
+            st.error(f"{len(res['diferencias'])} acumulados no cuadran")
+            render_table(pd.DataFrame(res['diferencias']))
+    if st.button("Reparar acumulados", key="audit_caja_reparar"):
+        res = verificar_caja(reparar=True)
+        st.success(f"{len(res['diferencias'])} acumulados corregidos")
+
+
+def _conciliacion_caja():
+    """Esperado vs real, deriva y encadenamiento de aperturas en un rango de días."""
+    st.markdown("#### Conciliación por rango")
+    col1, col2 = st.columns(2)
+    with col1:
+        desde = st.date_input("Desde", value=date.today() - timedelta(days=30), key="conc_desde")
+    with col2:
+        hasta = st.date_input("Hasta", value=date.today(), key="conc_hasta")
+    if desde > hasta:
+        st.error("El rango está invertido")
+        return
+
+    res = conciliar_caja(desde.isoformat(), hasta.isoformat(), analitica=True)
+    r = res['resumen']
+    c1, c2, c3, c4 = st.columns(4)
+    with c1:
+        st.metric("Cajas cerradas", f"{r['cerradas']}/{r['dias']}")
+    with c2:
+        st.metric("Deriva acumulada", fmt_cop(r['diferencia_total']))
+    with c3:
+        st.metric("Faltantes", fmt_cop(abs(r['faltantes'])))
+    with c4:
+        st.metric("Sobrantes", fmt_cop(r['sobrantes']))
+    if r['atipicos'] or r['descuadres_apertura'] or r['sin_cerrar']:
+        st.warning(f"{r['atipicos']} días atípicos · {r['descuadres_apertura']} aperturas que no "
+                   f"coinciden con el cierre anterior · {r['sin_cerrar']} cajas sin cerrar")
+
+    dias = [d for d in res['dias'] if d['con_caja']]
+    if not dias:
+        st.info("Sin cajas en el rango")
+        return
+    solo_alertas = st.checkbox("Solo días con alerta", key="conc_alertas")
+    if solo_alertas:
+        dias = [d for d in dias if d['atipico'] or d['descuadre_apertura'] or not d['cerrada']]
+    rows = []
+    for d in reversed(dias):
+        dif = d['diferencia']
+        rows.append({
+            'Fecha': d['fecha'],
+            'Esperado': fmt_cop(d['esperado']),
+            'Real': fmt_cop(d['real']) if d['real'] is not None else '-',
+            'Diferencia': fmt_cop(dif) if dif is not None else 'Sin cerrar',
+            'Deriva': fmt_cop(d['deriva']),
+            'Apertura vs cierre ant.': fmt_cop(d['descuadre_apertura']) if d['descuadre_apertura'] else '-',
+            'Alerta': '⚠️' if d['atipico'] else '',
+        })
+    render_table(pd.DataFrame(rows), max_height=400)
+
+
+def _audit_kardex():
+    """Stock a una fecha (snapshot + movimientos) y verificación kardex vs productos.stock."""
+    fecha = st.date_input("Stock al cierre de", value=date.today(), key="audit_kardex_fecha")
+    valor = get_valor_inventario_en_fecha(fecha.isoformat())
+    c1, c2 = st.columns(2)
+    with c1:
+        st.metric("Unidades", int(valor['unidades']))
+    with c2:
+        st.metric("Valor costo (costo actual)", fmt_cop(valor['valor_costo']))
+
+    stock = get_stock_en_fecha(fecha.isoformat())
+    if stock:
+        df = pd.DataFrame(stock)
+        display = df[['sku', 'nombre', 'stock', 'valor_costo']].copy()
+        display['valor_costo'] = fmt_cop_col(df['valor_costo'])
+        render_table(display, max_height=400)
+
+    productos = get_productos()
+    if productos:
+        st.markdown("#### Movimientos de un producto")
+        sku = st.selectbox("SKU", [p['sku'] for p in productos], key="audit_kardex_sku")
+        movs = get_movimientos(sku)
+        if movs:
+            render_table(pd.DataFrame(movs)[['fecha', 'tipo', 'cantidad', 'saldo', 'referencia']], max_height=300)
+        else:
+            st.info("Sin movimientos")
+
+    st.markdown("#### Verificación")
+    if st.button("Recalcular stock desde el kardex", key="audit_kardex_verificar"):
+        res = verificar_kardex()
+        if res['ok']:
+            st.success(f"✅ {res['skus']} SKUs cuadran con el kardex")
+        else:
+            st.error(f"{len(res['diferencias'])} SKUs no cuadran")
+            render_table(pd.DataFrame(res['diferencias']))
@@ -1,25 +1,35 @@
-"""Vista Dashboard — Metricas esenciales, PE, resultado mensual. v1.6"""
+"""Vista Dashboard — Metricas esenciales, PE, resultado mensual. v1.7"""
 import streamlit as st
+import pandas as pd
 from datetime import date
 
-from app.models import (
-    get_ventas_mes, get_ventas_semana,
-    calcular_punto_equilibrio,
-    get_resumen_inventario, get_total_deuda_proveedores,
-    get_creditos_pendientes, get_alertas_stock,
-    get_gastos_mes,
-)
-from app.components.helpers import fmt_cop, fmt_pct
+from app.models import get_dashboard_snapshot, get_resultado_mes, comparar_meses
+from app.components.helpers import fmt_cop, fmt_pct, render_table
+
+MESES_COMPARATIVO = 6
+
+
+def _meses_atras(hoy, n):
+    """'AAAA-MM' de los últimos n meses, del actual hacia atrás."""
+    y, m = hoy.year, hoy.month
+    res = []
+    for _ in range(n):
+        res.append(f"{y}-{m:02d}")
+        y, m = (y - 1, 12) if m == 1 else (y, m - 1)
+    return res
 
 
 def render():
     hoy = date.today()
     st.markdown(f"**ORVANN** — {hoy.strftime('%B %Y')}")
 
+    # Un solo round trip para todos los KPIs de la vista
+    snap = get_dashboard_snapshot()
+
     # ── Punto de Equilibrio ──────────────────────────────
     st.markdown("### Punto de Equilibrio")
 
-    pe = calcular_punto_equilibrio()
+    pe = snap['pe']
     progreso = min(pe['progreso_pct'], 100)
 
     st.progress(progreso / 100)
@@ -45,13 +55,15 @@ def render():
     st.markdown("---")
     st.markdown("### Esta Semana")
 
-    semana = get_ventas_semana()
+    semana = snap['semana']
     dias_semana = (hoy - date.fromisoformat(semana['fecha_inicio'])).days + 1
     prom_diario = semana['total'] / dias_semana if dias_semana > 0 else 0
+    anterior = snap['semana_anterior']
 
     c1, c2, c3 = st.columns(3)
     with c1:
-        st.metric("Ventas", fmt_cop(semana['total']))
+        st.metric("Ventas", fmt_cop(semana['total']),
+                  f"Sem. anterior: {fmt_cop(anterior['total'])}", delta_color="off")
     with c2:
         st.metric("Unidades", semana['unidades'])
     with c3:
@@ -61,13 +73,25 @@ def render():
     st.markdown("---")
     st.markdown("### Resultado del Mes")
 
-    ventas_mes = get_ventas_mes(hoy.year, hoy.month)
-    gastos_mes = get_gastos_mes(hoy.year, hoy.month)
+    meses = _meses_atras(hoy, 12)
+    mes_sel = st.selectbox("Mes", meses, key="dash_mes", label_visibility="collapsed")
 
-    ingreso = ventas_mes['total_ventas']
-    costo_merc = ventas_mes['total_costo']
-    utilidad_bruta = ventas_mes['utilidad_bruta']
-    gastos_op = gastos_mes['total']
+    if mes_sel == meses[0]:
+        ventas_mes = snap['mes']
+        ingreso = ventas_mes['total_ventas']
+        costo_merc = ventas_mes['total_costo']
+        utilidad_bruta = ventas_mes['utilidad_bruta']
+        gastos_op = snap['gastos_mes']
+        unidades = ventas_mes['total_unidades']
+    else:
+        # Meses pasados: snapshot de cierre si existe (una fila)
+        res = get_resultado_mes(int(mes_sel[:4]), int(mes_sel[5:]))
+        ingreso = res['ingresos']
+        costo_merc = res['costo_mercancia']
+        utilidad_bruta = res['utilidad_bruta']
+        gastos_op = res['gastos']
+        unidades = res['unidades']
+        st.caption("Mes cerrado" if res['cerrado'] else "Mes sin cerrar: calculado desde los registros")
     utilidad_op = utilidad_bruta - gastos_op
 
     c1, c2 = st.columns(2)
@@ -81,17 +105,29 @@ def render():
         else:
             st.metric("Perdida operativa", fmt_cop(utilidad_op))
 
-    st.caption(f"Utilidad bruta: {fmt_cop(utilidad_bruta)} | Uds vendidas: {ventas_mes['total_unidades']}")
+    st.caption(f"Utilidad bruta: {fmt_cop(utilidad_bruta)} | Uds vendidas: {unidades}")
+
+    with st.expander(f"Comparativo últimos {MESES_COMPARATIVO} meses"):
+        rango = _meses_atras(hoy, MESES_COMPARATIVO)
+        filas = comparar_meses(rango[-1], rango[0])
+        render_table(pd.DataFrame([{
+            'Mes': r['mes'],
+            'Ingresos': fmt_cop(r['ingresos']),
+            'Costo': fmt_cop(r['costo_mercancia']),
+            'Gastos': fmt_cop(r['gastos']),
+            'Utilidad op.': fmt_cop(r['utilidad_operativa']),
+            'PE': fmt_pct(r['progreso_pe_pct']),
+            'Estado': 'Cerrado' if r['cerrado'] else 'Abierto',
+        } for r in filas]))
 
     # ── Inventario + Finanzas ────────────────────────────
     st.markdown("---")
     st.markdown("### Situacion Actual")
 
-    inventario = get_resumen_inventario()
-    deuda = get_total_deuda_proveedores()
-    creditos = get_creditos_pendientes()
-    total_creditos = sum(c['monto'] for c in creditos)
-    total_info = inventario.get('total', {})
+    deuda = snap['deuda_proveedores']
+    creditos = snap['creditos']
+    total_creditos = creditos['total']
+    total_info = snap['inventario']
 
     c1, c2 = st.columns(2)
     with c1:
@@ -106,11 +142,11 @@ def render():
     st.caption(f"{skus_total} SKUs | {uds_total} unidades en stock")
 
     # ── Alertas ──────────────────────────────────────────
-    alertas = get_alertas_stock()
+    alertas = snap['alertas']
     agotados = [a for a in alertas if a['stock'] <= 0]
     stock_bajo = [a for a in alertas if a['stock'] > 0]
 
-    if agotados or stock_bajo or creditos:
+    if agotados or stock_bajo or creditos['cantidad']:
         st.markdown("---")
         st.markdown("### Alertas")
 
@@ -120,5 +156,5 @@ def render():
         if stock_bajo:
             nombres = ", ".join(f"{a['nombre'][:15]}({a['stock']})" for a in stock_bajo[:5])
             st.warning(f"**{len(stock_bajo)} stock bajo:** {nombres}")
-        if creditos:
-            st.warning(f"**{len(creditos)} creditos pendientes** — {fmt_cop(total_creditos)}")
+        if creditos['cantidad']:
+            st.warning(f"**{creditos['cantidad']} creditos pendientes** — {fmt_cop(total_creditos)}")
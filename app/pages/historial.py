@@ -4,8 +4,9 @@ import pandas as pd
 from datetime import date
 import io
 
-from app.models import get_ventas_rango, get_gastos_rango
-from app.components.helpers import fmt_cop, render_table
+from app.database import clase_carga, CargaSaturada
+from app.models import get_ventas_rango, get_gastos_rango, get_ventas_por_mes
+from app.components.helpers import fmt_cop, fmt_cop_col, render_table
 
 
 def render():
@@ -13,10 +14,16 @@ def render():
 
     tab1, tab2 = st.tabs(["📈 Ventas", "💸 Gastos"])
 
-    with tab1:
-        render_historial_ventas()
-    with tab2:
-        render_historial_gastos()
+    # Rangos largos y exportes: clase 'analytics' (cupo y timeout propios,
+    # no compiten con el POS)
+    with clase_carga('analytics'):
+        try:
+            with tab1:
+                render_historial_ventas()
+            with tab2:
+                render_historial_gastos()
+        except CargaSaturada as e:
+            st.warning(str(e))
 
 
 def render_historial_ventas():
@@ -41,7 +48,7 @@ def render_historial_ventas():
         st.error("La fecha de inicio debe ser anterior a la fecha fin")
         return
 
-    ventas = get_ventas_rango(fecha_inicio.isoformat(), fecha_fin.isoformat())
+    ventas = get_ventas_rango(fecha_inicio.isoformat(), fecha_fin.isoformat(), analitica=True)
 
     if not ventas:
         st.info("No hay ventas en el rango seleccionado")
@@ -56,7 +63,7 @@ def render_historial_ventas():
     # Métricas del rango
     total_ventas = df['total'].sum()
     total_unidades = df['cantidad'].sum()
-    total_costo = sum((v.get('costo') or 0) * v['cantidad'] for v in ventas)
+    total_costo = (df['costo'].fillna(0) * df['cantidad']).sum() if 'costo' in df.columns else 0
     utilidad = total_ventas - total_costo
 
     col1, col2, col3, col4 = st.columns(4)
@@ -92,7 +99,7 @@ def render_historial_ventas():
     display = display.fillna('').replace('None', '')
     # Formatear montos y fechas
     if 'total' in display.columns:
-        display['total'] = filtered['total'].apply(fmt_cop)
+        display['total'] = fmt_cop_col(filtered['total'])
     if 'fecha' in display.columns:
         display['fecha'] = pd.to_datetime(filtered['fecha']).dt.strftime('%d %b')
     if 'hora' in display.columns:
@@ -148,6 +155,15 @@ def render_historial_ventas():
             df_diario = df_diario.set_index('fecha')
             st.bar_chart(df_diario['total'], use_container_width=True)
 
+    # Tendencia mensual (rangos de varios meses): agregada en la BD y en el
+    # archivo Parquet, sin traer las filas
+    if (fecha_inicio.year, fecha_inicio.month) != (fecha_fin.year, fecha_fin.month):
+        st.markdown("#### Ventas por mes")
+        meses = get_ventas_por_mes(fecha_inicio.isoformat(), fecha_fin.isoformat(), analitica=True)
+        if meses:
+            df_mes = pd.DataFrame(meses).set_index('periodo')
+            st.bar_chart(df_mes['total'], use_container_width=True)
+
     # Exportar a Excel
     st.markdown("---")
     _exportar_excel(display, "ventas")
@@ -175,7 +191,7 @@ def render_historial_gastos():
         st.error("La fecha de inicio debe ser anterior a la fecha fin")
         return
 
-    gastos = get_gastos_rango(fecha_inicio.isoformat(), fecha_fin.isoformat())
+    gastos = get_gastos_rango(fecha_inicio.isoformat(), fecha_fin.isoformat(), analitica=True)
 
     if not gastos:
         st.info("No hay gastos en el rango seleccionado")
@@ -230,7 +246,7 @@ def render_historial_gastos():
     cols_exist = [c for c in cols_show if c in filtered.columns]
     display = filtered[cols_exist].copy()
     display = display.fillna('').replace('None', '')
-    display['monto'] = filtered['monto'].apply(fmt_cop)
+    display['monto'] = fmt_cop_col(filtered['monto'])
     if 'fecha' in display.columns:
         display['fecha'] = pd.to_datetime(filtered['fecha']).dt.strftime('%d %b')
 
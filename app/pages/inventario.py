@@ -3,7 +3,7 @@ import streamlit as st
 import pandas as pd
 
 from app.models import get_productos, get_resumen_inventario, agregar_stock
-from app.components.helpers import fmt_cop, color_stock, render_table
+from app.components.helpers import fmt_cop_col, color_stock_col, render_table
 
 
 def render():
@@ -53,9 +53,9 @@ def render():
     if not filtered.empty:
         # Agregar indicador visual de stock
         display = filtered[['sku', 'nombre', 'categoria', 'talla', 'color', 'costo', 'precio_venta', 'stock', 'stock_minimo']].copy()
-        display['estado'] = display.apply(lambda r: color_stock(r['stock'], r['stock_minimo']), axis=1)
-        display['costo'] = display['costo'].apply(fmt_cop)
-        display['precio_venta'] = display['precio_venta'].apply(fmt_cop)
+        display['estado'] = color_stock_col(display['stock'], display['stock_minimo'])
+        display['costo'] = fmt_cop_col(display['costo'])
+        display['precio_venta'] = fmt_cop_col(display['precio_venta'])
 
         render_table(display.rename(columns={
             'sku': 'SKU',
@@ -77,8 +77,8 @@ def render():
     resumen = get_resumen_inventario()
     if resumen['por_categoria']:
         df_cat = pd.DataFrame(resumen['por_categoria'])
-        df_cat['valor_costo'] = df_cat['valor_costo'].apply(lambda x: fmt_cop(x or 0))
-        df_cat['valor_venta'] = df_cat['valor_venta'].apply(lambda x: fmt_cop(x or 0))
+        df_cat['valor_costo'] = fmt_cop_col(df_cat['valor_costo'])
+        df_cat['valor_venta'] = fmt_cop_col(df_cat['valor_venta'])
         render_table(df_cat.rename(columns={
             'categoria': 'Categoría',
             'skus': 'SKUs',
@@ -4,10 +4,28 @@ import pandas as pd
 from datetime import date
 
 from app.models import (
-    registrar_venta, anular_venta, get_ventas_dia, get_productos,
-    registrar_gasto, get_estado_caja, abrir_caja, cerrar_caja, reabrir_caja,
+    anular_venta, get_ventas_dia, buscar_productos, get_estado_caja,
 )
-from app.components.helpers import fmt_cop, render_table, METODOS_PAGO, VENDEDORES, CATEGORIAS_GASTO
+from app import outbox
+from app.catalog import buscar_por_codigo
+from app.components.helpers import (
+    fmt_cop, render_table, clave_envio, confirmar_envio, METODOS_PAGO, VENDEDORES, CATEGORIAS_GASTO,
+)
+
+LIMITE_BUSQUEDA = 25
+
+
+def _on_escaneo():
+    """Resuelve el código escaneado contra el catálogo en memoria (sin BD)."""
+    codigo = st.session_state.get('venta_escaneo_input', '')
+    item = buscar_por_codigo(codigo)
+    st.session_state['venta_escaneo_input'] = ''
+    if item is None:
+        st.session_state['venta_escaneo'] = None
+        st.session_state['venta_escaneo_error'] = f"Código no encontrado: {codigo.strip()}"
+    else:
+        st.session_state['venta_escaneo'] = item.sku
+        st.session_state['venta_escaneo_error'] = None
 
 
 def render():
@@ -17,6 +35,7 @@ def render():
 
     # ── Header con fecha ──
     st.markdown(f"**ORVANN** — {hoy.strftime('%a %d %b %Y')}")
+    _render_estado_sync()
 
     # ── Métricas rápidas ──
     c1, c2 = st.columns(2)
@@ -32,7 +51,7 @@ def render():
             st.markdown("#### 💰 Abrir Caja")
             efectivo_ini = st.number_input("Efectivo inicial", min_value=0, value=0, step=10000)
             if st.form_submit_button("Abrir Caja", use_container_width=True):
-                abrir_caja(efectivo_inicio=efectivo_ini)
+                outbox.enviar('abrir_caja', efectivo_inicio=efectivo_ini)
                 st.rerun()
 
     st.markdown("---")
@@ -40,21 +59,43 @@ def render():
     # ── Formulario de venta (COMPACTO) ──
     st.markdown("### Registrar Venta")
 
-    productos = get_productos()
+    # Escáner (lector de código de barras = teclado + Enter): resuelve en memoria
+    st.text_input(
+        "Escanear código",
+        key="venta_escaneo_input",
+        placeholder="Código de barras o SKU...",
+        on_change=_on_escaneo,
+    )
+    if st.session_state.get('venta_escaneo_error'):
+        st.warning(st.session_state['venta_escaneo_error'])
+
+    escaneado = None
+    sku_escaneado = st.session_state.get('venta_escaneo')
+    if sku_escaneado:
+        escaneado = buscar_por_codigo(sku_escaneado)
+
+    # Búsqueda en servidor (índice FTS/tsvector): solo viajan los top N con stock
+    busqueda = st.text_input(
+        "Buscar producto",
+        key="venta_busqueda",
+        placeholder="Nombre, SKU, talla o color...",
+    )
+    productos = buscar_productos(busqueda, limite=LIMITE_BUSQUEDA, solo_con_stock=True)
+    if escaneado is not None and escaneado.stock > 0:
+        productos = [escaneado._asdict()] + [p for p in productos if p['sku'] != escaneado.sku]
     opciones = []
     productos_dict = {}
     for p in productos:
-        if p['stock'] > 0:
-            label = f"{p['nombre']} — {fmt_cop(p['precio_venta'])} ({p['stock']})"
-            opciones.append(label)
-            productos_dict[label] = p
+        label = f"{p['nombre']} — {fmt_cop(p['precio_venta'])} ({p['stock']})"
+        opciones.append(label)
+        productos_dict[label] = p
 
     with st.form("form_venta", clear_on_submit=True):
         seleccion = st.selectbox(
             "Producto",
             options=opciones,
-            index=None,
-            placeholder="Buscar por nombre...",
+            index=0 if (busqueda.strip() or escaneado is not None) and opciones else None,
+            placeholder="Escribe arriba para buscar..." if not opciones else "Selecciona producto...",
         )
 
         col1, col2 = st.columns(2)
@@ -79,6 +120,7 @@ def render():
         total_venta = precio * cantidad
         label_btn = f"REGISTRAR VENTA — {fmt_cop(total_venta)}" if total_venta > 0 else "REGISTRAR VENTA"
         submitted = st.form_submit_button(label_btn, use_container_width=True, type="primary")
+    clave = clave_envio('venta', submitted, [seleccion, cantidad, precio, metodo, cliente, vendedor])
 
     # ── Procesar venta ──
     if submitted:
@@ -92,7 +134,9 @@ def render():
                 st.error("Crédito requiere nombre de cliente")
             else:
                 try:
-                    venta_id = registrar_venta(
+                    envio = outbox.enviar(
+                        'registrar_venta',
+                        clave=clave,
                         sku=prod['sku'],
                         cantidad=cantidad,
                         precio=precio,
@@ -100,7 +144,10 @@ def render():
                         cliente=cliente.strip() or None,
                         vendedor=vendedor,
                     )
-                    st.success(f"✅ #{venta_id} — {prod['nombre']} x{cantidad} — {fmt_cop(total_venta)} ({metodo})")
+                    confirmar_envio('venta')
+                    st.session_state['venta_escaneo'] = None
+                    ref = "⏳ pendiente" if envio['pendiente'] else f"#{envio['resultado']}"
+                    st.success(f"✅ {ref} — {prod['nombre']} x{cantidad} — {fmt_cop(total_venta)} ({metodo})")
                     st.rerun()
                 except ValueError as e:
                     st.error(str(e))
@@ -181,9 +228,13 @@ def render():
 
             desc_gasto = st.text_input("Descripción", key="gr_desc")
             submit_gasto = st.form_submit_button("Registrar gasto", use_container_width=True)
+        clave_gasto = clave_envio('gasto', submit_gasto,
+                                  [cat_gasto, monto_gasto, pagador, metodo_gasto, desc_gasto])
 
         if submit_gasto and monto_gasto > 0 and desc_gasto:
-            registrar_gasto(
+            outbox.enviar(
+                'registrar_gasto',
+                clave=clave_gasto,
                 fecha=date.today().isoformat(),
                 categoria=cat_gasto,
                 monto=monto_gasto,
@@ -191,6 +242,7 @@ def render():
                 pagado_por=pagador,
                 metodo_pago=metodo_gasto,
             )
+            confirmar_envio('gasto')
             st.success(f"Gasto: {fmt_cop(monto_gasto)} — {desc_gasto} ({pagador})")
             st.rerun()
 
@@ -203,9 +255,12 @@ def render():
                 efectivo_real = st.number_input("Efectivo real en caja", min_value=0, value=0, step=1000)
                 notas_caja = st.text_input("Notas de cierre")
                 if st.form_submit_button("Cerrar Caja", use_container_width=True):
-                    result = cerrar_caja(hoy.isoformat(), efectivo_real, notas_caja.strip() or None)
-                    dif = result['diferencia']
-                    if abs(dif) < 1:
+                    envio = outbox.enviar('cerrar_caja', fecha=hoy.isoformat(), efectivo_real=efectivo_real,
+                                          notas=notas_caja.strip() or None)
+                    dif = 0 if envio['pendiente'] else envio['resultado']['diferencia']
+                    if envio['pendiente']:
+                        st.info("Cierre en cola — se sincroniza en segundo plano")
+                    elif abs(dif) < 1:
                         st.success("Caja cuadrada ✅")
                     elif dif > 0:
                         st.warning(f"Sobrante: {fmt_cop(dif)}")
@@ -218,5 +273,24 @@ def render():
         with st.expander("🔓 Reabrir caja"):
             st.warning("¿Reabrir la caja? Se borrará el cierre.")
             if st.button("Sí, reabrir caja", key="btn_reabrir"):
-                reabrir_caja(hoy.isoformat())
+                outbox.enviar('reabrir_caja', fecha=hoy.isoformat())
+                st.rerun()
+
+
+def _render_estado_sync():
+    """Aviso de operaciones del outbox aún no sincronizadas con la BD principal."""
+    estado = outbox.estado_sync()
+    if not estado['activo']:
+        return
+    if estado['pendientes']:
+        msg = f"⏳ {estado['pendientes']} operación(es) pendientes de sincronizar"
+        if estado['ultimo_error']:
+            msg += " — sin conexión, reintentando"
+        st.caption(msg)
+    for c in estado['conflictos']:
+        with st.expander(f"⚠️ No sincronizada: {c['operacion']} ({c['created_at']})"):
+            st.error(c['ultimo_error'])
+            st.code(c['payload'])
+            if st.button("Descartar", key=f"outbox_descartar_{c['clave']}"):
+                outbox.descartar_conflicto(c['clave'])
                 st.rerun()
@@ -0,0 +1,109 @@
+"""Registro de sentencias SQL de ORVANN Retail OS. v1.7
+
+Las sentencias calientes de app/models.py se declaran una sola vez con
+parámetros con nombre (:sku, :cantidad) y metadata explícita:
+
+    VENTA_INSERTAR = sentencia('venta_insertar', "INSERT INTO ventas ...",
+                               retorna='id')
+
+compilar() las traduce a cada backend una sola vez (cache por nombre):
+
+- SQLite: el SQL tal cual, parámetros por nombre nativos.
+- PostgreSQL: :nombre → %(nombre)s, '%' literal → '%%', y RETURNING <col>
+  si la sentencia declara retorna. No se prepara en el servidor
+  (PREPARE/EXECUTE): cada llamada abre su propia conexión PostgreSQL, así
+  un PREPARE por conexión nunca se reutilizaría y solo sumaría un viaje.
+
+El tokenizador respeta literales, identificadores entre comillas,
+comentarios y casts '::', así un ':' o '?' dentro de un string no se toca.
+adapt_sql() (SQL ad-hoc con '?') usa el mismo tokenizador.
+"""
+import re
+import threading
+from collections import namedtuple
+
+Sentencia = namedtuple('Sentencia', ['nombre', 'sql', 'retorna'])
+
+# sql: texto para cursor.execute en el backend
+Compilada = namedtuple('Compilada', ['sql'])
+
+_REGISTRO = {}
+_CACHE = {}
+_LOCK = threading.Lock()
+
+_TOKEN = re.compile(r"""
+    '(?:[^']|'')*'          # literal
+  | "(?:[^"]|"")*"          # identificador entre comillas
+  | --[^\n]*                # comentario
+  | ::                      # cast PostgreSQL
+  | :(?P<nombre>[A-Za-z_]\w*)
+  | (?P<pos>\?)
+  | (?P<pct>%)
+""", re.VERBOSE)
+
+
+def sentencia(nombre, sql, retorna=None):
+    """Declara una sentencia. retorna: columna a devolver en INSERT ('id') o None
+    (execute retorna rowcount)."""
+    if any(m.group('pos') for m in _TOKEN.finditer(sql)):
+        raise ValueError(f"Sentencia {nombre}: usar parámetros con nombre (:x), no '?'")
+    s = Sentencia(nombre, sql.strip(), retorna)
+    with _LOCK:
+        previa = _REGISTRO.get(nombre)
+        if previa is not None and previa != s:
+            raise ValueError(f"Sentencia {nombre} ya declarada con otro SQL")
+        _REGISTRO[nombre] = s
+    return s
+
+
+def registradas():
+    with _LOCK:
+        return dict(_REGISTRO)
+
+
+def _reescribir(sql, placeholder, escapar_pct):
+    """Recorre sql fuera de literales; placeholder(nombre|None) reemplaza
+    :nombre o '?'. Con escapar_pct, todo '%' (también en literales) → '%%'."""
+    nombres = []
+
+    def sub(m):
+        if m.group('nombre'):
+            nombres.append(m.group('nombre'))
+            return placeholder(m.group('nombre'))
+        if m.group('pos'):
+            return placeholder(None)
+        if m.group('pct'):
+            return '%%' if escapar_pct else '%'
+        texto = m.group(0)
+        return texto.replace('%', '%%') if escapar_pct else texto
+
+    return _TOKEN.sub(sub, sql), nombres
+
+
+def posicional_a_pg(sql):
+    """'?' → '%s' fuera de literales y '%' → '%%' (SQL ad-hoc con parámetros)."""
+    return _reescribir(sql, lambda nombre: '%s' if nombre is None else f':{nombre}', True)[0]
+
+
+def compilar(s, dialecto):
+    """Compilada de la sentencia para 'sqlite' o 'postgres' (cacheada)."""
+    clave = (s.nombre, dialecto)
+    comp = _CACHE.get(clave)
+    if comp is not None:
+        return comp
+    if dialecto == 'sqlite':
+        comp = Compilada(s.sql)
+    else:
+        sql = s.sql.rstrip(';')
+        if s.retorna:
+            sql = f"{sql} RETURNING {s.retorna}"
+        texto, _ = _reescribir(sql, lambda n: f'%({n})s', True)
+        comp = Compilada(texto)
+    with _LOCK:
+        _CACHE[clave] = comp
+    return comp
+
+
+def ejecutar_pg(cursor, s, params):
+    """Ejecuta la sentencia en un cursor psycopg2."""
+    cursor.execute(compilar(s, 'postgres').sql, params)
@@ -0,0 +1,175 @@
+"""Exporta meses cerrados de ventas, gastos y caja_diaria a Parquet. v1.7
+
+Cada mes cerrado con app/models.cerrar_mes (fila en cierres_mes) se escribe
+una vez, comprimido (zstd), en
+
+    <ORVANN_ARCHIVO_DIR>/<tabla>/mes=AAAA-MM/datos.parquet
+
+con tipos fijos por columna (scripts/schema.py): pesos en int64 y fecha en
+date32, así el filtro por fecha se resuelve con las estadísticas de cada
+row group. El archivo se escribe en un directorio temporal y se renombra:
+app/archivo.py nunca ve un mes a medias.
+
+Un mes exportado ya no se puede modificar ni reabrir
+(models._verificar_mes_abierto): Historial lo lee siempre del Parquet. Con
+--purgar, las filas de los meses exportados se borran de la BD después de
+verificar que cada una esté idéntica en el archivo (las ventas con crédito se
+quedan: creditos_clientes las referencia).
+
+Requiere pyarrow. Uso:
+    python -m scripts.archivo_parquet exportar [--purgar] [ruta.db]
+"""
+import hashlib
+import os
+import shutil
+import sys
+from datetime import date
+
+from app import archivo
+from app.database import query, transaction
+from scripts import schema
+from scripts.particiones import _mes, _siguiente
+
+TABLAS = archivo.TABLAS
+
+# Tipo lógico → tipo Arrow. hora y created_at quedan como texto (SQLite los
+# guarda como texto libre, PostgreSQL como TIME/TIMESTAMP).
+_ARROW = {
+    'serial': 'int64', 'entero': 'int64', 'dinero': 'int64', 'decimal': 'float64',
+    'texto': 'string', 'fecha': 'date32', 'hora': 'string', 'timestamp': 'string',
+}
+
+
+def esquema_arrow(tabla):
+    import pyarrow as pa
+    return pa.schema([(c.nombre, getattr(pa, _ARROW[c.tipo])()) for c in schema.tabla(tabla).columnas])
+
+
+def _fuente(tabla):
+    """ventas/gastos incluyen lo ya archivado en SQLite/PostgreSQL (*_historico)."""
+    return f"{tabla}_historico" if tabla in ('ventas', 'gastos') else tabla
+
+
+def _rango(mes):
+    inicio = _mes(mes)
+    return inicio.isoformat(), _siguiente(inicio).isoformat()
+
+
+def _convertir(fila, tipos):
+    res = {}
+    for col, tipo in tipos.items():
+        v = fila.get(col)
+        if v is not None:
+            if tipo == 'fecha':
+                v = date.fromisoformat(str(v)[:10])
+            elif tipo in ('hora', 'timestamp', 'texto'):
+                v = str(v)
+            elif tipo == 'decimal':
+                v = float(v)
+        res[col] = v
+    return res
+
+
+def _clave(tabla):
+    return 'fecha' if tabla == 'caja_diaria' else 'id'
+
+
+def _huella(fila, tipos):
+    """sha256 de la fila con los tipos del archivo: igual en BD y Parquet si
+    ninguna columna cambió."""
+    return hashlib.sha256(repr(sorted(_convertir(fila, tipos).items())).encode()).hexdigest()
+
+
+def meses_cerrados(tabla, db_path=None):
+    """'AAAA-MM' con filas en la BD y fila en cierres_mes. Un mes sin cerrar
+    aún admite ventas y gastos: exportarlo dejaría esos cambios fuera."""
+    rows = query(f"SELECT DISTINCT substr(CAST(fecha AS TEXT), 1, 7) AS mes FROM {_fuente(tabla)} "
+                 f"WHERE substr(CAST(fecha AS TEXT), 1, 7) IN (SELECT mes FROM cierres_mes)",
+                 db_path=db_path)
+    return sorted(r['mes'] for r in rows)
+
+
+def exportar_mes(tabla, mes, db_path=None, reemplazar=False):
+    """Escribe el Parquet del mes. Retorna filas escritas, o None si ya
+    existía (y no se pidió reemplazar)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    destino = os.path.dirname(archivo.ruta_mes(tabla, mes, db_path))
+    if os.path.exists(destino) and not reemplazar:
+        return None
+    desde, hasta = _rango(mes)
+    orden = 'fecha, id' if tabla != 'caja_diaria' else 'fecha'
+    filas = query(f"SELECT * FROM {_fuente(tabla)} WHERE fecha >= ? AND fecha < ? ORDER BY {orden}",
+                  (desde, hasta), db_path=db_path)
+    tipos = {c.nombre: c.tipo for c in schema.tabla(tabla).columnas}
+    t = pa.Table.from_pylist([_convertir(f, tipos) for f in filas], schema=esquema_arrow(tabla))
+
+    base = os.path.dirname(destino)
+    os.makedirs(base, exist_ok=True)
+    tmp = os.path.join(base, f'.tmp-mes={mes}')
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    pq.write_table(t, os.path.join(tmp, archivo.ARCHIVO_NOMBRE), compression='zstd')
+    viejo = None
+    if os.path.exists(destino):
+        viejo = os.path.join(base, f'.old-mes={mes}')
+        shutil.rmtree(viejo, ignore_errors=True)
+        os.rename(destino, viejo)
+    os.rename(tmp, destino)
+    if viejo:
+        shutil.rmtree(viejo)
+    return t.num_rows
+
+
+def purgar_mes(tabla, mes, db_path=None):
+    """Borra de la tabla viva las filas del mes ya exportado. Verifica antes
+    que cada una esté en el archivo con el mismo contenido (id y huella), no
+    solo que cuadre el conteo. Retorna filas borradas."""
+    import pyarrow.parquet as pq
+    ruta = archivo.ruta_mes(tabla, mes, db_path)
+    desde, hasta = _rango(mes)
+    filtro = "fecha >= ? AND fecha < ?"
+    if tabla == 'ventas':
+        filtro += " AND id NOT IN (SELECT venta_id FROM creditos_clientes WHERE venta_id IS NOT NULL)"
+    tipos = {c.nombre: c.tipo for c in schema.tabla(tabla).columnas}
+    clave = _clave(tabla)
+    archivadas = {_convertir(f, tipos)[clave]: _huella(f, tipos) for f in pq.read_table(ruta).to_pylist()}
+    with transaction(db_path) as tx:
+        vivas = tx.query(f"SELECT * FROM {tabla} WHERE {filtro}", (desde, hasta))
+        distintas = [f[clave] for f in vivas
+                     if archivadas.get(_convertir(f, tipos)[clave]) != _huella(f, tipos)]
+        if distintas:
+            raise RuntimeError(f"{ruta}: {len(distintas)} filas de la BD no coinciden con el archivo "
+                               f"({distintas[:5]}); re-exportar el mes")
+        tx.execute(f"DELETE FROM {tabla} WHERE {filtro}", (desde, hasta))
+    return len(vivas)
+
+
+def exportar_cerrados(db_path=None, purgar=False):
+    """Exporta los meses cerrados que falten. Retorna {tabla: [meses exportados]}."""
+    if not archivo.disponible():
+        raise RuntimeError("El archivo Parquet requiere pyarrow (pip install pyarrow)")
+    hechos = {}
+    for tabla in TABLAS:
+        hechos[tabla] = []
+        for mes in meses_cerrados(tabla, db_path):
+            if exportar_mes(tabla, mes, db_path) is not None:
+                hechos[tabla].append(mes)
+            if purgar:
+                purgar_mes(tabla, mes, db_path)
+    return hechos
+
+
+def _main(args):
+    if not args or args[0] != 'exportar':
+        print(__doc__)
+        return 1
+    purgar = '--purgar' in args
+    resto = [a for a in args[1:] if a != '--purgar']
+    for tabla, meses in exportar_cerrados(resto[0] if resto else None, purgar).items():
+        print(f"{tabla}: {', '.join(meses) or 'al día'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(_main(sys.argv[1:]))
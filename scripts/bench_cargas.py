@@ -0,0 +1,112 @@
+"""Benchmark: latencia del POS bajo carga analítica, con y sin clases de carga. v1.7
+
+Sesiones POS (buscar producto + vender) corren junto a sesiones de
+Historial/Auditoría que leen rangos completos de ventas. Se compara la
+latencia p50/p99 del POS en tres escenarios: solo POS, POS + analytics sin
+clases (ORVANN_CLASES_CARGA=0) y POS + analytics con clases.
+
+Uso:
+    python scripts/bench_cargas.py [ventas_historicas] [segundos]
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import database
+from app.models import registrar_venta, get_producto, get_ventas_rango
+from scripts.bench_sqlite import _preparar, PRODUCTOS
+from scripts.stress_escritor import _percentil
+
+SESIONES_POS = 4
+SESIONES_ANALYTICS = 4
+
+
+def _historial(path, ventas):
+    rng = random.Random(0)
+    conn = database._get_sqlite_connection(path)
+    conn.executemany("""
+        INSERT INTO ventas (fecha, hora, sku, cantidad, precio_unitario, total, metodo_pago,
+                            costo_unitario, producto_nombre)
+        VALUES (?, '12:00:00', ?, 1, 75000, 75000, 'Efectivo', 37000, ?)
+    """, [(f'202{rng.randint(3, 5)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+           f'BENCH-{i % PRODUCTOS}', f'Producto {i % PRODUCTOS}') for i in range(ventas)])
+    conn.commit()
+    conn.close()
+
+
+def _pos(path, n, hasta, latencias):
+    i = 0
+    while time.perf_counter() < hasta:
+        i += 1
+        sku = f'BENCH-{(n + i) % PRODUCTOS}'
+        t0 = time.perf_counter()
+        get_producto(sku, db_path=path)
+        registrar_venta(sku, 1, 75000, 'Efectivo', db_path=path)
+        latencias.append(time.perf_counter() - t0)
+
+
+def _analytics(path, hasta, cuenta):
+    while time.perf_counter() < hasta:
+        try:
+            with database.clase_carga('analytics'):
+                get_ventas_rango('2000-01-01', '2100-01-01', db_path=path)
+            cuenta['completadas'] += 1
+        except database.CargaSaturada:
+            cuenta['saturadas'] += 1
+            time.sleep(0.5)  # el usuario ve el aviso y reintenta
+        except Exception as exc:
+            if 'interrupted' not in str(exc):
+                raise
+            cuenta['canceladas'] += 1
+
+
+def medir(path, analytics, clases, segundos):
+    database.CLASES_ACTIVAS = clases
+    latencias = []
+    cuenta = {'completadas': 0, 'saturadas': 0, 'canceladas': 0}
+    hasta = time.perf_counter() + segundos
+    hilos = [threading.Thread(target=_pos, args=(path, n, hasta, latencias)) for n in range(SESIONES_POS)]
+    if analytics:
+        hilos += [threading.Thread(target=_analytics, args=(path, hasta, cuenta))
+                  for _ in range(SESIONES_ANALYTICS)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    return latencias, cuenta
+
+
+def run(ventas=50_000, segundos=5):
+    original = database.CLASES_ACTIVAS
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        _preparar(path)
+        _historial(path, ventas)
+        print(f"{SESIONES_POS} sesiones POS + {SESIONES_ANALYTICS} analytics sobre "
+              f"{ventas:,}".replace(",", ".") + f" ventas, {segundos}s por escenario")
+        for nombre, analytics, clases in (('solo POS', False, True),
+                                          ('sin clases', True, False),
+                                          ('con clases', True, True)):
+            latencias, cuenta = medir(path, analytics, clases, segundos)
+            extra = (f" | analytics: {cuenta['completadas']} ok, {cuenta['saturadas']} saturadas"
+                     if analytics else "")
+            print(f"  {nombre:<11} POS {len(latencias) / segundos:6.1f} ventas/s | "
+                  f"p50 {_percentil(latencias, 50) * 1000:6.1f} ms | "
+                  f"p99 {_percentil(latencias, 99) * 1000:7.1f} ms{extra}")
+    finally:
+        database.CLASES_ACTIVAS = original
+        database.cerrar_sqlite(path)
+        for suf in ('', '-wal', '-shm'):
+            if os.path.exists(path + suf):
+                os.unlink(path + suf)
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 5)
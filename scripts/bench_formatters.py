@@ -0,0 +1,58 @@
+"""Benchmark: formateo escalar (.apply) vs vectorizado sobre 100k filas. v1.7
+
+Uso:
+    python scripts/bench_formatters.py [filas]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+import pandas as pd
+
+from app.components.helpers import (
+    fmt_cop, fmt_pct, color_stock,
+    fmt_cop_col, fmt_pct_col, color_stock_col,
+)
+
+
+def _medir(fn, repeticiones=3):
+    mejor = float('inf')
+    resultado = None
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        resultado = fn()
+        mejor = min(mejor, time.perf_counter() - t0)
+    return mejor, resultado
+
+
+def run(filas=100_000):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'total': rng.uniform(-1e6, 5e7, filas).round(),
+        'pct': rng.uniform(0, 100, filas),
+        'stock': rng.integers(-1, 20, filas),
+        'stock_minimo': rng.integers(0, 6, filas),
+    })
+
+    casos = [
+        ('COP', lambda: df['total'].apply(fmt_cop), lambda: fmt_cop_col(df['total'])),
+        ('Porcentaje', lambda: df['pct'].apply(fmt_pct), lambda: fmt_pct_col(df['pct'])),
+        ('Semáforo stock',
+         lambda: df.apply(lambda r: color_stock(r['stock'], r['stock_minimo']), axis=1),
+         lambda: color_stock_col(df['stock'], df['stock_minimo'])),
+    ]
+
+    print(f"Formateo de {filas:,} filas".replace(",", "."))
+    for nombre, escalar, vectorizado in casos:
+        t_esc, r_esc = _medir(escalar, repeticiones=1)
+        t_vec, r_vec = _medir(vectorizado)
+        iguales = (r_esc.to_numpy() == r_vec.to_numpy()).all()
+        print(f"  {nombre:<15} apply: {t_esc * 1000:8.1f} ms | vectorizado: {t_vec * 1000:7.1f} ms "
+              f"| x{t_esc / t_vec:5.1f} | idéntico: {iguales}")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
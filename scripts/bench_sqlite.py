@@ -0,0 +1,95 @@
+"""Benchmark: perfil SQLite 'basico' vs 'rendimiento' con varias sesiones. v1.7
+
+Cada sesión es un hilo que simula una pestaña de Streamlit: 80% lecturas
+(estado de caja + ventas del día) y 20% ventas. Reporta operaciones por
+segundo y errores "database is locked" para cada perfil.
+
+Uso:
+    python scripts/bench_sqlite.py [sesiones] [segundos]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import database
+from app.models import registrar_venta, get_estado_caja, get_ventas_dia
+from scripts.create_db import create_tables
+
+PRODUCTOS = 50
+
+
+def _preparar(path):
+    create_tables(path)
+    conn = database._get_sqlite_connection(path)
+    conn.executemany("""
+        INSERT INTO productos (sku, nombre, categoria, costo, precio_venta, stock)
+        VALUES (?, ?, 'Camisa', 37000, 75000, 1000000)
+    """, [(f'BENCH-{i}', f'Producto {i}') for i in range(PRODUCTOS)])
+    conn.commit()
+    conn.close()
+
+
+def _sesion(path, n, hasta, cuenta):
+    ops = errores = 0
+    i = 0
+    while time.perf_counter() < hasta:
+        i += 1
+        try:
+            if i % 5 == 0:
+                registrar_venta(f'BENCH-{(n + i) % PRODUCTOS}', 1, 75000, 'Efectivo', db_path=path)
+            else:
+                get_estado_caja(db_path=path)
+                get_ventas_dia(db_path=path)
+            ops += 1
+        except Exception as exc:
+            if 'locked' not in str(exc):
+                raise
+            errores += 1
+    cuenta.append((ops, errores))
+
+
+def medir(perfil, sesiones, segundos):
+    database.SQLITE_PERFIL = perfil
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        _preparar(path)
+        cuenta = []
+        hasta = time.perf_counter() + segundos
+        hilos = [threading.Thread(target=_sesion, args=(path, n, hasta, cuenta)) for n in range(sesiones)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        ops = sum(o for o, _ in cuenta)
+        errores = sum(e for _, e in cuenta)
+        return ops / segundos, errores
+    finally:
+        database.cerrar_sqlite(path)
+        for suf in ('', '-wal', '-shm'):
+            if os.path.exists(path + suf):
+                os.unlink(path + suf)
+
+
+def run(sesiones=8, segundos=5):
+    original = database.SQLITE_PERFIL
+    print(f"{sesiones} sesiones concurrentes, {segundos}s por perfil (80% lectura / 20% venta)")
+    try:
+        resultados = {}
+        for perfil in ('basico', 'rendimiento'):
+            ops_s, errores = medir(perfil, sesiones, segundos)
+            resultados[perfil] = ops_s
+            print(f"  {perfil:<12} {ops_s:9.1f} ops/s | locked: {errores}")
+        if resultados['basico']:
+            print(f"  mejora x{resultados['rendimiento'] / resultados['basico']:.2f}")
+    finally:
+        database.SQLITE_PERFIL = original
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 8,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 5)
@@ -1,177 +1,103 @@
-"""Crea las 7 tablas de ORVANN Retail OS. Dual SQLite/PostgreSQL. v1.5 — CHECK constraints."""
+"""Esquema de ORVANN Retail OS (DDL dual SQLite/PostgreSQL). v1.7 — migraciones en scripts/migrations."""
 import sqlite3
 import os
 
+from scripts import particiones, schema
+
 DB_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'orvann.db')
 
-# ── DDL SQLite ──────────────────────────────────────────
-
-SQLITE_TABLES = [
-    """CREATE TABLE IF NOT EXISTS productos (
-        sku TEXT PRIMARY KEY,
-        nombre TEXT NOT NULL,
-        categoria TEXT,
-        talla TEXT,
-        color TEXT,
-        costo REAL NOT NULL CHECK (costo >= 0),
-        precio_venta REAL NOT NULL CHECK (precio_venta >= 0),
-        stock INTEGER DEFAULT 0 CHECK (stock >= 0),
-        stock_minimo INTEGER DEFAULT 3 CHECK (stock_minimo >= 0),
-        proveedor TEXT,
-        notas TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )""",
-    """CREATE TABLE IF NOT EXISTS ventas (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        fecha DATE NOT NULL DEFAULT (date('now')),
-        hora TIME DEFAULT (time('now')),
-        sku TEXT NOT NULL REFERENCES productos(sku),
-        cantidad INTEGER DEFAULT 1 CHECK (cantidad > 0),
-        precio_unitario REAL NOT NULL CHECK (precio_unitario >= 0),
-        descuento_pct REAL DEFAULT 0 CHECK (descuento_pct >= 0 AND descuento_pct <= 100),
-        total REAL NOT NULL CHECK (total >= 0),
-        metodo_pago TEXT NOT NULL CHECK (metodo_pago IN ('Efectivo', 'Transferencia', 'Datáfono', 'Crédito')),
-        cliente TEXT,
-        vendedor TEXT,
-        notas TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )""",
-    """CREATE TABLE IF NOT EXISTS caja_diaria (
-        fecha DATE PRIMARY KEY,
-        efectivo_inicio REAL DEFAULT 0 CHECK (efectivo_inicio >= 0),
-        efectivo_cierre_real REAL,
-        cerrada INTEGER DEFAULT 0 CHECK (cerrada IN (0, 1)),
-        notas TEXT
-    )""",
-    """CREATE TABLE IF NOT EXISTS gastos (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        fecha DATE NOT NULL,
-        categoria TEXT NOT NULL,
-        monto REAL NOT NULL CHECK (monto > 0),
-        descripcion TEXT,
-        metodo_pago TEXT,
-        pagado_por TEXT NOT NULL CHECK (pagado_por IN ('JP', 'KATHE', 'ANDRES')),
-        es_inversion INTEGER DEFAULT 0 CHECK (es_inversion IN (0, 1)),
-        notas TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )""",
-    """CREATE TABLE IF NOT EXISTS creditos_clientes (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        venta_id INTEGER REFERENCES ventas(id),
-        cliente TEXT NOT NULL,
-        monto REAL NOT NULL CHECK (monto > 0),
-        monto_pagado REAL DEFAULT 0 CHECK (monto_pagado >= 0),
-        fecha_credito DATE NOT NULL,
-        fecha_pago DATE,
-        pagado INTEGER DEFAULT 0 CHECK (pagado IN (0, 1)),
-        notas TEXT
-    )""",
-    """CREATE TABLE IF NOT EXISTS pedidos_proveedores (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        fecha_pedido DATE NOT NULL,
-        proveedor TEXT NOT NULL,
-        descripcion TEXT,
-        unidades INTEGER CHECK (unidades > 0),
-        costo_unitario REAL CHECK (costo_unitario >= 0),
-        total REAL CHECK (total >= 0),
-        estado TEXT DEFAULT 'Pendiente' CHECK (estado IN ('Pendiente', 'Pagado', 'Completo')),
-        pagado_por TEXT,
-        fecha_entrega_est DATE,
-        notas TEXT
-    )""",
-    """CREATE TABLE IF NOT EXISTS costos_fijos (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        concepto TEXT NOT NULL,
-        monto_mensual REAL NOT NULL CHECK (monto_mensual > 0),
-        activo INTEGER DEFAULT 1 CHECK (activo IN (0, 1)),
-        notas TEXT
-    )""",
+# ── DDL compilado ───────────────────────────────────────
+# Tablas e índices se definen una sola vez en scripts/schema.py. Es el esquema
+# actual (BD nueva); cada migración guarda su propia copia del DDL de su momento.
+
+SQLITE_TABLES = schema.compilar_tablas('sqlite')
+POSTGRES_TABLES = schema.compilar_tablas('postgres')
+SQLITE_INDEXES = schema.compilar_indices('sqlite')
+POSTGRES_INDEXES = schema.compilar_indices('postgres')
+
+# ── Triggers y búsqueda SQLite ──────────────────────────
+
+# Kardex inmutable (v1.7): solo INSERT sobre movimientos_inventario
+SQLITE_KARDEX = [
+    """CREATE TRIGGER IF NOT EXISTS movimientos_no_update BEFORE UPDATE ON movimientos_inventario BEGIN
+        SELECT RAISE(ABORT, 'movimientos_inventario es append-only');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS movimientos_no_delete BEFORE DELETE ON movimientos_inventario BEGIN
+        SELECT RAISE(ABORT, 'movimientos_inventario es append-only');
+    END""",
 ]
 
-# ── DDL PostgreSQL ──────────────────────────────────────
-
-POSTGRES_TABLES = [
-    """CREATE TABLE IF NOT EXISTS productos (
-        sku TEXT PRIMARY KEY,
-        nombre TEXT NOT NULL,
-        categoria TEXT,
-        talla TEXT,
-        color TEXT,
-        costo NUMERIC NOT NULL CHECK (costo >= 0),
-        precio_venta NUMERIC NOT NULL CHECK (precio_venta >= 0),
-        stock INTEGER DEFAULT 0 CHECK (stock >= 0),
-        stock_minimo INTEGER DEFAULT 3 CHECK (stock_minimo >= 0),
-        proveedor TEXT,
-        notas TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )""",
-    """CREATE TABLE IF NOT EXISTS ventas (
-        id SERIAL PRIMARY KEY,
-        fecha DATE NOT NULL DEFAULT CURRENT_DATE,
-        hora TIME DEFAULT CURRENT_TIME,
-        sku TEXT NOT NULL REFERENCES productos(sku),
-        cantidad INTEGER DEFAULT 1 CHECK (cantidad > 0),
-        precio_unitario NUMERIC NOT NULL CHECK (precio_unitario >= 0),
-        descuento_pct NUMERIC DEFAULT 0 CHECK (descuento_pct >= 0 AND descuento_pct <= 100),
-        total NUMERIC NOT NULL CHECK (total >= 0),
-        metodo_pago TEXT NOT NULL CHECK (metodo_pago IN ('Efectivo', 'Transferencia', 'Datáfono', 'Crédito')),
-        cliente TEXT,
-        vendedor TEXT,
-        notas TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )""",
-    """CREATE TABLE IF NOT EXISTS caja_diaria (
-        fecha DATE PRIMARY KEY,
-        efectivo_inicio NUMERIC DEFAULT 0 CHECK (efectivo_inicio >= 0),
-        efectivo_cierre_real NUMERIC,
-        cerrada INTEGER DEFAULT 0 CHECK (cerrada IN (0, 1)),
-        notas TEXT
-    )""",
-    """CREATE TABLE IF NOT EXISTS gastos (
-        id SERIAL PRIMARY KEY,
-        fecha DATE NOT NULL,
-        categoria TEXT NOT NULL,
-        monto NUMERIC NOT NULL CHECK (monto > 0),
-        descripcion TEXT,
-        metodo_pago TEXT,
-        pagado_por TEXT NOT NULL CHECK (pagado_por IN ('JP', 'KATHE', 'ANDRES')),
-        es_inversion INTEGER DEFAULT 0 CHECK (es_inversion IN (0, 1)),
-        notas TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )""",
-    """CREATE TABLE IF NOT EXISTS creditos_clientes (
-        id SERIAL PRIMARY KEY,
-        venta_id INTEGER REFERENCES ventas(id),
-        cliente TEXT NOT NULL,
-        monto NUMERIC NOT NULL CHECK (monto > 0),
-        monto_pagado NUMERIC DEFAULT 0 CHECK (monto_pagado >= 0),
-        fecha_credito DATE NOT NULL,
-        fecha_pago DATE,
-        pagado INTEGER DEFAULT 0 CHECK (pagado IN (0, 1)),
-        notas TEXT
-    )""",
-    """CREATE TABLE IF NOT EXISTS pedidos_proveedores (
-        id SERIAL PRIMARY KEY,
-        fecha_pedido DATE NOT NULL,
-        proveedor TEXT NOT NULL,
-        descripcion TEXT,
-        unidades INTEGER CHECK (unidades > 0),
-        costo_unitario NUMERIC CHECK (costo_unitario >= 0),
-        total NUMERIC CHECK (total >= 0),
-        estado TEXT DEFAULT 'Pendiente' CHECK (estado IN ('Pendiente', 'Pagado', 'Completo')),
-        pagado_por TEXT,
-        fecha_entrega_est DATE,
-        notas TEXT
-    )""",
-    """CREATE TABLE IF NOT EXISTS costos_fijos (
-        id SERIAL PRIMARY KEY,
-        concepto TEXT NOT NULL,
-        monto_mensual NUMERIC NOT NULL CHECK (monto_mensual > 0),
-        activo INTEGER DEFAULT 1 CHECK (activo IN (0, 1)),
-        notas TEXT
+# Búsqueda de productos (v1.7): FTS5 propio (no external content, porque
+# productos no tiene INTEGER PRIMARY KEY y VACUUM puede renumerar rowids).
+# Los triggers lo mantienen en sync solo cuando cambian columnas buscables,
+# así las ventas (UPDATE de stock) no tocan el índice.
+SQLITE_SEARCH = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS productos_fts USING fts5(
+        sku, nombre, categoria, talla, color,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '1 2 3'
     )""",
+    """CREATE TRIGGER IF NOT EXISTS productos_fts_ai AFTER INSERT ON productos BEGIN
+        INSERT INTO productos_fts (sku, nombre, categoria, talla, color)
+        VALUES (new.sku, new.nombre, new.categoria, new.talla, new.color);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS productos_fts_ad AFTER DELETE ON productos BEGIN
+        DELETE FROM productos_fts WHERE sku = old.sku;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS productos_fts_au
+    AFTER UPDATE OF sku, nombre, categoria, talla, color ON productos BEGIN
+        DELETE FROM productos_fts WHERE sku = old.sku;
+        INSERT INTO productos_fts (sku, nombre, categoria, talla, color)
+        VALUES (new.sku, new.nombre, new.categoria, new.talla, new.color);
+    END""",
 ]
 
+# Lecturas históricas (v1.7): ventas_historico / gastos_historico. Sin años
+# archivados son la tabla viva; con archivos, app/database.py las reemplaza
+# por una vista TEMP que une la tabla viva con cada archivo adjunto.
+SQLITE_HISTORICO = [f"CREATE VIEW IF NOT EXISTS {t}_historico AS SELECT * FROM {t}"
+                    for t in particiones.TABLAS]
+
+# ── Triggers y búsqueda PostgreSQL ──────────────────────
+
+# Búsqueda de productos (v1.7): tsvector con prefijos + trigramas para
+# coincidencias parciales. Los índices de expresión se mantienen solos.
+# PG_SEARCH_DOC debe coincidir exactamente con la expresión usada en app/models.py.
+PG_SEARCH_DOC = ("to_tsvector('simple', coalesce(sku, '') || ' ' || coalesce(nombre, '') || ' ' || "
+                 "coalesce(categoria, '') || ' ' || coalesce(talla, '') || ' ' || coalesce(color, ''))")
+PG_SEARCH_TRGM = "(coalesce(sku, '') || ' ' || coalesce(nombre, ''))"
+
+POSTGRES_KARDEX = [
+    """CREATE OR REPLACE FUNCTION movimientos_inmutable() RETURNS trigger AS $$
+    BEGIN
+        RAISE EXCEPTION 'movimientos_inventario es append-only';
+    END;
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS movimientos_inmutable ON movimientos_inventario",
+    """CREATE TRIGGER movimientos_inmutable BEFORE UPDATE OR DELETE ON movimientos_inventario
+    FOR EACH ROW EXECUTE FUNCTION movimientos_inmutable()""",
+]
+
+POSTGRES_SEARCH = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS idx_productos_busqueda ON productos USING gin ({PG_SEARCH_DOC})",
+    f"CREATE INDEX IF NOT EXISTS idx_productos_trgm ON productos USING gin ({PG_SEARCH_TRGM} gin_trgm_ops)",
+]
+
+
+def esquema_sqlite(cur):
+    """Tablas, índices, búsqueda y triggers del kardex (IF NOT EXISTS)."""
+    for ddl in SQLITE_TABLES + SQLITE_INDEXES + SQLITE_SEARCH + SQLITE_KARDEX + SQLITE_HISTORICO:
+        cur.execute(ddl)
+
+
+def esquema_postgres(cur):
+    """Tablas, índices y kardex; ventas/gastos particionadas por mes con sus
+    particiones y las vistas *_historico (scripts/particiones.py)."""
+    for ddl in POSTGRES_TABLES + POSTGRES_INDEXES + POSTGRES_KARDEX:
+        cur.execute(ddl)
+    particiones.preparar_postgres(cur)
+
 
 def create_tables(db_path=None):
     """Crea tablas en SQLite. Usado para dev local y tests."""
@@ -179,9 +105,7 @@ def create_tables(db_path=None):
         db_path = DB_PATH
     os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
     conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    for ddl in SQLITE_TABLES:
-        c.execute(ddl)
+    esquema_sqlite(conn.cursor())
     conn.commit()
     conn.close()
     print(f"SQLite DB creada en: {os.path.abspath(db_path)}")
@@ -189,16 +113,11 @@ def create_tables(db_path=None):
 
 
 def create_tables_postgres(database_url=None):
-    """Crea tablas en PostgreSQL con transacción única. Usado en Railway production."""
-    import psycopg2
-    url = database_url or os.environ.get('DATABASE_URL', '')
-    if url.startswith('postgres://'):
-        url = url.replace('postgres://', 'postgresql://', 1)
-    conn = psycopg2.connect(url)
+    """Crea tablas en PostgreSQL con transacción única."""
+    from scripts import migrations
+    conn = migrations._conectar_postgres(database_url)
     try:
-        c = conn.cursor()
-        for ddl in POSTGRES_TABLES:
-            c.execute(ddl)
+        esquema_postgres(conn.cursor())
         conn.commit()
         print("PostgreSQL tables created successfully")
     except Exception as e:
@@ -209,206 +128,169 @@ def create_tables_postgres(database_url=None):
         conn.close()
 
 
-def migrate_v13_postgres(database_url=None):
-    """Agrega columna monto_pagado a creditos_clientes si no existe. v1.3 — PostgreSQL."""
-    import psycopg2
-    url = database_url or os.environ.get('DATABASE_URL', '')
-    if url.startswith('postgres://'):
-        url = url.replace('postgres://', 'postgresql://', 1)
-    conn = psycopg2.connect(url)
+# ── Migraciones sueltas ─────────────────────────────────
+# La lógica vive en scripts/migrations (un archivo por paso). Estas funciones
+# corren un paso sobre una BD sin registrarlo en schema_version; para el
+# arranque normal usar ensure_tables().
+
+def _paso_sqlite(nombre, db_path=None):
+    if db_path is None:
+        db_path = DB_PATH
+    if not os.path.exists(db_path):
+        return
+    from scripts import migrations
+    conn = sqlite3.connect(db_path, isolation_level=None)
     try:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT column_name FROM information_schema.columns
-            WHERE table_name = 'creditos_clientes' AND column_name = 'monto_pagado'
-        """)
-        if not cur.fetchone():
-            cur.execute("ALTER TABLE creditos_clientes ADD COLUMN monto_pagado NUMERIC DEFAULT 0")
-            conn.commit()
-            print("Migration v1.3 (PG): added monto_pagado column")
-        else:
-            conn.rollback()
-    except Exception as e:
-        conn.rollback()
-        print(f"Migration v1.3 (PG) error: {e}")
+        migrations.aplicar_sqlite(conn, nombre)
     finally:
         conn.close()
 
 
-def migrate_v14_postgres(database_url=None):
-    """Fix vendedor NULL en ventas migradas desde Excel. v1.4 — PostgreSQL."""
-    import psycopg2
-    url = database_url or os.environ.get('DATABASE_URL', '')
-    if url.startswith('postgres://'):
-        url = url.replace('postgres://', 'postgresql://', 1)
-    conn = psycopg2.connect(url)
+def _paso_postgres(nombre, database_url=None):
+    from scripts import migrations
+    conn = migrations._conectar_postgres(database_url)
     try:
-        cur = conn.cursor()
-        cur.execute("UPDATE ventas SET vendedor = 'JP' WHERE vendedor IS NULL OR vendedor = ''")
-        updated = cur.rowcount
-        conn.commit()
-        if updated > 0:
-            print(f"Migration v1.4 (PG): fixed {updated} ventas with NULL vendedor → JP")
-    except Exception as e:
-        conn.rollback()
-        print(f"Migration v1.4 (PG) error: {e}")
+        migrations.aplicar_postgres(conn, nombre)
     finally:
         conn.close()
 
 
 def migrate_v13(db_path=None):
     """Agrega columna monto_pagado a creditos_clientes si no existe. v1.3"""
-    if db_path is None:
-        db_path = DB_PATH
-    if not os.path.exists(db_path):
-        return
-    conn = sqlite3.connect(db_path)
-    try:
-        cols = [row[1] for row in conn.execute("PRAGMA table_info(creditos_clientes)").fetchall()]
-        if 'monto_pagado' not in cols:
-            conn.execute("ALTER TABLE creditos_clientes ADD COLUMN monto_pagado REAL DEFAULT 0")
-            conn.commit()
-            print("Migration v1.3: added monto_pagado column")
-    finally:
-        conn.close()
+    _paso_sqlite('0002_monto_pagado', db_path)
+
+
+def migrate_v13_postgres(database_url=None):
+    _paso_postgres('0002_monto_pagado', database_url)
 
 
 def migrate_v14(db_path=None):
     """Fix vendedor NULL en ventas migradas desde Excel. v1.4"""
-    if db_path is None:
-        db_path = DB_PATH
-    if not os.path.exists(db_path):
-        return
-    conn = sqlite3.connect(db_path)
-    try:
-        updated = conn.execute(
-            "UPDATE ventas SET vendedor = 'JP' WHERE vendedor IS NULL OR vendedor = ''"
-        ).rowcount
-        if updated > 0:
-            conn.commit()
-            print(f"Migration v1.4: fixed {updated} ventas with NULL vendedor → JP")
-    finally:
-        conn.close()
+    _paso_sqlite('0003_vendedor_jp', db_path)
+
+
+def migrate_v14_postgres(database_url=None):
+    _paso_postgres('0003_vendedor_jp', database_url)
 
 
 def migrate_v15_fix_orvann_pagador(db_path=None):
-    """Fix gastos con pagado_por='ORVANN' → 'JP'. v1.5 — SQLite."""
-    if db_path is None:
-        db_path = DB_PATH
-    if not os.path.exists(db_path):
-        return
-    conn = sqlite3.connect(db_path)
-    try:
-        updated = conn.execute(
-            "UPDATE gastos SET pagado_por = 'JP' WHERE pagado_por = 'ORVANN'"
-        ).rowcount
-        if updated > 0:
-            conn.commit()
-            print(f"Migration v1.5: fixed {updated} gastos with pagado_por 'ORVANN' → 'JP'")
-    finally:
-        conn.close()
+    """Fix gastos con pagado_por='ORVANN' → 'JP'. v1.5"""
+    _paso_sqlite('0004_pagador_orvann', db_path)
 
 
 def migrate_v15_fix_orvann_postgres(database_url=None):
-    """Fix gastos con pagado_por='ORVANN' → 'JP'. v1.5 — PostgreSQL."""
-    import psycopg2
-    url = database_url or os.environ.get('DATABASE_URL', '')
-    if url.startswith('postgres://'):
-        url = url.replace('postgres://', 'postgresql://', 1)
-    conn = psycopg2.connect(url)
-    try:
-        cur = conn.cursor()
-        cur.execute("UPDATE gastos SET pagado_por = 'JP' WHERE pagado_por = 'ORVANN'")
-        updated = cur.rowcount
-        conn.commit()
-        if updated > 0:
-            print(f"Migration v1.5 (PG): fixed {updated} gastos with pagado_por 'ORVANN' → 'JP'")
-    except Exception as e:
-        conn.rollback()
-        print(f"Migration v1.5 (PG) fix ORVANN error: {e}")
-    finally:
-        conn.close()
+    _paso_postgres('0004_pagador_orvann', database_url)
 
 
 def migrate_v15_postgres(database_url=None):
-    """Agrega CHECK constraints a tablas PostgreSQL existentes. v1.5
-    Idempotente: usa IF NOT EXISTS (PG 12+) o ignora si ya existe."""
-    import psycopg2
-    url = database_url or os.environ.get('DATABASE_URL', '')
-    if url.startswith('postgres://'):
-        url = url.replace('postgres://', 'postgresql://', 1)
-    conn = psycopg2.connect(url)
-    cur = conn.cursor()
-
-    # Lista de (tabla, nombre_constraint, expresion CHECK)
-    constraints = [
-        # productos
-        ('productos', 'chk_productos_costo', 'costo >= 0'),
-        ('productos', 'chk_productos_precio', 'precio_venta >= 0'),
-        ('productos', 'chk_productos_stock', 'stock >= 0'),
-        ('productos', 'chk_productos_stock_min', 'stock_minimo >= 0'),
-        # ventas
-        ('ventas', 'chk_ventas_cantidad', 'cantidad > 0'),
-        ('ventas', 'chk_ventas_precio', 'precio_unitario >= 0'),
-        ('ventas', 'chk_ventas_descuento', 'descuento_pct >= 0 AND descuento_pct <= 100'),
-        ('ventas', 'chk_ventas_total', 'total >= 0'),
-        ('ventas', 'chk_ventas_metodo', "metodo_pago IN ('Efectivo', 'Transferencia', 'Datáfono', 'Crédito')"),
-        # caja_diaria
-        ('caja_diaria', 'chk_caja_inicio', 'efectivo_inicio >= 0'),
-        ('caja_diaria', 'chk_caja_cerrada', 'cerrada IN (0, 1)'),
-        # gastos
-        ('gastos', 'chk_gastos_monto', 'monto > 0'),
-        ('gastos', 'chk_gastos_pagador', "pagado_por IN ('JP', 'KATHE', 'ANDRES')"),
-        ('gastos', 'chk_gastos_inversion', 'es_inversion IN (0, 1)'),
-        # creditos
-        ('creditos_clientes', 'chk_creditos_monto', 'monto > 0'),
-        ('creditos_clientes', 'chk_creditos_pagado_monto', 'monto_pagado >= 0'),
-        ('creditos_clientes', 'chk_creditos_pagado', 'pagado IN (0, 1)'),
-        # pedidos
-        ('pedidos_proveedores', 'chk_pedidos_unidades', 'unidades > 0'),
-        ('pedidos_proveedores', 'chk_pedidos_costo', 'costo_unitario >= 0'),
-        ('pedidos_proveedores', 'chk_pedidos_total', 'total >= 0'),
-        ('pedidos_proveedores', 'chk_pedidos_estado', "estado IN ('Pendiente', 'Pagado', 'Completo')"),
-        # costos_fijos
-        ('costos_fijos', 'chk_cf_monto', 'monto_mensual > 0'),
-        ('costos_fijos', 'chk_cf_activo', 'activo IN (0, 1)'),
-    ]
-
-    added = 0
-    for tabla, nombre, expr in constraints:
-        try:
-            # Verificar si el constraint ya existe
-            cur.execute("""
-                SELECT 1 FROM information_schema.table_constraints
-                WHERE table_name = %s AND constraint_name = %s
-            """, (tabla, nombre))
-            if cur.fetchone():
-                continue  # Ya existe
-            cur.execute(f'ALTER TABLE {tabla} ADD CONSTRAINT {nombre} CHECK ({expr})')
-            added += 1
-        except Exception as e:
-            # Si falla (ej: datos existentes violan el constraint), reportar y continuar
-            conn.rollback()
-            print(f"  ⚠ Constraint {nombre} falló: {e}")
-            continue
+    """Agrega CHECK constraints a tablas PostgreSQL existentes. v1.5"""
+    _paso_postgres('0005_checks', database_url)
 
-    conn.commit()
-    conn.close()
-    if added > 0:
-        print(f"Migration v1.5: added {added} CHECK constraints to PostgreSQL")
+
+def migrate_v17_busqueda(db_path=None):
+    """Crea y llena el índice FTS5 de productos. v1.7"""
+    _paso_sqlite('0006_busqueda', db_path)
+
+
+def migrate_v17_busqueda_postgres(database_url=None):
+    _paso_postgres('0006_busqueda', database_url)
+
+
+def migrate_v17_kardex(db_path=None):
+    """Triggers del kardex y backfill de SKUs sin movimientos. v1.7"""
+    _paso_sqlite('0007_kardex', db_path)
+
+
+def migrate_v17_kardex_postgres(database_url=None):
+    _paso_postgres('0007_kardex', database_url)
+
+
+def migrate_v17_ventas_congeladas(db_path=None):
+    """Agrega y llena ventas.costo_unitario / ventas.producto_nombre. v1.7"""
+    _paso_sqlite('0008_ventas_congeladas', db_path)
+
+
+def migrate_v17_ventas_congeladas_postgres(database_url=None):
+    _paso_postgres('0008_ventas_congeladas', database_url)
+
+
+def migrate_v17_dinero_entero(db_path=None):
+    """Pasa las columnas de dinero a INTEGER (pesos redondeados). v1.7"""
+    _paso_sqlite('0009_dinero_entero', db_path)
+
+
+def migrate_v17_dinero_entero_postgres(database_url=None):
+    _paso_postgres('0009_dinero_entero', database_url)
+
+
+def migrate_v17_particiones(db_path=None):
+    """Vistas *_historico (en PostgreSQL, ventas/gastos particionadas). v1.7"""
+    _paso_sqlite('0010_particiones', db_path)
+
+
+def migrate_v17_particiones_postgres(database_url=None):
+    _paso_postgres('0010_particiones', database_url)
+
+
+def migrate_v17_cierres_mes(db_path=None):
+    """Crea cierres_mes (P&L mensual congelado). v1.7"""
+    _paso_sqlite('0011_cierres_mes', db_path)
+
+
+def migrate_v17_cierres_mes_postgres(database_url=None):
+    _paso_postgres('0011_cierres_mes', database_url)
+
+
+def migrate_v17_liquidacion_socios(db_path=None):
+    """Crea pagos_socios y el detalle por socio de cierres_mes. v1.7"""
+    _paso_sqlite('0012_liquidacion_socios', db_path)
+
+
+def migrate_v17_liquidacion_socios_postgres(database_url=None):
+    _paso_postgres('0012_liquidacion_socios', database_url)
+
+
+def migrate_v17_caja_acumulados(db_path=None):
+    """Agrega y llena los acumulados del día en caja_diaria. v1.7"""
+    _paso_sqlite('0013_caja_acumulados', db_path)
+
+
+def migrate_v17_caja_acumulados_postgres(database_url=None):
+    _paso_postgres('0013_caja_acumulados', database_url)
+
+
+def migrate_v17_clientes(db_path=None):
+    """Crea clientes y abonos y enlaza creditos_clientes.cliente_id. v1.7"""
+    _paso_sqlite('0014_clientes', db_path)
+
+
+def migrate_v17_clientes_postgres(database_url=None):
+    _paso_postgres('0014_clientes', database_url)
+
+
+def migrate_v17_clientes_prefijo_postgres(database_url=None):
+    """Índices text_pattern_ops para buscar clientes por prefijo. v1.7"""
+    _paso_postgres('0015_clientes_prefijo', database_url)
+
+
+def migrate_v17_idempotencia_huella(db_path=None):
+    """Agrega idempotencia.huella. v1.7"""
+    _paso_sqlite('0016_idempotencia_huella', db_path)
+
+
+def migrate_v17_idempotencia_huella_postgres(database_url=None):
+    _paso_postgres('0016_idempotencia_huella', database_url)
 
 
-EXPECTED_TABLES = {'productos', 'ventas', 'caja_diaria', 'gastos',
-                    'creditos_clientes', 'pedidos_proveedores', 'costos_fijos'}
+# Todas las tablas de scripts/schema.py más el registro de migraciones; las
+# vistas *_historico y productos_fts no cuentan.
+EXPECTED_TABLES = {t.nombre for t in schema.TABLAS} | {'schema_version'}
 
 
 def verify_tables_postgres(database_url=None):
     """Verifica que todas las tablas existan en PostgreSQL. Post-migration check."""
-    import psycopg2
-    url = database_url or os.environ.get('DATABASE_URL', '')
-    if url.startswith('postgres://'):
-        url = url.replace('postgres://', 'postgresql://', 1)
-    conn = psycopg2.connect(url)
+    from scripts import migrations
+    conn = migrations._conectar_postgres(database_url)
     try:
         cur = conn.cursor()
         cur.execute("SELECT tablename FROM pg_tables WHERE schemaname = 'public'")
@@ -445,22 +327,22 @@ def verify_tables_sqlite(db_path=None):
 
 
 def ensure_tables():
-    """Crea tablas en el backend activo. Ejecuta migraciones. Verifica resultado.
-    Idempotente (IF NOT EXISTS + column checks)."""
+    """Lleva el backend activo a la última versión de scripts/migrations.
+    Si ya está al día retorna tras una sola consulta a schema_version (en
+    PostgreSQL además asegura las particiones de los próximos meses); si
+    aplicó algo, verifica que estén todas las tablas. Retorna las versiones
+    aplicadas."""
+    from scripts import migrations
     database_url = os.environ.get('DATABASE_URL', '')
     if database_url.startswith('postgres'):
-        create_tables_postgres(database_url)
-        migrate_v13_postgres(database_url)
-        migrate_v14_postgres(database_url)
-        migrate_v15_fix_orvann_postgres(database_url)  # Fix data BEFORE adding constraints
-        migrate_v15_postgres(database_url)
-        verify_tables_postgres(database_url)
+        aplicadas = migrations.migrar(database_url=database_url)
+        if aplicadas:
+            verify_tables_postgres(database_url)
     else:
-        create_tables()
-        migrate_v13()
-        migrate_v14()
-        migrate_v15_fix_orvann_pagador()  # Fix data (for SQLite re-migrations)
-        verify_tables_sqlite()
+        aplicadas = migrations.migrar(db_path=DB_PATH)
+        if aplicadas:
+            verify_tables_sqlite()
+    return aplicadas
 
 
 if __name__ == '__main__':
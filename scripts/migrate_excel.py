@@ -130,7 +130,8 @@ def migrate_productos(ws, conn):
 
 
 def migrate_ventas(ws, conn):
-    """Migra hoja Ventas -> tabla ventas + creditos_clientes."""
+    """Migra hoja Ventas -> tabla ventas + creditos_clientes (+ clientes con su saldo)."""
+    from app.models import normalizar_nombre
     c = conn.cursor()
     count = 0
     creditos = 0
@@ -163,18 +164,28 @@ def migrate_ventas(ws, conn):
         total = precio_venta
 
         c.execute("""
-            INSERT INTO ventas (fecha, sku, cantidad, precio_unitario, descuento_pct, total, metodo_pago, cliente, notas)
-            VALUES (?, ?, 1, ?, 0, ?, ?, ?, ?)
-        """, (fecha_str, sku, precio_venta, total, metodo_pago, cliente, notas))
+            INSERT INTO ventas (fecha, sku, cantidad, precio_unitario, descuento_pct, total, metodo_pago, cliente, notas,
+                                costo_unitario, producto_nombre)
+            VALUES (?, ?, 1, ?, 0, ?, ?, ?, ?,
+                    (SELECT costo FROM productos WHERE sku = ?), (SELECT nombre FROM productos WHERE sku = ?))
+        """, (fecha_str, sku, precio_venta, total, metodo_pago, cliente, notas, sku, sku))
 
         venta_id = c.lastrowid
         count += 1
 
         if metodo_pago == 'Crédito' and cliente:
             c.execute("""
-                INSERT INTO creditos_clientes (venta_id, cliente, monto, fecha_credito, pagado, notas)
-                VALUES (?, ?, ?, ?, 0, ?)
-            """, (venta_id, cliente, total, fecha_str, notas))
+                INSERT INTO clientes (nombre, nombre_normalizado) VALUES (?, ?)
+                ON CONFLICT (nombre_normalizado) DO NOTHING
+            """, (cliente, normalizar_nombre(cliente)))
+            cliente_id = c.execute("SELECT id FROM clientes WHERE nombre_normalizado = ?",
+                                   (normalizar_nombre(cliente),)).fetchone()[0]
+            c.execute("""
+                INSERT INTO creditos_clientes (venta_id, cliente, monto, fecha_credito, pagado, notas, cliente_id)
+                VALUES (?, ?, ?, ?, 0, ?, ?)
+            """, (venta_id, cliente, total, fecha_str, notas, cliente_id))
+            c.execute("UPDATE clientes SET saldo = saldo + ?, creditos_abiertos = creditos_abiertos + 1 "
+                      "WHERE id = ?", (total, cliente_id))
             creditos += 1
 
     conn.commit()
@@ -357,6 +368,10 @@ def run_migration(excel_path=None, db_path=None):
         ws = wb['Pedidos Proveedores']
         n_pedidos = migrate_pedidos(ws, conn)
 
+        # Acumulados de caja_diaria para las ventas y gastos importados
+        from app.models import verificar_caja
+        verificar_caja(reparar=True, db_path=db_path)
+
         print()
         print("=" * 50)
         print("RESUMEN DE MIGRACIÓN")
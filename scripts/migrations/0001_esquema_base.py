@@ -0,0 +1,311 @@
+"""Tablas, índices y triggers base: el esquema de create_tables al introducir
+las migraciones (v1.7, antes de particiones, cierres y clientes). Antes de
+los índices agrega productos.codigo_barras en BDs previas a v1.7.
+
+El DDL queda copiado aquí y no se toca: los cambios posteriores van en su
+propia migración (una BD v1.6 pasa por este paso antes que por ellas)."""
+
+# ── DDL SQLite ──────────────────────────────────────────
+
+TABLAS_SQLITE = [
+    """CREATE TABLE IF NOT EXISTS productos (
+        sku TEXT PRIMARY KEY,
+        nombre TEXT NOT NULL,
+        categoria TEXT,
+        talla TEXT,
+        color TEXT,
+        costo INTEGER NOT NULL CHECK (costo >= 0),
+        precio_venta INTEGER NOT NULL CHECK (precio_venta >= 0),
+        stock INTEGER DEFAULT 0 CHECK (stock >= 0),
+        stock_minimo INTEGER DEFAULT 3 CHECK (stock_minimo >= 0),
+        proveedor TEXT,
+        notas TEXT,
+        codigo_barras TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE IF NOT EXISTS ventas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fecha DATE NOT NULL DEFAULT (date('now')),
+        hora TIME DEFAULT (time('now')),
+        sku TEXT NOT NULL REFERENCES productos(sku),
+        cantidad INTEGER DEFAULT 1 CHECK (cantidad > 0),
+        precio_unitario INTEGER NOT NULL CHECK (precio_unitario >= 0),
+        descuento_pct REAL DEFAULT 0 CHECK (descuento_pct >= 0 AND descuento_pct <= 100),
+        total INTEGER NOT NULL CHECK (total >= 0),
+        metodo_pago TEXT NOT NULL CHECK (metodo_pago IN ('Efectivo', 'Transferencia', 'Datáfono', 'Crédito')),
+        cliente TEXT,
+        vendedor TEXT,
+        notas TEXT,
+        costo_unitario INTEGER,
+        producto_nombre TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE IF NOT EXISTS caja_diaria (
+        fecha DATE PRIMARY KEY,
+        efectivo_inicio INTEGER DEFAULT 0 CHECK (efectivo_inicio >= 0),
+        efectivo_cierre_real INTEGER,
+        cerrada INTEGER DEFAULT 0 CHECK (cerrada IN (0, 1)),
+        notas TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS gastos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fecha DATE NOT NULL,
+        categoria TEXT NOT NULL,
+        monto INTEGER NOT NULL CHECK (monto > 0),
+        descripcion TEXT,
+        metodo_pago TEXT,
+        pagado_por TEXT NOT NULL CHECK (pagado_por IN ('JP', 'KATHE', 'ANDRES')),
+        es_inversion INTEGER DEFAULT 0 CHECK (es_inversion IN (0, 1)),
+        notas TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE IF NOT EXISTS creditos_clientes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        venta_id INTEGER REFERENCES ventas(id),
+        cliente TEXT NOT NULL,
+        monto INTEGER NOT NULL CHECK (monto > 0),
+        monto_pagado INTEGER DEFAULT 0 CHECK (monto_pagado >= 0),
+        fecha_credito DATE NOT NULL,
+        fecha_pago DATE,
+        pagado INTEGER DEFAULT 0 CHECK (pagado IN (0, 1)),
+        notas TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS pedidos_proveedores (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fecha_pedido DATE NOT NULL,
+        proveedor TEXT NOT NULL,
+        descripcion TEXT,
+        unidades INTEGER CHECK (unidades > 0),
+        costo_unitario INTEGER CHECK (costo_unitario >= 0),
+        total INTEGER CHECK (total >= 0),
+        estado TEXT DEFAULT 'Pendiente' CHECK (estado IN ('Pendiente', 'Pagado', 'Completo')),
+        pagado_por TEXT,
+        fecha_entrega_est DATE,
+        notas TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS costos_fijos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        concepto TEXT NOT NULL,
+        monto_mensual INTEGER NOT NULL CHECK (monto_mensual > 0),
+        activo INTEGER DEFAULT 1 CHECK (activo IN (0, 1)),
+        notas TEXT
+    )""",
+    # v1.7 — Claves de idempotencia de escrituras (reintentos / doble submit)
+    """CREATE TABLE IF NOT EXISTS idempotencia (
+        clave TEXT PRIMARY KEY,
+        operacion TEXT NOT NULL,
+        resultado TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    # v1.7 — Kardex: movimientos de stock append-only + snapshots por fecha
+    """CREATE TABLE IF NOT EXISTS movimientos_inventario (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fecha DATE NOT NULL,
+        sku TEXT NOT NULL,
+        tipo TEXT NOT NULL CHECK (tipo IN ('inicial', 'venta', 'anulacion', 'entrada', 'ajuste')),
+        cantidad INTEGER NOT NULL CHECK (cantidad <> 0),
+        referencia TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE IF NOT EXISTS snapshots_stock (
+        fecha DATE NOT NULL,
+        sku TEXT NOT NULL,
+        stock INTEGER NOT NULL,
+        ultimo_movimiento_id INTEGER NOT NULL,
+        PRIMARY KEY (fecha, sku)
+    )""",
+]
+
+# Índices (v1.7). Código de barras único solo cuando está definido.
+IDX_CODIGO_BARRAS = ("CREATE UNIQUE INDEX IF NOT EXISTS idx_productos_codigo_barras "
+                     "ON productos (codigo_barras) WHERE codigo_barras IS NOT NULL")
+
+INDICES_SQLITE = [
+    IDX_CODIGO_BARRAS,
+    "CREATE INDEX IF NOT EXISTS idx_movimientos_sku_fecha ON movimientos_inventario (sku, fecha)",
+    "CREATE INDEX IF NOT EXISTS idx_movimientos_fecha ON movimientos_inventario (fecha)",
+]
+
+# Kardex inmutable (v1.7): solo INSERT sobre movimientos_inventario
+KARDEX_SQLITE = [
+    """CREATE TRIGGER IF NOT EXISTS movimientos_no_update BEFORE UPDATE ON movimientos_inventario BEGIN
+        SELECT RAISE(ABORT, 'movimientos_inventario es append-only');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS movimientos_no_delete BEFORE DELETE ON movimientos_inventario BEGIN
+        SELECT RAISE(ABORT, 'movimientos_inventario es append-only');
+    END""",
+]
+
+# Búsqueda de productos (v1.7): FTS5 propio (no external content, porque
+# productos no tiene INTEGER PRIMARY KEY y VACUUM puede renumerar rowids).
+# Los triggers lo mantienen en sync solo cuando cambian columnas buscables,
+# así las ventas (UPDATE de stock) no tocan el índice.
+BUSQUEDA_SQLITE = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS productos_fts USING fts5(
+        sku, nombre, categoria, talla, color,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '1 2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS productos_fts_ai AFTER INSERT ON productos BEGIN
+        INSERT INTO productos_fts (sku, nombre, categoria, talla, color)
+        VALUES (new.sku, new.nombre, new.categoria, new.talla, new.color);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS productos_fts_ad AFTER DELETE ON productos BEGIN
+        DELETE FROM productos_fts WHERE sku = old.sku;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS productos_fts_au
+    AFTER UPDATE OF sku, nombre, categoria, talla, color ON productos BEGIN
+        DELETE FROM productos_fts WHERE sku = old.sku;
+        INSERT INTO productos_fts (sku, nombre, categoria, talla, color)
+        VALUES (new.sku, new.nombre, new.categoria, new.talla, new.color);
+    END""",
+]
+
+# ── DDL PostgreSQL ──────────────────────────────────────
+
+TABLAS_POSTGRES = [
+    """CREATE TABLE IF NOT EXISTS productos (
+        sku TEXT PRIMARY KEY,
+        nombre TEXT NOT NULL,
+        categoria TEXT,
+        talla TEXT,
+        color TEXT,
+        costo BIGINT NOT NULL CHECK (costo >= 0),
+        precio_venta BIGINT NOT NULL CHECK (precio_venta >= 0),
+        stock INTEGER DEFAULT 0 CHECK (stock >= 0),
+        stock_minimo INTEGER DEFAULT 3 CHECK (stock_minimo >= 0),
+        proveedor TEXT,
+        notas TEXT,
+        codigo_barras TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE IF NOT EXISTS ventas (
+        id SERIAL PRIMARY KEY,
+        fecha DATE NOT NULL DEFAULT CURRENT_DATE,
+        hora TIME DEFAULT CURRENT_TIME,
+        sku TEXT NOT NULL REFERENCES productos(sku),
+        cantidad INTEGER DEFAULT 1 CHECK (cantidad > 0),
+        precio_unitario BIGINT NOT NULL CHECK (precio_unitario >= 0),
+        descuento_pct NUMERIC DEFAULT 0 CHECK (descuento_pct >= 0 AND descuento_pct <= 100),
+        total BIGINT NOT NULL CHECK (total >= 0),
+        metodo_pago TEXT NOT NULL CHECK (metodo_pago IN ('Efectivo', 'Transferencia', 'Datáfono', 'Crédito')),
+        cliente TEXT,
+        vendedor TEXT,
+        notas TEXT,
+        costo_unitario BIGINT,
+        producto_nombre TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE IF NOT EXISTS caja_diaria (
+        fecha DATE PRIMARY KEY,
+        efectivo_inicio BIGINT DEFAULT 0 CHECK (efectivo_inicio >= 0),
+        efectivo_cierre_real BIGINT,
+        cerrada INTEGER DEFAULT 0 CHECK (cerrada IN (0, 1)),
+        notas TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS gastos (
+        id SERIAL PRIMARY KEY,
+        fecha DATE NOT NULL,
+        categoria TEXT NOT NULL,
+        monto BIGINT NOT NULL CHECK (monto > 0),
+        descripcion TEXT,
+        metodo_pago TEXT,
+        pagado_por TEXT NOT NULL CHECK (pagado_por IN ('JP', 'KATHE', 'ANDRES')),
+        es_inversion INTEGER DEFAULT 0 CHECK (es_inversion IN (0, 1)),
+        notas TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE IF NOT EXISTS creditos_clientes (
+        id SERIAL PRIMARY KEY,
+        venta_id INTEGER REFERENCES ventas(id),
+        cliente TEXT NOT NULL,
+        monto BIGINT NOT NULL CHECK (monto > 0),
+        monto_pagado BIGINT DEFAULT 0 CHECK (monto_pagado >= 0),
+        fecha_credito DATE NOT NULL,
+        fecha_pago DATE,
+        pagado INTEGER DEFAULT 0 CHECK (pagado IN (0, 1)),
+        notas TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS pedidos_proveedores (
+        id SERIAL PRIMARY KEY,
+        fecha_pedido DATE NOT NULL,
+        proveedor TEXT NOT NULL,
+        descripcion TEXT,
+        unidades INTEGER CHECK (unidades > 0),
+        costo_unitario BIGINT CHECK (costo_unitario >= 0),
+        total BIGINT CHECK (total >= 0),
+        estado TEXT DEFAULT 'Pendiente' CHECK (estado IN ('Pendiente', 'Pagado', 'Completo')),
+        pagado_por TEXT,
+        fecha_entrega_est DATE,
+        notas TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS costos_fijos (
+        id SERIAL PRIMARY KEY,
+        concepto TEXT NOT NULL,
+        monto_mensual BIGINT NOT NULL CHECK (monto_mensual > 0),
+        activo INTEGER DEFAULT 1 CHECK (activo IN (0, 1)),
+        notas TEXT
+    )""",
+    # v1.7 — Claves de idempotencia de escrituras (reintentos / doble submit)
+    """CREATE TABLE IF NOT EXISTS idempotencia (
+        clave TEXT PRIMARY KEY,
+        operacion TEXT NOT NULL,
+        resultado TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    # v1.7 — Kardex: movimientos de stock append-only + snapshots por fecha
+    """CREATE TABLE IF NOT EXISTS movimientos_inventario (
+        id SERIAL PRIMARY KEY,
+        fecha DATE NOT NULL,
+        sku TEXT NOT NULL,
+        tipo TEXT NOT NULL CHECK (tipo IN ('inicial', 'venta', 'anulacion', 'entrada', 'ajuste')),
+        cantidad INTEGER NOT NULL CHECK (cantidad <> 0),
+        referencia TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE IF NOT EXISTS snapshots_stock (
+        fecha DATE NOT NULL,
+        sku TEXT NOT NULL,
+        stock INTEGER NOT NULL,
+        ultimo_movimiento_id INTEGER NOT NULL,
+        PRIMARY KEY (fecha, sku)
+    )""",
+]
+
+
+INDICES_POSTGRES = [
+    IDX_CODIGO_BARRAS,
+    "CREATE INDEX IF NOT EXISTS idx_movimientos_sku_fecha ON movimientos_inventario (sku, fecha)",
+    "CREATE INDEX IF NOT EXISTS idx_movimientos_fecha ON movimientos_inventario (fecha)",
+]
+
+KARDEX_POSTGRES = [
+    """CREATE OR REPLACE FUNCTION movimientos_inmutable() RETURNS trigger AS $$
+    BEGIN
+        RAISE EXCEPTION 'movimientos_inventario es append-only';
+    END;
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS movimientos_inmutable ON movimientos_inventario",
+    """CREATE TRIGGER movimientos_inmutable BEFORE UPDATE OR DELETE ON movimientos_inventario
+    FOR EACH ROW EXECUTE FUNCTION movimientos_inmutable()""",
+]
+
+
+def sqlite(cur):
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name = 'productos'")
+    if cur.fetchone():
+        cols = [r[1] for r in cur.execute("PRAGMA table_info(productos)").fetchall()]
+        if 'codigo_barras' not in cols:
+            cur.execute("ALTER TABLE productos ADD COLUMN codigo_barras TEXT")
+        cur.execute(IDX_CODIGO_BARRAS)
+    for ddl in TABLAS_SQLITE + INDICES_SQLITE + BUSQUEDA_SQLITE + KARDEX_SQLITE:
+        cur.execute(ddl)
+
+
+def postgres(cur):
+    cur.execute("SELECT to_regclass('public.productos')")
+    if cur.fetchone()[0] is not None:
+        cur.execute("ALTER TABLE productos ADD COLUMN IF NOT EXISTS codigo_barras TEXT")
+        cur.execute(IDX_CODIGO_BARRAS)
+    for ddl in TABLAS_POSTGRES + INDICES_POSTGRES + KARDEX_POSTGRES:
+        cur.execute(ddl)
@@ -0,0 +1,11 @@
+"""v1.3 — creditos_clientes.monto_pagado."""
+
+
+def sqlite(cur):
+    cols = [r[1] for r in cur.execute("PRAGMA table_info(creditos_clientes)").fetchall()]
+    if 'monto_pagado' not in cols:
+        cur.execute("ALTER TABLE creditos_clientes ADD COLUMN monto_pagado INTEGER DEFAULT 0")
+
+
+def postgres(cur):
+    cur.execute("ALTER TABLE creditos_clientes ADD COLUMN IF NOT EXISTS monto_pagado BIGINT DEFAULT 0")
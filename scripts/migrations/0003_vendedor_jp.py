@@ -0,0 +1,11 @@
+"""v1.4 — ventas migradas del Excel sin vendedor → JP."""
+
+SQL = "UPDATE ventas SET vendedor = 'JP' WHERE vendedor IS NULL OR vendedor = ''"
+
+
+def sqlite(cur):
+    cur.execute(SQL)
+
+
+def postgres(cur):
+    cur.execute(SQL)
@@ -0,0 +1,11 @@
+"""v1.5 — gastos con pagado_por='ORVANN' → 'JP' (antes de los CHECK de pagador)."""
+
+SQL = "UPDATE gastos SET pagado_por = 'JP' WHERE pagado_por = 'ORVANN'"
+
+
+def sqlite(cur):
+    cur.execute(SQL)
+
+
+def postgres(cur):
+    cur.execute(SQL)
@@ -0,0 +1,59 @@
+"""v1.5 — CHECK constraints en tablas PostgreSQL creadas antes de v1.5.
+En SQLite los CHECK vienen en el DDL de las tablas."""
+
+# (tabla, nombre_constraint, expresion CHECK)
+CONSTRAINTS = [
+    # productos
+    ('productos', 'chk_productos_costo', 'costo >= 0'),
+    ('productos', 'chk_productos_precio', 'precio_venta >= 0'),
+    ('productos', 'chk_productos_stock', 'stock >= 0'),
+    ('productos', 'chk_productos_stock_min', 'stock_minimo >= 0'),
+    # ventas
+    ('ventas', 'chk_ventas_cantidad', 'cantidad > 0'),
+    ('ventas', 'chk_ventas_precio', 'precio_unitario >= 0'),
+    ('ventas', 'chk_ventas_descuento', 'descuento_pct >= 0 AND descuento_pct <= 100'),
+    ('ventas', 'chk_ventas_total', 'total >= 0'),
+    ('ventas', 'chk_ventas_metodo', "metodo_pago IN ('Efectivo', 'Transferencia', 'Datáfono', 'Crédito')"),
+    # caja_diaria
+    ('caja_diaria', 'chk_caja_inicio', 'efectivo_inicio >= 0'),
+    ('caja_diaria', 'chk_caja_cerrada', 'cerrada IN (0, 1)'),
+    # gastos
+    ('gastos', 'chk_gastos_monto', 'monto > 0'),
+    ('gastos', 'chk_gastos_pagador', "pagado_por IN ('JP', 'KATHE', 'ANDRES')"),
+    ('gastos', 'chk_gastos_inversion', 'es_inversion IN (0, 1)'),
+    # creditos
+    ('creditos_clientes', 'chk_creditos_monto', 'monto > 0'),
+    ('creditos_clientes', 'chk_creditos_pagado_monto', 'monto_pagado >= 0'),
+    ('creditos_clientes', 'chk_creditos_pagado', 'pagado IN (0, 1)'),
+    # pedidos
+    ('pedidos_proveedores', 'chk_pedidos_unidades', 'unidades > 0'),
+    ('pedidos_proveedores', 'chk_pedidos_costo', 'costo_unitario >= 0'),
+    ('pedidos_proveedores', 'chk_pedidos_total', 'total >= 0'),
+    ('pedidos_proveedores', 'chk_pedidos_estado', "estado IN ('Pendiente', 'Pagado', 'Completo')"),
+    # costos_fijos
+    ('costos_fijos', 'chk_cf_monto', 'monto_mensual > 0'),
+    ('costos_fijos', 'chk_cf_activo', 'activo IN (0, 1)'),
+]
+
+
+def sqlite(cur):
+    pass
+
+
+def postgres(cur):
+    cur.execute("""
+        SELECT constraint_name FROM information_schema.table_constraints
+        WHERE constraint_type = 'CHECK'
+    """)
+    existentes = {r[0] for r in cur.fetchall()}
+    for tabla, nombre, expr in CONSTRAINTS:
+        if nombre in existentes:
+            continue
+        # Si datos existentes violan el constraint, se reporta y se sigue
+        cur.execute("SAVEPOINT chk")
+        try:
+            cur.execute(f'ALTER TABLE {tabla} ADD CONSTRAINT {nombre} CHECK ({expr})')
+            cur.execute("RELEASE SAVEPOINT chk")
+        except Exception as e:
+            cur.execute("ROLLBACK TO SAVEPOINT chk")
+            print(f"  ⚠ Constraint {nombre} falló: {e}")
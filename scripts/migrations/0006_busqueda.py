@@ -0,0 +1,41 @@
+"""v1.7 — índice de búsqueda de productos.
+
+SQLite: FTS5 (la tabla ya la crea 0001); se repuebla si el conteo no
+coincide con productos. PostgreSQL: tsvector + pg_trgm; sin pg_trgm queda
+solo el índice tsvector."""
+from scripts.migrations import cargar
+
+# Deben coincidir con las expresiones de búsqueda de app/models.py
+_DOC = ("to_tsvector('simple', coalesce(sku, '') || ' ' || coalesce(nombre, '') || ' ' || "
+        "coalesce(categoria, '') || ' ' || coalesce(talla, '') || ' ' || coalesce(color, ''))")
+_TRGM = "(coalesce(sku, '') || ' ' || coalesce(nombre, ''))"
+
+BUSQUEDA_POSTGRES = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS idx_productos_busqueda ON productos USING gin ({_DOC})",
+    f"CREATE INDEX IF NOT EXISTS idx_productos_trgm ON productos USING gin ({_TRGM} gin_trgm_ops)",
+]
+
+
+def sqlite(cur):
+    for ddl in cargar('0001_esquema_base').BUSQUEDA_SQLITE:
+        cur.execute(ddl)
+    n_fts = cur.execute("SELECT COUNT(*) FROM productos_fts").fetchone()[0]
+    n_prod = cur.execute("SELECT COUNT(*) FROM productos").fetchone()[0]
+    if n_fts != n_prod:
+        cur.execute("DELETE FROM productos_fts")
+        cur.execute("""
+            INSERT INTO productos_fts (sku, nombre, categoria, talla, color)
+            SELECT sku, nombre, categoria, talla, color FROM productos
+        """)
+
+
+def postgres(cur):
+    for ddl in BUSQUEDA_POSTGRES:
+        cur.execute("SAVEPOINT busqueda")
+        try:
+            cur.execute(ddl)
+            cur.execute("RELEASE SAVEPOINT busqueda")
+        except Exception as e:
+            cur.execute("ROLLBACK TO SAVEPOINT busqueda")
+            print(f"  ⚠ Migration v1.7 (PG) search: {e}")
@@ -0,0 +1,37 @@
+"""v1.7 — kardex: triggers append-only y backfill de SKUs sin movimientos."""
+from scripts.migrations import cargar
+
+# Backfill del kardex: por SKU sin movimientos, un 'inicial' con el stock
+# previo a todas sus ventas + un movimiento 'venta' por cada venta existente.
+# Así la suma del kardex = stock actual y hay historia aproximada hacia atrás
+# (las entradas pasadas no quedaron registradas: quedan dentro del inicial).
+KARDEX_BACKFILL = [
+    """INSERT INTO movimientos_inventario (fecha, sku, tipo, cantidad, referencia)
+    SELECT COALESCE(MIN(v.fecha), {hoy}), p.sku, 'inicial',
+           p.stock + COALESCE(SUM(v.cantidad), 0), 'backfill v1.7'
+    FROM productos p
+    LEFT JOIN ventas v ON v.sku = p.sku
+    WHERE NOT EXISTS (SELECT 1 FROM movimientos_inventario m WHERE m.sku = p.sku)
+    GROUP BY p.sku, p.stock
+    HAVING p.stock + COALESCE(SUM(v.cantidad), 0) <> 0""",
+    """INSERT INTO movimientos_inventario (fecha, sku, tipo, cantidad, referencia)
+    SELECT v.fecha, v.sku, 'venta', -v.cantidad, 'venta:' || v.id
+    FROM ventas v
+    WHERE NOT EXISTS (SELECT 1 FROM movimientos_inventario m
+                      WHERE m.sku = v.sku AND m.tipo <> 'inicial')
+      AND EXISTS (SELECT 1 FROM movimientos_inventario m
+                  WHERE m.sku = v.sku AND m.referencia = 'backfill v1.7')
+    ORDER BY v.fecha, v.id""",
+]
+
+
+def sqlite(cur):
+    for ddl in cargar('0001_esquema_base').KARDEX_SQLITE:
+        cur.execute(ddl)
+    for sql in KARDEX_BACKFILL:
+        cur.execute(sql.format(hoy="date('now')"))
+
+
+def postgres(cur):
+    for sql in KARDEX_BACKFILL:
+        cur.execute(sql.format(hoy='CURRENT_DATE'))
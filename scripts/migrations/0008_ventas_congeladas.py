@@ -0,0 +1,32 @@
+"""v1.7 — ventas.costo_unitario / ventas.producto_nombre, llenados desde
+productos en ventas existentes."""
+
+
+def sqlite(cur):
+    cols = [r[1] for r in cur.execute("PRAGMA table_info(ventas)").fetchall()]
+    if 'costo_unitario' not in cols:
+        cur.execute("ALTER TABLE ventas ADD COLUMN costo_unitario INTEGER")
+    if 'producto_nombre' not in cols:
+        cur.execute("ALTER TABLE ventas ADD COLUMN producto_nombre TEXT")
+    cur.execute("""
+        UPDATE ventas SET
+            costo_unitario = COALESCE(costo_unitario,
+                                      (SELECT p.costo FROM productos p WHERE p.sku = ventas.sku)),
+            producto_nombre = COALESCE(producto_nombre,
+                                       (SELECT p.nombre FROM productos p WHERE p.sku = ventas.sku))
+        WHERE (costo_unitario IS NULL OR producto_nombre IS NULL)
+          AND EXISTS (SELECT 1 FROM productos p WHERE p.sku = ventas.sku)
+    """)
+
+
+def postgres(cur):
+    cur.execute("ALTER TABLE ventas ADD COLUMN IF NOT EXISTS costo_unitario BIGINT")
+    cur.execute("ALTER TABLE ventas ADD COLUMN IF NOT EXISTS producto_nombre TEXT")
+    cur.execute("""
+        UPDATE ventas v SET
+            costo_unitario = COALESCE(v.costo_unitario, p.costo),
+            producto_nombre = COALESCE(v.producto_nombre, p.nombre)
+        FROM productos p
+        WHERE p.sku = v.sku
+          AND (v.costo_unitario IS NULL OR v.producto_nombre IS NULL)
+    """)
@@ -0,0 +1,80 @@
+"""v1.7 — columnas de dinero en pesos enteros (INTEGER / BIGINT).
+
+SQLite no permite cambiar el tipo de una columna: cada tabla con dinero en
+REAL se reconstruye con el DDL actual (crear, copiar, borrar, renombrar)
+conservando ids y la secuencia AUTOINCREMENT; luego se recrean índices y
+triggers de productos. El DDL es el de 0001 (sin las columnas de migraciones
+posteriores, que las agregan ellas). La conexión del runner no activa foreign_keys, así
+el DROP de tablas referenciadas no dispara acciones. Las vistas *_historico
+(0010) se quitan durante la reconstrucción: el RENAME valida las vistas."""
+from scripts.migrations import cargar
+
+# Columnas de dinero: pesos enteros. El COP no usa centavos, así que
+# INTEGER/BIGINT da sumas exactas y el mismo tipo Python (int) en ambos backends.
+MONEY_COLUMNS = {
+    'productos': ('costo', 'precio_venta'),
+    'ventas': ('precio_unitario', 'total', 'costo_unitario'),
+    'caja_diaria': ('efectivo_inicio', 'efectivo_cierre_real'),
+    'gastos': ('monto',),
+    'creditos_clientes': ('monto', 'monto_pagado'),
+    'pedidos_proveedores': ('costo_unitario', 'total'),
+    'costos_fijos': ('monto_mensual',),
+}
+
+_HISTORICO = [f"CREATE VIEW IF NOT EXISTS {t}_historico AS SELECT * FROM {t}" for t in ('ventas', 'gastos')]
+
+
+def _ddl(base, tabla):
+    prefijo = f"CREATE TABLE IF NOT EXISTS {tabla} ("
+    return next(ddl for ddl in base.TABLAS_SQLITE if ddl.startswith(prefijo))
+
+
+def sqlite(cur):
+    base = cargar('0001_esquema_base')
+    tablas = {r[0] for r in cur.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()}
+    reconstruidas = False
+    vistas = cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'view' "
+                         "AND name = 'ventas_historico'").fetchone() is not None
+    for tabla, cols in MONEY_COLUMNS.items():
+        if tabla not in tablas:
+            continue
+        tipos = {r[1]: (r[2] or '').upper() for r in cur.execute(f"PRAGMA table_info({tabla})").fetchall()}
+        if not any(tipos.get(c) == 'REAL' for c in cols):
+            continue
+        nuevo = f"{tabla}__v17"
+        cur.execute(f"DROP VIEW IF EXISTS {tabla}_historico")
+        seq = None
+        if 'sqlite_sequence' in tablas:
+            row = cur.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (tabla,)).fetchone()
+            seq = row[0] if row else None
+        cur.execute(_ddl(base, tabla).replace(
+            f"CREATE TABLE IF NOT EXISTS {tabla} (", f"CREATE TABLE {nuevo} (", 1))
+        nuevas = [r[1] for r in cur.execute(f"PRAGMA table_info({nuevo})").fetchall()]
+        comunes = [c for c in nuevas if c in tipos]
+        select = [f"CAST(ROUND({c}) AS INTEGER)" if c in cols else c for c in comunes]
+        cur.execute(f"INSERT INTO {nuevo} ({', '.join(comunes)}) "
+                    f"SELECT {', '.join(select)} FROM {tabla}")
+        cur.execute(f"DROP TABLE {tabla}")
+        cur.execute(f"ALTER TABLE {nuevo} RENAME TO {tabla}")
+        if seq is not None:
+            cur.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ?", (seq, tabla))
+        reconstruidas = True
+    if reconstruidas:
+        for ddl in base.INDICES_SQLITE + base.BUSQUEDA_SQLITE:
+            cur.execute(ddl)
+        if vistas:
+            for ddl in _HISTORICO:
+                cur.execute(ddl)
+
+
+def postgres(cur):
+    cur.execute("""
+        SELECT table_name, column_name FROM information_schema.columns
+        WHERE table_schema = 'public' AND data_type = 'numeric'
+    """)
+    numericas = set(cur.fetchall())
+    for tabla, cols in MONEY_COLUMNS.items():
+        cambios = [f"ALTER COLUMN {c} TYPE BIGINT USING ROUND({c})::BIGINT"
+                   for c in cols if (tabla, c) in numericas]
+        if cambios:
+            cur.execute(f"ALTER TABLE {tabla} {', '.join(cambios)}")
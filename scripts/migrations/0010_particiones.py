@@ -0,0 +1,75 @@
+"""v1.7 — ventas y gastos particionadas por mes (scripts/particiones.py).
+
+PostgreSQL: si las tablas todavía son heap se convierten a particionadas
+RANGE (fecha) copiando las filas (conserva ids y secuencia); se crean las
+particiones mensuales, la DEFAULT, el esquema archivo y las vistas
+*_historico. Se elimina la FK creditos_clientes.venta_id → ventas(id).
+
+SQLite: índices por fecha y vistas *_historico sobre la tabla viva (los años
+archivados se suman al abrir la conexión).
+
+El DDL de destino es el de este momento; columnas agregadas por migraciones
+posteriores las agregan ellas."""
+from scripts import particiones
+
+_INDICES = {
+    'ventas': {'idx_ventas_fecha': "CREATE INDEX IF NOT EXISTS idx_ventas_fecha ON ventas (fecha)"},
+    'gastos': {'idx_gastos_fecha': "CREATE INDEX IF NOT EXISTS idx_gastos_fecha ON gastos (fecha)"},
+}
+
+_COLUMNAS = {
+    'ventas': ['id', 'fecha', 'hora', 'sku', 'cantidad', 'precio_unitario', 'descuento_pct', 'total',
+               'metodo_pago', 'cliente', 'vendedor', 'notas', 'costo_unitario', 'producto_nombre',
+               'created_at'],
+    'gastos': ['id', 'fecha', 'categoria', 'monto', 'descripcion', 'metodo_pago', 'pagado_por',
+               'es_inversion', 'notas', 'created_at'],
+}
+
+_TABLAS_POSTGRES = {
+    'ventas': """CREATE TABLE IF NOT EXISTS ventas (
+        id SERIAL,
+        fecha DATE NOT NULL DEFAULT CURRENT_DATE,
+        hora TIME DEFAULT CURRENT_TIME,
+        sku TEXT NOT NULL REFERENCES productos(sku),
+        cantidad INTEGER DEFAULT 1 CHECK (cantidad > 0),
+        precio_unitario BIGINT NOT NULL CHECK (precio_unitario >= 0),
+        descuento_pct NUMERIC DEFAULT 0 CHECK (descuento_pct >= 0 AND descuento_pct <= 100),
+        total BIGINT NOT NULL CHECK (total >= 0),
+        metodo_pago TEXT NOT NULL CHECK (metodo_pago IN ('Efectivo', 'Transferencia', 'Datáfono', 'Crédito')),
+        cliente TEXT,
+        vendedor TEXT,
+        notas TEXT,
+        costo_unitario BIGINT,
+        producto_nombre TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (id, fecha)
+    ) PARTITION BY RANGE (fecha)""",
+    'gastos': """CREATE TABLE IF NOT EXISTS gastos (
+        id SERIAL,
+        fecha DATE NOT NULL,
+        categoria TEXT NOT NULL,
+        monto BIGINT NOT NULL CHECK (monto > 0),
+        descripcion TEXT,
+        metodo_pago TEXT,
+        pagado_por TEXT NOT NULL CHECK (pagado_por IN ('JP', 'KATHE', 'ANDRES')),
+        es_inversion INTEGER DEFAULT 0 CHECK (es_inversion IN (0, 1)),
+        notas TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (id, fecha)
+    ) PARTITION BY RANGE (fecha)""",
+}
+
+
+def sqlite(cur):
+    for tabla in _TABLAS_POSTGRES:
+        for ddl in _INDICES[tabla].values():
+            cur.execute(ddl)
+        cur.execute(f"CREATE VIEW IF NOT EXISTS {tabla}_historico AS SELECT * FROM {tabla}")
+
+
+def postgres(cur):
+    for tabla in _TABLAS_POSTGRES:
+        if not particiones._particionada(cur, tabla):
+            particiones.convertir_postgres(cur, tabla, ddl=_TABLAS_POSTGRES[tabla],
+                                           indices=_INDICES[tabla], columnas=_COLUMNAS[tabla])
+    particiones.preparar_postgres(cur, columnas=_COLUMNAS)
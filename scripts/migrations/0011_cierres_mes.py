@@ -0,0 +1,30 @@
+"""v1.7 — tabla cierres_mes (P&L mensual congelado, app/models.cerrar_mes)."""
+
+_CIERRES_MES = """CREATE TABLE IF NOT EXISTS cierres_mes (
+        mes TEXT PRIMARY KEY,
+        ingresos {dinero} NOT NULL,
+        costo_mercancia {dinero} NOT NULL,
+        utilidad_bruta {dinero} NOT NULL,
+        gastos {dinero} NOT NULL,
+        utilidad_operativa {dinero} NOT NULL,
+        unidades INTEGER NOT NULL,
+        num_ventas INTEGER NOT NULL,
+        gastos_por_categoria TEXT NOT NULL,
+        gastos_por_socio TEXT NOT NULL,
+        costos_fijos {dinero} NOT NULL,
+        margen_prom {decimal} NOT NULL,
+        pe_pesos {dinero} NOT NULL,
+        pe_unidades {decimal} NOT NULL,
+        progreso_pe_pct {decimal} NOT NULL,
+        inventario_unidades INTEGER NOT NULL,
+        inventario_valor_costo {dinero} NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )"""
+
+
+def sqlite(cur):
+    cur.execute(_CIERRES_MES.format(dinero='INTEGER', decimal='REAL'))
+
+
+def postgres(cur):
+    cur.execute(_CIERRES_MES.format(dinero='BIGINT', decimal='NUMERIC'))
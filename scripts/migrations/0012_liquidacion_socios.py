@@ -0,0 +1,48 @@
+"""v1.7 — pagos_socios y cierres_mes.gastos_por_socio_categoria (liquidación
+por mes, app/models.calcular_liquidacion_socios). Los meses ya cerrados
+guardan su detalle desde las filas de gastos."""
+import json
+
+_PAGOS_SOCIOS = """CREATE TABLE IF NOT EXISTS pagos_socios (
+        id {id},
+        fecha DATE NOT NULL,
+        de_socio TEXT NOT NULL CHECK (de_socio IN ('JP', 'KATHE', 'ANDRES')),
+        a_socio TEXT NOT NULL CHECK (a_socio IN ('JP', 'KATHE', 'ANDRES')),
+        monto {dinero} NOT NULL CHECK (monto > 0),
+        notas TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )"""
+
+_DETALLE = """
+    SELECT c.mes, g.pagado_por, g.categoria, SUM(g.monto) AS total
+    FROM cierres_mes c JOIN gastos_historico g ON substr(CAST(g.fecha AS TEXT), 1, 7) = c.mes
+    WHERE c.gastos_por_socio_categoria IS NULL
+    GROUP BY c.mes, g.pagado_por, g.categoria
+"""
+
+
+def _llenar(cur, marcador):
+    por_mes = {}
+    cur.execute("SELECT mes FROM cierres_mes WHERE gastos_por_socio_categoria IS NULL")
+    for (mes,) in cur.fetchall():
+        por_mes[mes] = {}
+    cur.execute(_DETALLE)
+    for mes, socio, categoria, total in cur.fetchall():
+        por_mes[mes].setdefault(socio, {})[categoria] = int(total)
+    for mes, detalle in por_mes.items():
+        cur.execute(f"UPDATE cierres_mes SET gastos_por_socio_categoria = {marcador} WHERE mes = {marcador}",
+                    (json.dumps(detalle, sort_keys=True), mes))
+
+
+def sqlite(cur):
+    cur.execute(_PAGOS_SOCIOS.format(id='INTEGER PRIMARY KEY AUTOINCREMENT', dinero='INTEGER'))
+    cols = [r[1] for r in cur.execute("PRAGMA table_info(cierres_mes)").fetchall()]
+    if 'gastos_por_socio_categoria' not in cols:
+        cur.execute("ALTER TABLE cierres_mes ADD COLUMN gastos_por_socio_categoria TEXT")
+    _llenar(cur, '?')
+
+
+def postgres(cur):
+    cur.execute(_PAGOS_SOCIOS.format(id='SERIAL PRIMARY KEY', dinero='BIGINT'))
+    cur.execute("ALTER TABLE cierres_mes ADD COLUMN IF NOT EXISTS gastos_por_socio_categoria TEXT")
+    _llenar(cur, '%s')
@@ -0,0 +1,55 @@
+"""v1.7 — caja_diaria con acumulados del día por método de pago y gastos en
+efectivo (app/models._sumar_caja) y la marca abierta. Llena los acumulados
+desde ventas y gastos, creando la fila de los días sin caja."""
+
+_ACUMULADOS_NUEVOS = ('ventas_efectivo', 'ventas_transferencia', 'ventas_datafono',
+                      'ventas_credito', 'gastos_efectivo')
+
+_COLUMNAS = ["abierta INTEGER DEFAULT 0 CHECK (abierta IN (0, 1))"] + \
+            [f"{c} {{dinero}} NOT NULL DEFAULT 0" for c in _ACUMULADOS_NUEVOS]
+
+# Hasta v1.6 la caja estaba abierta si tenía fila. Las filas previas se
+# reconocen por no tener acumulados todavía (las de v1.7 nacen de una venta o
+# gasto); no depende de si esta migración agregó la columna o ya existía.
+_ABIERTAS = "UPDATE caja_diaria SET abierta = 1 WHERE COALESCE(abierta, 0) = 0 AND " + \
+            " AND ".join(f"{c} = 0" for c in _ACUMULADOS_NUEVOS)
+
+_DIAS_SIN_CAJA = """
+    INSERT INTO caja_diaria (fecha, abierta)
+    SELECT fecha, 0 FROM ventas_historico
+    UNION
+    SELECT fecha, 0 FROM gastos_historico WHERE metodo_pago = 'Efectivo'
+    EXCEPT
+    SELECT fecha, 0 FROM caja_diaria
+"""
+
+_VENTAS = "COALESCE((SELECT SUM(v.total) FROM ventas_historico v " \
+          "WHERE v.fecha = caja_diaria.fecha AND v.metodo_pago = '{}'), 0)"
+
+_ACUMULADOS = f"""
+    UPDATE caja_diaria SET
+        ventas_efectivo = {_VENTAS.format('Efectivo')},
+        ventas_transferencia = {_VENTAS.format('Transferencia')},
+        ventas_datafono = {_VENTAS.format('Datáfono')},
+        ventas_credito = {_VENTAS.format('Crédito')},
+        gastos_efectivo = COALESCE((SELECT SUM(g.monto) FROM gastos_historico g
+                                    WHERE g.fecha = caja_diaria.fecha AND g.metodo_pago = 'Efectivo'), 0)
+"""
+
+
+def sqlite(cur):
+    cols = [r[1] for r in cur.execute("PRAGMA table_info(caja_diaria)").fetchall()]
+    if 'abierta' not in cols:
+        for ddl in _COLUMNAS:
+            cur.execute(f"ALTER TABLE caja_diaria ADD COLUMN {ddl.format(dinero='INTEGER')}")
+    cur.execute(_ABIERTAS)
+    cur.execute(_DIAS_SIN_CAJA)
+    cur.execute(_ACUMULADOS)
+
+
+def postgres(cur):
+    for ddl in _COLUMNAS:
+        cur.execute(f"ALTER TABLE caja_diaria ADD COLUMN IF NOT EXISTS {ddl.format(dinero='BIGINT')}")
+    cur.execute(_ABIERTAS)
+    cur.execute(_DIAS_SIN_CAJA)
+    cur.execute(_ACUMULADOS)
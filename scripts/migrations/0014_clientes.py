@@ -0,0 +1,108 @@
+"""v1.7 — clientes (saldo y créditos abiertos incrementales), abonos y
+creditos_clientes.cliente_id. Un cliente por nombre normalizado
+(_normalizar_nombre); lo ya abonado de cada crédito queda como un abono
+'Saldo migrado' (antes de v1.7 los abonos no tenían historial)."""
+import unicodedata
+
+_CLIENTES = """CREATE TABLE IF NOT EXISTS clientes (
+        id {id},
+        nombre TEXT NOT NULL,
+        nombre_normalizado TEXT NOT NULL,
+        telefono TEXT,
+        saldo {dinero} NOT NULL DEFAULT 0 CHECK (saldo >= 0),
+        creditos_abiertos INTEGER NOT NULL DEFAULT 0 CHECK (creditos_abiertos >= 0),
+        notas TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )"""
+
+_ABONOS = """CREATE TABLE IF NOT EXISTS abonos (
+        id {id},
+        credito_id INTEGER NOT NULL REFERENCES creditos_clientes(id),
+        cliente_id INTEGER NOT NULL REFERENCES clientes(id),
+        fecha DATE NOT NULL,
+        monto {dinero} NOT NULL CHECK (monto > 0),
+        notas TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )"""
+
+_TIPOS = {
+    'sqlite': {'id': 'INTEGER PRIMARY KEY AUTOINCREMENT', 'dinero': 'INTEGER'},
+    'postgres': {'id': 'SERIAL PRIMARY KEY', 'dinero': 'BIGINT'},
+}
+
+_CLIENTE_ID = "cliente_id INTEGER REFERENCES clientes(id)"
+
+# Se crean aquí (no en 0001): creditos_clientes.cliente_id nace en esta migración
+_INDICES = [
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_clientes_nombre ON clientes (nombre_normalizado)",
+    "CREATE INDEX IF NOT EXISTS idx_clientes_telefono ON clientes (telefono) WHERE telefono IS NOT NULL",
+    "CREATE INDEX IF NOT EXISTS idx_clientes_con_saldo ON clientes (saldo) WHERE saldo > 0",
+    "CREATE INDEX IF NOT EXISTS idx_creditos_cliente ON creditos_clientes (cliente_id, pagado)",
+    "CREATE INDEX IF NOT EXISTS idx_abonos_cliente ON abonos (cliente_id, fecha)",
+    "CREATE INDEX IF NOT EXISTS idx_abonos_credito ON abonos (credito_id)",
+]
+
+_ABONOS_MIGRADOS = """
+    INSERT INTO abonos (credito_id, cliente_id, fecha, monto, notas)
+    SELECT c.id, c.cliente_id, COALESCE(c.fecha_pago, c.fecha_credito), c.monto_pagado, 'Saldo migrado'
+    FROM creditos_clientes c
+    WHERE c.monto_pagado > 0 AND c.cliente_id IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM abonos a WHERE a.credito_id = c.id)
+"""
+
+_SALDOS = """
+    UPDATE clientes SET
+        saldo = COALESCE((SELECT SUM(c.monto - COALESCE(c.monto_pagado, 0)) FROM creditos_clientes c
+                          WHERE c.cliente_id = clientes.id AND c.pagado = 0), 0),
+        creditos_abiertos = (SELECT COUNT(*) FROM creditos_clientes c
+                             WHERE c.cliente_id = clientes.id AND c.pagado = 0)
+"""
+
+
+def _crear(cur, dialecto):
+    for ddl in (_CLIENTES, _ABONOS):
+        cur.execute(ddl.format(**_TIPOS[dialecto]))
+
+
+def _normalizar_nombre(nombre):
+    """Copia de app/models.normalizar_nombre al momento de esta migración:
+    minúsculas, sin tildes, espacios simples."""
+    texto = unicodedata.normalize('NFKD', nombre or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(texto.lower().split())
+
+
+def _llenar(cur, marcador):
+    for ddl in _INDICES:
+        cur.execute(ddl)
+
+    cur.execute("SELECT id, cliente FROM creditos_clientes WHERE cliente_id IS NULL")
+    ids = {}
+    vincular = []
+    for credito_id, nombre in cur.fetchall():
+        clave = _normalizar_nombre(nombre)
+        if not clave:
+            continue
+        if clave not in ids:
+            cur.execute(f"INSERT INTO clientes (nombre, nombre_normalizado) VALUES ({marcador}, {marcador}) "
+                        f"ON CONFLICT (nombre_normalizado) DO NOTHING", (' '.join(nombre.split()), clave))
+            cur.execute(f"SELECT id FROM clientes WHERE nombre_normalizado = {marcador}", (clave,))
+            ids[clave] = cur.fetchone()[0]
+        vincular.append((ids[clave], credito_id))
+    cur.executemany(f"UPDATE creditos_clientes SET cliente_id = {marcador} WHERE id = {marcador}", vincular)
+    cur.execute(_ABONOS_MIGRADOS)
+    cur.execute(_SALDOS)
+
+
+def sqlite(cur):
+    _crear(cur, 'sqlite')
+    cols = [r[1] for r in cur.execute("PRAGMA table_info(creditos_clientes)").fetchall()]
+    if 'cliente_id' not in cols:
+        cur.execute(f"ALTER TABLE creditos_clientes ADD COLUMN {_CLIENTE_ID}")
+    _llenar(cur, '?')
+
+
+def postgres(cur):
+    _crear(cur, 'postgres')
+    cur.execute(f"ALTER TABLE creditos_clientes ADD COLUMN IF NOT EXISTS {_CLIENTE_ID}")
+    _llenar(cur, '%s')
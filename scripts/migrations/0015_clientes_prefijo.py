@@ -0,0 +1,22 @@
+"""v1.7 — búsqueda de clientes por prefijo en PostgreSQL con LIKE e índices
+text_pattern_ops (app/models._prefijo): con una collation distinta de C el
+rango >= / < no equivale a 'empieza por'. SQLite compara por bytes y sigue
+con el rango sobre los índices de 0014."""
+
+_INDICES = [
+    "CREATE INDEX IF NOT EXISTS idx_clientes_nombre_prefijo "
+    "ON clientes (nombre_normalizado text_pattern_ops)",
+    "CREATE INDEX IF NOT EXISTS idx_clientes_telefono_prefijo "
+    "ON clientes (telefono text_pattern_ops) WHERE telefono IS NOT NULL",
+]
+
+
+def sqlite(cur):
+    pass
+
+
+def postgres(cur):
+    for ddl in _INDICES:
+        cur.execute(ddl)
+    # Con la collation de la BD no sirve para LIKE; lo reemplaza el de arriba
+    cur.execute("DROP INDEX IF EXISTS idx_clientes_telefono")
@@ -0,0 +1,13 @@
+"""v1.7 — idempotencia.huella: sha256 de los argumentos de la escritura. Una
+clave repetida con otros datos es un error (app/models._resultado_previo),
+no el resultado de otra venta. Las filas previas quedan con NULL."""
+
+
+def sqlite(cur):
+    cols = [r[1] for r in cur.execute("PRAGMA table_info(idempotencia)").fetchall()]
+    if 'huella' not in cols:
+        cur.execute("ALTER TABLE idempotencia ADD COLUMN huella TEXT")
+
+
+def postgres(cur):
+    cur.execute("ALTER TABLE idempotencia ADD COLUMN IF NOT EXISTS huella TEXT")
@@ -0,0 +1,218 @@
+"""Migraciones versionadas del esquema de ORVANN Retail OS. v1.7
+
+Cada archivo NNNN_nombre.py de este paquete es un paso del esquema con dos
+funciones que reciben un cursor ya dentro de una transacción:
+
+    def sqlite(cur): ...
+    def postgres(cur): ...
+
+migrar() las aplica una sola vez, en orden, y registra cada versión en la
+tabla schema_version en la misma transacción que el paso. Todo corre en una
+única conexión:
+
+- Arranque al día: una sola consulta (MAX(version)) y retorna.
+- PostgreSQL: pg_advisory_lock serializa réplicas que arrancan a la vez.
+- SQLite: BEGIN IMMEDIATE toma el lock de escritura por paso.
+
+Los pasos son idempotentes (IF NOT EXISTS, chequeos de columnas), así una
+BD anterior a schema_version simplemente los recorre todos la primera vez.
+Para agregar un cambio de esquema: nuevo archivo con el siguiente número.
+"""
+import importlib
+import os
+import pkgutil
+import re
+import sqlite3
+
+# Clave del advisory lock de PostgreSQL ('ORVN')
+LOCK_ID = 0x4F52564E
+
+_PATRON = re.compile(r'^(\d{4})_(\w+)$')
+
+_SQLITE_TABLA = """CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    aplicada_en TEXT NOT NULL DEFAULT (datetime('now'))
+)"""
+
+_POSTGRES_TABLA = """CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    aplicada_en TIMESTAMP NOT NULL DEFAULT NOW()
+)"""
+
+
+def listar():
+    """[(version, nombre)] de los archivos de migración, ordenado por versión."""
+    pasos = []
+    for info in pkgutil.iter_modules([os.path.dirname(__file__)]):
+        m = _PATRON.match(info.name)
+        if m:
+            pasos.append((int(m.group(1)), info.name))
+    pasos.sort()
+    versiones = [v for v, _ in pasos]
+    if len(set(versiones)) != len(versiones):
+        raise RuntimeError(f"Versiones de migración repetidas: {versiones}")
+    return pasos
+
+
+def cargar(nombre):
+    """Módulo de la migración nombre (ej. '0002_monto_pagado')."""
+    return importlib.import_module(f'{__name__}.{nombre}')
+
+
+def ultima_version():
+    pasos = listar()
+    return pasos[-1][0] if pasos else 0
+
+
+def _pg_url(database_url=None):
+    url = database_url or os.environ.get('DATABASE_URL', '')
+    # Railway usa postgres:// pero psycopg2 necesita postgresql://
+    if url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql://', 1)
+    return url
+
+
+def _conectar_sqlite(db_path):
+    # Autocommit: las transacciones las abre aplicar_sqlite (BEGIN IMMEDIATE)
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    return sqlite3.connect(db_path, isolation_level=None)
+
+
+def _conectar_postgres(database_url=None):
+    import psycopg2
+    return psycopg2.connect(_pg_url(database_url))
+
+
+# ── Aplicar un paso ──────────────────────────────────────
+
+def aplicar_sqlite(conn, nombre, version=None):
+    """Corre un paso en su propia transacción. Con version la registra en
+    schema_version (si otro proceso ya la aplicó, no hace nada)."""
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        if version is not None:
+            cur.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,))
+            if cur.fetchone():
+                cur.execute("ROLLBACK")
+                return False
+        cargar(nombre).sqlite(cur)
+        if version is not None:
+            cur.execute("INSERT INTO schema_version (version, nombre) VALUES (?, ?)", (version, nombre))
+        cur.execute("COMMIT")
+    except Exception:
+        cur.execute("ROLLBACK")
+        raise
+    return True
+
+
+def aplicar_postgres(conn, nombre, version=None):
+    """Equivalente PostgreSQL de aplicar_sqlite (el llamador tiene el advisory lock)."""
+    cur = conn.cursor()
+    try:
+        cargar(nombre).postgres(cur)
+        if version is not None:
+            cur.execute("INSERT INTO schema_version (version, nombre) VALUES (%s, %s)", (version, nombre))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return True
+
+
+# ── Runner ───────────────────────────────────────────────
+
+def version_actual(conn, postgres=False):
+    """Versión registrada, o None si schema_version no existe. Una consulta."""
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT MAX(version) FROM schema_version")
+    except Exception:
+        if postgres:
+            conn.rollback()
+        return None
+    row = cur.fetchone()
+    if postgres:
+        conn.rollback()  # no dejar la sesión "idle in transaction"
+    return row[0] or 0
+
+
+def migrar(db_path=None, database_url=None):
+    """Lleva la BD a la última versión. Retorna las versiones aplicadas ([] si ya estaba al día).
+
+    Con database_url → PostgreSQL; si no, SQLite en db_path.
+    """
+    if database_url:
+        return _migrar_postgres(database_url)
+    return _migrar_sqlite(db_path)
+
+
+def _pendientes(aplicadas):
+    return [(v, n) for v, n in listar() if v not in aplicadas]
+
+
+def _migrar_sqlite(db_path):
+    conn = _conectar_sqlite(db_path)
+    try:
+        if version_actual(conn) == ultima_version():
+            return []
+        conn.execute(_SQLITE_TABLA)
+        aplicadas = {r[0] for r in conn.execute("SELECT version FROM schema_version")}
+        hechas = []
+        for version, nombre in _pendientes(aplicadas):
+            if aplicar_sqlite(conn, nombre, version):
+                print(f"Migración {nombre} aplicada (SQLite)")
+                hechas.append(version)
+        return hechas
+    finally:
+        conn.close()
+
+
+def _migrar_postgres(database_url):
+    """Aplica lo pendiente bajo el advisory lock y, aunque el esquema ya esté
+    al día, crea ahí mismo las particiones de los próximos meses
+    (_particiones_postgres): 0010 solo crea las del momento del deploy."""
+    conn = _conectar_postgres(database_url)
+    try:
+        al_dia = version_actual(conn, postgres=True) == ultima_version()
+        cur = conn.cursor()
+        cur.execute("SELECT pg_advisory_lock(%s)", (LOCK_ID,))
+        try:
+            hechas = []
+            if not al_dia:
+                cur.execute(_POSTGRES_TABLA)
+                # Releer bajo el lock: otra réplica pudo aplicar mientras esperábamos
+                cur.execute("SELECT version FROM schema_version")
+                aplicadas = {r[0] for r in cur.fetchall()}
+                conn.commit()
+                for version, nombre in _pendientes(aplicadas):
+                    aplicar_postgres(conn, nombre, version)
+                    print(f"Migración {nombre} aplicada (PG)")
+                    hechas.append(version)
+            _particiones_postgres(conn)
+            return hechas
+        finally:
+            cur = conn.cursor()
+            cur.execute("SELECT pg_advisory_unlock(%s)", (LOCK_ID,))
+            conn.commit()
+    finally:
+        conn.close()
+
+
+def _particiones_postgres(conn):
+    """Particiones hasta MESES_ADELANTE y meses caídos en la DEFAULT
+    (scripts/particiones.asegurar_postgres; el llamador tiene el advisory
+    lock). Si ya existen son unas pocas consultas de catálogo. Sin esto, a los
+    tres meses del deploy todo caería en ventas_default / gastos_default."""
+    from scripts import particiones
+    try:
+        creadas = particiones.asegurar_postgres(conn.cursor())
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    for nombre in creadas:
+        print(f"Partición {nombre} creada (PG)")
+    return creadas
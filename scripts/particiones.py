@@ -0,0 +1,306 @@
+"""Particionado por mes de ventas y gastos. v1.7
+
+ventas y gastos solo crecen, y casi toda lectura filtra por fecha (día de
+caja, mes del dashboard, rangos de Historial).
+
+PostgreSQL: particionado declarativo RANGE (fecha), una partición por mes
+(ventas_2025_03) más una DEFAULT de respaldo. asegurar_postgres() crea los
+meses hasta MESES_ADELANTE hacia adelante y saca de la DEFAULT lo que haya
+caído ahí; el planner descarta las particiones fuera del rango consultado.
+archivar_postgres() desengancha los meses viejos y los pasa al esquema
+archivo (archivo.ventas, también particionada): dejan de pesar en los
+índices y el vacuum de las tablas vivas, y siguen visibles en
+ventas_historico / gastos_historico (UNION ALL de ambos esquemas).
+
+SQLite: archivar_sqlite(año) mueve las filas de un año cerrado a un archivo
+aparte (orvann_archivo_2024.db). app/database.py los adjunta (ATTACH) en
+cada conexión y define ventas_historico / gastos_historico sobre la tabla
+viva y los archivos; cada tramo usa su índice por fecha.
+
+Uso:
+    python -m scripts.particiones asegurar               # PostgreSQL (DATABASE_URL)
+    python -m scripts.particiones archivar AAAA-MM       # PostgreSQL: meses anteriores
+    python -m scripts.particiones archivar AAAA [ruta.db]  # SQLite: año completo
+"""
+import os
+import re
+import sqlite3
+import sys
+from datetime import date
+
+from scripts import schema
+
+TABLAS = ('ventas', 'gastos')
+MESES_ADELANTE = 3
+
+_NOMBRE = re.compile(r'^(\w+)_(\d{4})_(\d{2})$')
+
+
+# ── Meses ────────────────────────────────────────────────
+
+def _mes(d):
+    """Primer día del mes de d (date o 'AAAA-MM[-DD]')."""
+    if isinstance(d, str):
+        d = date.fromisoformat(d[:7] + '-01')
+    return d.replace(day=1)
+
+
+def _siguiente(mes):
+    return date(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
+
+
+def meses(desde, hasta):
+    """Primeros días de mes de desde a hasta, ambos incluidos."""
+    mes, fin = _mes(desde), _mes(hasta)
+    while mes <= fin:
+        yield mes
+        mes = _siguiente(mes)
+
+
+def nombre_particion(tabla, mes):
+    return f"{tabla}_{mes.year:04d}_{mes.month:02d}"
+
+
+def _vista(tabla):
+    return f"{tabla}_historico"
+
+
+def _columnas(tabla):
+    return [c.nombre for c in schema.tabla(tabla).columnas]
+
+
+# ── PostgreSQL ───────────────────────────────────────────
+
+def _particionada(cur, tabla, esquema='public'):
+    cur.execute("""
+        SELECT c.relkind = 'p' FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relname = %s
+    """, (esquema, tabla))
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+
+def _particiones(cur, tabla, esquema='public'):
+    """{primer día del mes: nombre} de las particiones mensuales de esquema.tabla."""
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        JOIN pg_namespace n ON n.oid = p.relnamespace
+        WHERE n.nspname = %s AND p.relname = %s
+    """, (esquema, tabla))
+    res = {}
+    for (nombre,) in cur.fetchall():
+        m = _NOMBRE.match(nombre)
+        if m and m.group(1) == tabla:
+            res[date(int(m.group(2)), int(m.group(3)), 1)] = nombre
+    return res
+
+
+def crear_mes_postgres(cur, tabla, mes):
+    """Crea la partición del mes. Las filas de ese mes que estén en la
+    DEFAULT se mueven antes del ATTACH (si no, el ATTACH falla)."""
+    nombre = nombre_particion(tabla, mes)
+    desde, hasta = mes.isoformat(), _siguiente(mes).isoformat()
+    cur.execute(f"CREATE TABLE {nombre} (LIKE {tabla} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    cur.execute(f"""
+        WITH movidas AS (
+            DELETE FROM {tabla}_default WHERE fecha >= %s AND fecha < %s RETURNING *
+        )
+        INSERT INTO {nombre} SELECT * FROM movidas
+    """, (desde, hasta))
+    cur.execute(f"ALTER TABLE {tabla} ATTACH PARTITION {nombre} "
+                f"FOR VALUES FROM ('{desde}') TO ('{hasta}')")
+    return nombre
+
+
+def asegurar_postgres(cur, desde=None, meses_adelante=MESES_ADELANTE):
+    """DEFAULT + particiones desde (o el mes actual) hasta meses_adelante,
+    más los meses que hayan caído en la DEFAULT. Retorna las creadas.
+    Tablas sin particionar (BD anterior a 0010) se saltan."""
+    hoy = date.today()
+    tope = _mes(hoy)
+    for _ in range(meses_adelante):
+        tope = _siguiente(tope)
+    creadas = []
+    for tabla in TABLAS:
+        if not _particionada(cur, tabla):
+            continue
+        cur.execute(f"CREATE TABLE IF NOT EXISTS {tabla}_default PARTITION OF {tabla} DEFAULT")
+        existentes = _particiones(cur, tabla)
+        cur.execute(f"SELECT DISTINCT date_trunc('month', fecha)::date FROM {tabla}_default")
+        pendientes = {r[0] for r in cur.fetchall()}
+        pendientes.update(meses(desde or hoy, tope))
+        for mes in sorted(pendientes - set(existentes)):
+            creadas.append(crear_mes_postgres(cur, tabla, mes))
+    return creadas
+
+
+def preparar_postgres(cur, columnas=None):
+    """Esquema archivo, vistas *_historico y particiones al día (idempotente).
+    Las tablas todavía sin particionar (BD anterior a 0010) no se tocan.
+    columnas ({tabla: [nombres]}) fija las de las vistas; por defecto las del
+    esquema actual (las migraciones pasan las de su momento)."""
+    cur.execute("CREATE SCHEMA IF NOT EXISTS archivo")
+    for tabla in TABLAS:
+        if not _particionada(cur, tabla):
+            continue
+        cur.execute(f"CREATE TABLE IF NOT EXISTS archivo.{tabla} (LIKE public.{tabla}) "
+                    f"PARTITION BY RANGE (fecha)")
+        cols = ', '.join((columnas or {}).get(tabla) or _columnas(tabla))
+        cur.execute(f"DROP VIEW IF EXISTS {_vista(tabla)}")
+        cur.execute(f"""
+            CREATE VIEW {_vista(tabla)} AS
+            SELECT {cols} FROM public.{tabla}
+            UNION ALL
+            SELECT {cols} FROM archivo.{tabla}
+        """)
+    return asegurar_postgres(cur)
+
+
+def convertir_postgres(cur, tabla, ddl=None, indices=None, columnas=None):
+    """Reemplaza la tabla heap por la particionada conservando filas, ids y
+    secuencia. La FK creditos_clientes.venta_id → ventas(id) se elimina:
+    PostgreSQL no admite FK hacia una PK particionada sin la fecha.
+
+    ddl, indices ({nombre: DDL}) y columnas fijan el esquema de destino; por
+    defecto el actual de scripts/schema.py."""
+    viejo = f"{tabla}_sin_particion"
+    if tabla == 'ventas':
+        cur.execute("ALTER TABLE creditos_clientes DROP CONSTRAINT IF EXISTS creditos_clientes_venta_id_fkey")
+    cur.execute(f"ALTER TABLE {tabla} RENAME TO {viejo}")
+    cur.execute(f"ALTER SEQUENCE IF EXISTS {tabla}_id_seq RENAME TO {viejo}_id_seq")
+    cur.execute(f"ALTER INDEX IF EXISTS {tabla}_pkey RENAME TO {viejo}_pkey")
+    if indices is None:
+        indices = {ix.nombre: schema.compilar_indice(ix, 'postgres')
+                   for ix in schema.INDICES if ix.tabla == tabla}
+    for nombre in indices:
+        cur.execute(f"DROP INDEX IF EXISTS {nombre}")
+
+    cur.execute(ddl or schema.compilar_tabla(schema.tabla(tabla), 'postgres'))
+    for ddl_ix in indices.values():
+        if ddl_ix:
+            cur.execute(ddl_ix)
+    cur.execute(f"SELECT MIN(fecha) FROM {viejo}")
+    asegurar_postgres(cur, desde=cur.fetchone()[0])
+
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = %s
+    """, (viejo,))
+    vivas = {r[0] for r in cur.fetchall()}
+    cols = ', '.join(c for c in (columnas or _columnas(tabla)) if c in vivas)
+    cur.execute(f"INSERT INTO {tabla} ({cols}) SELECT {cols} FROM {viejo}")
+    asegurar_postgres(cur)  # fechas más allá de MESES_ADELANTE cayeron en la DEFAULT
+    cur.execute(f"SELECT setval(pg_get_serial_sequence('{tabla}', 'id'), "
+                f"COALESCE((SELECT MAX(id) FROM {tabla}), 0) + 1, false)")
+    cur.execute(f"DROP TABLE {viejo}")
+
+
+def archivar_postgres(cur, antes_de):
+    """Pasa al esquema archivo las particiones de meses anteriores a antes_de
+    ('AAAA-MM'). Retorna los nombres movidos."""
+    limite = _mes(antes_de)
+    if limite > _mes(date.today()):
+        raise ValueError("No se archiva el mes en curso ni meses futuros")
+    movidas = []
+    for tabla in TABLAS:
+        for mes, nombre in sorted(_particiones(cur, tabla).items()):
+            if mes >= limite:
+                continue
+            desde, hasta = mes.isoformat(), _siguiente(mes).isoformat()
+            cur.execute(f"ALTER TABLE public.{tabla} DETACH PARTITION {nombre}")
+            cur.execute(f"ALTER TABLE {nombre} SET SCHEMA archivo")
+            cur.execute(f"ALTER TABLE archivo.{tabla} ATTACH PARTITION archivo.{nombre} "
+                        f"FOR VALUES FROM ('{desde}') TO ('{hasta}')")
+            movidas.append(nombre)
+    return movidas
+
+
+# ── SQLite ───────────────────────────────────────────────
+
+def _ddl_archivo(tabla):
+    """CREATE TABLE de la tabla en el archivo: mismo DDL, sin REFERENCES
+    (productos y creditos viven en la BD principal)."""
+    t = schema.tabla(tabla)
+    t = t._replace(columnas=[c._replace(referencia=None) for c in t.columnas])
+    return schema.compilar_tabla(t, 'sqlite').replace(
+        f"CREATE TABLE IF NOT EXISTS {tabla} (", f"CREATE TABLE IF NOT EXISTS archivo.{tabla} (", 1)
+
+
+def archivar_sqlite(anio, db_path=None):
+    """Mueve ventas y gastos del año (cerrado) al archivo de ese año.
+
+    Copia y borrado van en una sola transacción. Las ventas con crédito
+    asociado se quedan en la BD principal (creditos_clientes las referencia).
+    Retorna {tabla: filas movidas}.
+    """
+    from app import database
+    anio = int(anio)
+    if anio >= date.today().year:
+        raise ValueError("Solo se archivan años cerrados")
+    path = db_path or database.DB_PATH
+    destino = database.ruta_archivo(anio, path)
+    desde, hasta = f"{anio:04d}-01-01", f"{anio + 1:04d}-01-01"
+    movidas = {}
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    try:
+        conn.execute("ATTACH DATABASE ? AS archivo", (destino,))
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for tabla in TABLAS:
+                conn.execute(_ddl_archivo(tabla))
+                conn.execute(f"CREATE INDEX IF NOT EXISTS archivo.idx_{tabla}_fecha ON {tabla} (fecha)")
+                vivas = {r[1] for r in conn.execute(f"PRAGMA main.table_info({tabla})")}
+                cols = ', '.join(c for c in _columnas(tabla) if c in vivas)
+                filtro = "fecha >= ? AND fecha < ?"
+                if tabla == 'ventas':
+                    filtro += (" AND id NOT IN (SELECT venta_id FROM creditos_clientes"
+                               " WHERE venta_id IS NOT NULL)")
+                conn.execute(f"INSERT OR IGNORE INTO archivo.{tabla} ({cols}) "
+                             f"SELECT {cols} FROM main.{tabla} WHERE {filtro}", (desde, hasta))
+                movidas[tabla] = conn.execute(
+                    f"DELETE FROM main.{tabla} WHERE {filtro}", (desde, hasta)).rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("DETACH DATABASE archivo")
+    finally:
+        conn.close()
+    database.refrescar_archivos(path)
+    return movidas
+
+
+def _main(args):
+    database_url = os.environ.get('DATABASE_URL', '')
+    if args[:1] == ['archivar'] and len(args) >= 2 and re.fullmatch(r'\d{4}', args[1]):
+        print(archivar_sqlite(int(args[1]), args[2] if len(args) > 2 else None))
+        return 0
+    if args[:1] in (['asegurar'], ['archivar']) and database_url.startswith('postgres'):
+        from scripts import migrations
+        conn = migrations._conectar_postgres(database_url)
+        try:
+            cur = conn.cursor()
+            if args[0] == 'asegurar':
+                hechas = asegurar_postgres(cur)
+            elif len(args) == 2 and re.fullmatch(r'\d{4}-\d{2}', args[1]):
+                hechas = archivar_postgres(cur, args[1])
+            else:
+                print(__doc__)
+                return 1
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        for nombre in hechas:
+            print(nombre)
+        return 0
+    print(__doc__)
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(_main(sys.argv[1:]))
@@ -0,0 +1,598 @@
+"""Definición declarativa del esquema de ORVANN Retail OS. v1.7
+
+Una sola fuente para SQLite y PostgreSQL: TABLAS e INDICES describen
+columnas con tipos lógicos, CHECKs, índices (parciales y de expresión),
+columnas generadas y particionado, y compilar_*() produce el DDL de cada
+backend. scripts/create_db.py expone el resultado como SQLITE_TABLES /
+POSTGRES_TABLES / *_INDEXES.
+
+diff() compara la BD viva contra la definición (tipo, NOT NULL, DEFAULT y
+CHECK por columna, particionado, nombres de índices) y retorna la migración
+mínima (CREATE TABLE / ADD COLUMN / ALTER COLUMN / ADD CHECK / CREATE INDEX).
+Nunca borra: lo que sobra, y lo que SQLite no puede alterar, sale como
+comentario. Uso:
+
+    python -m scripts.schema sql sqlite|postgres
+    python -m scripts.schema diff [ruta.db]        # sin ruta usa DATABASE_URL
+"""
+import os
+import re
+import sqlite3
+import sys
+from collections import namedtuple
+
+DIALECTOS = ('sqlite', 'postgres')
+
+# Expresión que cambia según el backend (defaults, columnas generadas)
+Dialectal = namedtuple('Dialectal', ['sqlite', 'postgres'])
+
+Columna = namedtuple(
+    'Columna',
+    ['nombre', 'tipo', 'nulo', 'pk', 'default', 'referencia', 'check', 'generada'],
+    defaults=(True, False, None, None, None, None),
+)
+Tabla = namedtuple('Tabla', ['nombre', 'columnas', 'pk', 'particion'], defaults=(None, None))
+# columnas: nombres o expresiones; donde: índice parcial; solo: 'sqlite'/'postgres'/None
+Indice = namedtuple(
+    'Indice', ['nombre', 'tabla', 'columnas', 'unico', 'donde', 'metodo', 'solo'],
+    defaults=(False, None, None, None),
+)
+
+# Tipos lógicos → tipo por backend. 'dinero' son pesos enteros (v1.7).
+TIPOS = {
+    'serial': Dialectal('INTEGER', 'SERIAL'),
+    'texto': Dialectal('TEXT', 'TEXT'),
+    'entero': Dialectal('INTEGER', 'INTEGER'),
+    'dinero': Dialectal('INTEGER', 'BIGINT'),
+    'decimal': Dialectal('REAL', 'NUMERIC'),
+    'fecha': Dialectal('DATE', 'DATE'),
+    'hora': Dialectal('TIME', 'TIME'),
+    'timestamp': Dialectal('TIMESTAMP', 'TIMESTAMP'),
+}
+
+HOY = Dialectal("(date('now'))", 'CURRENT_DATE')
+AHORA_HORA = Dialectal("(time('now'))", 'CURRENT_TIME')
+AHORA = 'CURRENT_TIMESTAMP'
+
+_C = Columna
+_ID = _C('id', 'serial', pk=True)
+_CREATED = _C('created_at', 'timestamp', default=AHORA)
+METODOS_PAGO = "('Efectivo', 'Transferencia', 'Datáfono', 'Crédito')"
+
+TABLAS = [
+    Tabla('productos', [
+        _C('sku', 'texto', pk=True),
+        _C('nombre', 'texto', nulo=False),
+        _C('categoria', 'texto'),
+        _C('talla', 'texto'),
+        _C('color', 'texto'),
+        _C('costo', 'dinero', nulo=False, check='costo >= 0'),
+        _C('precio_venta', 'dinero', nulo=False, check='precio_venta >= 0'),
+        _C('stock', 'entero', default='0', check='stock >= 0'),
+        _C('stock_minimo', 'entero', default='3', check='stock_minimo >= 0'),
+        _C('proveedor', 'texto'),
+        _C('notas', 'texto'),
+        _C('codigo_barras', 'texto'),
+        _CREATED,
+    ]),
+    Tabla('ventas', [
+        _ID,
+        _C('fecha', 'fecha', nulo=False, default=HOY),
+        _C('hora', 'hora', default=AHORA_HORA),
+        _C('sku', 'texto', nulo=False, referencia='productos(sku)'),
+        _C('cantidad', 'entero', default='1', check='cantidad > 0'),
+        _C('precio_unitario', 'dinero', nulo=False, check='precio_unitario >= 0'),
+        _C('descuento_pct', 'decimal', default='0', check='descuento_pct >= 0 AND descuento_pct <= 100'),
+        _C('total', 'dinero', nulo=False, check='total >= 0'),
+        _C('metodo_pago', 'texto', nulo=False, check=f'metodo_pago IN {METODOS_PAGO}'),
+        _C('cliente', 'texto'),
+        _C('vendedor', 'texto'),
+        _C('notas', 'texto'),
+        _C('costo_unitario', 'dinero'),
+        _C('producto_nombre', 'texto'),
+        _CREATED,
+    ], particion=('RANGE', 'fecha')),  # v1.7: un mes por partición (scripts/particiones.py)
+    Tabla('caja_diaria', [
+        _C('fecha', 'fecha', pk=True),
+        _C('efectivo_inicio', 'dinero', default='0', check='efectivo_inicio >= 0'),
+        _C('efectivo_cierre_real', 'dinero'),
+        _C('cerrada', 'entero', default='0', check='cerrada IN (0, 1)'),
+        _C('notas', 'texto'),
+        # v1.7 — Acumulados del día, al día con cada escritura de ventas y
+        # gastos (app/models._sumar_caja). abierta=0: fila creada por una venta
+        # o gasto sin que se haya abierto la caja.
+        _C('abierta', 'entero', default='0', check='abierta IN (0, 1)'),
+        _C('ventas_efectivo', 'dinero', nulo=False, default='0'),
+        _C('ventas_transferencia', 'dinero', nulo=False, default='0'),
+        _C('ventas_datafono', 'dinero', nulo=False, default='0'),
+        _C('ventas_credito', 'dinero', nulo=False, default='0'),
+        _C('gastos_efectivo', 'dinero', nulo=False, default='0'),
+    ]),
+    Tabla('gastos', [
+        _ID,
+        _C('fecha', 'fecha', nulo=False),
+        _C('categoria', 'texto', nulo=False),
+        _C('monto', 'dinero', nulo=False, check='monto > 0'),
+        _C('descripcion', 'texto'),
+        _C('metodo_pago', 'texto'),
+        _C('pagado_por', 'texto', nulo=False, check="pagado_por IN ('JP', 'KATHE', 'ANDRES')"),
+        _C('es_inversion', 'entero', default='0', check='es_inversion IN (0, 1)'),
+        _C('notas', 'texto'),
+        _CREATED,
+    ], particion=('RANGE', 'fecha')),
+    # v1.7 — Clientes a crédito. saldo y creditos_abiertos se mantienen en
+    # cada venta a crédito, abono y anulación (app/models.py); nombre_normalizado
+    # (minúsculas, sin tildes) es la clave de búsqueda y de unicidad.
+    Tabla('clientes', [
+        _ID,
+        _C('nombre', 'texto', nulo=False),
+        _C('nombre_normalizado', 'texto', nulo=False),
+        _C('telefono', 'texto'),
+        _C('saldo', 'dinero', nulo=False, default='0', check='saldo >= 0'),
+        _C('creditos_abiertos', 'entero', nulo=False, default='0', check='creditos_abiertos >= 0'),
+        _C('notas', 'texto'),
+        _CREATED,
+    ]),
+    Tabla('creditos_clientes', [
+        _ID,
+        # PostgreSQL no admite FK hacia ventas(id) particionada (la PK es id, fecha)
+        _C('venta_id', 'entero', referencia=Dialectal('ventas(id)', None)),
+        _C('cliente', 'texto', nulo=False),
+        _C('monto', 'dinero', nulo=False, check='monto > 0'),
+        _C('monto_pagado', 'dinero', default='0', check='monto_pagado >= 0'),
+        _C('fecha_credito', 'fecha', nulo=False),
+        _C('fecha_pago', 'fecha'),
+        _C('pagado', 'entero', default='0', check='pagado IN (0, 1)'),
+        _C('notas', 'texto'),
+        _C('cliente_id', 'entero', referencia='clientes(id)'),
+    ]),
+    # v1.7 — Historial de abonos a créditos (monto aplicado, nunca se edita)
+    Tabla('abonos', [
+        _ID,
+        _C('credito_id', 'entero', nulo=False, referencia='creditos_clientes(id)'),
+        _C('cliente_id', 'entero', nulo=False, referencia='clientes(id)'),
+        _C('fecha', 'fecha', nulo=False),
+        _C('monto', 'dinero', nulo=False, check='monto > 0'),
+        _C('notas', 'texto'),
+        _CREATED,
+    ]),
+    Tabla('pedidos_proveedores', [
+        _ID,
+        _C('fecha_pedido', 'fecha', nulo=False),
+        _C('proveedor', 'texto', nulo=False),
+        _C('descripcion', 'texto'),
+        _C('unidades', 'entero', check='unidades > 0'),
+        _C('costo_unitario', 'dinero', check='costo_unitario >= 0'),
+        _C('total', 'dinero', check='total >= 0'),
+        _C('estado', 'texto', default="'Pendiente'", check="estado IN ('Pendiente', 'Pagado', 'Completo')"),
+        _C('pagado_por', 'texto'),
+        _C('fecha_entrega_est', 'fecha'),
+        _C('notas', 'texto'),
+    ]),
+    Tabla('costos_fijos', [
+        _ID,
+        _C('concepto', 'texto', nulo=False),
+        _C('monto_mensual', 'dinero', nulo=False, check='monto_mensual > 0'),
+        _C('activo', 'entero', default='1', check='activo IN (0, 1)'),
+        _C('notas', 'texto'),
+    ]),
+    # v1.7 — Claves de idempotencia de escrituras (reintentos / doble submit)
+    Tabla('idempotencia', [
+        _C('clave', 'texto', pk=True),
+        _C('operacion', 'texto', nulo=False),
+        _C('resultado', 'texto'),
+        _CREATED,
+        # sha256 de los argumentos (app/models._huella); NULL en filas previas
+        _C('huella', 'texto'),
+    ]),
+    # v1.7 — Kardex: movimientos de stock append-only + snapshots por fecha
+    Tabla('movimientos_inventario', [
+        _ID,
+        _C('fecha', 'fecha', nulo=False),
+        _C('sku', 'texto', nulo=False),
+        _C('tipo', 'texto', nulo=False,
+           check="tipo IN ('inicial', 'venta', 'anulacion', 'entrada', 'ajuste')"),
+        _C('cantidad', 'entero', nulo=False, check='cantidad <> 0'),
+        _C('referencia', 'texto'),
+        _CREATED,
+    ]),
+    Tabla('snapshots_stock', [
+        _C('fecha', 'fecha', nulo=False),
+        _C('sku', 'texto', nulo=False),
+        _C('stock', 'entero', nulo=False),
+        _C('ultimo_movimiento_id', 'entero', nulo=False),
+    ], pk=('fecha', 'sku')),
+    # v1.7 — Cierre de mes: P&L congelado por mes ('AAAA-MM'). Mientras existe
+    # la fila, ventas y gastos del mes no se pueden modificar.
+    Tabla('cierres_mes', [
+        _C('mes', 'texto', pk=True),
+        _C('ingresos', 'dinero', nulo=False),
+        _C('costo_mercancia', 'dinero', nulo=False),
+        _C('utilidad_bruta', 'dinero', nulo=False),
+        _C('gastos', 'dinero', nulo=False),
+        _C('utilidad_operativa', 'dinero', nulo=False),
+        _C('unidades', 'entero', nulo=False),
+        _C('num_ventas', 'entero', nulo=False),
+        _C('gastos_por_categoria', 'texto', nulo=False),  # JSON {categoría: pesos}
+        _C('gastos_por_socio', 'texto', nulo=False),      # JSON {socio: pesos}
+        # JSON {socio: {categoría: pesos}}: caché del mes para la liquidación
+        _C('gastos_por_socio_categoria', 'texto'),
+        _C('costos_fijos', 'dinero', nulo=False),
+        _C('margen_prom', 'decimal', nulo=False),
+        _C('pe_pesos', 'dinero', nulo=False),
+        _C('pe_unidades', 'decimal', nulo=False),
+        _C('progreso_pe_pct', 'decimal', nulo=False),
+        _C('inventario_unidades', 'entero', nulo=False),
+        _C('inventario_valor_costo', 'dinero', nulo=False),
+        _CREATED,
+    ]),
+    # v1.7 — Pagos entre socios que saldan la liquidación (de_socio le paga a a_socio)
+    Tabla('pagos_socios', [
+        _ID,
+        _C('fecha', 'fecha', nulo=False),
+        _C('de_socio', 'texto', nulo=False, check="de_socio IN ('JP', 'KATHE', 'ANDRES')"),
+        _C('a_socio', 'texto', nulo=False, check="a_socio IN ('JP', 'KATHE', 'ANDRES')"),
+        _C('monto', 'dinero', nulo=False, check='monto > 0'),
+        _C('notas', 'texto'),
+        _CREATED,
+    ]),
+]
+
+INDICES = [
+    # Código de barras único solo cuando está definido
+    Indice('idx_productos_codigo_barras', 'productos', ('codigo_barras',), unico=True,
+           donde='codigo_barras IS NOT NULL'),
+    Indice('idx_movimientos_sku_fecha', 'movimientos_inventario', ('sku', 'fecha')),
+    Indice('idx_movimientos_fecha', 'movimientos_inventario', ('fecha',)),
+    # Rangos por fecha (Historial); en PostgreSQL se crean en cada partición
+    Indice('idx_ventas_fecha', 'ventas', ('fecha',)),
+    Indice('idx_gastos_fecha', 'gastos', ('fecha',)),
+    # Clientes: búsqueda por prefijo de nombre / teléfono y créditos por cliente
+    Indice('idx_clientes_nombre', 'clientes', ('nombre_normalizado',), unico=True),
+    Indice('idx_clientes_telefono', 'clientes', ('telefono',), donde='telefono IS NOT NULL',
+           solo='sqlite'),
+    # PostgreSQL: el prefijo va con LIKE, que solo usa índices text_pattern_ops
+    # si la collation de la BD no es C (models._prefijo)
+    Indice('idx_clientes_nombre_prefijo', 'clientes', ('nombre_normalizado text_pattern_ops',),
+           solo='postgres'),
+    Indice('idx_clientes_telefono_prefijo', 'clientes', ('telefono text_pattern_ops',),
+           donde='telefono IS NOT NULL', solo='postgres'),
+    Indice('idx_clientes_con_saldo', 'clientes', ('saldo',), donde='saldo > 0'),
+    Indice('idx_creditos_cliente', 'creditos_clientes', ('cliente_id', 'pagado')),
+    Indice('idx_abonos_cliente', 'abonos', ('cliente_id', 'fecha')),
+    Indice('idx_abonos_credito', 'abonos', ('credito_id',)),
+]
+
+
+def tabla(nombre):
+    return next(t for t in TABLAS if t.nombre == nombre)
+
+
+def columnas_de_tipo(tipo):
+    """{tabla: (columnas,)} con el tipo lógico dado (ej. 'dinero')."""
+    res = {}
+    for t in TABLAS:
+        cols = tuple(c.nombre for c in t.columnas if c.tipo == tipo)
+        if cols:
+            res[t.nombre] = cols
+    return res
+
+
+# ── Compilador ───────────────────────────────────────────
+
+def _por_dialecto(valor, dialecto):
+    return getattr(valor, dialecto) if isinstance(valor, Dialectal) else valor
+
+
+def compilar_columna(col, dialecto, tabla_pk=None):
+    """Definición de una columna (sin coma final)."""
+    partes = [col.nombre, getattr(TIPOS[col.tipo], dialecto)]
+    if col.pk and not tabla_pk:
+        partes.append('PRIMARY KEY')
+        if col.tipo == 'serial' and dialecto == 'sqlite':
+            partes.append('AUTOINCREMENT')
+    if not col.nulo and not col.pk:
+        partes.append('NOT NULL')
+    if col.default is not None:
+        partes.append(f'DEFAULT {_por_dialecto(col.default, dialecto)}')
+    referencia = _por_dialecto(col.referencia, dialecto)
+    if referencia:
+        partes.append(f'REFERENCES {referencia}')
+    if col.check:
+        partes.append(f'CHECK ({col.check})')
+    if col.generada is not None:
+        partes.append(f'GENERATED ALWAYS AS ({_por_dialecto(col.generada, dialecto)}) STORED')
+    return ' '.join(partes)
+
+
+def _pk(t, dialecto):
+    """PK compuesta de la tabla. En PostgreSQL una tabla particionada debe
+    incluir la columna de partición en la PK: ventas queda (id, fecha)."""
+    if not (t.particion and dialecto == 'postgres'):
+        return t.pk
+    pk = t.pk or tuple(c.nombre for c in t.columnas if c.pk)
+    columna = t.particion[1]
+    return pk if columna in pk else pk + (columna,)
+
+
+def compilar_tabla(t, dialecto):
+    """CREATE TABLE IF NOT EXISTS. El particionado solo aplica en PostgreSQL."""
+    pk = _pk(t, dialecto)
+    lineas = [compilar_columna(c, dialecto, pk) for c in t.columnas]
+    if pk:
+        lineas.append(f"PRIMARY KEY ({', '.join(pk)})")
+    cuerpo = ',\n        '.join(lineas)
+    ddl = f"CREATE TABLE IF NOT EXISTS {t.nombre} (\n        {cuerpo}\n    )"
+    if t.particion and dialecto == 'postgres':
+        metodo, columna = t.particion
+        ddl += f" PARTITION BY {metodo} ({columna})"
+    return ddl
+
+
+def compilar_indice(ix, dialecto):
+    """CREATE INDEX IF NOT EXISTS, o None si el índice no aplica al backend."""
+    if ix.solo and ix.solo != dialecto:
+        return None
+    unico = 'UNIQUE ' if ix.unico else ''
+    metodo = f" USING {ix.metodo}" if ix.metodo and dialecto == 'postgres' else ''
+    ddl = (f"CREATE {unico}INDEX IF NOT EXISTS {ix.nombre} "
+           f"ON {ix.tabla}{metodo} ({', '.join(ix.columnas)})")
+    if ix.donde:
+        ddl += f" WHERE {ix.donde}"
+    return ddl
+
+
+def compilar_tablas(dialecto):
+    return [compilar_tabla(t, dialecto) for t in TABLAS]
+
+
+def compilar_indices(dialecto):
+    return [ddl for ddl in (compilar_indice(ix, dialecto) for ix in INDICES) if ddl]
+
+
+# ── Diff contra la BD viva ───────────────────────────────
+
+# Tipo declarado (SQLite) / data_type (information_schema) esperado por tipo lógico
+_TIPO_VIVO = {
+    'sqlite': {k: v.sqlite for k, v in TIPOS.items()},
+    'postgres': {
+        'serial': 'integer', 'texto': 'text', 'entero': 'integer', 'dinero': 'bigint',
+        'decimal': 'numeric', 'fecha': 'date', 'hora': 'time without time zone',
+        'timestamp': 'timestamp without time zone',
+    },
+}
+
+
+# Columna viva: tipo, NOT NULL, DEFAULT normalizado y CHECK. En SQLite check es
+# la expresión; en PostgreSQL solo si la columna tiene alguno (el servidor
+# reescribe el texto).
+Viva = namedtuple('Viva', ['tipo', 'notnull', 'default', 'check'])
+
+
+def _normalizar(expr):
+    """Sin espacios repetidos ni paréntesis externos; None si no hay."""
+    if expr is None:
+        return None
+    expr = ' '.join(str(expr).split())
+    while expr.startswith('(') and _cierre(expr, 0) == len(expr) - 1:
+        expr = expr[1:-1].strip()
+    return expr
+
+
+def _cierre(texto, i):
+    """Posición del paréntesis que cierra el abierto en texto[i] (respeta comillas)."""
+    nivel, comilla = 0, False
+    for j in range(i, len(texto)):
+        ch = texto[j]
+        if ch == "'":
+            comilla = not comilla
+        elif not comilla and ch == '(':
+            nivel += 1
+        elif not comilla and ch == ')':
+            nivel -= 1
+            if nivel == 0:
+                return j
+    return -1
+
+
+def _partes(cuerpo):
+    """Divide por comas de primer nivel."""
+    partes, nivel, comilla, inicio = [], 0, False, 0
+    for j, ch in enumerate(cuerpo):
+        if ch == "'":
+            comilla = not comilla
+        elif not comilla and ch == '(':
+            nivel += 1
+        elif not comilla and ch == ')':
+            nivel -= 1
+        elif not comilla and nivel == 0 and ch == ',':
+            partes.append(cuerpo[inicio:j])
+            inicio = j + 1
+    partes.append(cuerpo[inicio:])
+    return [p.strip() for p in partes if p.strip()]
+
+
+def _checks_sqlite(sql):
+    """{columna: expresión CHECK} desde el CREATE TABLE guardado en sqlite_master."""
+    abre = sql.index('(')
+    checks = {}
+    for parte in _partes(sql[abre + 1:_cierre(sql, abre)]):
+        nombre = parte.split()[0].strip('"`[]')
+        if nombre.upper() in ('PRIMARY', 'UNIQUE', 'CHECK', 'FOREIGN', 'CONSTRAINT'):
+            continue
+        i = parte.upper().find('CHECK')
+        if i >= 0 and '(' in parte[i:]:
+            j = parte.index('(', i)
+            checks[nombre] = _normalizar(parte[j:_cierre(parte, j) + 1])
+    return checks
+
+
+def _leer_sqlite(conn):
+    """{tabla: {columna: Viva}}, {índices}, {particionadas} (vacío en SQLite)"""
+    tablas = {}
+    for nombre, sql in conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"):
+        checks = _checks_sqlite(sql) if sql and sql.upper().startswith('CREATE TABLE') else {}
+        tablas[nombre] = {r[1]: Viva((r[2] or '').upper(), bool(r[3]), _normalizar(r[4]), checks.get(r[1]))
+                          for r in conn.execute(f"PRAGMA table_info({nombre})")}
+    indices = {r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND name NOT LIKE 'sqlite_%'")}
+    return tablas, indices, set()
+
+
+def _leer_postgres(conn):
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT k.relname, a.attname FROM pg_constraint r
+        JOIN pg_class k ON k.oid = r.conrelid AND k.relnamespace = 'public'::regnamespace
+        JOIN pg_attribute a ON a.attrelid = r.conrelid AND a.attnum = ANY (r.conkey)
+        WHERE r.contype = 'c'
+    """)
+    con_check = set(cur.fetchall())
+    cur.execute("""
+        SELECT c.table_name, c.column_name, c.data_type, c.is_nullable = 'NO', c.column_default
+        FROM information_schema.columns c
+        JOIN pg_class k ON k.relname = c.table_name
+             AND k.relnamespace = 'public'::regnamespace
+        WHERE c.table_schema = 'public'
+          AND k.relkind IN ('r', 'p') AND NOT k.relispartition  -- sin vistas ni particiones
+    """)
+    tablas = {}
+    for t, c, tipo, notnull, default in cur.fetchall():
+        default = re.sub(r"::[a-z ]+", '', default) if default else None
+        tablas.setdefault(t, {})[c] = Viva(tipo, notnull, _normalizar(default), (t, c) in con_check)
+    cur.execute("SELECT indexname FROM pg_indexes WHERE schemaname = 'public'")
+    indices = {r[0] for r in cur.fetchall()}
+    cur.execute("SELECT relname FROM pg_class "
+                "WHERE relkind = 'p' AND relnamespace = 'public'::regnamespace")
+    particionadas = {r[0] for r in cur.fetchall()}
+    conn.rollback()
+    return tablas, indices, particionadas
+
+
+def _cambios_postgres(t, c, viva):
+    """ALTERs de NOT NULL, DEFAULT y CHECK de una columna existente."""
+    sql = []
+    quiere_notnull = not c.nulo or c.pk
+    if viva.notnull != quiere_notnull:
+        accion = 'SET' if quiere_notnull else 'DROP'
+        sql.append(f"ALTER TABLE {t.nombre} ALTER COLUMN {c.nombre} {accion} NOT NULL")
+    if c.tipo != 'serial':
+        default = _normalizar(_por_dialecto(c.default, 'postgres'))
+        if (viva.default or '').lower() != (default or '').lower():
+            accion = f"SET DEFAULT {default}" if default is not None else 'DROP DEFAULT'
+            sql.append(f"ALTER TABLE {t.nombre} ALTER COLUMN {c.nombre} {accion}")
+    if c.check and not viva.check:
+        sql.append(f"ALTER TABLE {t.nombre} ADD CHECK ({c.check})")
+    elif viva.check and not c.check:
+        sql.append(f"-- sobra CHECK en {t.nombre}.{c.nombre}")
+    return sql
+
+
+def _cambios_sqlite(c, viva):
+    """Diferencias de NOT NULL, DEFAULT y CHECK (SQLite no las altera: comentario)."""
+    cambios = []
+    if viva.notnull != (not c.nulo and not c.pk):
+        cambios.append('NOT NULL' if viva.notnull else 'sin NOT NULL')
+    default = _normalizar(_por_dialecto(c.default, 'sqlite'))
+    if viva.default != default:
+        cambios.append(f"DEFAULT {viva.default} → {default}")
+    check = _normalizar(c.check)
+    if viva.check != check:
+        cambios.append(f"CHECK {viva.check} → {check}")
+    return cambios
+
+
+def diferencias(vivas, indices_vivos, dialecto, particionadas=()):
+    """Sentencias para llevar la BD descrita (tablas/índices vivos) a la definición.
+
+    Compara por columna tipo, NOT NULL, DEFAULT y CHECK, y el particionado de
+    PostgreSQL. Límites: en PostgreSQL el CHECK solo se compara por presencia
+    (no el texto de la expresión); no se comparan FKs ni la definición de los
+    índices que ya existen (solo el nombre)."""
+    sql = []
+    esperadas = {t.nombre for t in TABLAS}
+    for t in TABLAS:
+        cols = vivas.get(t.nombre)
+        if cols is None:
+            sql.append(compilar_tabla(t, dialecto))
+            continue
+        if dialecto == 'postgres' and bool(t.particion) != (t.nombre in particionadas):
+            esperado = f"PARTITION BY {t.particion[0]} ({t.particion[1]})" if t.particion else 'sin particionar'
+            sql.append(f"-- {t.nombre}: particionado → {esperado}; ver scripts/particiones.py")
+        for c in t.columnas:
+            esperado = _TIPO_VIVO[dialecto][c.tipo]
+            if c.nombre not in cols:
+                if dialecto == 'sqlite' and (c.pk or c.generada is not None):
+                    sql.append(f"-- {t.nombre}.{c.nombre}: SQLite no agrega PK/generadas; reconstruir tabla")
+                else:
+                    sql.append(f"ALTER TABLE {t.nombre} ADD COLUMN {compilar_columna(c, dialecto)}")
+                continue
+            viva = cols[c.nombre]
+            if dialecto == 'postgres':
+                if viva.tipo != esperado:
+                    pg = getattr(TIPOS[c.tipo], dialecto)
+                    pg = 'INTEGER' if pg == 'SERIAL' else pg
+                    sql.append(f"ALTER TABLE {t.nombre} ALTER COLUMN {c.nombre} TYPE {pg} "
+                               f"USING {c.nombre}::{pg}")
+                if c.generada is None:
+                    sql.extend(_cambios_postgres(t, c, viva))
+                continue
+            cambios = [f"{viva.tipo} → {esperado}"] if viva.tipo != esperado else []
+            if c.generada is None:
+                cambios.extend(_cambios_sqlite(c, viva))
+            if cambios:
+                sql.append(f"-- {t.nombre}.{c.nombre}: {'; '.join(cambios)}; reconstruir tabla")
+        for sobra in sorted(set(cols) - {c.nombre for c in t.columnas}):
+            sql.append(f"-- sobra columna {t.nombre}.{sobra}")
+    for ix in INDICES:
+        ddl = compilar_indice(ix, dialecto)
+        if ddl and ix.nombre not in indices_vivos:
+            sql.append(ddl)
+    ajenas = {'schema_version', 'productos_fts'}
+    for sobra in sorted(set(vivas) - esperadas):
+        if sobra not in ajenas and not sobra.startswith(('productos_fts_', 'sqlite_')):
+            sql.append(f"-- sobra tabla {sobra}")
+    return sql
+
+
+def diff(db_path=None, database_url=None):
+    """Migración mínima (lista de sentencias) de la BD viva a la definición."""
+    if database_url:
+        from scripts import migrations
+        conn = migrations._conectar_postgres(database_url)
+        dialecto = 'postgres'
+    else:
+        conn = sqlite3.connect(db_path)
+        dialecto = 'sqlite'
+    try:
+        lector = _leer_postgres if dialecto == 'postgres' else _leer_sqlite
+        vivas, indices, particionadas = lector(conn)
+    finally:
+        conn.close()
+    return diferencias(vivas, indices, dialecto, particionadas)
+
+
+def _main(args):
+    if len(args) >= 2 and args[0] == 'sql' and args[1] in DIALECTOS:
+        for ddl in compilar_tablas(args[1]) + compilar_indices(args[1]):
+            print(ddl + ';\n')
+        return 0
+    if args and args[0] == 'diff':
+        database_url = os.environ.get('DATABASE_URL', '')
+        if len(args) > 1 or not database_url.startswith('postgres'):
+            from scripts.create_db import DB_PATH
+            sentencias = diff(db_path=args[1] if len(args) > 1 else DB_PATH)
+        else:
+            sentencias = diff(database_url=database_url)
+        for s in sentencias:
+            print(s if s.startswith('--') else s + ';')
+        if not sentencias:
+            print('-- esquema al día')
+        return 0
+    print(__doc__)
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(_main(sys.argv[1:]))
@@ -1,11 +1,12 @@
 """
-Setup script para Railway deployment de ORVANN Retail OS. v1.5
+Setup script para Railway deployment de ORVANN Retail OS. v1.7
 
 Se ejecuta al iniciar en Railway (antes de streamlit).
-1. Crea tablas si no existen (idempotente)
-2. Ejecuta todas las migraciones (v1.3, v1.4, v1.5)
-3. Verifica integridad post-migración
-4. Si las tablas están vacías, migra datos desde SQLite local si existe
+1. Aplica las migraciones pendientes de scripts/migrations (schema_version);
+   si el esquema ya está al día es una sola consulta
+2. Verifica integridad post-migración (solo si se aplicó algo)
+3. Si las tablas están vacías, migra datos desde SQLite local si existe
+   (llevada antes a la última versión; copia con ids, en orden de FKs)
 """
 import os
 import sys
@@ -29,13 +30,69 @@ def setup():
 
     # 1. Crear tablas + migraciones + verificación
     from scripts.create_db import ensure_tables
-    ensure_tables()
-    print("[OK] Tablas creadas, migraciones aplicadas, verificación OK")
+    aplicadas = ensure_tables()
+    print(f"[OK] Esquema al día ({len(aplicadas)} migraciones aplicadas)")
 
     # 2. Verificar si necesita migración inicial
     _maybe_seed_from_sqlite()
 
 
+# Orden de copia: cada tabla después de las que referencia (clientes antes que
+# creditos_clientes, que antes que abonos). idempotencia no se copia: sus
+# claves son de envíos ya resueltos en la BD local.
+TABLAS_SEMILLA = [
+    'costos_fijos',
+    'productos',
+    # Kardex: sin él verificar_kardex marca todo SKU y el stock a fecha da 0
+    'movimientos_inventario',
+    'snapshots_stock',
+    'ventas',
+    'caja_diaria',
+    'gastos',
+    'clientes',
+    'creditos_clientes',
+    'abonos',
+    'pedidos_proveedores',
+    'pagos_socios',
+    'cierres_mes',
+]
+
+
+def _copiar_tabla(sqlite_conn, pg, table):
+    """Copia table con sus ids (creditos_clientes.venta_id, abonos.credito_id...
+    apuntan a ellos) y deja la secuencia detrás del mayor. Cada fila va en su
+    SAVEPOINT: una fila rechazada no aborta el resto de la tabla."""
+    pgc = pg.cursor()
+    existe = sqlite_conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                 (table,)).fetchone()
+    rows = sqlite_conn.execute(f"SELECT * FROM {table}").fetchall() if existe else []
+    if not rows:
+        print(f"  {table}: 0 registros (vacía)")
+        return
+
+    columns = list(rows[0].keys())
+    placeholders = ', '.join(['%s'] * len(columns))
+    insert_sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+
+    count_inserted = 0
+    for row in rows:
+        pgc.execute("SAVEPOINT fila")
+        try:
+            pgc.execute(insert_sql, tuple(row[c] for c in columns))
+            pgc.execute("RELEASE SAVEPOINT fila")
+            count_inserted += 1
+        except Exception as e:
+            pgc.execute("ROLLBACK TO SAVEPOINT fila")
+            print(f"  [WARN] {table}: Error insertando fila: {e}")
+
+    if 'id' in columns:
+        pgc.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"COALESCE(MAX(id), 0) + 1, false) FROM {table}")
+
+    pg.commit()
+    print(f"  {table}: {count_inserted} registros migrados")
+
+
 def _maybe_seed_from_sqlite():
     """Si PostgreSQL está vacío y existe SQLite local, migra datos."""
     import psycopg2
@@ -64,55 +121,15 @@ def _maybe_seed_from_sqlite():
 
     print("[INFO] PostgreSQL vacío, migrando desde SQLite local...")
 
+    # Mismas columnas que PostgreSQL (cliente_id, abonos, kardex...) antes de copiar
+    from scripts import migrations
+    migrations.migrar(db_path=LOCAL_DB)
+
     sqlite_conn = sqlite3.connect(LOCAL_DB)
     sqlite_conn.row_factory = sqlite3.Row
 
-    # Migrar cada tabla en orden (respetar FKs)
-    tables_order = [
-        'costos_fijos',
-        'productos',
-        'ventas',
-        'caja_diaria',
-        'gastos',
-        'creditos_clientes',
-        'pedidos_proveedores',
-    ]
-
-    for table in tables_order:
-        rows = sqlite_conn.execute(f"SELECT * FROM {table}").fetchall()
-        if not rows:
-            print(f"  {table}: 0 registros (vacía)")
-            continue
-
-        columns = rows[0].keys()
-        # Excluir 'id' para tablas con SERIAL (PostgreSQL auto-genera)
-        if table != 'productos' and table != 'caja_diaria':
-            cols_to_insert = [c for c in columns if c != 'id']
-        else:
-            cols_to_insert = list(columns)
-
-        placeholders = ', '.join(['%s'] * len(cols_to_insert))
-        col_names = ', '.join(cols_to_insert)
-        insert_sql = f"INSERT INTO {table} ({col_names}) VALUES ({placeholders})"
-
-        count_inserted = 0
-        for row in rows:
-            values = tuple(row[c] for c in cols_to_insert)
-            try:
-                pgc.execute(insert_sql, values)
-                count_inserted += 1
-            except Exception as e:
-                print(f"  [WARN] {table}: Error insertando fila: {e}")
-
-        # Reset sequence para tablas con SERIAL
-        if table not in ('productos', 'caja_diaria'):
-            try:
-                pgc.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {table}")
-            except Exception:
-                pass
-
-        pg.commit()
-        print(f"  {table}: {count_inserted} registros migrados")
+    for table in TABLAS_SEMILLA:
+        _copiar_tabla(sqlite_conn, pg, table)
 
     sqlite_conn.close()
     pg.close()
@@ -0,0 +1,92 @@
+"""Stress: ventas concurrentes con y sin escritor único SQLite. v1.7
+
+20 sesiones (hilos) registran ventas sin pausa durante N segundos. Reporta
+ventas/s sostenidas, latencia p50/p95/p99 por venta, errores "locked" y,
+con escritor, el tamaño medio de lote (ventas por commit).
+
+Uso:
+    python scripts/stress_escritor.py [sesiones] [segundos]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import database
+from app.models import registrar_venta
+from scripts.bench_sqlite import _preparar, PRODUCTOS
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+
+def _sesion(path, n, hasta, latencias, errores):
+    i = 0
+    while time.perf_counter() < hasta:
+        i += 1
+        t0 = time.perf_counter()
+        try:
+            registrar_venta(f'BENCH-{(n + i) % PRODUCTOS}', 1, 75000, 'Efectivo', db_path=path)
+        except Exception as exc:
+            if 'locked' not in str(exc):
+                raise
+            errores.append(exc)
+            continue
+        latencias.append(time.perf_counter() - t0)
+
+
+def medir(con_escritor, sesiones, segundos):
+    database.SQLITE_ESCRITOR = con_escritor
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        _preparar(path)
+        database.reset_query_stats()
+        latencias, errores = [], []
+        hasta = time.perf_counter() + segundos
+        hilos = [threading.Thread(target=_sesion, args=(path, n, hasta, latencias, errores))
+                 for n in range(sesiones)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        stats = database.get_query_stats()
+        return {
+            'ventas_s': len(latencias) / segundos,
+            'p50': _percentil(latencias, 50) * 1000,
+            'p95': _percentil(latencias, 95) * 1000,
+            'p99': _percentil(latencias, 99) * 1000,
+            'locked': len(errores),
+            'lote': stats['trabajos_escritor'] / stats['lotes_escritor'] if stats['lotes_escritor'] else 1,
+        }
+    finally:
+        database.detener_escritor()
+        database.cerrar_sqlite(path)
+        for suf in ('', '-wal', '-shm'):
+            if os.path.exists(path + suf):
+                os.unlink(path + suf)
+
+
+def run(sesiones=20, segundos=5):
+    original = database.SQLITE_ESCRITOR
+    print(f"{sesiones} sesiones vendiendo, {segundos}s por modo")
+    try:
+        for nombre, con_escritor in (('directo', False), ('escritor', True)):
+            r = medir(con_escritor, sesiones, segundos)
+            print(f"  {nombre:<9} {r['ventas_s']:7.1f} ventas/s | p50 {r['p50']:6.1f} ms | "
+                  f"p95 {r['p95']:6.1f} ms | p99 {r['p99']:6.1f} ms | locked: {r['locked']} | "
+                  f"ventas/commit: {r['lote']:.1f}")
+    finally:
+        database.SQLITE_ESCRITOR = original
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 5)
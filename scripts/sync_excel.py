@@ -152,10 +152,15 @@ def sync(db_path=None):
     conn.commit()
     conn.close()
 
+    # Acumulados de caja_diaria para los gastos agregados
+    from app.models import verificar_caja
+    verificar_caja(reparar=True, db_path=db_path)
+
     print(f"\n{'='*40}")
     print(f"TOTAL CAMBIOS: {changes}")
     print("Sync completado.")
 
 
 if __name__ == '__main__':
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
     sync()
@@ -1,5 +1,6 @@
 """Pytest fixtures for ORVANN tests."""
 import os
+import shutil
 import sys
 import tempfile
 import pytest
@@ -8,6 +9,22 @@ import pytest
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 
+def _borrar_bd(path):
+    from app.database import cerrar_sqlite, archivos_sqlite, refrescar_archivos
+    cerrar_sqlite(path)
+    # WAL (perfil rendimiento) deja -wal/-shm junto al archivo
+    for suf in ('', '-wal', '-shm'):
+        if os.path.exists(path + suf):
+            os.unlink(path + suf)
+    # Años archivados (scripts/particiones.py)
+    refrescar_archivos(path)
+    for _, ruta in archivos_sqlite(path):
+        os.unlink(ruta)
+    refrescar_archivos(path)
+    # Meses en Parquet (scripts/archivo_parquet.py)
+    shutil.rmtree(os.path.splitext(path)[0] + '_parquet', ignore_errors=True)
+
+
 @pytest.fixture
 def db_path():
     """Create a temporary database for testing."""
@@ -16,7 +33,123 @@ def db_path():
     from scripts.create_db import create_tables
     create_tables(path)
     yield path
-    os.unlink(path)
+    _borrar_bd(path)
+
+
+# Las 7 tablas de v1.6 (antes de schema_version), dinero en REAL
+V16_SQLITE = [
+    """CREATE TABLE IF NOT EXISTS productos (
+        sku TEXT PRIMARY KEY,
+        nombre TEXT NOT NULL,
+        categoria TEXT,
+        talla TEXT,
+        color TEXT,
+        costo REAL NOT NULL CHECK (costo >= 0),
+        precio_venta REAL NOT NULL CHECK (precio_venta >= 0),
+        stock INTEGER DEFAULT 0 CHECK (stock >= 0),
+        stock_minimo INTEGER DEFAULT 3 CHECK (stock_minimo >= 0),
+        proveedor TEXT,
+        notas TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE IF NOT EXISTS ventas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fecha DATE NOT NULL DEFAULT (date('now')),
+        hora TIME DEFAULT (time('now')),
+        sku TEXT NOT NULL REFERENCES productos(sku),
+        cantidad INTEGER DEFAULT 1 CHECK (cantidad > 0),
+        precio_unitario REAL NOT NULL CHECK (precio_unitario >= 0),
+        descuento_pct REAL DEFAULT 0 CHECK (descuento_pct >= 0 AND descuento_pct <= 100),
+        total REAL NOT NULL CHECK (total >= 0),
+        metodo_pago TEXT NOT NULL CHECK (metodo_pago IN ('Efectivo', 'Transferencia', 'Datáfono', 'Crédito')),
+        cliente TEXT,
+        vendedor TEXT,
+        notas TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE IF NOT EXISTS caja_diaria (
+        fecha DATE PRIMARY KEY,
+        efectivo_inicio REAL DEFAULT 0 CHECK (efectivo_inicio >= 0),
+        efectivo_cierre_real REAL,
+        cerrada INTEGER DEFAULT 0 CHECK (cerrada IN (0, 1)),
+        notas TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS gastos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fecha DATE NOT NULL,
+        categoria TEXT NOT NULL,
+        monto REAL NOT NULL CHECK (monto > 0),
+        descripcion TEXT,
+        metodo_pago TEXT,
+        pagado_por TEXT NOT NULL CHECK (pagado_por IN ('JP', 'KATHE', 'ANDRES')),
+        es_inversion INTEGER DEFAULT 0 CHECK (es_inversion IN (0, 1)),
+        notas TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE IF NOT EXISTS creditos_clientes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        venta_id INTEGER REFERENCES ventas(id),
+        cliente TEXT NOT NULL,
+        monto REAL NOT NULL CHECK (monto > 0),
+        monto_pagado REAL DEFAULT 0 CHECK (monto_pagado >= 0),
+        fecha_credito DATE NOT NULL,
+        fecha_pago DATE,
+        pagado INTEGER DEFAULT 0 CHECK (pagado IN (0, 1)),
+        notas TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS pedidos_proveedores (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fecha_pedido DATE NOT NULL,
+        proveedor TEXT NOT NULL,
+        descripcion TEXT,
+        unidades INTEGER CHECK (unidades > 0),
+        costo_unitario REAL CHECK (costo_unitario >= 0),
+        total REAL CHECK (total >= 0),
+        estado TEXT DEFAULT 'Pendiente' CHECK (estado IN ('Pendiente', 'Pagado', 'Completo')),
+        pagado_por TEXT,
+        fecha_entrega_est DATE,
+        notas TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS costos_fijos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        concepto TEXT NOT NULL,
+        monto_mensual REAL NOT NULL CHECK (monto_mensual > 0),
+        activo INTEGER DEFAULT 1 CHECK (activo IN (0, 1)),
+        notas TEXT
+    )""",
+]
+
+
+@pytest.fixture
+def db_v16():
+    """BD de v1.6 con una venta a crédito, un gasto y la caja del día."""
+    import sqlite3
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    conn = sqlite3.connect(path)
+    for ddl in V16_SQLITE:
+        conn.execute(ddl)
+    conn.execute("""
+        INSERT INTO productos (sku, nombre, categoria, costo, precio_venta, stock)
+        VALUES ('CAM-V16', 'Camisa v1.6', 'Camisa', 37000.0, 75000.0, 9)
+    """)
+    conn.execute("""
+        INSERT INTO ventas (fecha, sku, cantidad, precio_unitario, total, metodo_pago, cliente)
+        VALUES ('2025-03-10', 'CAM-V16', 1, 75000.0, 75000.0, 'Crédito', 'Carlos')
+    """)
+    conn.execute("""
+        INSERT INTO creditos_clientes (venta_id, cliente, monto, monto_pagado, fecha_credito)
+        VALUES (1, 'Carlos', 75000.0, 20000.0, '2025-03-10')
+    """)
+    conn.execute("""
+        INSERT INTO gastos (fecha, categoria, monto, metodo_pago, pagado_por)
+        VALUES ('2025-03-10', 'Transporte', 12000.0, 'Efectivo', 'JP')
+    """)
+    conn.execute("INSERT INTO caja_diaria (fecha, efectivo_inicio) VALUES ('2025-03-10', 50000.0)")
+    conn.commit()
+    conn.close()
+    yield path
+    _borrar_bd(path)
 
 
 @pytest.fixture
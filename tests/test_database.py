@@ -1,4 +1,5 @@
 """Tests para la base de datos ORVANN."""
+import os
 import sqlite3
 import pytest
 
@@ -62,3 +63,762 @@ def test_no_vender_sin_stock(db_with_data):
     db = db_with_data
     with pytest.raises(ValueError, match="Stock insuficiente"):
         registrar_venta('NO-STOCK', 1, 75000, 'Efectivo', vendedor='JP', db_path=db)
+
+
+# ── Memo por rerun ──────────────────────────────────────────
+
+def test_memo_scope_deduplica_lecturas(db_with_data):
+    """Dentro de memo_scope, PE + get_ventas_mes consultan la BD una sola vez por sentencia."""
+    from app.database import memo_scope, get_query_stats, reset_query_stats
+    from app.models import calcular_punto_equilibrio, get_ventas_mes
+    from datetime import date
+    db = db_with_data
+    hoy = date.today()
+
+    reset_query_stats()
+    with memo_scope():
+        calcular_punto_equilibrio(db_path=db)
+        get_ventas_mes(hoy.year, hoy.month, db_path=db)
+        calcular_punto_equilibrio(db_path=db)
+    stats = get_query_stats()
+    assert stats['query'] == 3  # costos_fijos, productos, ventas del mes
+    assert stats['memo_hits'] == 4
+
+
+def test_memo_scope_escritura_invalida(db_with_data):
+    """Una escritura dentro del scope descarta el memo."""
+    from app.database import memo_scope
+    db = db_with_data
+    with memo_scope():
+        antes = query("SELECT stock FROM productos WHERE sku = 'CAM-TEST-S'", db_path=db)
+        registrar_venta('CAM-TEST-S', 1, 75000, 'Efectivo', vendedor='JP', db_path=db)
+        despues = query("SELECT stock FROM productos WHERE sku = 'CAM-TEST-S'", db_path=db)
+        execute("UPDATE productos SET stock = 20 WHERE sku = 'CAM-TEST-S'", db_path=db)
+        final = query("SELECT stock FROM productos WHERE sku = 'CAM-TEST-S'", db_path=db)
+    assert antes[0]['stock'] == 10
+    assert despues[0]['stock'] == 9
+    assert final[0]['stock'] == 20
+
+
+def test_sin_memo_scope_no_memoiza(db_with_data):
+    """Fuera del scope cada query va a la BD."""
+    from app.database import get_query_stats, reset_query_stats
+    db = db_with_data
+    reset_query_stats()
+    query("SELECT * FROM productos", db_path=db)
+    query("SELECT * FROM productos", db_path=db)
+    assert get_query_stats()['query'] == 2
+    assert get_query_stats()['memo_hits'] == 0
+
+
+def test_transaction_rollback(db_with_data):
+    """Una excepción dentro de transaction() deshace todas las escrituras."""
+    from app.database import transaction
+    db = db_with_data
+    with pytest.raises(RuntimeError):
+        with transaction(db) as tx:
+            tx.execute("UPDATE productos SET stock = 0 WHERE sku = 'CAM-TEST-S'")
+            assert tx.query("SELECT stock FROM productos WHERE sku = 'CAM-TEST-S'")[0]['stock'] == 0
+            raise RuntimeError("falla a mitad")
+    assert query("SELECT stock FROM productos WHERE sku = 'CAM-TEST-S'", db_path=db)[0]['stock'] == 10
+
+
+# ── Tests v1.7 — Migraciones versionadas ────────────────────
+
+def test_migrar_aplica_una_vez_y_arranque_al_dia(db_with_data, monkeypatch):
+    """BD previa a schema_version: aplica todo sin perder datos; luego el arranque es una consulta."""
+    from scripts import migrations
+    aplicadas = migrations.migrar(db_path=db_with_data)
+    assert aplicadas == [v for v, _ in migrations.listar()]
+    assert query("SELECT COUNT(*) AS c FROM productos", db_path=db_with_data)[0]['c'] == 4
+
+    sentencias = []
+    conectar = migrations._conectar_sqlite
+
+    def conectar_con_traza(path):
+        conn = conectar(path)
+        conn.set_trace_callback(sentencias.append)
+        return conn
+
+    monkeypatch.setattr(migrations, '_conectar_sqlite', conectar_con_traza)
+    assert migrations.migrar(db_path=db_with_data) == []
+    assert sentencias == ["SELECT MAX(version) FROM schema_version"]
+
+
+def test_migracion_fallida_no_queda_registrada(db_path, monkeypatch):
+    """Un paso que falla se deshace completo y se reintenta en el siguiente arranque."""
+    import types
+    from scripts import migrations
+    migrations.migrar(db_path=db_path)
+    ultima = migrations.ultima_version()
+
+    def rompe(cur):
+        cur.execute("CREATE TABLE a_medias (id INTEGER)")
+        raise RuntimeError("paso roto")
+
+    monkeypatch.setattr(migrations, 'listar', lambda: [(ultima + 1, 'roto')])
+    monkeypatch.setattr(migrations, 'ultima_version', lambda: ultima + 1)
+    monkeypatch.setattr(migrations, 'cargar', lambda nombre: types.SimpleNamespace(sqlite=rompe))
+    with pytest.raises(RuntimeError):
+        migrations.migrar(db_path=db_path)
+    assert 'a_medias' not in get_tables(db_path)
+    version = query("SELECT MAX(version) AS v FROM schema_version", db_path=db_path)[0]['v']
+    assert version == ultima
+
+
+def test_migrar_bd_v16_queda_igual_al_esquema(db_v16):
+    """Una BD v1.6 recorre todas las migraciones y termina igual a una nueva."""
+    from scripts import migrations, schema
+    assert migrations.migrar(db_path=db_v16) == [v for v, _ in migrations.listar()]
+    assert schema.diff(db_path=db_v16) == []
+    venta = query("SELECT total, costo_unitario FROM ventas", db_path=db_v16)[0]
+    assert venta['total'] == 75000 and isinstance(venta['total'], int)
+    credito = query("SELECT venta_id, cliente_id, monto_pagado FROM creditos_clientes", db_path=db_v16)[0]
+    assert (credito['venta_id'], credito['monto_pagado']) == (1, 20000)
+    assert credito['cliente_id'] is not None
+
+
+
+def test_verificacion_cubre_todas_las_tablas_y_pasos(db_v16):
+    """EXPECTED_TABLES sale de schema.TABLAS y cada paso tiene su función suelta."""
+    import inspect
+    from scripts import create_db, migrations, schema
+    migrations.migrar(db_path=db_v16)
+    assert create_db.EXPECTED_TABLES >= {t.nombre for t in schema.TABLAS} | {'schema_version'}
+    assert create_db.verify_tables_sqlite(db_v16) is True
+    conn = sqlite3.connect(db_v16)
+    conn.execute("DROP TABLE abonos")
+    conn.commit()
+    conn.close()
+    assert create_db.verify_tables_sqlite(db_v16) is False
+
+    fuente = inspect.getsource(create_db)
+    for _, nombre in migrations.listar()[1:]:
+        assert f"'{nombre}'" in fuente, nombre
+
+# ── Tests v1.7 — Esquema declarativo ────────────────────────
+
+def test_esquema_compila_por_backend():
+    """Una definición → tipos, particionado y columnas generadas por backend."""
+    from scripts import schema
+    ventas = schema.tabla('ventas')
+    assert 'total INTEGER NOT NULL' in schema.compilar_tabla(ventas, 'sqlite')
+    assert 'total BIGINT NOT NULL' in schema.compilar_tabla(ventas, 'postgres')
+    assert 'id INTEGER PRIMARY KEY AUTOINCREMENT' in schema.compilar_tabla(ventas, 'sqlite')
+
+    t = schema.Tabla('prueba', [
+        schema.Columna('fecha', 'fecha', nulo=False),
+        schema.Columna('bruto', 'dinero'),
+        schema.Columna('neto', 'dinero', generada='bruto * 2'),
+    ], pk=('fecha',), particion=('RANGE', 'fecha'))
+    assert schema.compilar_tabla(t, 'postgres').endswith('PARTITION BY RANGE (fecha)')
+    assert 'PARTITION' not in schema.compilar_tabla(t, 'sqlite')
+    assert 'GENERATED ALWAYS AS (bruto * 2) STORED' in schema.compilar_tabla(t, 'sqlite')
+    ix = schema.Indice('idx_x', 'prueba', ('fecha',), metodo='brin', solo='postgres')
+    assert schema.compilar_indice(ix, 'sqlite') is None
+    assert 'USING brin' in schema.compilar_indice(ix, 'postgres')
+
+
+def test_diff_contra_bd_viva(db_path):
+    """Una BD al día no tiene diferencias; lo que falta sale como migración mínima aplicable."""
+    from scripts import schema
+    assert schema.diff(db_path=db_path) == []
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("DROP INDEX idx_movimientos_fecha")
+    conn.execute("DROP TABLE snapshots_stock")
+    conn.execute("ALTER TABLE gastos ADD COLUMN legado TEXT")
+    conn.commit()
+    sentencias = schema.diff(db_path=db_path)
+    assert "-- sobra columna gastos.legado" in sentencias
+    ejecutables = [s for s in sentencias if not s.startswith('--')]
+    assert len(ejecutables) == 2
+    for s in ejecutables:
+        conn.execute(s)
+    conn.commit()
+    conn.close()
+    assert schema.diff(db_path=db_path) == ["-- sobra columna gastos.legado"]
+
+
+def test_diff_detecta_check_not_null_y_default():
+    """Columnas con el mismo nombre pero otro CHECK, NOT NULL o DEFAULT salen en el diff."""
+    from scripts import schema
+    vivas, indices, _ = schema._leer_sqlite(_bd_con_costos_fijos_viejo())
+    sentencias = schema.diferencias(vivas, indices, 'sqlite')
+    assert ("-- costos_fijos.monto_mensual: sin NOT NULL; CHECK monto_mensual >= 0 → monto_mensual > 0; "
+            "reconstruir tabla") in sentencias
+    assert "-- costos_fijos.activo: DEFAULT 0 → 1; reconstruir tabla" in sentencias
+
+    vivas = {t.nombre: {c.nombre: schema.Viva(schema._TIPO_VIVO['postgres'][c.tipo], not c.nulo or c.pk,
+                                              None if c.tipo == 'serial' else
+                                              schema._normalizar(schema._por_dialecto(c.default, 'postgres')),
+                                              bool(c.check))
+                        for c in t.columnas} for t in schema.TABLAS}
+    particionadas = {t.nombre for t in schema.TABLAS if t.particion}
+    assert schema.diferencias(vivas, set(), 'postgres', particionadas) == schema.compilar_indices('postgres')
+    vivas['productos']['stock'] = vivas['productos']['stock']._replace(default=None, check=False)
+    vivas['gastos']['monto'] = vivas['gastos']['monto']._replace(notnull=False)
+    sentencias = schema.diferencias(vivas, set(), 'postgres', particionadas - {'ventas'})
+    assert "ALTER TABLE productos ALTER COLUMN stock SET DEFAULT 0" in sentencias
+    assert "ALTER TABLE productos ADD CHECK (stock >= 0)" in sentencias
+    assert "ALTER TABLE gastos ALTER COLUMN monto SET NOT NULL" in sentencias
+    assert any(s.startswith("-- ventas: particionado → PARTITION BY RANGE (fecha)") for s in sentencias)
+
+
+def _bd_con_costos_fijos_viejo():
+    conn = sqlite3.connect(':memory:')
+    conn.execute("""CREATE TABLE costos_fijos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        concepto TEXT NOT NULL,
+        monto_mensual INTEGER CHECK (monto_mensual >= 0),
+        activo INTEGER DEFAULT 0 CHECK (activo IN (0, 1)),
+        notas TEXT
+    )""")
+    return conn
+
+
+# ── Tests v1.7 — Sentencias registradas ─────────────────────
+
+def test_adapt_sql_respeta_literales(monkeypatch):
+    """'?' dentro de un string no es placeholder; '%' se escapa para psycopg2."""
+    from app import database
+    monkeypatch.setattr(database, 'USE_POSTGRES', True)
+    sql = "SELECT * FROM gastos WHERE descripcion = '¿pagado?' AND notas LIKE '10%' AND id = ?"
+    assert database.adapt_sql(sql) == (
+        "SELECT * FROM gastos WHERE descripcion = '¿pagado?' AND notas LIKE '10%%' AND id = %s")
+
+
+def test_sentencia_compila_por_backend():
+    """Parámetros con nombre y RETURNING explícito en PostgreSQL."""
+    from app.sentencias import sentencia, compilar
+    s = sentencia('prueba_insertar', """
+        INSERT INTO gastos (fecha, monto, notas) VALUES (:fecha, :monto, 'a:b ' || :fecha::text)
+    """, retorna='id')
+    assert compilar(s, 'sqlite').sql == s.sql
+    pg = compilar(s, 'postgres')
+    assert pg.sql.endswith("VALUES (%(fecha)s, %(monto)s, 'a:b ' || %(fecha)s::text) RETURNING id")
+    assert compilar(s, 'postgres') is pg  # cacheada
+    with pytest.raises(ValueError):
+        sentencia('prueba_posicional', "SELECT * FROM ventas WHERE id = ?")
+
+
+def test_sentencia_en_query_execute_y_memo(db_with_data):
+    """Una Sentencia corre por query/execute/transaction y el memo la distingue por params."""
+    from app.sentencias import sentencia
+    from app.database import memo_scope, get_query_stats, reset_query_stats, transaction
+    db = db_with_data
+    stock = sentencia('prueba_stock', "SELECT stock FROM productos WHERE sku = :sku")
+    sumar = sentencia('prueba_sumar', "UPDATE productos SET stock = stock + :n WHERE sku = :sku")
+    assert execute(sumar, {'n': 2, 'sku': 'CAM-TEST-S'}, db_path=db) == 1  # rowcount
+    with transaction(db) as tx:
+        assert tx.execute(sumar, {'n': 1, 'sku': 'NO-EXISTE'}) == 0
+    reset_query_stats()
+    with memo_scope():
+        assert query(stock, {'sku': 'CAM-TEST-S'}, db_path=db) == [{'stock': 12}]
+        assert query(stock, {'sku': 'CAM-TEST-S'}, db_path=db) == [{'stock': 12}]
+        assert query(stock, {'sku': 'HOOD-TEST-L'}, db_path=db) == [{'stock': 5}]
+    assert get_query_stats()['query'] == 2
+
+
+# ── Tests v1.7 — Perfil SQLite ──────────────────────────────
+
+def test_perfil_rendimiento_wal_y_lector_reutilizado(db_with_data, monkeypatch):
+    """WAL + pragmas; query() reutiliza una conexión de solo lectura que ve las escrituras."""
+    from app import database
+    monkeypatch.setattr(database, 'SQLITE_PERFIL', 'rendimiento')
+    db = db_with_data
+    conn = database.get_connection(db, solo_lectura=True)
+    try:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM productos")
+    finally:
+        conn.close()
+
+    lector = database._conexion_lectura(db)
+    assert database._conexion_lectura(db) is lector
+    execute("UPDATE productos SET stock = 42 WHERE sku = 'CAM-TEST-S'", db_path=db)
+    assert query("SELECT stock FROM productos WHERE sku = 'CAM-TEST-S'", db_path=db) == [{'stock': 42}]
+    assert database._conexion_lectura(db) is lector
+
+
+def test_mantenimiento_periodico(db_with_data, monkeypatch):
+    """Una escritura corre optimize + checkpoint cuando venció el intervalo."""
+    from app import database
+    monkeypatch.setattr(database, 'SQLITE_PERFIL', 'rendimiento')
+    db = db_with_data
+    execute("UPDATE productos SET stock = 9 WHERE sku = 'CAM-TEST-S'", db_path=db)
+    antes = database._ultimo_mantenimiento[db]
+    monkeypatch.setattr(database, 'SQLITE_MANTENIMIENTO', 0)
+    execute("UPDATE productos SET stock = 8 WHERE sku = 'CAM-TEST-S'", db_path=db)
+    assert database._ultimo_mantenimiento[db] > antes
+    busy, _, _ = database.mantenimiento_sqlite(db, truncar=True)
+    assert busy == 0
+    assert os.path.getsize(db + '-wal') == 0
+
+
+# ── Tests v1.7 — Escritor único ─────────────────────────────
+
+@pytest.fixture
+def con_escritor(monkeypatch):
+    from app import database
+    monkeypatch.setattr(database, 'SQLITE_ESCRITOR', True)
+    yield database
+    database.detener_escritor()
+
+
+def test_escritor_lote_aisla_trabajo_fallido(db_with_data, con_escritor):
+    """Un lote con un trabajo que falla confirma los demás; cada future recibe lo suyo."""
+    import threading
+    db = db_with_data
+    empezo, liberar = threading.Event(), threading.Event()
+    esc = con_escritor.escritor()
+    con_escritor.reset_query_stats()
+    bloqueo = esc.enviar(lambda tx: empezo.set() or liberar.wait(5), db)
+    assert empezo.wait(5)  # el escritor está ocupado: los 3 siguientes forman un lote
+
+    def sumar(n):
+        return lambda tx: tx.execute("UPDATE productos SET stock = stock + ? WHERE sku = 'CAM-TEST-S'", (n,))
+
+    def fallar(tx):
+        tx.execute("UPDATE productos SET stock = 0 WHERE sku = 'CAM-TEST-S'")
+        raise ValueError("regla de negocio")
+
+    futuros = [esc.enviar(sumar(1), db), esc.enviar(fallar, db), esc.enviar(sumar(2), db)]
+    liberar.set()
+    bloqueo.result(5)
+    assert futuros[0].result(5) is not None
+    with pytest.raises(ValueError, match="regla de negocio"):
+        futuros[1].result(5)
+    futuros[2].result(5)
+    assert query("SELECT stock FROM productos WHERE sku = 'CAM-TEST-S'", db_path=db)[0]['stock'] == 13
+    stats = con_escritor.get_query_stats()
+    assert stats['trabajos_escritor'] == 4 and stats['lotes_escritor'] == 2  # bloqueo + lote de 3
+
+
+def test_escritor_20_sesiones_sin_sobreventa(db_with_data, con_escritor):
+    """20 sesiones venden el mismo SKU (stock 10): 10 ventas, 10 rechazos, sin 'locked'."""
+    import threading
+    db = db_with_data
+    resultados = []
+
+    def vender():
+        try:
+            resultados.append(registrar_venta('CAM-TEST-S', 1, 75000, 'Efectivo', db_path=db))
+        except ValueError as exc:
+            resultados.append(exc)
+
+    hilos = [threading.Thread(target=vender) for _ in range(20)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    ids = [r for r in resultados if isinstance(r, int)]
+    assert len(ids) == 10 and len(set(ids)) == 10
+    assert all('Stock insuficiente' in str(r) for r in resultados if not isinstance(r, int))
+    assert query("SELECT stock FROM productos WHERE sku = 'CAM-TEST-S'", db_path=db)[0]['stock'] == 0
+    assert query("SELECT COUNT(*) AS n FROM ventas", db_path=db)[0]['n'] == 10
+
+
+# ── Tests v1.7 — Reintentos ─────────────────────────────────
+
+@pytest.fixture
+def reintentos_rapidos(monkeypatch):
+    from app import database
+    monkeypatch.setattr(database, 'REINTENTO_BASE', 0.001)
+    monkeypatch.setattr(database, 'REINTENTO_MAX', 0.005)
+    database.reset_query_stats()
+    return database
+
+
+def _fallar_primeras(monkeypatch, modulo, nombre, n, error):
+    """Reemplaza modulo.nombre para que las primeras n llamadas lancen error."""
+    original = getattr(modulo, nombre)
+    fallas = {'quedan': n}
+
+    def con_falla(*args, **kwargs):
+        if fallas['quedan'] > 0:
+            fallas['quedan'] -= 1
+            raise error
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(modulo, nombre, con_falla)
+    return fallas
+
+
+def test_clasificar_error_por_backend():
+    from app.database import clasificar_error
+    assert clasificar_error(sqlite3.OperationalError("database is locked")) == 'bloqueo'
+    assert clasificar_error(sqlite3.OperationalError("no such table: x")) is None
+    assert clasificar_error(ValueError("Stock insuficiente")) is None
+    psycopg2 = pytest.importorskip('psycopg2')
+    extensions = pytest.importorskip('psycopg2.extensions')
+    assert clasificar_error(extensions.TransactionRollbackError("could not serialize")) == 'bloqueo'
+    assert clasificar_error(psycopg2.OperationalError("server closed the connection unexpectedly")) == 'conexion'
+    assert clasificar_error(psycopg2.InterfaceError("connection already closed")) == 'conexion'
+    assert clasificar_error(extensions.QueryCanceledError("statement timeout")) is None
+    assert clasificar_error(psycopg2.IntegrityError("duplicate key")) is None
+
+
+def test_query_y_execute_reintentan_lock(db_with_data, reintentos_rapidos, monkeypatch):
+    """Un 'database is locked' inyectado se reintenta y la página no lo ve."""
+    database = reintentos_rapidos
+    db = db_with_data
+    _fallar_primeras(monkeypatch, database, '_run_sqlite', 2, sqlite3.OperationalError("database is locked"))
+    assert query("SELECT stock FROM productos WHERE sku = 'CAM-TEST-S'", db_path=db) == [{'stock': 10}]
+    _fallar_primeras(monkeypatch, database, '_sqlite_execute', 1, sqlite3.OperationalError("database is locked"))
+    execute("UPDATE productos SET stock = stock + 1 WHERE sku = 'CAM-TEST-S'", db_path=db)
+    assert query("SELECT stock FROM productos WHERE sku = 'CAM-TEST-S'", db_path=db) == [{'stock': 11}]
+    stats = database.get_query_stats()
+    assert stats['reintentos'] == 3 and stats['reintentos_bloqueo'] == 3
+
+
+def test_conexion_caida_solo_reintenta_idempotente(db_with_data, reintentos_rapidos, monkeypatch):
+    """Desconexión: query() se repite; execute() no (pudo haberse aplicado)."""
+    psycopg2 = pytest.importorskip('psycopg2')
+    database = reintentos_rapidos
+    db = db_with_data
+    caida = psycopg2.OperationalError("server closed the connection unexpectedly")
+    _fallar_primeras(monkeypatch, database, '_run_sqlite', 1, caida)
+    assert query("SELECT stock FROM productos WHERE sku = 'CAM-TEST-S'", db_path=db) == [{'stock': 10}]
+    fallas = _fallar_primeras(monkeypatch, database, '_sqlite_execute', 1, caida)
+    with pytest.raises(psycopg2.OperationalError):
+        execute("UPDATE productos SET stock = 0", db_path=db)
+    assert fallas['quedan'] == 0
+    assert database.get_query_stats()['reintentos_conexion'] == 1
+
+
+def test_unidad_de_trabajo_se_repite_entera_y_respeta_plazo(db_with_data, reintentos_rapidos):
+    """La unidad completa se repite tras un lock (sin efectos dobles); sin plazo, se propaga."""
+    from app.database import unidad_de_trabajo, reintentar
+    database = reintentos_rapidos
+    db = db_with_data
+    intentos = []
+
+    def vender(tx):
+        tx.execute("UPDATE productos SET stock = stock - 1 WHERE sku = 'CAM-TEST-S'")
+        intentos.append(1)
+        if len(intentos) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return len(intentos)
+
+    assert unidad_de_trabajo(vender, db) == 2
+    assert query("SELECT stock FROM productos WHERE sku = 'CAM-TEST-S'", db_path=db) == [{'stock': 9}]
+
+    def siempre_bloqueado():
+        raise sqlite3.OperationalError("database is locked")
+
+    with pytest.raises(sqlite3.OperationalError):
+        reintentar(siempre_bloqueado, plazo=0.05)
+    assert database.get_query_stats()['reintentos_agotados'] == 1
+
+
+# ── Tests v1.7 — Réplica de lectura ─────────────────────────
+
+def test_replica_al_dia_guardia_de_escritura():
+    """La réplica sirve solo si ya aplicó la LSN de la última escritura; atraso 0 no basta."""
+    from app.database import _replica_al_dia
+    assert _replica_al_dia(lag=0, lsn_replica=5000, ultima_lsn=5000)
+    assert not _replica_al_dia(lag=0, lsn_replica=4999, ultima_lsn=5000)  # recibido = aplicado, sin el commit
+    assert _replica_al_dia(lag=2.0, lsn_replica=6000, ultima_lsn=5000)
+    assert _replica_al_dia(lag=0, lsn_replica=100, ultima_lsn=None)  # el proceso no escribió
+    assert _replica_al_dia(lag=0, lsn_replica=None, ultima_lsn=5000)  # no es réplica
+    assert not _replica_al_dia(lag=600, lsn_replica=6000, ultima_lsn=5000)  # sobre REPLICA_LAG_MAX
+
+
+
+def test_marcar_escritura_guarda_lsn_de_la_primaria(monkeypatch):
+    """Tras el commit se guarda la LSN más alta; si no se puede leer, la réplica se pausa sin fallar."""
+    from app import database
+    monkeypatch.setattr(database, 'USE_POSTGRES', True)
+    monkeypatch.setattr(database, 'DATABASE_REPLICA_URL', 'postgresql://replica')
+    monkeypatch.setattr(database, '_ultima_lsn', None)
+    monkeypatch.setattr(database, '_replica', {'lag': 0.0, 'lsn': None, 'medido': float('-inf'),
+                                               'caida_hasta': 0.0})
+
+    class Conexion:
+        def __init__(self, lsn):
+            self.lsn, self.sql = lsn, []
+
+        def cursor(self):
+            return self
+
+        def execute(self, sql, params=None):
+            if isinstance(self.lsn, Exception):
+                raise self.lsn
+            self.sql.append(sql)
+
+        def fetchone(self):
+            return (self.lsn,)
+
+        def rollback(self):
+            pass
+
+    conn = Conexion(5000)
+    database._marcar_escritura(conn)
+    assert conn.sql == [database._SQL_LSN_PRIMARIA]
+    database._marcar_escritura(Conexion(4000))
+    assert database._ultima_lsn == 5000
+    database._marcar_escritura(Conexion(RuntimeError("conexión cerrada")))
+    assert database._ultima_lsn == 5000
+    assert database._replica['caida_hasta'] > 0
+
+def test_replica_caida_vuelve_a_primaria_y_pausa(monkeypatch):
+    """Réplica inalcanzable: None (→ primaria) y no se reintenta durante REPLICA_PAUSA."""
+    pytest.importorskip('psycopg2')
+    from app import database
+    monkeypatch.setattr(database, 'DATABASE_REPLICA_URL', 'postgresql://orvann@127.0.0.1:1/replica?connect_timeout=2')
+    monkeypatch.setattr(database, '_replica', {'lag': 0.0, 'lsn': None, 'medido': float('-inf'),
+                                               'caida_hasta': 0.0})
+    conexiones = []
+    original = database._get_pg_connection
+    monkeypatch.setattr(database, '_get_pg_connection', lambda url=None: conexiones.append(url) or original(url))
+    database.reset_query_stats()
+    assert database._leer_replica("SELECT 1", ()) is None
+    assert database._leer_replica("SELECT 1", ()) is None
+    assert len(conexiones) == 1
+    assert database.get_query_stats()['replica_descartada'] == 2
+
+
+@pytest.mark.skipif(not (os.environ.get('DATABASE_URL', '').startswith('postgres')
+                         and os.environ.get('DATABASE_REPLICA_URL')),
+                    reason="Requiere DATABASE_URL y DATABASE_REPLICA_URL (dos PostgreSQL locales)")
+def test_replica_lectura_despues_de_escritura():
+    """Una venta recién registrada aparece en la lectura analítica (réplica al día o primaria)."""
+    import uuid
+    from datetime import date
+    from app.models import crear_producto, eliminar_producto, anular_venta, get_ventas_rango
+    from scripts.create_db import ensure_tables
+    ensure_tables()
+    sku = f"REPLICA-{uuid.uuid4().hex[:8]}".upper()
+    crear_producto(sku, 'Réplica Test', 'Camisa', 'M', 'Negro', 37000, 75000, stock=3)
+    try:
+        venta_id = registrar_venta(sku, 1, 75000, 'Efectivo')
+        hoy = date.today().isoformat()
+        assert venta_id in [v['id'] for v in get_ventas_rango(hoy, hoy, analitica=True)]
+        anular_venta(venta_id)
+    finally:
+        eliminar_producto(sku)
+
+
+# ── Tests v1.7 — Clases de carga ────────────────────────────
+
+@pytest.fixture
+def clases_chicas(monkeypatch):
+    from app import database
+    monkeypatch.setattr(database, 'CLASES_ACTIVAS', True)
+    monkeypatch.setitem(database.CLASES_CARGA, 'analytics', database.ClaseCarga(cupos=1, timeout=0.2, espera=0.05))
+    return database
+
+
+def test_admision_por_clase(db_with_data, clases_chicas):
+    """Con el único cupo analytics ocupado, otra lectura analytics se rechaza; el POS pasa."""
+    import threading
+    database = clases_chicas
+    db = db_with_data
+    ocupado, liberar = threading.Event(), threading.Event()
+
+    def reporte_largo():
+        with database.clase_carga('analytics'):
+            with database.transaction(db) as tx:
+                tx.query("SELECT COUNT(*) FROM ventas")
+                # reentrante: un query() dentro de la transacción no pide otro cupo
+                query("SELECT COUNT(*) FROM productos", db_path=db)
+                ocupado.set()
+                liberar.wait(5)
+
+    hilo = threading.Thread(target=reporte_largo)
+    hilo.start()
+    try:
+        assert ocupado.wait(5)
+        with database.clase_carga('analytics'):
+            with pytest.raises(database.CargaSaturada):
+                query("SELECT * FROM ventas", db_path=db)
+            # la clase externa manda sobre la de la función (get_producto es 'pos')
+            with pytest.raises(database.CargaSaturada):
+                from app.models import get_producto
+                get_producto('CAM-TEST-S', db_path=db)
+        with database.clase_carga('pos'):
+            assert query("SELECT stock FROM productos WHERE sku = 'CAM-TEST-S'", db_path=db) == [{'stock': 10}]
+    finally:
+        liberar.set()
+        hilo.join()
+    assert database.get_query_stats()['saturada_analytics'] >= 2
+
+
+def test_timeout_por_sentencia_sqlite(db_with_data, clases_chicas):
+    """El progress handler corta una consulta analytics que pasa su timeout."""
+    database = clases_chicas
+    sin_fin = """
+        WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n)
+        SELECT x FROM n WHERE x < 0 LIMIT 1
+    """
+    with database.clase_carga('analytics'):
+        with pytest.raises(sqlite3.OperationalError, match='interrupted'):
+            query(sin_fin, db_path=db_with_data)
+        # la conexión de lectura reutilizada sigue sana y sin handler pendiente
+        assert query("SELECT COUNT(*) AS n FROM productos", db_path=db_with_data) == [{'n': 4}]
+
+
+
+def test_analytics_cupo_por_socio_y_hilos_heredan_clase(db_with_data, monkeypatch):
+    """Tres socios con reportes a la vez no saturan; los hilos de verificar_kardex
+    corren en analytics (cupo y timeout) y no pasan de sus cupos."""
+    import threading
+    from app import database, models
+    monkeypatch.setattr(database, 'CLASES_ACTIVAS', True)
+    cupos = database.CLASES_CARGA['analytics'].cupos
+    assert cupos >= len(models.SOCIOS)
+
+    clases = []
+    original = models.query
+
+    def query_con_traza(*args, **kwargs):
+        clases.append((threading.current_thread().name, database._clase_actual()))
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(models, 'query', query_con_traza)
+    assert models.verificar_kardex(workers=8, tamano_bloque=1, db_path=db_with_data)['skus'] == 4
+    hilos = {nombre for nombre, _ in clases} - {threading.current_thread().name}
+    assert 1 <= len(hilos) <= cupos
+    assert all(clase is database.CLASES_CARGA['analytics'] for _, clase in clases)
+
+
+# ── Tests v1.7 — Particiones por mes ────────────────────────
+
+def test_particiones_postgres_ddl():
+    """ventas/gastos particionadas por mes: la PK incluye la fecha y la FK de
+    creditos hacia ventas solo queda en SQLite."""
+    from scripts import schema, particiones
+    ventas = schema.compilar_tabla(schema.tabla('ventas'), 'postgres')
+    assert 'PRIMARY KEY (id, fecha)' in ventas and 'id SERIAL,' in ventas
+    assert ventas.endswith('PARTITION BY RANGE (fecha)')
+    assert 'id INTEGER PRIMARY KEY AUTOINCREMENT' in schema.compilar_tabla(schema.tabla('ventas'), 'sqlite')
+    creditos = schema.tabla('creditos_clientes')
+    assert 'REFERENCES ventas(id)' in schema.compilar_tabla(creditos, 'sqlite')
+    assert 'REFERENCES ventas' not in schema.compilar_tabla(creditos, 'postgres')
+    from datetime import date
+    assert [particiones.nombre_particion('ventas', m) for m in particiones.meses('2025-11-15', '2026-02-01')] == \
+        ['ventas_2025_11', 'ventas_2025_12', 'ventas_2026_01', 'ventas_2026_02']
+    assert particiones._siguiente(date(2025, 12, 1)) == date(2026, 1, 1)
+
+
+def test_arranque_postgres_al_dia_asegura_particiones(monkeypatch):
+    """Con el esquema al día el arranque igual crea las particiones de los
+    próximos meses, dentro del advisory lock de las migraciones."""
+    from scripts import migrations, particiones
+    eventos = []
+
+    class Conexion:
+        def cursor(self):
+            return self
+
+        def execute(self, sql, params=None):
+            eventos.append(sql)
+
+        def fetchone(self):
+            return (migrations.ultima_version(),)
+
+        def commit(self):
+            pass
+
+        def rollback(self):
+            pass
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(migrations, '_conectar_postgres', lambda url=None: Conexion())
+    monkeypatch.setattr(particiones, 'asegurar_postgres',
+                        lambda cur: eventos.append('asegurar') or ['ventas_2099_01'])
+    assert migrations.migrar(database_url='postgresql://x') == []
+    assert [e for e in eventos if 'advisory' in e or e == 'asegurar'] == [
+        "SELECT pg_advisory_lock(%s)", 'asegurar', "SELECT pg_advisory_unlock(%s)"]
+
+
+def test_archivar_anio_sqlite(db_with_data):
+    """Un año cerrado pasa al archivo; los rangos lo siguen viendo por índice."""
+    from datetime import date
+    from scripts import particiones
+    from app.database import ruta_archivo, _conexion_lectura
+    from app.models import get_ventas_rango, get_gastos_rango
+    venta_vieja = execute("""INSERT INTO ventas (fecha, sku, cantidad, precio_unitario, total, metodo_pago)
+                             VALUES ('2024-03-10', 'CAM-TEST-S', 1, 75000, 75000, 'Efectivo')""",
+                          db_path=db_with_data)
+    fiada = execute("""INSERT INTO ventas (fecha, sku, cantidad, precio_unitario, total, metodo_pago, cliente)
+                       VALUES ('2024-05-02', 'CAM-TEST-S', 1, 75000, 75000, 'Crédito', 'Ana')""",
+                    db_path=db_with_data)
+    execute("""INSERT INTO creditos_clientes (venta_id, cliente, monto, fecha_credito)
+               VALUES (?, 'Ana', 75000, '2024-05-02')""", (fiada,), db_path=db_with_data)
+    execute("""INSERT INTO gastos (fecha, categoria, monto, descripcion, pagado_por)
+               VALUES ('2024-07-01', 'Otro', 5000, 'viejo', 'JP')""", db_path=db_with_data)
+    hoy = registrar_venta('CAM-TEST-S', 1, 75000, 'Efectivo', db_path=db_with_data)
+    assert get_ventas_rango('2024-01-01', '2024-12-31', db_path=db_with_data)  # lector abierto antes
+
+    # La venta con crédito se queda: creditos_clientes la referencia
+    assert particiones.archivar_sqlite(2024, db_with_data) == {'ventas': 1, 'gastos': 1}
+    assert os.path.exists(ruta_archivo(2024, db_with_data))
+    vivas = {r['id'] for r in query("SELECT id FROM ventas", db_path=db_with_data)}
+    assert venta_vieja not in vivas and {fiada, hoy} <= vivas
+    assert {v['id'] for v in get_ventas_rango('2024-01-01', '2024-12-31', db_path=db_with_data)} == \
+        {venta_vieja, fiada}
+    assert [g['descripcion'] for g in get_gastos_rango('2024-01-01', '2024-12-31', db_path=db_with_data)] == ['viejo']
+    assert len(get_ventas_rango('2000-01-01', '2100-01-01', db_path=db_with_data)) == 3
+
+    plan = ' '.join(r[3] for r in _conexion_lectura(db_with_data).execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM ventas_historico WHERE fecha >= '2024-01-01' AND fecha <= '2024-12-31'"))
+    assert plan.count('idx_ventas_fecha') == 2  # tabla viva + archivo 2024, sin recorrer tablas
+
+    with pytest.raises(ValueError):
+        particiones.archivar_sqlite(date.today().year, db_with_data)
+
+
+# ── Tests v1.7 — Semilla de Railway ─────────────────────────
+
+def test_semilla_railway_en_orden_de_fk():
+    """Cada tabla copiada va después de las que referencia; solo idempotencia queda fuera."""
+    from scripts import schema
+    from scripts.setup_railway import TABLAS_SEMILLA
+    assert set(TABLAS_SEMILLA) == {t.nombre for t in schema.TABLAS} - {'idempotencia'}
+    for t in schema.TABLAS:
+        if t.nombre not in TABLAS_SEMILLA:
+            continue
+        for c in t.columnas:
+            ref = schema._por_dialecto(c.referencia, 'postgres')
+            if ref:
+                assert TABLAS_SEMILLA.index(ref.split('(')[0]) < TABLAS_SEMILLA.index(t.nombre)
+
+
+def test_semilla_railway_copia_ids_y_salta_filas_rechazadas(db_with_data):
+    """Se copian los ids; una fila rechazada se deshace con su SAVEPOINT sin
+    abortar el resto de la tabla."""
+    from scripts.setup_railway import _copiar_tabla
+    sentencias = []
+
+    class Pg:
+        def cursor(self):
+            return self
+
+        def execute(self, sql, params=None):
+            sentencias.append((sql, params))
+            if sql.startswith('INSERT') and params[0] == 'CAM-TEST-S':
+                raise RuntimeError("fila rechazada")
+
+        def commit(self):
+            sentencias.append(('COMMIT', None))
+
+    local = sqlite3.connect(db_with_data)
+    local.row_factory = sqlite3.Row
+    _copiar_tabla(local, Pg(), 'productos')
+    _copiar_tabla(local, Pg(), 'costos_fijos')
+    local.close()
+    inserts = [sql for sql, _ in sentencias if sql.startswith('INSERT INTO productos')]
+    assert len(inserts) == 4
+    assert sentencias.count(("ROLLBACK TO SAVEPOINT fila", None)) == 1
+    assert sentencias.count(("RELEASE SAVEPOINT fila", None)) == 3 + len(
+        [sql for sql, _ in sentencias if sql.startswith('INSERT INTO costos_fijos')])
+    assert any(sql.startswith('INSERT INTO costos_fijos (id,') for sql, _ in sentencias)
+    assert any('setval' in sql and "'costos_fijos'" in sql for sql, _ in sentencias)
+    assert not any('setval' in sql and "'productos'" in sql for sql, _ in sentencias)
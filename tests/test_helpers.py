@@ -0,0 +1,69 @@
+"""Tests para los formateadores vectorizados de helpers. v1.7"""
+import numpy as np
+import pandas as pd
+
+from app.components.helpers import (
+    fmt_cop, fmt_pct, color_stock,
+    fmt_cop_col, fmt_pct_col, color_stock_col,
+)
+
+
+def test_fmt_cop_col_igual_a_escalar():
+    """Mismo texto que fmt_cop para positivos, negativos, redondeo y miles."""
+    valores = [0, 5, 999, 1000, 75000, 1234567, 1234567.49, 2.5, 3.5,
+               -1, -1234.5, -0.4, 10 ** 15 + 7, 1914900.0]
+    assert list(fmt_cop_col(valores)) == [fmt_cop(v) for v in valores]
+
+
+def test_fmt_cop_col_nulos_y_series():
+    """None y NaN → $0; con Series se conserva el índice."""
+    s = pd.Series([None, np.nan, 37000], index=[10, 20, 30])
+    out = fmt_cop_col(s)
+    assert isinstance(out, pd.Series)
+    assert list(out.index) == [10, 20, 30]
+    assert list(out) == ['$0', '$0', '$37.000']
+    assert len(fmt_cop_col([])) == 0
+
+
+def test_fmt_cop_col_aleatorio():
+    """Muestra aleatoria amplia coincide con el formateador escalar."""
+    rng = np.random.default_rng(7)
+    valores = rng.uniform(-1e9, 1e12, 2000)
+    assert list(fmt_cop_col(valores)) == [fmt_cop(v) for v in valores]
+
+
+def test_fmt_pct_col_igual_a_escalar():
+    valores = [0, 50.66, 0.05, 0.15, 0.25, 2.675, -3.25, -0.04, 100, 12.345]
+    assert list(fmt_pct_col(valores)) == [fmt_pct(v) for v in valores]
+    assert list(fmt_pct_col([None])) == ['0%']
+
+
+def test_color_stock_col_igual_a_escalar():
+    stock = pd.Series([0, -1, 1, 3, 4, 10])
+    minimo = pd.Series([3, 3, 3, 3, 3, 12])
+    esperado = [color_stock(s, m) for s, m in zip(stock, minimo)]
+    assert list(color_stock_col(stock, minimo)) == esperado
+    assert list(color_stock_col([0, 2, 5])) == ['🔴', '🟡', '🟢']
+
+
+def test_clave_envio_por_formulario(monkeypatch):
+    """Doble tap (aun después del rerun del envío) repite la clave; otros
+    datos o un render sin envío tras confirmar dan una clave nueva."""
+    from app.components import helpers
+    monkeypatch.setattr(helpers.st, 'session_state', {})
+    datos = ['CAM-S', 1, 75000]
+    assert helpers.clave_envio('venta', False, datos) is None
+    clave = helpers.clave_envio('venta', True, datos)
+    assert helpers.clave_envio('venta', True, datos) == clave    # rerun interrumpido
+    assert helpers.clave_envio('gasto', True, datos) != clave
+
+    helpers.confirmar_envio('venta')
+    helpers.clave_envio('venta', False)                          # st.rerun() tras el envío
+    assert helpers.clave_envio('venta', True, datos) == clave    # segundo tap
+    assert helpers.clave_envio('venta', True, ['CAM-S', 2, 75000]) != clave
+
+    clave = helpers.clave_envio('venta', True, datos)
+    helpers.confirmar_envio('venta')
+    helpers.clave_envio('venta', False)
+    helpers.clave_envio('venta', False)                          # el usuario siguió usando la página
+    assert helpers.clave_envio('venta', True, datos) != clave
\ No newline at end of file
@@ -976,3 +976,869 @@ def test_constraint_metodo_pago_valido(db_with_data):
     with pytest.raises(Exception):
         registrar_venta('CAM-TEST-S', 1, 75000, 'Bitcoin',
                         vendedor='JP', db_path=db)
+
+
+# ── Dashboard snapshot ────────────────────────────────────
+
+def test_dashboard_snapshot_coincide_con_funciones(db_with_data):
+    """El snapshot de una sentencia da los mismos KPIs que las funciones individuales."""
+    from datetime import timedelta
+    from app.models import (
+        get_dashboard_snapshot, get_ventas_semana, get_ventas_semana_anterior,
+        get_ventas_mes, get_gastos_mes, get_resumen_inventario,
+    )
+    db = db_with_data
+    hoy = date.today()
+    registrar_venta('CAM-TEST-S', 2, 75000, 'Efectivo', vendedor='JP', db_path=db)
+    registrar_venta('HOOD-TEST-L', 1, 200000, 'Crédito', cliente='Ana', vendedor='JP', db_path=db)
+    lunes = hoy - timedelta(days=hoy.weekday())
+    execute("""INSERT INTO ventas (fecha, hora, sku, cantidad, precio_unitario, total, metodo_pago)
+               VALUES (?, '10:00:00', 'CAM-TEST-S', 1, 75000, 75000, 'Efectivo')""",
+            ((lunes - timedelta(days=3)).isoformat(),), db_path=db)
+    registrar_gasto(hoy.isoformat(), 'Arriendo', 500000, 'Mes', 'JP', db_path=db)
+    registrar_pedido(hoy.isoformat(), 'BRACOR', 'Camisas', 10, 37000, db_path=db)
+
+    snap = get_dashboard_snapshot(db_path=db)
+    pe = calcular_punto_equilibrio(db_path=db)
+    for k in ('cf', 'margen_prom', 'ticket_prom', 'pe_pesos', 'ventas_acumuladas', 'progreso_pct'):
+        assert snap['pe'][k] == pytest.approx(pe[k])
+
+    semana = get_ventas_semana(db_path=db)
+    assert snap['semana']['total'] == pytest.approx(semana['total'])
+    assert snap['semana']['costo'] == pytest.approx(semana['costo'])
+    assert snap['semana_anterior']['total'] == pytest.approx(get_ventas_semana_anterior(db_path=db)['total'])
+
+    mes = get_ventas_mes(hoy.year, hoy.month, db_path=db)
+    assert snap['mes']['total_ventas'] == pytest.approx(mes['total_ventas'])
+    assert snap['mes']['total_costo'] == pytest.approx(mes['total_costo'])
+    assert snap['gastos_mes'] == pytest.approx(get_gastos_mes(hoy.year, hoy.month, db_path=db)['total'])
+
+    inv = get_resumen_inventario(db_path=db)['total']
+    assert snap['inventario']['valor_costo'] == pytest.approx(inv['valor_costo'])
+    assert snap['deuda_proveedores'] == pytest.approx(get_total_deuda_proveedores(db_path=db))
+    assert snap['creditos']['cantidad'] == len(get_creditos_pendientes(db_path=db))
+    assert [a['sku'] for a in snap['alertas']] == [a['sku'] for a in get_alertas_stock(db_path=db)]
+
+
+def test_dashboard_snapshot_un_round_trip(db_with_data):
+    """El snapshot hace una sola sentencia."""
+    from app.models import get_dashboard_snapshot
+    from app.database import get_query_stats, reset_query_stats
+    reset_query_stats()
+    get_dashboard_snapshot(db_path=db_with_data)
+    assert get_query_stats()['query'] == 1
+
+
+# ── Tests v1.7 — Búsqueda de productos ──────────────────────
+
+def test_buscar_productos_prefijo(db_with_data):
+    """Prefijos de nombre, color y talla encuentran el producto (AND entre tokens)."""
+    from app.models import buscar_productos
+    db = db_with_data
+    skus = {p['sku'] for p in buscar_productos('cami neg', db_path=db)}
+    assert skus == {'CAM-TEST-S', 'NO-STOCK'}
+    assert [p['sku'] for p in buscar_productos('hood', db_path=db)] == ['HOOD-TEST-L']
+
+
+def test_buscar_productos_postgres_sin_pg_trgm(monkeypatch):
+    """Sin pg_trgm (0006 no pudo crearla) la búsqueda no llama a similarity();
+    pg_extension se consulta una sola vez."""
+    from app import database, models
+    monkeypatch.setattr(database, 'USE_POSTGRES', True)
+    monkeypatch.setattr(models, '_PG_EXTENSIONES', {})
+    consultas = []
+
+    def query_falso(sql, params=(), db_path=None, **kw):
+        consultas.append((sql, params))
+        return []
+
+    monkeypatch.setattr(models, 'query', query_falso)
+    models.buscar_productos('cami neg')
+    models.buscar_productos('hood')
+    assert [p for s, p in consultas if 'pg_extension' in s] == [('pg_trgm',)]
+    busquedas = [(s, p) for s, p in consultas if 'to_tsquery' in s]
+    assert busquedas and not any('similarity' in s for s, _ in busquedas)
+    assert busquedas[0][1] == ('cami:* & neg:*', 20)
+
+    models._PG_EXTENSIONES['pg_trgm'] = True
+    models.buscar_productos('hood')
+    sql, params = consultas[-1]
+    assert 'similarity' in sql and params == ('hood:*', 'hood', 20)
+
+
+def test_buscar_productos_sku_y_stock(db_with_data):
+    """Busca por partes del SKU y filtra sin stock si se pide."""
+    from app.models import buscar_productos
+    db = db_with_data
+    assert [p['sku'] for p in buscar_productos('CAM-TEST', db_path=db)] == ['CAM-TEST-S']
+    con_stock = buscar_productos('camisa', solo_con_stock=True, db_path=db)
+    assert 'NO-STOCK' not in {p['sku'] for p in con_stock}
+    assert len(buscar_productos('camisa', limite=1, db_path=db)) == 1
+    assert len(buscar_productos('', limite=2, db_path=db)) == 2
+
+
+def test_buscar_productos_sync_crear_editar(db_with_data):
+    """El índice se actualiza con crear_producto, editar_producto y eliminar_producto."""
+    from app.models import buscar_productos
+    db = db_with_data
+    crear_producto('JOG-AZU-M', 'Jogger Cargo M Azul', 'Jogger', 'M', 'Azul', 50000, 110000,
+                   stock=4, db_path=db)
+    assert [p['sku'] for p in buscar_productos('cargo', db_path=db)] == ['JOG-AZU-M']
+
+    editar_producto('JOG-AZU-M', nombre='Jogger Urbano M Azul', db_path=db)
+    assert buscar_productos('cargo', db_path=db) == []
+    assert [p['sku'] for p in buscar_productos('urbano', db_path=db)] == ['JOG-AZU-M']
+
+    eliminar_producto('JOG-AZU-M', db_path=db)
+    assert buscar_productos('urbano', db_path=db) == []
+
+
+# ── Tests v1.7 — Catálogo en memoria ────────────────────────
+
+def test_catalogo_escaneo_sin_bd(db_with_data):
+    """Tras cargar, resolver SKU o código de barras no toca la BD."""
+    from app.catalog import buscar_por_codigo
+    from app.database import get_query_stats, reset_query_stats
+    db = db_with_data
+    editar_producto('CAM-TEST-S', codigo_barras='7701234567890', db_path=db)
+    assert buscar_por_codigo('cam-test-s', db_path=db).sku == 'CAM-TEST-S'
+
+    reset_query_stats()
+    item = buscar_por_codigo('7701234567890', db_path=db)
+    assert item.sku == 'CAM-TEST-S'
+    assert item.precio_venta == 75000
+    assert buscar_por_codigo('HOOD-TEST-L', db_path=db).sku == 'HOOD-TEST-L'
+    assert buscar_por_codigo('NO-EXISTE', db_path=db) is None
+    assert get_query_stats()['query'] == 0
+
+
+def test_catalogo_invalidacion_por_escrituras(db_with_data):
+    """Ventas, anulaciones y stock nuevo invalidan el catálogo."""
+    from app.catalog import buscar_por_codigo
+    from app.models import agregar_stock
+    db = db_with_data
+    stock_ini = buscar_por_codigo('CAM-TEST-S', db_path=db).stock
+
+    venta_id = registrar_venta('CAM-TEST-S', 2, 75000, 'Efectivo', db_path=db)
+    assert buscar_por_codigo('CAM-TEST-S', db_path=db).stock == stock_ini - 2
+
+    anular_venta(venta_id, db_path=db)
+    agregar_stock('CAM-TEST-S', 5, db_path=db)
+    assert buscar_por_codigo('CAM-TEST-S', db_path=db).stock == stock_ini + 5
+
+    editar_producto('CAM-TEST-S', codigo_barras='111', db_path=db)
+    assert buscar_por_codigo('111', db_path=db).sku == 'CAM-TEST-S'
+    editar_producto('CAM-TEST-S', codigo_barras='', db_path=db)
+    assert buscar_por_codigo('111', db_path=db) is None
+
+
+
+def test_catalogo_parchea_el_sku_sin_recargar(db_with_data):
+    """Una escritura relee solo su SKU (una consulta por PK); el catálogo no se recarga."""
+    from app import catalog
+    from app.database import get_query_stats, reset_query_stats
+    db = db_with_data
+    cargado = catalog.get_catalogo(db)
+
+    reset_query_stats()
+    registrar_venta('CAM-TEST-S', 1, 75000, 'Efectivo', db_path=db)
+    consultas = get_query_stats()['query']
+    assert catalog.buscar_por_codigo('CAM-TEST-S', db_path=db).stock == 9
+    assert catalog.get_catalogo(db) is cargado
+    assert get_query_stats()['query'] == consultas
+
+    eliminar_producto('NO-STOCK', db_path=db)
+    assert catalog.buscar_por_codigo('NO-STOCK', db_path=db) is None
+    assert catalog.get_catalogo(db) is cargado
+
+
+def test_catalogo_recarga_incluye_escrituras_durante_la_carga(db_with_data, monkeypatch):
+    """Lo escrito mientras corre la consulta de recarga queda en el catálogo instalado."""
+    from app import catalog
+    db = db_with_data
+    catalog.get_catalogo(db)
+    cargar = catalog._cargar
+
+    def cargar_y_vender(path):
+        resultado = cargar(path)  # stock 10 en la foto
+        registrar_venta('CAM-TEST-S', 1, 75000, 'Efectivo', db_path=path)
+        return resultado
+
+    monkeypatch.setattr(catalog, '_cargar', cargar_y_vender)
+    catalog.invalidar(db)
+    assert catalog.buscar_por_codigo('CAM-TEST-S', db_path=db).stock == 9
+
+
+# ── Tests v1.7 — Idempotencia ───────────────────────────────
+
+def test_venta_idempotente(db_with_data):
+    """Reintento con la misma clave retorna la venta original sin duplicar."""
+    from app.models import get_producto
+    db = db_with_data
+    v1 = registrar_venta('CAM-TEST-S', 2, 75000, 'Efectivo', clave_idempotencia='k-venta', db_path=db)
+    v2 = registrar_venta('CAM-TEST-S', 2, 75000, 'Efectivo', clave_idempotencia='k-venta', db_path=db)
+    assert v1 == v2
+    assert query("SELECT COUNT(*) AS c FROM ventas", db_path=db)[0]['c'] == 1
+    assert get_producto('CAM-TEST-S', db_path=db)['stock'] == 8
+
+    # Una venta fallida no consume la clave
+    with pytest.raises(ValueError):
+        registrar_venta('NO-STOCK', 1, 75000, 'Efectivo', clave_idempotencia='k-fallida', db_path=db)
+    assert query("SELECT COUNT(*) AS c FROM idempotencia WHERE clave = 'k-fallida'",
+                 db_path=db)[0]['c'] == 0
+
+    # La misma clave con otro payload no retorna la venta anterior
+    with pytest.raises(ValueError, match="otros datos"):
+        registrar_venta('CAM-TEST-S', 1, 75000, 'Efectivo', clave_idempotencia='k-venta', db_path=db)
+    assert query("SELECT COUNT(*) AS c FROM ventas", db_path=db)[0]['c'] == 1
+
+
+def test_gasto_y_abono_idempotentes(db_with_data):
+    db = db_with_data
+    g1 = registrar_gasto('2026-02-10', 'Otro', 5000, 'Bolsas', 'JP', clave_idempotencia='k-gasto', db_path=db)
+    g2 = registrar_gasto('2026-02-10', 'Otro', 5000, 'Bolsas', 'JP', clave_idempotencia='k-gasto', db_path=db)
+    assert g1 == g2
+    assert query("SELECT COUNT(*) AS c FROM gastos", db_path=db)[0]['c'] == 1
+
+    registrar_venta('HOOD-TEST-L', 1, 200000, 'Crédito', cliente='Maria', db_path=db)
+    cid = get_creditos_pendientes(db_path=db)[0]['id']
+    r1 = registrar_abono(cid, 50000, clave_idempotencia='k-abono', db_path=db)
+    r2 = registrar_abono(cid, 50000, clave_idempotencia='k-abono', db_path=db)
+    assert r1 == r2
+    assert r2['saldo_restante'] == 150000
+    assert get_creditos_pendientes(db_path=db)[0]['monto_pagado'] == 50000
+
+    # Misma clave para otra operación es un error del cliente
+    with pytest.raises(ValueError, match="ya se usó"):
+        registrar_gasto('2026-02-10', 'Otro', 1000, 'x', 'JP', clave_idempotencia='k-abono', db_path=db)
+
+
+def test_pagar_pedido_idempotente(db_with_data):
+    db = db_with_data
+    pid = registrar_pedido(
+        fecha_pedido='2026-02-10', proveedor='AUREN',
+        descripcion='Camisas x5', unidades=5, costo_unitario=37000, db_path=db,
+    )
+    pagar_pedido(pid, pagado_por='JP', clave_idempotencia='k-pedido', db_path=db)
+    pedido = pagar_pedido(pid, pagado_por='JP', clave_idempotencia='k-pedido', db_path=db)
+    assert pedido['id'] == pid
+    gastos = query("SELECT * FROM gastos WHERE descripcion LIKE ?", (f"Pedido #{pid}%",), db_path=db)
+    assert len(gastos) == 1
+
+
+# ── Tests v1.7 — Kardex ─────────────────────────────────────
+
+def test_kardex_registra_cada_cambio_de_stock(db_with_data):
+    """Venta, anulación, entrada, ajuste y alta quedan en el kardex y cuadran."""
+    from scripts.create_db import migrate_v17_kardex
+    from app.models import agregar_stock, get_movimientos, verificar_kardex
+    db = db_with_data
+    migrate_v17_kardex(db)  # 'inicial' para los productos del fixture
+
+    vid = registrar_venta('CAM-TEST-S', 3, 75000, 'Efectivo', db_path=db)
+    anular_venta(vid, db_path=db)
+    agregar_stock('CAM-TEST-S', 4, referencia='pedido:9', db_path=db)
+    editar_producto('CAM-TEST-S', stock=12, db_path=db)
+    crear_producto('JOG-NEG-M', 'Jogger Negro M', 'Jogger', 'M', 'Negro', 50000, 110000,
+                   stock=6, db_path=db)
+
+    movs = get_movimientos('CAM-TEST-S', db_path=db)
+    assert [(m['tipo'], m['cantidad']) for m in movs] == [
+        ('inicial', 10), ('venta', -3), ('anulacion', 3), ('entrada', 4), ('ajuste', -2),
+    ]
+    assert movs[-1]['saldo'] == 12
+    assert movs[1]['referencia'] == f'venta:{vid}'
+    assert verificar_kardex(workers=2, tamano_bloque=2, db_path=db)['ok']
+
+    with pytest.raises(sqlite3.IntegrityError):
+        execute("DELETE FROM movimientos_inventario", db_path=db)
+
+
+def test_kardex_stock_en_fecha_con_snapshot(db_with_data):
+    """Snapshot + delta da el stock a una fecha, incluso con movimientos fechados
+    antes del snapshot pero insertados después."""
+    from app.models import get_stock_en_fecha, get_valor_inventario_en_fecha, tomar_snapshot_stock
+    db = db_with_data
+    crear_producto('SNAP-1', 'Snap', 'Camisa', 'M', 'Negro', 30000, 60000, stock=10, db_path=db)
+    # Fechas futuras: el 'inicial' de crear_producto queda antes (hoy)
+    registrar_venta('SNAP-1', 2, 60000, 'Efectivo', fecha='2099-03-02', db_path=db)
+    registrar_venta('SNAP-1', 1, 60000, 'Efectivo', fecha='2099-03-05', db_path=db)
+
+    def stock(fecha):
+        filas = get_stock_en_fecha(fecha, sku='SNAP-1', db_path=db)
+        return filas[0]['stock'] if filas else 0
+
+    assert (stock('2099-03-01'), stock('2099-03-03'), stock('2099-03-06')) == (10, 8, 7)
+    assert tomar_snapshot_stock('2099-03-03', db_path=db) >= 1
+    assert (stock('2099-03-01'), stock('2099-03-03'), stock('2099-03-06')) == (10, 8, 7)
+
+    # Venta fechada antes del snapshot, insertada después
+    registrar_venta('SNAP-1', 1, 60000, 'Efectivo', fecha='2099-03-02', db_path=db)
+    assert (stock('2099-03-01'), stock('2099-03-03'), stock('2099-03-06')) == (10, 7, 6)
+
+    valor = get_valor_inventario_en_fecha('2099-03-06', db_path=db)
+    assert valor['unidades'] == 6  # productos del fixture sin kardex no cuentan
+    assert valor['valor_costo'] == 6 * 30000
+
+
+def test_verificar_kardex_detecta_desvio(db_with_data):
+    from scripts.create_db import migrate_v17_kardex
+    from app.models import verificar_kardex
+    db = db_with_data
+    migrate_v17_kardex(db)
+    execute("UPDATE productos SET stock = 99 WHERE sku = 'HOOD-TEST-L'", db_path=db)
+    res = verificar_kardex(db_path=db)
+    assert not res['ok']
+    assert res['diferencias'] == [{'sku': 'HOOD-TEST-L', 'stock': 99, 'kardex': 5}]
+
+
+# ── Tests v1.7 — Costo y nombre congelados en ventas ────────
+
+def test_venta_congela_costo_y_nombre(db_with_data):
+    """Cambiar el costo o nombre del producto no altera el COGS histórico."""
+    from app.models import get_ventas_mes, get_dashboard_snapshot
+    db = db_with_data
+    hoy = date.today()
+    registrar_venta('CAM-TEST-S', 2, 75000, 'Efectivo', db_path=db)
+    editar_producto('CAM-TEST-S', costo=50000, nombre='Camisa Renombrada', db_path=db)
+    registrar_venta('CAM-TEST-S', 1, 75000, 'Efectivo', db_path=db)
+
+    mes = get_ventas_mes(hoy.year, hoy.month, db_path=db)
+    assert mes['total_costo'] == 2 * 37000 + 50000
+    assert {v['producto_nombre'] for v in mes['ventas']} == {'Camisa Test S Negro', 'Camisa Renombrada'}
+    snap = get_dashboard_snapshot(db_path=db)
+    assert snap['mes']['total_costo'] == 2 * 37000 + 50000
+
+
+def test_migracion_congela_ventas_existentes(db_with_data):
+    """El backfill llena costo/nombre de ventas previas a v1.7 desde productos."""
+    from scripts.create_db import migrate_v17_ventas_congeladas
+    db = db_with_data
+    execute("""
+        INSERT INTO ventas (fecha, sku, cantidad, precio_unitario, total, metodo_pago)
+        VALUES ('2026-01-15', 'HOOD-TEST-L', 1, 200000, 200000, 'Efectivo')
+    """, db_path=db)
+    migrate_v17_ventas_congeladas(db)
+    migrate_v17_ventas_congeladas(db)  # idempotente
+    v = query("SELECT costo_unitario, producto_nombre FROM ventas", db_path=db)[0]
+    assert v == {'costo_unitario': 120000, 'producto_nombre': 'Hoodie Test L Gris'}
+
+
+# ── Tests v1.7 — Dinero en pesos enteros ────────────────────
+
+def test_montos_se_guardan_como_pesos_enteros(db_with_data):
+    """Montos con decimales se redondean a pesos y las sumas son int exactos."""
+    db = db_with_data
+    abrir_caja('2026-03-01', efectivo_inicio=100000.4, db_path=db)
+    registrar_venta('CAM-TEST-S', 1, 74999.5, 'Efectivo', fecha='2026-03-01', db_path=db)
+    registrar_venta('CAM-TEST-S', 3, 75000, 'Efectivo', descuento=10, fecha='2026-03-01', db_path=db)
+    registrar_gasto('2026-03-01', 'Otro', 1000.5, 'Bolsas', 'JP', 'Efectivo', db_path=db)
+
+    tipos = query("SELECT typeof(total) AS t, typeof(precio_unitario) AS p FROM ventas", db_path=db)
+    assert {(r['t'], r['p']) for r in tipos} == {('integer', 'integer')}
+    estado = get_estado_caja('2026-03-01', db_path=db)
+    assert estado['ventas_efectivo'] == 75000 + 202500
+    assert isinstance(estado['ventas_efectivo'], int)
+    assert estado['gastos_efectivo'] == 1001
+    assert estado['efectivo_esperado'] == 100000 + 277500 - 1001
+    liq = calcular_liquidacion_socios(db_path=db)
+    assert isinstance(liq['total_real'], int)
+
+
+def test_migracion_dinero_real_a_entero(db_path):
+    """Una BD con columnas REAL se reconstruye con INTEGER, redondeando y conservando ids."""
+    from scripts.create_db import migrate_v17_dinero_entero, SQLITE_TABLES
+    conn = sqlite3.connect(db_path)
+    conn.execute("DROP TABLE gastos")
+    ddl = next(t for t in SQLITE_TABLES if 'TABLE IF NOT EXISTS gastos' in t)
+    conn.execute(ddl.replace('monto INTEGER', 'monto REAL'))
+    conn.executemany("INSERT INTO gastos (id, fecha, categoria, monto, descripcion, pagado_por) VALUES (?, ?, ?, ?, ?, ?)",
+                     [(7, '2026-01-01', 'Otro', 1000.4, 'a', 'JP'), (9, '2026-01-02', 'Otro', 1000.6, 'b', 'KATHE')])
+    conn.commit()
+    conn.close()
+
+    migrate_v17_dinero_entero(db_path)
+    migrate_v17_dinero_entero(db_path)  # idempotente
+    rows = query("SELECT id, monto, typeof(monto) AS t FROM gastos ORDER BY id", db_path=db_path)
+    assert rows == [{'id': 7, 'monto': 1000, 't': 'integer'}, {'id': 9, 'monto': 1001, 't': 'integer'}]
+    nuevo = registrar_gasto('2026-01-03', 'Otro', 500, 'c', 'JP', db_path=db_path)
+    assert nuevo == 10
+
+
+# ── Tests v1.7 — Archivo Parquet ────────────────────────────
+
+def test_archivo_parquet_combina_con_bd(db_with_data):
+    """Meses cerrados pasan a Parquet; Historial los suma a la BD sin duplicar."""
+    pytest.importorskip('pyarrow')
+    from app import archivo
+    from app.models import cerrar_mes, get_ventas_rango, get_gastos_rango, get_ventas_por_mes
+    from scripts.archivo_parquet import exportar_cerrados
+    db = db_with_data
+    venta = """INSERT INTO ventas (fecha, hora, sku, cantidad, precio_unitario, total, metodo_pago, costo_unitario)
+               VALUES (?, ?, 'CAM-TEST-S', 1, ?, ?, ?, 37000)"""
+    execute(venta, ('2025-01-10', '10:00:00', 75000, 75000, 'Efectivo'), db_path=db)
+    fiada = execute(venta, ('2025-01-20', '11:00:00', 80000, 80000, 'Crédito'), db_path=db)
+    execute("INSERT INTO creditos_clientes (venta_id, cliente, monto, fecha_credito) VALUES (?, 'Ana', 80000, '2025-01-20')",
+            (fiada,), db_path=db)
+    execute(venta, ('2025-02-03', '09:30:00', 70000, 70000, 'Transferencia'), db_path=db)
+    registrar_gasto('2025-01-15', 'Otro', 9000, 'viejo', 'JP', db_path=db)
+    execute("INSERT INTO caja_diaria (fecha, efectivo_inicio, cerrada) VALUES ('2025-01-10', 50000, 1)", db_path=db)
+    registrar_venta('CAM-TEST-S', 1, 75000, 'Efectivo', db_path=db)
+    hoy = date.today().isoformat()
+    assert exportar_cerrados(db) == {'ventas': [], 'gastos': [], 'caja_diaria': []}  # sin cerrar
+    cerrar_mes(2025, 1, db_path=db)
+    cerrar_mes(2025, 2, db_path=db)
+
+    assert exportar_cerrados(db, purgar=True) == {
+        'ventas': ['2025-01', '2025-02'], 'gastos': ['2025-01'], 'caja_diaria': ['2025-01']}
+    assert archivo.meses_archivados('ventas', db) == {'2025-01', '2025-02'}
+    # Solo quedan la venta de hoy y la fiada (creditos_clientes la referencia)
+    assert query("SELECT COUNT(*) AS c FROM ventas", db_path=db)[0]['c'] == 2
+    assert query("SELECT COUNT(*) AS c FROM gastos", db_path=db)[0]['c'] == 0
+
+    ventas = get_ventas_rango('2025-01-01', hoy, db_path=db)
+    assert [v['total'] for v in ventas] == [75000, 70000, 80000, 75000]
+    assert [v['fecha'] for v in ventas][1:] == ['2025-02-03', '2025-01-20', '2025-01-10']
+    assert ventas[-1]['costo'] == 37000 and ventas[-1]['metodo_pago'] == 'Efectivo'
+    assert [v['total'] for v in get_ventas_rango('2025-01-15', '2025-01-31', db_path=db)] == [80000]
+    assert [g['monto'] for g in get_gastos_rango('2025-01-01', hoy, db_path=db)] == [9000]
+    meses = get_ventas_por_mes('2025-01-01', hoy, db_path=db)
+    assert [(m['periodo'], m['total'], m['filas']) for m in meses][:2] == \
+        [('2025-01', 155000, 2), ('2025-02', 70000, 1)]
+    assert meses[-1]['periodo'] == hoy[:7] and meses[-1]['total'] == 75000
+
+    assert exportar_cerrados(db) == {'ventas': [], 'gastos': [], 'caja_diaria': []}
+    assert archivo.tramos('2025-01-15', '2025-03-02', {'2025-01', '2025-02'}) == [
+        ('2025-01-15', '2025-02-28', True), ('2025-03-01', '2025-03-02', False)]
+
+
+def test_archivo_parquet_bloquea_mes_exportado_y_verifica_contenido(db_with_data):
+    """Un mes exportado no se edita ni se reabre; purgar compara el contenido
+    de cada fila con el archivo, no solo el conteo."""
+    pytest.importorskip('pyarrow')
+    from app.models import cerrar_mes, reabrir_mes
+    from scripts.archivo_parquet import exportar_cerrados, purgar_mes
+    db = db_with_data
+    vid = execute("""INSERT INTO ventas (fecha, hora, sku, cantidad, precio_unitario, total, metodo_pago, costo_unitario)
+                     VALUES ('2025-01-10', '10:00:00', 'CAM-TEST-S', 1, 100, 100, 'Efectivo', 37000)""", db_path=db)
+    cerrar_mes(2025, 1, db_path=db)
+    assert exportar_cerrados(db)['ventas'] == ['2025-01']
+    with pytest.raises(ValueError, match='archivado'):
+        reabrir_mes(2025, 1, db_path=db)
+
+    # Aun sin cierre (BD con meses exportados antes), el mes archivado queda bloqueado
+    execute("DELETE FROM cierres_mes", db_path=db)
+    with pytest.raises(ValueError, match='archivado'):
+        editar_venta(vid, precio=500, db_path=db)
+    with pytest.raises(ValueError, match='archivado'):
+        registrar_venta('CAM-TEST-S', 1, 75000, 'Efectivo', fecha='2025-01-20', db_path=db)
+
+    # Cambio por fuera de models: mismo conteo, otro contenido → no se purga
+    execute("UPDATE ventas SET total = 500 WHERE id = ?", (vid,), db_path=db)
+    with pytest.raises(RuntimeError, match='no coinciden'):
+        purgar_mes('ventas', '2025-01', db)
+    assert query("SELECT total FROM ventas WHERE id = ?", (vid,), db_path=db)[0]['total'] == 500
+
+
+# ── Tests v1.7 — Cierre de mes ──────────────────────────────
+
+def _mes_pasado(db):
+    """Una venta y dos gastos en marzo de 2025."""
+    venta = execute("""INSERT INTO ventas (fecha, hora, sku, cantidad, precio_unitario, total, metodo_pago, costo_unitario)
+                       VALUES ('2025-03-10', '10:00:00', 'CAM-TEST-S', 2, 75000, 150000, 'Efectivo', 37000)""",
+                    db_path=db)
+    gasto = registrar_gasto('2025-03-05', 'Arriendo', 40000, 'local', 'JP', db_path=db)
+    registrar_gasto('2025-03-20', 'Otro', 10000, 'bolsas', 'KATHE', db_path=db)
+    return venta, gasto
+
+
+def test_cerrar_mes_congela_resultado(db_with_data):
+    """El snapshot no cambia aunque lleguen filas por fuera de models."""
+    from app.models import cerrar_mes, get_resultado_mes
+    db = db_with_data
+    _mes_pasado(db)
+
+    res = cerrar_mes(2025, 3, db_path=db)
+    assert res['cerrado'] is True
+    assert (res['ingresos'], res['costo_mercancia'], res['gastos']) == (150000, 74000, 50000)
+    assert res['utilidad_operativa'] == 150000 - 74000 - 50000
+    assert res['gastos_por_socio'] == {'JP': 40000, 'KATHE': 10000}
+
+    execute("INSERT INTO gastos (fecha, categoria, monto, descripcion, pagado_por) "
+            "VALUES ('2025-03-25', 'Otro', 99000, 'tarde', 'ANDRES')", db_path=db)
+    snap = get_resultado_mes(2025, 3, db_path=db)
+    assert snap['cerrado'] is True and snap['cerrado_en']
+    assert snap['gastos'] == 50000
+    assert snap['gastos_por_categoria'] == {'Arriendo': 40000, 'Otro': 10000}
+
+    with pytest.raises(ValueError, match="ya está cerrado"):
+        cerrar_mes(2025, 3, db_path=db)
+    hoy = date.today()
+    with pytest.raises(ValueError, match="terminados"):
+        cerrar_mes(hoy.year, hoy.month, db_path=db)
+
+
+def test_mes_cerrado_bloquea_cambios(db_with_data):
+    """Ventas y gastos de un mes cerrado no se tocan hasta reabrirlo."""
+    from app.models import cerrar_mes, reabrir_mes
+    db = db_with_data
+    venta, gasto = _mes_pasado(db)
+    cerrar_mes(2025, 3, db_path=db)
+
+    with pytest.raises(ValueError, match="2025-03 está cerrado"):
+        registrar_gasto('2025-03-28', 'Otro', 5000, 'x', 'JP', db_path=db)
+    with pytest.raises(ValueError, match="cerrado"):
+        editar_gasto(gasto, monto=1000, db_path=db)
+    with pytest.raises(ValueError, match="cerrado"):
+        eliminar_gasto(gasto, db_path=db)
+    with pytest.raises(ValueError, match="cerrado"):
+        anular_venta(venta, db_path=db)
+    # Mover un gasto de un mes abierto hacia el cerrado tampoco
+    otro = registrar_gasto('2025-04-02', 'Otro', 5000, 'x', 'JP', db_path=db)
+    with pytest.raises(ValueError, match="cerrado"):
+        editar_gasto(otro, fecha='2025-03-30', db_path=db)
+    assert query("SELECT COUNT(*) AS c FROM gastos WHERE fecha LIKE '2025-03%'", db_path=db)[0]['c'] == 2
+
+    assert reabrir_mes(2025, 3, db_path=db) is True
+    assert reabrir_mes(2025, 3, db_path=db) is False
+    editar_gasto(gasto, monto=1000, db_path=db)
+    eliminar_gasto(gasto, db_path=db)
+
+
+def test_comparar_meses_mezcla_cerrados_y_abiertos(db_with_data):
+    from app.models import cerrar_mes, comparar_meses
+    db = db_with_data
+    _mes_pasado(db)
+    registrar_gasto('2025-04-02', 'Otro', 5000, 'x', 'JP', db_path=db)
+    cerrar_mes(2025, 3, db_path=db)
+
+    meses = comparar_meses('2025-02', '2025-04', db_path=db)
+    assert [m['mes'] for m in meses] == ['2025-02', '2025-03', '2025-04']
+    assert [m['cerrado'] for m in meses] == [False, True, False]
+    assert [m['gastos'] for m in meses] == [0, 50000, 5000]
+    assert meses[1]['ingresos'] == 150000
+
+
+
+def test_cerrar_mes_insert_sin_returning_id_en_postgres(db_with_data, monkeypatch):
+    """cierres_mes no tiene id (la PK es mes): su INSERT es una Sentencia sin
+    retorna y en PostgreSQL no lleva RETURNING id. Toda Sentencia con
+    retorna='id' inserta en una tabla con columna id."""
+    import re
+    from app import database
+    from app.models import cerrar_mes
+    from app.sentencias import Sentencia, registradas
+    from scripts import schema
+    inserts = []
+    original = database.Transaccion.execute
+
+    def execute_con_traza(self, sql, params=()):
+        if 'INSERT INTO cierres_mes' in getattr(sql, 'sql', sql):
+            inserts.append((sql, params))
+        return original(self, sql, params)
+
+    monkeypatch.setattr(database.Transaccion, 'execute', execute_con_traza)
+    _mes_pasado(db_with_data)
+    cerrar_mes(2025, 3, db_path=db_with_data)
+
+    class CursorPg:
+        description = None
+        rowcount = 1
+
+        def __init__(self):
+            self.sql = []
+
+        def execute(self, sql, params=None):
+            self.sql.append(sql)
+
+    (sql, params), = inserts
+    assert isinstance(sql, Sentencia) and sql.retorna is None
+    cur = CursorPg()
+    assert database._pg_execute(cur, sql, params) == 1
+    assert 'RETURNING' not in cur.sql[0] and '%(mes)s' in cur.sql[0]
+
+    con_id = {t.nombre for t in schema.TABLAS if 'id' in {c.nombre for c in t.columnas}}
+    for s in registradas().values():
+        tabla = re.match(r'INSERT\s+INTO\s+(\w+)', s.sql)
+        if tabla and s.retorna == 'id':
+            assert tabla.group(1) in con_id, s.nombre
+    # SQL ad-hoc (scripts): la lista de respaldo cubre toda tabla sin id
+    sin_id = {t.nombre for t in schema.TABLAS} - con_id
+    assert sin_id <= set(database._NO_ID_TABLES)
+
+
+# ── Tests v1.7 — Liquidación por mes ────────────────────────
+
+def test_liquidacion_saldos_por_mes_y_pagos(db_with_data):
+    """Saldo acumulado mes a mes; un pago entre socios lo salda."""
+    from app.models import registrar_pago_socio, eliminar_pago_socio
+    db = db_with_data
+    registrar_gasto('2025-03-05', 'Arriendo', 90000, 'local', 'JP', db_path=db)
+    registrar_gasto('2025-04-05', 'Arriendo', 60000, 'local', 'KATHE', db_path=db)
+    registrar_gasto('2025-04-09', 'Transporte', 30000, 'taxi', 'KATHE', db_path=db)
+
+    liq = calcular_liquidacion_socios(db_path=db)
+    assert 'gastos' not in liq
+    assert [m['mes'] for m in liq['meses']] == ['2025-03', '2025-04']
+    assert liq['meses'][0]['saldos'] == {'JP': 60000, 'KATHE': -30000, 'ANDRES': -30000}
+    assert liq['meses'][1]['saldos'] == {'JP': 30000, 'KATHE': 30000, 'ANDRES': -60000}
+    assert liq['por_socio_categoria']['KATHE'] == {'Arriendo': 60000, 'Transporte': 30000}
+    assert liq['transferencias'] == [{'de': 'ANDRES', 'a': 'JP', 'monto': 30000},
+                                     {'de': 'ANDRES', 'a': 'KATHE', 'monto': 30000}]
+
+    pago = registrar_pago_socio('2025-05-02', 'ANDRES', 'JP', 30000, db_path=db)
+    liq = calcular_liquidacion_socios(db_path=db)
+    assert liq['meses'][-1]['mes'] == '2025-05' and liq['meses'][-1]['total'] == 0
+    assert liq['saldos']['ANDRES']['pagos'] == 30000
+    assert {s: v['saldo'] for s, v in liq['saldos'].items()} == {'JP': 0, 'KATHE': 30000, 'ANDRES': -30000}
+    assert liq['transferencias'] == [{'de': 'ANDRES', 'a': 'KATHE', 'monto': 30000}]
+
+    with pytest.raises(ValueError):
+        registrar_pago_socio('2025-05-02', 'JP', 'JP', 1000, db_path=db)
+    eliminar_pago_socio(pago, db_path=db)
+    assert calcular_liquidacion_socios(db_path=db)['saldos']['JP']['saldo'] == 30000
+
+
+def test_liquidacion_usa_cache_de_meses_cerrados(db_with_data):
+    """Un mes cerrado se lee de cierres_mes; el GROUP BY solo recorre el resto."""
+    from app.models import cerrar_mes, reabrir_mes, _fuera_de_meses
+    db = db_with_data
+    registrar_gasto('2025-03-05', 'Arriendo', 90000, 'local', 'JP', db_path=db)
+    registrar_gasto('2025-05-05', 'Otro', 30000, 'x', 'ANDRES', db_path=db)
+    cerrar_mes(2025, 3, db_path=db)
+    # Fila que no pasa por models: el caché del mes cerrado no la ve
+    execute("INSERT INTO gastos (fecha, categoria, monto, descripcion, pagado_por) "
+            "VALUES ('2025-03-25', 'Otro', 60000, 'tarde', 'KATHE')", db_path=db)
+
+    liq = calcular_liquidacion_socios(db_path=db)
+    assert liq['total_real'] == 120000
+    assert liq['aportes'] == {'JP': 90000, 'KATHE': 0, 'ANDRES': 30000}
+    reabrir_mes(2025, 3, db_path=db)
+    assert calcular_liquidacion_socios(db_path=db)['aportes']['KATHE'] == 60000
+
+    assert _fuera_de_meses(['2025-03', '2025-04', '2025-12']) == (
+        "fecha < ? OR (fecha >= ? AND fecha < ?) OR fecha >= ?",
+        ('2025-03-01', '2025-05-01', '2025-12-01', '2026-01-01'))
+    assert _fuera_de_meses([]) == ('', ())
+
+
+# ── Tests v1.7 — Acumulados de caja ─────────────────────────
+
+def test_caja_acumulados_siguen_escrituras(db_with_data):
+    """Venta, anulación, edición y gastos mueven los acumulados; una sola lectura por PK."""
+    from app.database import get_query_stats, reset_query_stats
+    from app.models import editar_venta, verificar_caja
+    db = db_with_data
+    hoy = date.today().isoformat()
+
+    v1 = registrar_venta('CAM-TEST-S', 1, 75000, 'Efectivo', db_path=db)
+    v2 = registrar_venta('CAM-TEST-S', 1, 70000, 'Transferencia', db_path=db)
+    registrar_venta('HOOD-TEST-L', 1, 200000, 'Datáfono', db_path=db)
+    # Sin abrir_caja la fila existe pero la caja no figura abierta
+    assert get_estado_caja(db_path=db)['caja_abierta'] is False
+    abrir_caja(fecha=hoy, efectivo_inicio=50000, db_path=db)
+
+    anular_venta(v1, db_path=db)
+    editar_venta(v2, precio=60000, metodo_pago='Efectivo', db_path=db)
+    g = registrar_gasto(hoy, 'Transporte', 10000, 'Taxi', 'JP', 'Efectivo', db_path=db)
+    registrar_gasto(hoy, 'Otro', 5000, 'Bolsas', 'KATHE', 'Transferencia', db_path=db)
+    editar_gasto(g, monto=12000, db_path=db)
+
+    reset_query_stats()
+    estado = get_estado_caja(db_path=db)
+    assert get_query_stats()['query'] == 1
+    assert estado['caja_abierta'] is True
+    assert estado['totales_ventas'] == {'Efectivo': 60000, 'Datáfono': 200000}
+    assert estado['gastos_efectivo'] == 12000
+    assert estado['efectivo_esperado'] == 50000 + 60000 - 12000
+    assert verificar_caja(db_path=db)['ok']
+
+    eliminar_gasto(g, db_path=db)
+    assert get_estado_caja(db_path=db)['gastos_efectivo'] == 0
+    assert verificar_caja(hoy, hoy, db_path=db)['ok']
+
+
+def test_verificar_caja_detecta_y_repara(db_with_data):
+    """Filas escritas por fuera de models (scripts) se detectan y se reparan."""
+    from app.models import verificar_caja
+    db = db_with_data
+    registrar_venta('CAM-TEST-S', 1, 75000, 'Efectivo', fecha='2026-03-02', db_path=db)
+    execute("""INSERT INTO ventas (fecha, hora, sku, cantidad, precio_unitario, total, metodo_pago)
+               VALUES ('2026-03-02', '12:00:00', 'CAM-TEST-S', 1, 80000, 80000, 'Crédito')""", db_path=db)
+    execute("""INSERT INTO gastos (fecha, categoria, monto, descripcion, pagado_por, metodo_pago)
+               VALUES ('2026-03-05', 'Otro', 7000, 'x', 'JP', 'Efectivo')""", db_path=db)
+
+    res = verificar_caja(db_path=db)
+    assert not res['ok']
+    assert [(d['fecha'], d['columna'], d['guardado'], d['calculado']) for d in res['diferencias']] == [
+        ('2026-03-02', 'ventas_credito', 0, 80000), ('2026-03-05', 'gastos_efectivo', None, 7000)]
+
+    verificar_caja(reparar=True, db_path=db)
+    assert verificar_caja(db_path=db)['ok']
+    assert get_estado_caja('2026-03-05', db_path=db)['gastos_efectivo'] == 7000
+    assert get_estado_caja('2026-03-02', db_path=db)['totales_ventas'] == {'Efectivo': 75000, 'Crédito': 80000}
+
+
+
+@pytest.mark.parametrize('columna_previa', [False, True])
+def test_migrar_caja_v16_queda_abierta(db_v16, columna_previa):
+    """Las cajas de v1.6 quedan abiertas con sus acumulados, aunque la columna
+    abierta ya existiera antes de 0013."""
+    from app.models import verificar_caja
+    from scripts import migrations
+    if columna_previa:
+        conn = sqlite3.connect(db_v16)
+        conn.execute("ALTER TABLE caja_diaria ADD COLUMN abierta INTEGER DEFAULT 0")
+        conn.commit()
+        conn.close()
+    migrations.migrar(db_path=db_v16)
+
+    estado = get_estado_caja('2025-03-10', db_path=db_v16)
+    assert estado['caja_abierta'] is True
+    assert estado['totales_ventas'] == {'Crédito': 75000}
+    assert estado['gastos_efectivo'] == 12000
+    assert verificar_caja(db_path=db_v16)['ok']
+
+
+# ── Tests v1.7 — Conciliación de caja por rango ─────────────
+
+def test_conciliar_caja_rango(db_with_data):
+    """Diferencia, deriva, encadenamiento con el cierre anterior y días sin caja."""
+    from app.models import conciliar_caja
+    db = db_with_data
+    abrir_caja('2026-03-01', 100000, db_path=db)
+    registrar_venta('CAM-TEST-S', 1, 75000, 'Efectivo', fecha='2026-03-01', db_path=db)
+    cerrar_caja('2026-03-01', 170000, db_path=db)              # faltan 5.000
+    abrir_caja('2026-03-03', 170000, db_path=db)
+    registrar_gasto('2026-03-03', 'Otro', 20000, 'x', 'JP', 'Efectivo', db_path=db)
+    cerrar_caja('2026-03-03', 153000, db_path=db)              # sobran 3.000
+    abrir_caja('2026-03-04', 100000, db_path=db)               # no cuadra con 153.000
+    cerrar_caja('2026-03-04', 40000, db_path=db)               # faltan 60.000
+
+    res = conciliar_caja('2026-03-01', '2026-03-05', db_path=db)
+    dias = {d['fecha']: d for d in res['dias']}
+    assert list(dias) == ['2026-03-01', '2026-03-02', '2026-03-03', '2026-03-04', '2026-03-05']
+    assert dias['2026-03-01']['esperado'] == 175000 and dias['2026-03-01']['diferencia'] == -5000
+    assert dias['2026-03-02']['con_caja'] is False and dias['2026-03-02']['deriva'] == -5000
+    assert dias['2026-03-03']['cierre_previo'] == 170000
+    assert dias['2026-03-03']['descuadre_apertura'] == 0
+    assert dias['2026-03-04']['descuadre_apertura'] == 100000 - 153000
+    assert [d['deriva'] for d in res['dias']] == [-5000, -5000, -2000, -62000, -62000]
+    assert [d['fecha'] for d in res['dias'] if d['atipico']] == ['2026-03-04']
+    assert res['resumen']['cerradas'] == 3 and res['resumen']['faltantes'] == -65000
+
+    # El cierre anterior al rango también encadena
+    res = conciliar_caja('2026-03-04', '2026-03-04', db_path=db)
+    assert res['dias'][0]['cierre_previo'] == 153000 and res['dias'][0]['deriva'] == -60000
+
+
+def test_conciliar_caja_cerrada_sin_efectivo_real(db_with_data):
+    """Una caja cerrada sin efectivo_cierre_real no rompe el resumen."""
+    from app.models import conciliar_caja
+    db = db_with_data
+    abrir_caja('2026-03-01', 100000, db_path=db)
+    cerrar_caja('2026-03-01', 90000, db_path=db)               # faltan 10.000
+    abrir_caja('2026-03-02', 90000, db_path=db)
+    conn = sqlite3.connect(db)
+    conn.execute("UPDATE caja_diaria SET cerrada = 1, abierta = 0 WHERE fecha = '2026-03-02'")
+    conn.commit()
+    conn.close()
+    res = conciliar_caja('2026-03-01', '2026-03-02', db_path=db)
+    assert res['dias'][1]['diferencia'] is None
+    assert res['resumen']['cerradas'] == 2
+    assert (res['resumen']['faltantes'], res['resumen']['sobrantes']) == (-10000, 0)
+
+
+# ── Tests v1.7 — Clientes y abonos ──────────────────────────
+
+def test_clientes_saldo_y_abonos(db_with_data):
+    """Un cliente por nombre normalizado; el saldo sigue ventas, abonos y anulaciones."""
+    from app.models import buscar_clientes, get_abonos, get_cliente
+    db = db_with_data
+    registrar_venta('CAM-TEST-S', 1, 75000, 'Crédito', cliente='Ána  López', db_path=db)
+    v2 = registrar_venta('HOOD-TEST-L', 1, 200000, 'Crédito', cliente='ana lopez', db_path=db)
+    registrar_venta('CAM-TEST-S', 1, 75000, 'Crédito', cliente='Pedro', db_path=db)
+
+    ana = buscar_clientes('ANA', db_path=db)
+    assert [(c['nombre'], c['saldo'], c['creditos_abiertos']) for c in ana] == [('Ána López', 275000, 2)]
+    creditos = get_creditos_pendientes(ana[0]['id'], db_path=db)
+    assert [c['monto'] for c in creditos] == [75000, 200000] and creditos[0]['sku'] == 'CAM-TEST-S'
+
+    registrar_abono(creditos[0]['id'], 30000, db_path=db)
+    registrar_abono(creditos[0]['id'], 45000, db_path=db)
+    registrar_abono(creditos[1]['id'], 50000, db_path=db)
+    cliente = get_cliente(ana[0]['id'], db_path=db)
+    assert cliente['saldo'] == 150000 and cliente['creditos_abiertos'] == 1
+    assert [a['monto'] for a in get_abonos(cliente_id=cliente['id'], db_path=db)] == [50000, 45000, 30000]
+
+    # Anular descuenta lo pendiente y borra los abonos del crédito
+    anular_venta(v2, db_path=db)
+    cliente = get_cliente(cliente['id'], db_path=db)
+    assert cliente['saldo'] == 0 and cliente['creditos_abiertos'] == 0
+    assert [a['monto'] for a in get_abonos(cliente_id=cliente['id'], db_path=db)] == [45000, 30000]
+    assert [c['nombre'] for c in buscar_clientes(db_path=db)] == ['Pedro']
+
+
+def test_buscar_clientes_y_verificar(db_with_data):
+    """Búsqueda por teléfono, nombre único y verificación de saldos."""
+    from app.models import buscar_clientes, editar_cliente, verificar_clientes
+    db = db_with_data
+    registrar_venta('CAM-TEST-S', 1, 75000, 'Crédito', cliente='Carlos', db_path=db)
+    registrar_venta('CAM-TEST-S', 1, 75000, 'Crédito', cliente='Camila', db_path=db)
+    carlos = buscar_clientes('carl', db_path=db)[0]
+    editar_cliente(carlos['id'], telefono='300 123-4567', db_path=db)
+    assert [c['nombre'] for c in buscar_clientes('300 12', db_path=db)] == ['Carlos']
+    assert [c['nombre'] for c in buscar_clientes('ca', db_path=db)] == ['Camila', 'Carlos']
+    with pytest.raises(ValueError):
+        editar_cliente(carlos['id'], nombre='CAMILA', db_path=db)
+
+    # Crédito insertado sin pasar por models: el saldo no lo incluye
+    conn = sqlite3.connect(db)
+    conn.execute("INSERT INTO creditos_clientes (cliente, monto, fecha_credito, pagado, cliente_id) "
+                 "VALUES ('Carlos', 10000, '2026-03-01', 0, ?)", (carlos['id'],))
+    conn.commit()
+    conn.close()
+    res = verificar_clientes(db_path=db)
+    assert [(d['nombre'], d['saldo'], d['calculado']) for d in res['diferencias']] == [('Carlos', 75000, 85000)]
+    verificar_clientes(reparar=True, db_path=db)
+    assert verificar_clientes(db_path=db)['ok']
+
+    # Pago completo de un crédito sin cliente_id lo vincula y salda
+    conn = sqlite3.connect(db)
+    conn.execute("INSERT INTO creditos_clientes (cliente, monto, fecha_credito, pagado) "
+                 "VALUES ('  carlos ', 5000, '2026-03-02', 0)")
+    conn.commit()
+    conn.close()
+    suelto = [c for c in get_creditos_pendientes(db_path=db) if c['cliente_id'] is None][0]
+    registrar_pago_credito(suelto['id'], db_path=db)
+    assert buscar_clientes('carlos', db_path=db)[0]['saldo'] == 85000
+    assert verificar_clientes(db_path=db)['ok']
+
+
+def test_prefijo_clientes_no_depende_de_la_collation(monkeypatch):
+    """En PostgreSQL el prefijo va con LIKE (escapando comodines) sobre índices
+    text_pattern_ops; en SQLite, rango por bytes."""
+    import importlib
+    from app import database
+    from app.models import _prefijo
+    from scripts import schema
+    assert _prefijo('telefono', '300', db_path='x.db') == ("telefono >= ? AND telefono < ?", ('300', '301'))
+    monkeypatch.setattr(database, 'USE_POSTGRES', True)
+    assert _prefijo('nombre_normalizado', 'ana_m%') == ("nombre_normalizado LIKE ?", ('ana\\_m\\%%',))
+    pg = schema.compilar_indices('postgres')
+    assert not any('idx_clientes_telefono ' in ddl for ddl in pg)
+    migracion = importlib.import_module('scripts.migrations.0015_clientes_prefijo')
+    assert set(migracion._INDICES) <= set(pg)
+
+
+def test_creditos_pendientes_con_fecha_credito_editada(db_with_data):
+    """La venta del crédito se encuentra aunque fecha_credito no sea la de la venta."""
+    db = db_with_data
+    registrar_venta('CAM-TEST-S', 1, 75000, 'Crédito', cliente='Carlos', db_path=db)
+    conn = sqlite3.connect(db)
+    conn.execute("UPDATE creditos_clientes SET fecha_credito = '2020-01-01'")
+    conn.commit()
+    conn.close()
+    credito = get_creditos_pendientes(db_path=db)[0]
+    assert credito['sku'] == 'CAM-TEST-S'
+    assert credito['fecha_venta'] is not None
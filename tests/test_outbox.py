@@ -0,0 +1,107 @@
+"""Tests del outbox local del POS (v1.7)."""
+import os
+import tempfile
+import uuid
+
+import pytest
+
+from app import outbox
+from app.database import query, USE_POSTGRES
+from app.models import get_producto
+
+
+@pytest.fixture
+def outbox_path():
+    fd, path = tempfile.mkstemp(suffix='_outbox.db')
+    os.close(fd)
+    yield path
+    for suf in ('', '-wal', '-shm'):
+        if os.path.exists(path + suf):
+            os.unlink(path + suf)
+
+
+def test_encolar_y_sincronizar(db_with_data, outbox_path):
+    """La venta queda en el journal y el worker la aplica con la fecha de encolado."""
+    envio = outbox.enviar('registrar_venta', outbox_path=outbox_path,
+                          sku='CAM-TEST-S', cantidad=2, precio=75000, metodo_pago='Efectivo',
+                          fecha='2026-02-10', hora='10:00:00')
+    outbox.enviar('registrar_gasto', outbox_path=outbox_path,
+                  fecha='2026-02-10', categoria='Otro', monto=5000,
+                  descripcion='Bolsas', pagado_por='JP', metodo_pago='Efectivo')
+    assert envio['pendiente']
+    assert outbox.estado_sync(outbox_path)['pendientes'] == 2
+    assert query("SELECT COUNT(*) AS c FROM ventas", db_path=db_with_data)[0]['c'] == 0
+
+    res = outbox.sincronizar(db_path=db_with_data, outbox_path=outbox_path)
+    assert res == {'sincronizadas': 2, 'conflictos': 0, 'fallidas': 0}
+    ventas = query("SELECT fecha, hora, cantidad FROM ventas", db_path=db_with_data)
+    assert ventas == [{'fecha': '2026-02-10', 'hora': '10:00:00', 'cantidad': 2}]
+    assert get_producto('CAM-TEST-S', db_path=db_with_data)['stock'] == 8
+    assert outbox.estado_sync(outbox_path)['pendientes'] == 0
+
+
+def test_clave_repetida_no_duplica(db_with_data, outbox_path):
+    """Un doble submit con la misma clave se encola una sola vez."""
+    for _ in range(2):
+        outbox.encolar('registrar_venta',
+                       {'sku': 'CAM-TEST-S', 'cantidad': 1, 'precio': 75000, 'metodo_pago': 'Efectivo'},
+                       clave='venta-1', outbox_path=outbox_path)
+    outbox.sincronizar(db_path=db_with_data, outbox_path=outbox_path)
+    assert query("SELECT COUNT(*) AS c FROM ventas", db_path=db_with_data)[0]['c'] == 1
+
+
+def test_conflicto_de_stock(db_with_data, outbox_path):
+    """Sin stock la entrada queda en conflicto y las siguientes siguen sincronizando."""
+    outbox.encolar('registrar_venta',
+                   {'sku': 'LOW-STOCK', 'cantidad': 5, 'precio': 75000, 'metodo_pago': 'Efectivo'},
+                   outbox_path=outbox_path)
+    outbox.encolar('registrar_venta',
+                   {'sku': 'HOOD-TEST-L', 'cantidad': 1, 'precio': 200000, 'metodo_pago': 'Efectivo'},
+                   outbox_path=outbox_path)
+
+    res = outbox.sincronizar(db_path=db_with_data, outbox_path=outbox_path)
+    assert res == {'sincronizadas': 1, 'conflictos': 1, 'fallidas': 0}
+    estado = outbox.estado_sync(outbox_path)
+    assert estado['pendientes'] == 0
+    assert len(estado['conflictos']) == 1
+    assert 'Stock insuficiente' in estado['conflictos'][0]['ultimo_error']
+
+    outbox.descartar_conflicto(estado['conflictos'][0]['clave'], outbox_path=outbox_path)
+    assert outbox.estado_sync(outbox_path)['conflictos'] == []
+
+
+def test_error_de_conexion_reintenta_con_backoff(db_with_data, outbox_path):
+    """Si la BD principal no responde la entrada sigue pendiente y espera su backoff."""
+    outbox.encolar('registrar_venta',
+                   {'sku': 'CAM-TEST-S', 'cantidad': 1, 'precio': 75000, 'metodo_pago': 'Efectivo'},
+                   outbox_path=outbox_path)
+    caida = os.path.join(tempfile.gettempdir(), 'no-existe', 'orvann.db')
+
+    res = outbox.sincronizar(db_path=caida, outbox_path=outbox_path)
+    assert res['fallidas'] == 1
+    estado = outbox.estado_sync(outbox_path)
+    assert estado['pendientes'] == 1
+    assert estado['ultimo_error']
+
+    # Dentro de la ventana de backoff no se reintenta
+    assert outbox.sincronizar(db_path=db_with_data, outbox_path=outbox_path)['sincronizadas'] == 0
+
+
+@pytest.mark.skipif(not USE_POSTGRES, reason="Requiere DATABASE_URL (PostgreSQL local)")
+def test_sincronizar_postgres(outbox_path):
+    """Con un PostgreSQL local como BD principal."""
+    from app.models import crear_producto, eliminar_producto, anular_venta
+    from scripts.create_db import ensure_tables
+    ensure_tables()
+    sku = f"OUTBOX-{uuid.uuid4().hex[:8]}".upper()
+    crear_producto(sku, 'Outbox Test', 'Camisa', 'M', 'Negro', 37000, 75000, stock=3)
+    try:
+        outbox.encolar('registrar_venta',
+                       {'sku': sku, 'cantidad': 1, 'precio': 75000, 'metodo_pago': 'Efectivo'},
+                       outbox_path=outbox_path)
+        assert outbox.sincronizar(outbox_path=outbox_path)['sincronizadas'] == 1
+        assert get_producto(sku)['stock'] == 2
+        for v in query("SELECT id FROM ventas WHERE sku = ?", (sku,)):
+            anular_venta(v['id'])
+    finally:
+        eliminar_producto(sku)